@@ -4,23 +4,35 @@
 # namespaces da API, rotas e inicialização do APScheduler.
 # ==============================================================================
 import os
+import base64
+import hmac
+import json
 import logging # Para configurar o logging
-from flask import Flask, request, jsonify, send_from_directory, Blueprint
+from flask import Flask, request, jsonify, send_from_directory, Blueprint, Response, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import tuple_
+from sqlalchemy.orm import selectinload, load_only, validates
 from flask_migrate import Migrate
 from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
 from datetime import datetime, timedelta
 from flask_cors import CORS
-from flask_restx import Api, Namespace, Resource, fields
+from flask_restx import Api, Namespace, Resource, fields, marshal
 from flask_apscheduler import APScheduler # IMPORT para o Scheduler
 
 # Importe suas configurações, o serviço CNJ e a nova task
 # Assumindo que config.py, cnj_service.py, tasks.py estão no mesmo diretório (gestao_advocacia)
 from config import Config 
-from cnj_service import consultar_processo_cnj 
 from tasks import job_verificar_processos_cnj 
+from lideranca_scheduler import EleicaoLider
+from comandos_cnj import cnj_sync_command, cnj_replay_command
+from cnj_jobs import enfileirar_atualizacao_caso, atualizar_casos_em_lote, expirar_job_abandonado
+from cnj_payload_bruto import descomprimir_payload
+from cnj_prioridade import reagendar_verificacao_cnj
+from cnj_cache_negativo import invalidar as invalidar_cache_negativo
+from cnj_service import decompor_numero_processo, normalizar_numero_processo
+from cnj_metricas import agregar_execucoes, calcular_atraso_verificacoes, formatar_prometheus
 
 # Inicialização das extensões
 db = SQLAlchemy()
@@ -78,11 +90,52 @@ class Caso(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('user.id', name='fk_caso_user_id'), nullable=False)
     
     data_ultima_verificacao_cnj = db.Column(db.DateTime, nullable=True)
+    # Processo no DataJud (compartilhado com os outros casos de mesmo número), vinculado na sincronização
+    processo_cnj_id = db.Column(db.Integer, db.ForeignKey('processo_cnj.id', name='fk_caso_processo_cnj_id', ondelete='SET NULL'), nullable=True, index=True)
+    # Derivados de numero_processo (ver _decompor_numero_processo): apenas dígitos, segmento de justiça (J),
+    # tribunal (TR) e alias do DataJud. Permitem agrupar e consultar por tribunal sem reprocessar o número.
+    numero_processo_digits = db.Column(db.String(20), nullable=True, index=True)
+    segmento_justica = db.Column(db.String(1), nullable=True)
+    tribunal_tr = db.Column(db.String(2), nullable=True)
+    alias_tribunal_cnj = db.Column(db.String(60), nullable=True)
+    # Agenda adaptativa das verificações (ver cnj_prioridade.py): taxa de movimentações por dia
+    # (média móvel), prioridade e data da próxima verificação, que ordena a fila do job.
+    taxa_movimentacoes_cnj = db.Column(db.Float, nullable=True)
+    prioridade_cnj = db.Column(db.Float, nullable=True)
+    proxima_verificacao_cnj = db.Column(db.DateTime, nullable=True, index=True)
     
-    movimentacoes_cnj = db.relationship('MovimentacaoCNJ', backref='caso_cnj_associado', lazy='dynamic', cascade="all, delete-orphan")
+    processo_cnj = db.relationship('ProcessoCNJ', backref=db.backref('casos', lazy='dynamic'))
     documentos_caso = db.relationship('Documento', backref='caso_documento_associado', lazy='dynamic', cascade="all, delete-orphan")
     despesas_caso = db.relationship('Despesa', backref='caso_despesa_associado', lazy='dynamic', cascade="all, delete-orphan")
     recebimentos_caso = db.relationship('Recebimento', backref='caso_recebimento_associado', lazy='dynamic', cascade="all, delete-orphan")
+    # Eventos continuam na agenda se o caso for deletado (caso_id volta a NULL)
+    eventos_caso = db.relationship('EventoAgenda', backref='caso_evento_associado', lazy='dynamic')
+
+    __table_args__ = (
+        db.Index('ix_caso_alias_verificacao', 'alias_tribunal_cnj', 'data_ultima_verificacao_cnj'),
+    )
+
+    @validates('numero_processo')
+    def _decompor_numero_processo(self, chave, numero_processo):
+        if normalizar_numero_processo(numero_processo) != (self.numero_processo_digits or ''):
+            # Outro processo: o histórico de verificações não vale mais, verifica o quanto antes
+            # (a sincronização vincula o caso ao processo do novo número)
+            self.taxa_movimentacoes_cnj = self.proxima_verificacao_cnj = None
+            self.processo_cnj = None
+        self.numero_processo_digits, self.segmento_justica, self.tribunal_tr, self.alias_tribunal_cnj = \
+            decompor_numero_processo(numero_processo)
+        return numero_processo
+
+    @staticmethod
+    def filtro_mesmo_numero_processo(numero_processo):
+        # Compara pelos dígitos, para que formatações diferentes do mesmo número sejam reconhecidas
+        digitos = normalizar_numero_processo(numero_processo)
+        return Caso.numero_processo_digits == digitos if digitos else Caso.numero_processo == numero_processo
+
+    @property
+    def movimentacoes_cnj(self):
+        # As movimentações pertencem ao processo, não ao caso: casos com o mesmo número veem o mesmo histórico
+        return MovimentacaoCNJ.query.filter(MovimentacaoCNJ.processo_cnj_id == self.processo_cnj_id)
 
     def __repr__(self): return f'<Caso {self.id} - {self.nome_caso}>'
     def to_dict(self):
@@ -98,19 +151,72 @@ class Caso(db.Model):
             'movimentacoes_cnj_count': self.movimentacoes_cnj.count()
         }
 
+class PayloadCNJ(db.Model):
+    # JSON bruto do DataJud, comprimido e endereçado pelo conteúdo (ver cnj_payload_bruto.py)
+    __tablename__ = 'payload_cnj'
+    id = db.Column(db.Integer, primary_key=True)
+    hash = db.Column(db.LargeBinary(32), nullable=False) # SHA-256 do JSON serializado de forma canônica
+    formato = db.Column(db.String(16), nullable=False)
+    conteudo = db.Column(db.LargeBinary, nullable=False)
+    tamanho_original = db.Column(db.Integer, nullable=False)
+
+    __table_args__ = (
+        db.UniqueConstraint('hash', name='uq_payload_cnj_hash'),
+    )
+
+    def carregar(self):
+        return descomprimir_payload(self.conteudo, self.formato)
+
+    def __repr__(self): return f'<PayloadCNJ {self.id} {len(self.conteudo)}/{self.tamanho_original} bytes>'
+
+class ProcessoCNJ(db.Model):
+    # Processo no DataJud, um por número (só dígitos), referenciado por todos os casos com esse número.
+    # As movimentações e a última resposta ingerida ficam aqui, uma única vez (ver cnj_ingestao.py).
+    __tablename__ = 'processo_cnj'
+    id = db.Column(db.Integer, primary_key=True)
+    # Nulo só para históricos migrados de casos que já não tinham número de processo
+    numero_processo_digits = db.Column(db.String(20), nullable=True)
+    # Última resposta do DataJud ingerida para o processo (ver cnj_ingestao.ingerir_resposta_processo)
+    data_hora_ultima_atualizacao_cnj = db.Column(db.String(40), nullable=True)
+    hash_payload_cnj = db.Column(db.String(64), nullable=True)
+    data_ultima_sincronizacao_cnj = db.Column(db.DateTime, nullable=True)
+
+    movimentacoes = db.relationship('MovimentacaoCNJ', backref='processo_cnj', lazy='dynamic', cascade="all, delete-orphan")
+
+    __table_args__ = (
+        db.UniqueConstraint('numero_processo_digits', name='uq_processo_cnj_numero'),
+    )
+
+    def __repr__(self): return f'<ProcessoCNJ {self.id} {self.numero_processo_digits}>'
+
 class MovimentacaoCNJ(db.Model):
     __tablename__ = 'movimentacao_cnj'
     id = db.Column(db.Integer, primary_key=True)
-    caso_id = db.Column(db.Integer, db.ForeignKey('caso.id', name='fk_movimentacao_cnj_caso_id'), nullable=False, index=True)
-    data_movimentacao = db.Column(db.DateTime, nullable=False, index=True)
+    # processo_cnj_id e data_movimentacao são cobertos pelo índice composto (processo_cnj_id, data_movimentacao DESC, id DESC)
+    processo_cnj_id = db.Column(db.Integer, db.ForeignKey('processo_cnj.id', name='fk_movimentacao_cnj_processo_cnj_id'), nullable=False)
+    data_movimentacao = db.Column(db.DateTime, nullable=False)
     descricao = db.Column(db.Text, nullable=False)
-    dados_integra_cnj = db.Column(db.JSON, nullable=True) 
+    # O JSON bruto fica na tabela payload_cnj; listagens não o carregam a menos que acessem dados_integra_cnj
+    payload_cnj_id = db.Column(db.Integer, db.ForeignKey('payload_cnj.id', name='fk_movimentacao_cnj_payload'), nullable=True)
+    payload_bruto = db.relationship('PayloadCNJ', lazy='select')
     data_registro_sistema = db.Column(db.DateTime, default=datetime.utcnow)
+    # Impressão digital determinística (processo + dataHora + código + complementos), ver calcular_hash_movimentacao
+    hash_movimentacao = db.Column(db.String(64), nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_movimentacao_cnj_processo_hash', 'processo_cnj_id', 'hash_movimentacao', unique=True),
+        # Listagem paginada (keyset) do histórico de um processo, da mais recente para a mais antiga
+        db.Index('ix_movimentacao_cnj_processo_data_id', processo_cnj_id, data_movimentacao.desc(), id.desc()),
+    )
+
+    @property
+    def dados_integra_cnj(self):
+        return self.payload_bruto.carregar() if self.payload_bruto is not None else None
 
-    def __repr__(self): return f'<MovimentacaoCNJ id={self.id} caso_id={self.caso_id} data="{self.data_movimentacao.strftime("%Y-%m-%d %H:%M")}">'
+    def __repr__(self): return f'<MovimentacaoCNJ id={self.id} processo_cnj_id={self.processo_cnj_id} data="{self.data_movimentacao.strftime("%Y-%m-%d %H:%M")}">'
     def to_dict(self):
         return {
-            'id': self.id, 'caso_id': self.caso_id,
+            'id': self.id, 'processo_cnj_id': self.processo_cnj_id,
             'data_movimentacao': self.data_movimentacao.isoformat() if self.data_movimentacao else None,
             'descricao': self.descricao, 'dados_integra_cnj': self.dados_integra_cnj,
             'data_registro_sistema': self.data_registro_sistema.isoformat() if self.data_registro_sistema else None
@@ -124,11 +230,16 @@ class EventoAgenda(db.Model):
     data_fim = db.Column(db.DateTime, nullable=True)
     descricao = db.Column(db.Text, nullable=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id', name='fk_evento_user_id'), nullable=False)
+    caso_id = db.Column(db.Integer, db.ForeignKey('caso.id', name='fk_evento_caso_id', ondelete='SET NULL'), nullable=True)
+
+    __table_args__ = (
+        db.Index('ix_evento_agenda_caso_data', 'caso_id', 'data_inicio'),
+    )
 
     def to_dict(self):
         return {'id': self.id, 'title': self.titulo, 'start': self.data_inicio.isoformat(),
                 'end': self.data_fim.isoformat() if self.data_fim else None,
-                'description': self.descricao, 'user_id': self.user_id}
+                'description': self.descricao, 'user_id': self.user_id, 'caso_id': self.caso_id}
 
 class Documento(db.Model):
     __tablename__ = 'documento'
@@ -175,6 +286,116 @@ class Recebimento(db.Model):
         return {'id': self.id, 'descricao': self.descricao, 'valor': str(self.valor),
                 'data_recebimento': self.data_recebimento.isoformat(), 'recebido': self.recebido,
                 'caso_id': self.caso_id, 'user_id': self.user_id}
+
+class LiderancaScheduler(db.Model):
+    # Lease da eleição de líder do scheduler nos bancos sem advisory lock (ver lideranca_scheduler.py)
+    __tablename__ = 'lideranca_scheduler'
+    nome = db.Column(db.String(100), primary_key=True)
+    dono = db.Column(db.String(255), nullable=False)
+    expira_em = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self): return f'<LiderancaScheduler {self.nome} dono={self.dono} expira_em={self.expira_em}>'
+
+class CnjJob(db.Model):
+    # Atualização CNJ assíncrona disparada pela API (ver cnj_jobs.py)
+    __tablename__ = 'cnj_job'
+    id = db.Column(db.String(36), primary_key=True)
+    tipo = db.Column(db.String(30), nullable=False, default='atualizar_caso')
+    caso_id = db.Column(db.Integer, db.ForeignKey('caso.id', name='fk_cnj_job_caso_id', ondelete='CASCADE'), nullable=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', name='fk_cnj_job_user_id'), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='pendente')
+    http_status = db.Column(db.Integer, nullable=True)
+    resultado = db.Column(db.JSON, nullable=True)
+    criado_em = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    iniciado_em = db.Column(db.DateTime, nullable=True)
+    concluido_em = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        db.Index('ix_cnj_job_caso_status', 'caso_id', 'status'),
+    )
+
+    def __repr__(self): return f'<CnjJob {self.id} caso_id={self.caso_id} status={self.status}>'
+    def to_dict(self):
+        return {
+            'id': self.id, 'tipo': self.tipo, 'caso_id': self.caso_id, 'status': self.status,
+            'http_status': self.http_status, 'resultado': self.resultado,
+            'criado_em': self.criado_em.isoformat() if self.criado_em else None,
+            'iniciado_em': self.iniciado_em.isoformat() if self.iniciado_em else None,
+            'concluido_em': self.concluido_em.isoformat() if self.concluido_em else None
+        }
+
+class CacheNegativoCNJ(db.Model):
+    # Números de processo sem resultado no DataJud, não consultados até 'valido_ate' (ver cnj_cache_negativo.py)
+    __tablename__ = 'cache_negativo_cnj'
+    numero_processo_digits = db.Column(db.String(20), primary_key=True)
+    consultas_sem_resultado = db.Column(db.Integer, nullable=False, default=1)
+    valido_ate = db.Column(db.DateTime, nullable=False)
+    atualizado_em = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self): return f'<CacheNegativoCNJ {self.numero_processo_digits} x{self.consultas_sem_resultado} até {self.valido_ate}>'
+
+class FilaSincronizacaoCNJ(db.Model):
+    # Fila durável de atualizações CNJ (periódicas e pedidas pelo usuário), consumida por vários workers (ver cnj_fila.py)
+    __tablename__ = 'cnj_sync_queue'
+    id = db.Column(db.Integer, primary_key=True)
+    caso_id = db.Column(db.Integer, db.ForeignKey('caso.id', name='fk_cnj_sync_queue_caso_id', ondelete='CASCADE'), nullable=False)
+    prioridade = db.Column(db.Integer, nullable=False, default=0)
+    cnj_job_id = db.Column(db.String(36), db.ForeignKey('cnj_job.id', name='fk_cnj_sync_queue_cnj_job_id', ondelete='SET NULL'), nullable=True)
+    enfileirado_em = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    reserva = db.Column(db.String(64), nullable=True) # Token da reserva (lease) do worker que está processando o item
+    reservado_ate = db.Column(db.DateTime, nullable=True)
+    tentativas = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.UniqueConstraint('caso_id', name='uq_cnj_sync_queue_caso'),
+        db.Index('ix_cnj_sync_queue_prioridade', prioridade.desc(), enfileirado_em, id),
+    )
+
+    def __repr__(self): return f'<FilaSincronizacaoCNJ caso_id={self.caso_id} prioridade={self.prioridade} reserva={self.reserva}>'
+
+class MarcaSincronizacaoCNJ(db.Model):
+    # Maior dataHoraUltimaAtualizacao já sincronizada por tribunal, na sincronização incremental (ver cnj_incremental.py)
+    __tablename__ = 'cnj_sync_watermark'
+    alias_tribunal = db.Column(db.String(60), primary_key=True)
+    data_hora_ultima_atualizacao = db.Column(db.DateTime, nullable=False)
+    atualizado_em = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self): return f'<MarcaSincronizacaoCNJ {self.alias_tribunal} {self.data_hora_ultima_atualizacao}>'
+
+class ExecucaoSincronizacaoCNJ(db.Model):
+    # Uma execução da sincronização com o DataJud (job ou 'flask cnj-sync') e as suas métricas (ver cnj_metricas.py)
+    __tablename__ = 'cnj_sync_run'
+    id = db.Column(db.Integer, primary_key=True)
+    origem = db.Column(db.String(20), nullable=False) # 'job' ou 'cli'
+    iniciado_em = db.Column(db.DateTime, nullable=False)
+    concluido_em = db.Column(db.DateTime, nullable=False)
+    duracao_segundos = db.Column(db.Float, nullable=False)
+    casos_verificados = db.Column(db.Integer, nullable=False, default=0)
+    novas_movimentacoes = db.Column(db.Integer, nullable=False, default=0)
+    consultas_http = db.Column(db.Integer, nullable=False, default=0)
+    erros_http = db.Column(db.Integer, nullable=False, default=0)
+    # Casos com a verificação vencida ao fim da execução e a espera do mais atrasado
+    casos_pendentes = db.Column(db.Integer, nullable=False, default=0)
+    atraso_maximo_segundos = db.Column(db.Float, nullable=True)
+    # Por tribunal: consultas por status, histograma de latência, casos e movimentações (MetricasCNJ.instantaneo)
+    tribunais = db.Column(db.JSON, nullable=True)
+    erro = db.Column(db.Text, nullable=True)
+
+    __table_args__ = (
+        db.Index('ix_cnj_sync_run_iniciado_em', 'iniciado_em'),
+    )
+
+    def __repr__(self): return f'<ExecucaoSincronizacaoCNJ {self.id} {self.origem} {self.iniciado_em}>'
+    def to_dict(self):
+        return {
+            'id': self.id, 'origem': self.origem,
+            'iniciado_em': self.iniciado_em.isoformat() if self.iniciado_em else None,
+            'concluido_em': self.concluido_em.isoformat() if self.concluido_em else None,
+            'duracao_segundos': self.duracao_segundos, 'casos_verificados': self.casos_verificados,
+            'novas_movimentacoes': self.novas_movimentacoes, 'consultas_http': self.consultas_http, 'erros_http': self.erros_http,
+            'casos_pendentes': self.casos_pendentes, 'atraso_maximo_segundos': self.atraso_maximo_segundos,
+            'tribunais': self.tribunais or {}, 'erro': self.erro
+        }
 # --- FIM DOS MODELOS SQLAlchemy ---
 
 
@@ -201,7 +422,7 @@ def create_app(config_class=Config):
     db.init_app(app)
     migrate.init_app(app, db)
     jwt.init_app(app)
-    CORS(app) 
+    CORS(app, expose_headers=['Location', 'X-Next-Cursor']) 
 
     api_bp = Blueprint('api', __name__, url_prefix='/api')
     api = Api(api_bp, version='1.0', title='API Gestão Advocacia',
@@ -224,6 +445,8 @@ def create_app(config_class=Config):
     documentos_ns = Namespace('documentos', description='Operações de Documentos')
     despesas_ns = Namespace('despesas', description='Operações de Despesas')
     recebimentos_ns = Namespace('recebimentos', description='Operações de Recebimentos')
+    cnj_jobs_ns = Namespace('cnj-jobs', description='Acompanhamento das atualizações CNJ assíncronas')
+    admin_ns = Namespace('admin', description='Operação e métricas da sincronização com o CNJ')
 
     api.add_namespace(auth_ns)
     api.add_namespace(clientes_ns)
@@ -232,6 +455,8 @@ def create_app(config_class=Config):
     api.add_namespace(documentos_ns)
     api.add_namespace(despesas_ns)
     api.add_namespace(recebimentos_ns)
+    api.add_namespace(cnj_jobs_ns)
+    api.add_namespace(admin_ns)
 
     # --- DEFINIÇÃO DOS MODELOS DA API (DTOs - Data Transfer Objects) para Flask-RESTx ---
     user_model_dto = auth_ns.model('UserRegistration', {
@@ -284,6 +509,8 @@ def create_app(config_class=Config):
         'nome_cliente': fields.String(attribute='cliente_associado.nome', description='Nome do cliente associado (se disponível e carregado)'),
         'user_id': fields.Integer,
         'data_ultima_verificacao_cnj': fields.DateTime(dt_format='iso8601', nullable=True, description='Data da última verificação de atualizações no CNJ'),
+        'proxima_verificacao_cnj': fields.DateTime(dt_format='iso8601', nullable=True, description='Data prevista da próxima verificação no CNJ (agenda adaptativa; vazio = o quanto antes)'),
+        'alias_tribunal_cnj': fields.String(readonly=True, description='Alias do tribunal no DataJud, derivado do número do processo (nulo se não identificado)'),
         'movimentacoes_cnj_count': fields.Integer(description='Quantidade de movimentações do CNJ registradas para este caso')
     })
 
@@ -291,15 +518,18 @@ def create_app(config_class=Config):
        'id': fields.Integer(readonly=True, description='ID da movimentação no sistema local'),
        'data_movimentacao': fields.DateTime(dt_format='iso8601', description='Data/hora da movimentação conforme consta no processo CNJ'),
        'descricao': fields.String(required=True, description='Descrição da movimentação processual'),
-       'dados_integra_cnj': fields.Raw(description="JSON original completo da movimentação como recebido da API do CNJ (pode ser extenso e técnico)"),
        'data_registro_sistema': fields.DateTime(dt_format='iso8601', description='Data/hora em que esta movimentação foi registrada no sistema local')
     })
+    movimentacao_cnj_completa_output_model_dto = casos_ns.inherit('MovimentacaoCNJCompletaOutput', movimentacao_cnj_output_model_dto, {
+       'dados_integra_cnj': fields.Raw(description="JSON original completo da movimentação como recebido da API do CNJ (pode ser extenso e técnico)")
+    })
     
     evento_input_model_dto = eventos_ns.model('EventoInput', {
         'titulo': fields.String(required=True, description='Título do evento da agenda'),
         'data_inicio': fields.DateTime(required=True, description='Data e hora de início do evento (formato ISO 8601)'),
         'data_fim': fields.DateTime(description='Data e hora de término do evento (formato ISO 8601, opcional)'),
-        'descricao': fields.String(description='Descrição ou detalhes adicionais sobre o evento')
+        'descricao': fields.String(description='Descrição ou detalhes adicionais sobre o evento'),
+        'caso_id': fields.Integer(description='ID do caso ao qual o evento está associado (opcional)')
     })
     evento_model_dto = eventos_ns.model('EventoOutput', {
         'id': fields.Integer(readonly=True),
@@ -307,7 +537,8 @@ def create_app(config_class=Config):
         'start': fields.DateTime(attribute='data_inicio', dt_format='iso8601', description='Início do evento (compatível com FullCalendar)'),
         'end': fields.DateTime(attribute='data_fim', dt_format='iso8601', nullable=True, description='Fim do evento (compatível com FullCalendar)'),
         'description': fields.String(attribute='descricao', nullable=True, description='Descrição do evento'),
-        'user_id': fields.Integer(description='ID do usuário criador do evento')
+        'user_id': fields.Integer(description='ID do usuário criador do evento'),
+        'caso_id': fields.Integer(nullable=True, description='ID do caso associado ao evento')
     })
 
     documento_model_dto = documentos_ns.model('DocumentoOutput', {
@@ -518,7 +749,7 @@ def create_app(config_class=Config):
             if not cliente:
                 return {"message": f"Cliente com ID {data['cliente_id']} não encontrado."}, 404
             num_proc_strip = data.get('numero_processo', '').strip() or None
-            if num_proc_strip and Caso.query.filter_by(user_id=user_id, numero_processo=num_proc_strip).first():
+            if num_proc_strip and Caso.query.filter(Caso.user_id == user_id, Caso.filtro_mesmo_numero_processo(num_proc_strip)).first():
                 return {"message": f"Já existe um caso com o número de processo '{num_proc_strip}'."}, 409
             novo_caso = Caso(
                 nome_caso=data['nome_caso'], numero_processo=num_proc_strip,
@@ -559,12 +790,17 @@ def create_app(config_class=Config):
                 caso.cliente_id = novo_cliente_id
             novo_numero_processo = data.get('numero_processo', '').strip() or None
             if novo_numero_processo and novo_numero_processo != caso.numero_processo:
-                if Caso.query.filter(Caso.user_id == user_id, Caso.numero_processo == novo_numero_processo, Caso.id != caso_id_param).first():
+                if Caso.query.filter(Caso.user_id == user_id, Caso.filtro_mesmo_numero_processo(novo_numero_processo), Caso.id != caso_id_param).first():
                     return {"message": f"Outro caso já utiliza o número de processo '{novo_numero_processo}'."}, 409
+                # Número editado: consulta de novo no DataJud mesmo que ele estivesse no cache negativo
+                invalidar_cache_negativo([normalizar_numero_processo(novo_numero_processo)])
             caso.nome_caso = data['nome_caso']
             caso.numero_processo = novo_numero_processo
             caso.descricao = data.get('descricao', caso.descricao)
-            caso.status = data.get('status', caso.status)
+            novo_status = data.get('status', caso.status)
+            if novo_status != caso.status:
+                caso.status = novo_status
+                reagendar_verificacao_cnj(caso)
             db.session.commit()
             app.logger.info(f"Caso ID {caso.id} atualizado pelo usuário ID {user_id}.")
             return caso
@@ -584,7 +820,7 @@ def create_app(config_class=Config):
     @casos_ns.param('caso_id', 'O ID do caso para o qual buscar e registrar atualizações do CNJ')
     class CasoAtualizarCNJAPI(Resource):
         @casos_ns.doc('atualizar_caso_via_cnj_endpoint', security='jsonWebToken',
-                     description="Consulta a API do CNJ para um caso específico, buscando as últimas movimentações e atualizando o status do caso e registrando novas movimentações no sistema local.")
+                     description="Enfileira a consulta à API do CNJ para um caso específico (registro das novas movimentações e atualização do status do caso). Responde 202 com o 'job_id'; o resultado fica em GET /api/cnj-jobs/<job_id>. Pedidos simultâneos para o mesmo caso compartilham o mesmo job.")
         @jwt_required()
         def post(self, caso_id): 
             user_id_atual = get_jwt_identity()
@@ -594,7 +830,7 @@ def create_app(config_class=Config):
                 app.logger.info(f"API CNJ: Tentativa de atualizar caso inexistente ID {caso_id} por usuário {user_id_atual}")
                 return {"message": f"Caso com ID {caso_id} não encontrado."}, 404
             
-            if caso_para_atualizar.user_id != user_id_atual:
+            if str(caso_para_atualizar.user_id) != str(user_id_atual):
                 app.logger.warning(f"API CNJ: Usuário {user_id_atual} tentou acesso não autorizado ao caso {caso_id} (pertence a user {caso_para_atualizar.user_id}).")
                 return {"message": "Acesso não autorizado a este caso."}, 403
                 
@@ -602,126 +838,195 @@ def create_app(config_class=Config):
                 app.logger.info(f"API CNJ: Caso {caso_id} não possui número de processo para consulta.")
                 return {"message": "Este caso não possui um número de processo válido para consulta ao CNJ."}, 400
 
-            app.logger.info(f"API CNJ: Iniciando atualização para caso ID {caso_id}, processo '{caso_para_atualizar.numero_processo}'. Solicitado por usuário {user_id_atual}.")
-            dados_resposta_cnj, status_http_cnj = consultar_processo_cnj(caso_para_atualizar.numero_processo)
-
-            if status_http_cnj >= 400:
-                app.logger.error(f"API CNJ: Falha na consulta ao cnj_service para caso {caso_id}. Status: {status_http_cnj}. Erro: {dados_resposta_cnj.get('erro')}")
-                response_status_api = status_http_cnj if status_http_cnj in [400, 401, 403, 404, 429, 500, 502, 503, 504] else 500
-                return {
-                    "message": "Falha ao consultar o serviço do CNJ.", 
-                    "details": dados_resposta_cnj.get("erro", "Detalhes do erro indisponíveis."),
-                    "cnj_service_response_details": dados_resposta_cnj.get("detalhes_servico_cnj")
-                }, response_status_api
+            job, criado = enfileirar_atualizacao_caso(caso_para_atualizar, int(user_id_atual))
+            if criado:
+                app.logger.info(f"API CNJ: Atualização do caso ID {caso_id}, processo '{caso_para_atualizar.numero_processo}', enfileirada (job {job.id}). Solicitado por usuário {user_id_atual}.")
+                mensagem = "Atualização via CNJ enfileirada. Acompanhe o andamento pelo job."
+            else:
+                app.logger.info(f"API CNJ: Caso ID {caso_id} já tem atualização em andamento (job {job.id}); pedido do usuário {user_id_atual} reaproveitado.")
+                mensagem = "Já existe uma atualização via CNJ em andamento para este caso."
+            url_job = f"{api_bp.url_prefix}/cnj-jobs/{job.id}"
+            return {"message": mensagem, "job_id": job.id, "status": job.status, "status_url": url_job}, 202, {'Location': url_job}
+
+    @casos_ns.route('/atualizar-cnj-lote')
+    class CasoAtualizarCNJLoteAPI(Resource):
+        @casos_ns.doc('atualizar_casos_via_cnj_em_lote_endpoint', security='jsonWebToken',
+                     description="Atualiza via CNJ vários casos do usuário em uma única chamada. Corpo: {\"caso_ids\": [1, 2, ...]} ou {\"todos\": true}. Os casos são agrupados por tribunal e consultados em lotes concorrentes; o progresso é devolvido em streaming, uma linha JSON por caso (application/x-ndjson), ou como Server-Sent Events se o cliente enviar 'Accept: text/event-stream'. A primeira linha é {\"tipo\": \"inicio\"} e a última {\"tipo\": \"fim\", \"resumo\": {...}}.")
+        @jwt_required()
+        def post(self):
+            user_id_atual = get_jwt_identity()
+            data = request.get_json(silent=True) or {}
+            limite_casos = app.config.get('CNJ_LOTE_API_MAX_CASOS', 500)
+            consulta = Caso.query.filter(Caso.user_id == user_id_atual, Caso.numero_processo_digits.isnot(None))
+            caso_ids_pedidos = []
+            if data.get('todos') is True:
+                consulta = consulta.order_by(Caso.id)
+            else:
+                caso_ids_pedidos = data.get('caso_ids')
+                if not isinstance(caso_ids_pedidos, list) or not caso_ids_pedidos or not all(isinstance(i, int) for i in caso_ids_pedidos):
+                    return {"message": "Informe 'caso_ids' (lista de IDs de casos) ou 'todos': true."}, 400
+                caso_ids_pedidos = list(dict.fromkeys(caso_ids_pedidos))
+                if len(caso_ids_pedidos) > limite_casos:
+                    return {"message": f"Máximo de {limite_casos} casos por pedido."}, 400
+                consulta = consulta.filter(Caso.id.in_(caso_ids_pedidos))
+            casos = consulta.with_entities(Caso.id, Caso.numero_processo, Caso.numero_processo_digits, Caso.alias_tribunal_cnj)\
+                .limit(limite_casos + 1).all()
+            if len(casos) > limite_casos:
+                return {"message": f"Máximo de {limite_casos} casos por pedido; informe 'caso_ids' para atualizar em partes."}, 400
+            # IDs inexistentes, de outro usuário ou sem número de processo não são consultados.
+            encontrados = {caso.id for caso in casos}
+            ignorados = [caso_id for caso_id in caso_ids_pedidos if caso_id not in encontrados]
+            app.logger.info(f"API CNJ LOTE: Usuário {user_id_atual} solicitou a atualização de {len(casos)} caso(s) ({len(ignorados)} ignorado(s)).")
+
+            usar_sse = request.accept_mimetypes.best_match(['application/x-ndjson', 'text/event-stream']) == 'text/event-stream'
+
+            def formatar(evento):
+                linha = json.dumps(evento, ensure_ascii=False)
+                return f"data: {linha}\n\n" if usar_sse else f"{linha}\n"
+
+            def gerar_progresso():
+                resumo = {}
+                yield formatar({"tipo": "inicio", "total": len(casos) + len(ignorados)})
+                for caso_id in ignorados:
+                    resumo['nao_encontrado'] = resumo.get('nao_encontrado', 0) + 1
+                    yield formatar({"tipo": "caso", "caso_id": caso_id, "status": "nao_encontrado",
+                                    "message": "Caso não encontrado, sem acesso ou sem número de processo."})
+                for evento in atualizar_casos_em_lote(casos):
+                    resumo[evento['status']] = resumo.get(evento['status'], 0) + 1
+                    yield formatar(evento)
+                app.logger.info(f"API CNJ LOTE: Atualização em lote do usuário {user_id_atual} concluída: {resumo}.")
+                yield formatar({"tipo": "fim", "resumo": resumo})
+
+            return Response(
+                stream_with_context(gerar_progresso()),
+                mimetype='text/event-stream' if usar_sse else 'application/x-ndjson',
+                headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+            )
 
-            try:
-                hits_cnj_api = dados_resposta_cnj.get("hits", {}).get("hits", [])
-                if not hits_cnj_api:
-                    app.logger.info(f"API CNJ: Nenhum 'hit' encontrado para '{caso_para_atualizar.numero_processo}' (caso {caso_id}).")
-                    caso_para_atualizar.data_ultima_verificacao_cnj = datetime.utcnow()
-                    db.session.commit()
-                    return {"message": "Nenhum dado de processo encontrado no CNJ para o número fornecido.", "cnj_raw_response": dados_resposta_cnj}, 200
-
-                dados_processo_cnj = hits_cnj_api[0].get('_source', {})
-                movimentos_api_cnj = dados_processo_cnj.get('movimentos', []) 
-                if not isinstance(movimentos_api_cnj, list): movimentos_api_cnj = []
-
-                if not movimentos_api_cnj:
-                    app.logger.info(f"API CNJ: Processo '{caso_para_atualizar.numero_processo}' encontrado, mas sem lista 'movimentos'.")
-                    caso_para_atualizar.data_ultima_verificacao_cnj = datetime.utcnow()
-                    db.session.commit()
-                    return {"message": "Processo encontrado no CNJ, mas sem detalhamento de movimentações."}, 200
-
-                novas_movs_count = 0
-                data_mov_recente_lote = None
-                desc_mov_recente_lote = "Nenhuma nova movimentação significativa identificada."
-                movimentos_api_cnj.sort(key=lambda m: m.get('dataHora', '1900-01-01T00:00:00Z'), reverse=True)
-
-                for movimento_json in movimentos_api_cnj:
-                    data_mov_str_api = movimento_json.get('dataHora') 
-                    if not data_mov_str_api: continue
-                    try: data_mov_obj_utc = datetime.fromisoformat(data_mov_str_api.replace('Z', '+00:00'))
-                    except ValueError: 
-                        app.logger.warning(f"API CNJ: Formato de 'dataHora' ('{data_mov_str_api}') inválido para caso {caso_id}. Ignorando.")
-                        continue
-                    
-                    desc_parts = []
-                    mov_nacional = movimento_json.get('movimentoNacional')
-                    if mov_nacional and isinstance(mov_nacional, dict) and mov_nacional.get('descricao'):
-                        desc_parts.append(mov_nacional['descricao'])
-                    
-                    mov_local = movimento_json.get('movimentoLocal')
-                    if not desc_parts and mov_local and isinstance(mov_local, dict) and mov_local.get('descricao'):
-                         desc_parts.append(mov_local['descricao'])
-
-                    complementos_api = movimento_json.get('complementos', [])
-                    if isinstance(complementos_api, list):
-                        for comp_item in complementos_api:
-                            if isinstance(comp_item, dict) and comp_item.get('descricao'):
-                                desc_parts.append(comp_item['descricao'])
-                    
-                    descricao_db = " | ".join(filter(None, desc_parts))
-                    if not descricao_db: 
-                        descricao_db = movimento_json.get('descricao') or f"Movimento Cód: {movimento_json.get('codigoNacional', {}).get('codigo', 'N/A')}"
-
-                    mov_existente = MovimentacaoCNJ.query.filter_by(
-                        caso_id=caso_para_atualizar.id,
-                        data_movimentacao=data_mov_obj_utc
-                    ).filter(MovimentacaoCNJ.descricao.startswith(descricao_db[:150])).first()
-
-                    if not mov_existente:
-                        nova_mov = MovimentacaoCNJ(
-                            caso_id=caso_para_atualizar.id,
-                            data_movimentacao=data_mov_obj_utc,
-                            descricao=descricao_db,
-                            dados_integra_cnj=movimento_json
-                        )
-                        db.session.add(nova_mov)
-                        novas_movs_count += 1
-                        if data_mov_recente_lote is None or data_mov_obj_utc > data_mov_recente_lote:
-                            data_mov_recente_lote = data_mov_obj_utc
-                            desc_mov_recente_lote = descricao_db
-                
-                if novas_movs_count > 0 and data_mov_recente_lote:
-                    caso_para_atualizar.status = desc_mov_recente_lote[:255] 
-                    caso_para_atualizar.data_atualizacao = data_mov_recente_lote
-                
-                caso_para_atualizar.data_ultima_verificacao_cnj = datetime.utcnow()
-                db.session.commit()
+    def codificar_cursor_movimentacoes(movimentacao):
+        chave = f"{movimentacao.data_movimentacao.isoformat()}|{movimentacao.id}"
+        return base64.urlsafe_b64encode(chave.encode('utf-8')).decode('ascii').rstrip('=')
 
-                msg_final = f"Caso atualizado. {novas_movs_count} nova(s) movimentação(ões) registrada(s)." if novas_movs_count > 0 else "Nenhuma nova movimentação encontrada para registrar."
-                app.logger.info(f"API CNJ: Atualização para caso {caso_id} concluída. {msg_final}")
-                return {
-                    "message": msg_final, 
-                    "novas_movimentacoes_registradas": novas_movs_count,
-                    "descricao_ultima_movimentacao_nova": desc_mov_recente_lote if novas_movs_count > 0 else None
-                }, 200
-
-            except (KeyError, IndexError, TypeError, AttributeError) as e_proc:
-                db.session.rollback()
-                app.logger.error(f"API CNJ: Erro crítico ao processar dados da resposta CNJ para caso {caso_id}: {str(e_proc)}. Resposta CNJ (parcial): {str(dados_resposta_cnj)[:500]}", exc_info=True)
-                return {"message": "Erro interno ao processar os dados recebidos do CNJ.", "error_details": str(e_proc)}, 500
-            except Exception as e_geral:
-                db.session.rollback()
-                app.logger.critical(f"API CNJ: Erro geral INESPERADO no endpoint de atualização CNJ para caso {caso_id}: {str(e_geral)}", exc_info=True)
-                return {"message": f"Ocorreu um erro geral e inesperado no sistema: {str(e_geral)}"}, 500
+    def decodificar_cursor_movimentacoes(cursor):
+        """Converte o cursor opaco em (data_movimentacao, id); ValueError se for inválido."""
+        try:
+            chave = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('utf-8')
+            data_texto, id_texto = chave.split('|')
+            return datetime.fromisoformat(data_texto), int(id_texto)
+        except (ValueError, UnicodeDecodeError, TypeError) as e_cursor:
+            raise ValueError(f"Cursor inválido: {cursor}") from e_cursor
 
     @casos_ns.route('/<int:caso_id>/movimentacoes-cnj')
     @casos_ns.param('caso_id', 'O ID do caso para o qual listar as movimentações CNJ registradas no sistema')
     class CasoListarMovimentacoesCNJAPI(Resource):
-        @casos_ns.doc('listar_movimentacoes_cnj_registradas_caso_endpoint', security='jsonWebToken')
-        @casos_ns.marshal_list_with(movimentacao_cnj_output_model_dto)
+        @casos_ns.doc('listar_movimentacoes_cnj_registradas_caso_endpoint', security='jsonWebToken',
+                     description="Lista as movimentações CNJ do caso, da mais recente para a mais antiga, em páginas de 'limit' itens. Se houver mais páginas, o cabeçalho 'X-Next-Cursor' traz o valor a enviar em 'cursor' para obter a próxima. O JSON bruto (dados_integra_cnj) só é incluído com include_raw=true.",
+                     params={'limit': 'Itens por página (padrão CNJ_MOVIMENTACOES_LIMITE_PADRAO, máximo CNJ_MOVIMENTACOES_LIMITE_MAXIMO)',
+                             'cursor': "Valor do cabeçalho 'X-Next-Cursor' da página anterior",
+                             'include_raw': 'Inclui o JSON original de cada movimentação (true/false, padrão false)'})
+        @casos_ns.response(200, 'Página de movimentações', [movimentacao_cnj_completa_output_model_dto])
         @jwt_required()
         def get(self, caso_id):
             user_id_atual = get_jwt_identity()
             caso_db = db.session.get(Caso, caso_id)
             if not caso_db: casos_ns.abort(404, message=f"Caso com ID {caso_id} não foi encontrado.")
-            if caso_db.user_id != user_id_atual: casos_ns.abort(403, message="Acesso não autorizado.")
-            movimentacoes = MovimentacaoCNJ.query.filter_by(caso_id=caso_db.id)\
-                .order_by(MovimentacaoCNJ.data_movimentacao.desc(), MovimentacaoCNJ.id.desc())\
-                .all()
-            return movimentacoes, 200
-            
+            if str(caso_db.user_id) != str(user_id_atual): casos_ns.abort(403, message="Acesso não autorizado.")
+
+            limite_maximo = app.config.get('CNJ_MOVIMENTACOES_LIMITE_MAXIMO', 500)
+            limite = request.args.get('limit', app.config.get('CNJ_MOVIMENTACOES_LIMITE_PADRAO', 50), type=int)
+            if limite is None or limite < 1:
+                casos_ns.abort(400, message="'limit' deve ser um inteiro positivo.")
+            limite = min(limite, limite_maximo)
+            incluir_bruto = request.args.get('include_raw', 'false').strip().lower() in ('1', 'true', 'sim', 'yes')
+
+            consulta = caso_db.movimentacoes_cnj
+            cursor = request.args.get('cursor')
+            if cursor:
+                try:
+                    data_cursor, id_cursor = decodificar_cursor_movimentacoes(cursor)
+                except ValueError as e_cursor:
+                    casos_ns.abort(400, message=str(e_cursor))
+                consulta = consulta.filter(tuple_(MovimentacaoCNJ.data_movimentacao, MovimentacaoCNJ.id) < (data_cursor, id_cursor))
+            if incluir_bruto:
+                consulta = consulta.options(selectinload(MovimentacaoCNJ.payload_bruto))
+            else:
+                consulta = consulta.options(load_only(
+                    MovimentacaoCNJ.id, MovimentacaoCNJ.data_movimentacao, MovimentacaoCNJ.descricao, MovimentacaoCNJ.data_registro_sistema
+                ))
+            # Uma linha a mais indica se existe próxima página.
+            movimentacoes = consulta.order_by(MovimentacaoCNJ.data_movimentacao.desc(), MovimentacaoCNJ.id.desc())\
+                .limit(limite + 1).all()
+
+            cabecalhos = {}
+            if len(movimentacoes) > limite:
+                movimentacoes = movimentacoes[:limite]
+                cabecalhos['X-Next-Cursor'] = codificar_cursor_movimentacoes(movimentacoes[-1])
+            modelo = movimentacao_cnj_completa_output_model_dto if incluir_bruto else movimentacao_cnj_output_model_dto
+            return marshal(movimentacoes, modelo), 200, cabecalhos
+
+    @cnj_jobs_ns.route('/<string:job_id>')
+    @cnj_jobs_ns.param('job_id', 'O ID do job retornado por POST /api/casos/<id>/atualizar-cnj')
+    class CnjJobDetailAPI(Resource):
+        @cnj_jobs_ns.doc('obter_job_cnj', security='jsonWebToken',
+                         description="Status e resultado de uma atualização CNJ assíncrona. 'status' é pendente, executando, concluido ou erro; quando terminado, 'resultado' traz a resposta da atualização e 'http_status' o status correspondente. Um job pendente ou em execução há mais de CNJ_ASYNC_JOB_STALE_SECONDS, sem worker que o execute, é informado como erro.")
+        @jwt_required()
+        def get(self, job_id):
+            user_id_atual = get_jwt_identity()
+            job = db.session.get(CnjJob, job_id)
+            if not job or str(job.user_id) != str(user_id_atual):
+                return {"message": f"Job {job_id} não encontrado."}, 404
+            return expirar_job_abandonado(job).to_dict(), 200
+
+    @admin_ns.route('/cnj-sync/stats')
+    class CnjSyncStatsAPI(Resource):
+        @admin_ns.doc('estatisticas_sincronizacao_cnj', security='jsonWebToken',
+                      description="Últimas execuções da sincronização com o CNJ (tabela cnj_sync_run), contadores por tribunal somados das execuções na janela CNJ_METRICAS_JANELA_SEGUNDOS e o atraso atual das verificações. Restrito aos usuários em CNJ_ADMIN_USER_IDS.",
+                      params={'limit': 'Quantidade de execuções (padrão 20, máximo 200)'})
+        @jwt_required()
+        def get(self):
+            if str(get_jwt_identity()) not in {str(user_id) for user_id in app.config.get('CNJ_ADMIN_USER_IDS', [])}:
+                admin_ns.abort(403, message="Acesso não autorizado.")
+            limite = request.args.get('limit', 20, type=int)
+            if limite is None or limite < 1:
+                admin_ns.abort(400, message="'limit' deve ser um inteiro positivo.")
+            execucoes = ExecucaoSincronizacaoCNJ.query.order_by(ExecucaoSincronizacaoCNJ.iniciado_em.desc(), ExecucaoSincronizacaoCNJ.id.desc())\
+                .limit(min(limite, 200)).all()
+            return {
+                'execucoes': [execucao.to_dict() for execucao in execucoes],
+                'janela': agregar_execucoes(app.config.get('CNJ_METRICAS_JANELA_SEGUNDOS', 86400)),
+                'atraso': calcular_atraso_verificacoes()
+            }, 200
+
+    @admin_ns.route('/cnj-sync/metrics')
+    class CnjSyncMetricsAPI(Resource):
+        @admin_ns.doc('metricas_sincronizacao_cnj',
+                      description="Métricas da sincronização com o CNJ no formato de exposição do Prometheus, lidas de cnj_sync_run (iguais em todos os workers). Exige 'Authorization: Bearer <CNJ_METRICAS_TOKEN>'; sem o token configurado, retorna 404.")
+        def get(self):
+            token = app.config.get('CNJ_METRICAS_TOKEN')
+            if not token:
+                admin_ns.abort(404, message="Endpoint de métricas desativado.")
+            if not hmac.compare_digest(request.headers.get('Authorization', '').encode('utf-8'), f"Bearer {token}".encode('utf-8')):
+                admin_ns.abort(401, message="Token de métricas inválido.")
+            ultima_execucao = ExecucaoSincronizacaoCNJ.query.order_by(ExecucaoSincronizacaoCNJ.iniciado_em.desc(), ExecucaoSincronizacaoCNJ.id.desc()).first()
+            janela = agregar_execucoes(app.config.get('CNJ_METRICAS_JANELA_SEGUNDOS', 86400))
+            texto = formatar_prometheus(janela, calcular_atraso_verificacoes(), ultima_execucao)
+            return Response(texto, mimetype='text/plain; version=0.0.4')
+
+    def obter_caso_do_evento(caso_id, user_id):
+        # Retorna (caso, erro): o caso informado para o evento, se pertencer ao usuário
+        if not caso_id:
+            return None, None
+        caso = Caso.query.filter_by(id=caso_id, user_id=user_id).first()
+        if caso is None:
+            return None, {"message": f"Caso ID {caso_id} não encontrado."}
+        return caso, None
+
+    def reagendar_casos_do_evento(*casos):
+        # Eventos próximos antecipam a verificação CNJ do caso (ver cnj_prioridade.py)
+        db.session.flush()
+        for caso in {caso for caso in casos if caso is not None}:
+            reagendar_verificacao_cnj(caso)
+
     @eventos_ns.route('/')
     class EventoListAPI(Resource):
         @jwt_required()
@@ -746,11 +1051,15 @@ def create_app(config_class=Config):
                 data_fim_obj = datetime.fromisoformat(data['data_fim']) if data.get('data_fim') else None
             except ValueError:
                 return {"message": "Formato de data inválido. Utilize o formato ISO 8601 (ex: YYYY-MM-DDTHH:MM:SS)."}, 400
+            caso_evento, erro_caso = obter_caso_do_evento(data.get('caso_id'), user_id)
+            if erro_caso:
+                return erro_caso, 404
             novo_evento = EventoAgenda(
                 titulo=data['titulo'], data_inicio=data_inicio_obj, data_fim=data_fim_obj, 
-                descricao=data.get('descricao'), user_id=user_id
+                descricao=data.get('descricao'), user_id=user_id, caso_id=caso_evento.id if caso_evento else None
             )
             db.session.add(novo_evento)
+            reagendar_casos_do_evento(caso_evento)
             db.session.commit()
             app.logger.info(f"Novo evento '{novo_evento.titulo}' (ID: {novo_evento.id}) criado para usuário ID {user_id}.")
             return novo_evento, 201
@@ -782,10 +1091,18 @@ def create_app(config_class=Config):
                 data_fim_obj = datetime.fromisoformat(data['data_fim']) if data.get('data_fim') else None
             except ValueError:
                 return {"message": "Formato de data inválido. Utilize ISO 8601."}, 400
+            caso_anterior = evento.caso_evento_associado
+            caso_evento = caso_anterior
+            if 'caso_id' in data:
+                caso_evento, erro_caso = obter_caso_do_evento(data['caso_id'], user_id)
+                if erro_caso:
+                    return erro_caso, 404
+                evento.caso_id = caso_evento.id if caso_evento else None
             evento.titulo = data['titulo']
             evento.data_inicio = data_inicio_obj
             evento.data_fim = data_fim_obj
             evento.descricao = data.get('descricao', evento.descricao)
+            reagendar_casos_do_evento(caso_anterior, caso_evento)
             db.session.commit()
             app.logger.info(f"Evento ID {evento.id} atualizado pelo usuário ID {user_id}.")
             return evento
@@ -796,7 +1113,9 @@ def create_app(config_class=Config):
         def delete(self, evento_id_param):
             user_id = get_jwt_identity()
             evento = EventoAgenda.query.filter_by(id=evento_id_param, user_id=user_id).first_or_404()
+            caso_evento = evento.caso_evento_associado
             db.session.delete(evento)
+            reagendar_casos_do_evento(caso_evento)
             db.session.commit()
             app.logger.info(f"Evento ID {evento.id} ('{evento.titulo}') deletado pelo usuário ID {user_id}.")
             return '', 204
@@ -1079,18 +1398,46 @@ def create_app(config_class=Config):
 
     app.register_blueprint(api_bp)
 
+    # Comandos de linha de comando (ex.: flask cnj-sync --shard 0/4 --loop)
+    app.cli.add_command(cnj_sync_command)
+    app.cli.add_command(cnj_replay_command)
+
     # --- INICIALIZAÇÃO DO APSCHEDULER ---
+    # Cada worker do gunicorn executa create_app e sobe o seu scheduler, mas ele começa pausado:
+    # só o processo eleito líder (ver lideranca_scheduler.py) o retoma e executa os jobs.
+    # Os comandos 'flask ...' (db upgrade, cnj-sync, cnj-replay, ...) não sobem o scheduler nem
+    # disputam a liderança: o Flask marca esses processos com FLASK_RUN_FROM_CLI.
     if app.config.get('CNJ_JOB_ENABLED', False):
-        if not app.config.get('TESTING', False): 
+        if os.environ.get('FLASK_RUN_FROM_CLI') == 'true':
+            app.logger.info("APScheduler não iniciado (comando 'flask').")
+        elif not app.config.get('TESTING', False): 
             scheduler.init_app(app)
             if not app.debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+                eleicao_habilitada = app.config.get('SCHEDULER_LEADER_ELECTION_ENABLED', True)
+                eleicao = None
+                if eleicao_habilitada:
+                    eleicao = EleicaoLider(
+                        app, 'scheduler-cnj',
+                        ao_assumir=scheduler.resume, ao_perder=scheduler.pause,
+                        duracao_lease=app.config.get('SCHEDULER_LEADER_LEASE_SECONDS', 60),
+                        intervalo_heartbeat=app.config.get('SCHEDULER_LEADER_HEARTBEAT_SECONDS', 15)
+                    )
+                    app.extensions['eleicao_lider_scheduler'] = eleicao
                 job_id = 'VerificarProcessosCNJJob'
                 if not scheduler.get_job(job_id):
                     try:
                         interval_hours = app.config.get('CNJ_JOB_INTERVAL_HOURS', 12)
                         interval_minutes = app.config.get('CNJ_JOB_INTERVAL_MINUTES', 0)
+                        def job_verificar_processos_cnj_com_contexto():
+                            # Proteção extra: a liderança pode ter sido perdida depois do disparo do job.
+                            if eleicao is not None and not eleicao.e_lider():
+                                app.logger.info(f"Job '{job_id}' ignorado: este processo não é o líder do scheduler.")
+                                return
+                            # O APScheduler executa o job em outra thread, fora do contexto da app.
+                            with app.app_context():
+                                job_verificar_processos_cnj()
                         scheduler.add_job(
-                            id=job_id, func=job_verificar_processos_cnj, trigger='interval', 
+                            id=job_id, func=job_verificar_processos_cnj_com_contexto, trigger='interval', 
                             hours=interval_hours, minutes=interval_minutes, replace_existing=True
                         )
                         app.logger.info(f"Job '{job_id}' agendado: {interval_hours}h{interval_minutes}m.")
@@ -1098,12 +1445,14 @@ def create_app(config_class=Config):
                         app.logger.error(f"Falha ao adicionar job '{job_id}': {str(e_add_job)}")
                 if not scheduler.running:
                     try:
-                        scheduler.start(paused=False)
-                        app.logger.info("APScheduler iniciado com sucesso.")
+                        scheduler.start(paused=eleicao_habilitada)
+                        app.logger.info("APScheduler iniciado com sucesso." + (" Aguardando eleição de líder." if eleicao_habilitada else ""))
                     except Exception as e_start_scheduler:
                         app.logger.error(f"Falha ao iniciar APScheduler: {str(e_start_scheduler)}")
                 else:
                     app.logger.info("APScheduler já está em execução.")
+                if eleicao is not None:
+                    eleicao.iniciar()
             else:
                 app.logger.info("APScheduler não iniciado (Werkzeug reloader ou debug).")
         else:
@@ -0,0 +1,29 @@
+# ==============================================================================
+# ARQUIVO: gestao_advocacia/benchmarks/banco_benchmark.py
+# Banco de dados dos benchmarks: BENCH_DATABASE_URL ou, sem ela, um SQLite em
+# diretório temporário. Nunca DATABASE_URL, que é o banco da aplicação (o
+# config.py a carrega do .env): os benchmarks apagam as tabelas ao terminar,
+# por isso também se recusam a rodar em um banco que já tenha tabelas.
+#
+# Uso (a partir de gestao_advocacia/):
+#     BENCH_DATABASE_URL=postgresql://.../bench_vazio python benchmarks/bench_insert_movimentacoes.py
+# ==============================================================================
+import os
+
+from sqlalchemy import inspect
+
+
+def uri_banco_benchmark(diretorio_tmp):
+    """URI do banco do benchmark: BENCH_DATABASE_URL ou um SQLite novo em 'diretorio_tmp'."""
+    return os.environ.get('BENCH_DATABASE_URL') or 'sqlite:///' + os.path.join(diretorio_tmp, 'bench.db')
+
+
+def criar_tabelas_em_banco_vazio(db):
+    """Cria as tabelas da aplicação no banco do benchmark; recusa (RuntimeError) um banco que já tenha tabelas."""
+    tabelas = inspect(db.engine).get_table_names()
+    if tabelas:
+        raise RuntimeError(
+            f"O banco do benchmark ({db.engine.url.render_as_string(hide_password=True)}) já tem "
+            f"{len(tabelas)} tabela(s) ({', '.join(sorted(tabelas)[:5])}). Aponte BENCH_DATABASE_URL para um banco vazio."
+        )
+    db.create_all()
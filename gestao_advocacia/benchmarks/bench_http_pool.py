@@ -0,0 +1,88 @@
+# ==============================================================================
+# ARQUIVO: gestao_advocacia/benchmarks/bench_http_pool.py
+# Benchmark: requisições/segundo ao DataJud com requests.post avulso (comportamento
+# antigo, uma conexão nova por consulta) versus a sessão HTTP com pool persistente
+# do cnj_service, ambos contra um servidor stub local.
+#
+# Uso (a partir de gestao_advocacia/):
+#     python benchmarks/bench_http_pool.py --requisicoes 2000
+# ==============================================================================
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import requests
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from flask import Flask  # noqa: E402
+import cnj_service  # noqa: E402
+
+NUMERO_PROCESSO = '0000001-02.2023.8.19.0001'
+RESPOSTA_STUB = json.dumps({"hits": {"hits": [{"_source": {"numeroProcesso": "00000010220238190001", "movimentos": []}}]}}).encode()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True # Evita o atraso de ~40 ms (Nagle + ACK atrasado) em conexões keep-alive
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(RESPOSTA_STUB)))
+        self.end_headers()
+        self.wfile.write(RESPOSTA_STUB)
+
+    def log_message(self, *args):
+        pass
+
+
+def medir(funcao, requisicoes):
+    inicio = time.perf_counter()
+    for _ in range(requisicoes):
+        funcao()
+    return requisicoes / (time.perf_counter() - inicio)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requisicoes', type=int, default=2000)
+    args = parser.parse_args()
+
+    servidor = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    url_base = f'http://127.0.0.1:{servidor.server_address[1]}'
+
+    app = Flask('bench_http_pool')
+    app.config.update(CNJ_API_KEY='chave-benchmark', CNJ_API_BASE_URL=url_base)
+    app.logger.disabled = True
+
+    headers = {"Authorization": "APIKey chave-benchmark", "Content-Type": "application/json"}
+    payload = {"query": {"match": {"numeroProcesso": "00000010220238190001"}}, "size": 1}
+
+    def sem_pool():
+        resposta = requests.post(f'{url_base}/api_publica_tjrj/_search', headers=headers, json=payload, timeout=30)
+        resposta.raise_for_status()
+        resposta.json()
+
+    def com_pool():
+        _, status = cnj_service.consultar_processo_cnj(NUMERO_PROCESSO)
+        assert status == 200
+
+    with app.app_context():
+        medir(com_pool, 20)  # aquecimento
+        rps_sem_pool = medir(sem_pool, args.requisicoes)
+        rps_com_pool = medir(com_pool, args.requisicoes)
+
+    servidor.shutdown()
+    print(f"requests.post avulso : {rps_sem_pool:8.1f} req/s")
+    print(f"sessão com pool      : {rps_com_pool:8.1f} req/s")
+    print(f"ganho                : {rps_com_pool / rps_sem_pool:8.2f}x")
+
+
+if __name__ == '__main__':
+    main()
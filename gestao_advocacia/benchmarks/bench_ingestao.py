@@ -0,0 +1,145 @@
+# ==============================================================================
+# ARQUIVO: gestao_advocacia/benchmarks/bench_ingestao.py
+# Suíte pytest-benchmark do módulo de ingestão (cnj_ingestao.py), com payloads
+# sintéticos de 10, 1.000 e 20.000 movimentos. O nome bench_*.py a mantém fora
+# da coleta padrão do pytest; ela só roda quando o arquivo é passado explicitamente.
+#
+# Uso (a partir de gestao_advocacia/):
+#     python -m pytest benchmarks/bench_ingestao.py --benchmark-only -p no:cacheprovider
+#     BENCH_DATABASE_URL=postgresql://... python -m pytest benchmarks/bench_ingestao.py --benchmark-only
+# ==============================================================================
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from app import create_app, db as _db, User, Cliente, Caso, ProcessoCNJ, MovimentacaoCNJ  # noqa: E402
+import cnj_ingestao  # noqa: E402
+from banco_benchmark import uri_banco_benchmark, criar_tabelas_em_banco_vazio  # noqa: E402
+
+TAMANHOS = [10, 1000, 20000]
+
+
+def gerar_payload(quantidade):
+    """Resposta sintética do DataJud com 'quantidade' movimentos em ordem crescente (como o DataJud devolve)."""
+    inicio = datetime(2010, 1, 1, tzinfo=timezone.utc)
+    movimentos = []
+    for i in range(quantidade):
+        movimentos.append({
+            "codigo": 1000 + (i % 80),
+            "nome": f"Movimento {i % 80}",
+            "dataHora": (inicio + timedelta(hours=i)).strftime('%Y-%m-%dT%H:%M:%S.000Z'),
+            "movimentoNacional": {"descricao": f"Movimento {i % 80}"},
+            "complementosTabelados": [{"codigo": 3, "valor": i % 7, "nome": "tipo", "descricao": "complemento"}],
+            "complementos": [{"descricao": "complemento"}],
+        })
+    return {"hits": {"hits": [{"_source": {"numeroProcesso": "00000010220238190001", "movimentos": movimentos}}]}}
+
+
+@pytest.fixture(scope='module')
+def app_benchmark():
+    diretorio_tmp = tempfile.mkdtemp()
+
+    class ConfigBenchmark:
+        SQLALCHEMY_DATABASE_URI = uri_banco_benchmark(diretorio_tmp)
+        SQLALCHEMY_TRACK_MODIFICATIONS = False
+        CNJ_JOB_ENABLED = False
+        LOG_LEVEL = 'WARNING'
+
+    app = create_app(ConfigBenchmark)
+    with app.app_context():
+        criar_tabelas_em_banco_vazio(_db)
+        yield app
+        _db.session.remove()
+        _db.drop_all()
+
+
+@pytest.fixture()
+def caso(app_benchmark):
+    user = User(username='bench', email='bench@exemplo.com', password_hash='x')
+    _db.session.add(user)
+    _db.session.flush()
+    cliente = Cliente(nome='Cliente benchmark', user_id=user.id)
+    _db.session.add(cliente)
+    _db.session.flush()
+    caso = Caso(nome_caso='Caso benchmark', numero_processo='0000001-02.2023.8.19.0001', cliente_id=cliente.id, user_id=user.id)
+    _db.session.add(caso)
+    _db.session.commit()
+    yield caso
+    _db.session.rollback()
+    MovimentacaoCNJ.query.delete()
+    Caso.query.delete()
+    ProcessoCNJ.query.delete()
+    Cliente.query.delete()
+    User.query.delete()
+    _db.session.commit()
+
+
+def _limpar_movimentacoes(caso):
+    if caso.processo_cnj is not None:
+        MovimentacaoCNJ.query.filter_by(processo_cnj_id=caso.processo_cnj_id).delete()
+        caso.processo_cnj.hash_payload_cnj = None
+    _db.session.commit()
+
+
+@pytest.mark.parametrize('quantidade', TAMANHOS)
+def test_analise_primeira_sincronizacao(benchmark, quantidade):
+    """Etapa pura, sem movimentações registradas: todos os movimentos são candidatos."""
+    _, movimentos = cnj_ingestao.extrair_movimentos(gerar_payload(quantidade))
+    candidatos, _ = benchmark(cnj_ingestao.analisar_movimentos, 1, movimentos, None)
+    assert len(candidatos) == quantidade
+
+
+@pytest.mark.parametrize('quantidade', TAMANHOS)
+def test_analise_payload_sem_novidades(benchmark, quantidade):
+    """Etapa pura com o último movimento já registrado: a análise para logo no início."""
+    _, movimentos = cnj_ingestao.extrair_movimentos(gerar_payload(quantidade))
+    data_limite = datetime.fromisoformat(movimentos[-1]['dataHora'].replace('Z', '+00:00'))
+    candidatos, _ = benchmark(cnj_ingestao.analisar_movimentos, 1, movimentos, data_limite)
+    assert len(candidatos) == 1
+
+
+@pytest.mark.parametrize('quantidade', TAMANHOS)
+def test_ingestao_completa_primeira_sincronizacao(benchmark, caso, quantidade):
+    """Análise + persistência em lote de um caso sem movimentações registradas."""
+    dados = gerar_payload(quantidade)
+
+    def ingerir():
+        resultado = cnj_ingestao.ingerir_resposta_cnj(caso, dados)
+        _db.session.commit()
+        return resultado
+
+    resultado = benchmark.pedantic(ingerir, setup=lambda: _limpar_movimentacoes(caso), rounds=5, iterations=1)
+    assert resultado['novas_movimentacoes'] == quantidade
+
+
+@pytest.mark.parametrize('quantidade', TAMANHOS)
+def test_ingestao_completa_payload_sem_novidades(benchmark, caso, quantidade):
+    """Análise + diff de um payload já inteiramente registrado, sem o cache de payload."""
+    dados = gerar_payload(quantidade)
+    cnj_ingestao.ingerir_resposta_cnj(caso, dados)
+    _db.session.commit()
+
+    def ingerir():
+        caso.processo_cnj.hash_payload_cnj = None
+        resultado = cnj_ingestao.ingerir_resposta_cnj(caso, dados)
+        _db.session.commit()
+        return resultado
+
+    resultado = benchmark(ingerir)
+    assert resultado['novas_movimentacoes'] == 0
+
+
+@pytest.mark.parametrize('quantidade', TAMANHOS)
+def test_ingestao_payload_identico_ao_anterior(benchmark, caso, quantidade):
+    """Resposta idêntica à da última sincronização: só a impressão digital do _source é calculada."""
+    dados = gerar_payload(quantidade)
+    dados['hits']['hits'][0]['_source']['dataHoraUltimaAtualizacao'] = '2024-01-10T12:00:00.000Z'
+    cnj_ingestao.ingerir_resposta_cnj(caso, dados)
+    _db.session.commit()
+
+    resultado = benchmark(cnj_ingestao.ingerir_resposta_cnj, caso, dados)
+    assert resultado['payload_inalterado'] is True
@@ -0,0 +1,92 @@
+# ==============================================================================
+# ARQUIVO: gestao_advocacia/benchmarks/bench_insert_movimentacoes.py
+# Micro-benchmark: inserção de movimentações CNJ pelo caminho antigo (um
+# db.session.add por objeto ORM) versus o caminho em lote
+# (cnj_ingestao.inserir_movimentacoes_em_lote).
+#
+# Uso (a partir de gestao_advocacia/):
+#     python benchmarks/bench_insert_movimentacoes.py --quantidade 10000
+#     BENCH_DATABASE_URL=postgresql://... python benchmarks/bench_insert_movimentacoes.py
+# O banco precisa estar vazio (ver banco_benchmark.py); sem BENCH_DATABASE_URL, usa SQLite temporário.
+# ==============================================================================
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from app import create_app, db, ProcessoCNJ, MovimentacaoCNJ, PayloadCNJ  # noqa: E402
+from cnj_ingestao import inserir_movimentacoes_em_lote  # noqa: E402
+from cnj_service import calcular_hash_movimentacao  # noqa: E402
+from cnj_payload_bruto import comprimir_payload  # noqa: E402
+from banco_benchmark import uri_banco_benchmark, criar_tabelas_em_banco_vazio  # noqa: E402
+
+
+def gerar_linhas(processo_id, quantidade):
+    inicio = datetime(2015, 1, 1, tzinfo=timezone.utc)
+    linhas = []
+    for i in range(quantidade):
+        data_hora = inicio + timedelta(hours=i)
+        movimento = {
+            "codigo": 1000 + (i % 50), "nome": f"Movimento {i}", "dataHora": data_hora.isoformat(),
+            "complementosTabelados": [{"codigo": 3, "valor": i, "nome": "tipo", "descricao": "complemento sintético"}],
+        }
+        linhas.append({
+            'processo_cnj_id': processo_id, 'data_movimentacao': data_hora, 'descricao': f"Movimento {i} | complemento sintético",
+            'dados_integra_cnj': movimento, 'hash_movimentacao': calcular_hash_movimentacao(processo_id, movimento),
+        })
+    return linhas
+
+
+def criar_processo(numero_digitos):
+    processo = ProcessoCNJ(numero_processo_digits=numero_digitos)
+    db.session.add(processo)
+    db.session.commit()
+    return processo.id
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--quantidade', type=int, default=10000)
+    args = parser.parse_args()
+
+    diretorio_tmp = tempfile.mkdtemp()
+
+    class ConfigBenchmark:
+        SQLALCHEMY_DATABASE_URI = uri_banco_benchmark(diretorio_tmp)
+        SQLALCHEMY_TRACK_MODIFICATIONS = False
+        CNJ_JOB_ENABLED = False
+        LOG_LEVEL = 'WARNING'
+
+    app = create_app(ConfigBenchmark)
+    with app.app_context():
+        criar_tabelas_em_banco_vazio(db)
+
+        linhas_orm = gerar_linhas(criar_processo('00000010220238190001'), args.quantidade)
+        inicio = time.perf_counter()
+        for linha in linhas_orm:
+            dados_brutos = linha.pop('dados_integra_cnj')
+            db.session.add(MovimentacaoCNJ(**linha, payload_bruto=PayloadCNJ(**comprimir_payload(dados_brutos))))
+        db.session.commit()
+        tempo_orm = time.perf_counter() - inicio
+
+        linhas_lote = gerar_linhas(criar_processo('00000020320238190001'), args.quantidade)
+        inicio = time.perf_counter()
+        inserir_movimentacoes_em_lote(linhas_lote)
+        db.session.commit()
+        tempo_lote = time.perf_counter() - inicio
+
+        assert MovimentacaoCNJ.query.count() == 2 * args.quantidade
+        dialeto = db.engine.dialect.name
+        db.drop_all()
+
+    print(f"{args.quantidade} movimentações ({dialeto})")
+    print(f"db.session.add por objeto : {tempo_orm:7.3f} s ({args.quantidade / tempo_orm:9.0f} linhas/s)")
+    print(f"INSERT em lote            : {tempo_lote:7.3f} s ({args.quantidade / tempo_lote:9.0f} linhas/s)")
+    print(f"ganho                     : {tempo_orm / tempo_lote:7.2f}x")
+
+
+if __name__ == '__main__':
+    main()
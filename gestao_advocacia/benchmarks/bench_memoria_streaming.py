@@ -0,0 +1,134 @@
+# ==============================================================================
+# ARQUIVO: gestao_advocacia/benchmarks/bench_memoria_streaming.py
+# Benchmark de memória: ingestão de uma resposta sintética do DataJud de ~50 MB
+# (um processo com dezenas de milhares de movimentos) decodificada inteira
+# (json.load + ingerir_resposta_processo) versus lida em streaming
+# (RespostaEmStreaming + ingerir_resposta_em_streaming).
+#
+# Cada modo roda em um subprocesso próprio, para que o pico de RSS (ru_maxrss)
+# de um não contamine o do outro; é relatado o acréscimo sobre o RSS da aplicação
+# já carregada.
+#
+# Uso (a partir de gestao_advocacia/):
+#     python benchmarks/bench_memoria_streaming.py --megabytes 50
+# O banco é BENCH_DATABASE_URL, que precisa estar vazio, ou um SQLite temporário (ver banco_benchmark.py).
+# ==============================================================================
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+NUMERO_PROCESSO = '0000001-02.2023.8.19.0001'
+MODOS = ['completo', 'streaming']
+
+
+def pico_rss_mb():
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return pico / (1024 * 1024) if sys.platform == 'darwin' else pico / 1024
+
+
+def gerar_resposta(caminho, megabytes):
+    """Grava, sem montá-la em memória, uma resposta _search com um processo de ~'megabytes' MB. Retorna a quantidade de movimentos."""
+    inicio = datetime(2000, 1, 1, tzinfo=timezone.utc)
+    limite = megabytes * 1024 * 1024
+    quantidade = 0
+    with open(caminho, 'w', encoding='utf-8') as arquivo:
+        arquivo.write('{"took": 12, "hits": {"total": {"value": 1}, "hits": [{"_index": "api_publica_tjrj", "_source": {')
+        arquivo.write(f'"numeroProcesso": "{NUMERO_PROCESSO.replace("-", "").replace(".", "")}", "dataHoraUltimaAtualizacao": "2024-06-01T00:00:00.000Z", "movimentos": [')
+        while arquivo.tell() < limite:
+            movimento = {
+                "codigo": 1000 + quantidade % 80,
+                "nome": f"Movimento {quantidade % 80}",
+                "dataHora": (inicio + timedelta(hours=quantidade)).strftime('%Y-%m-%dT%H:%M:%S.000Z'),
+                "movimentoNacional": {"descricao": f"Movimento {quantidade % 80}"},
+                "complementosTabelados": [{"codigo": 3, "valor": quantidade % 7, "nome": "tipo", "descricao": "complemento do movimento processual"}],
+                "complementos": [{"descricao": "complemento"}],
+                "orgaoJulgador": {"codigoOrgao": 1234, "nomeOrgao": "1ª Vara Cível da Comarca da Capital"},
+            }
+            arquivo.write((',' if quantidade else '') + json.dumps(movimento, ensure_ascii=False))
+            quantidade += 1
+        arquivo.write(']}}]}}')
+    return quantidade
+
+
+def executar_modo(modo, caminho):
+    """Executado no subprocesso: ingere a resposta em um banco novo e imprime as medições em JSON."""
+    from app import create_app, db, User, Cliente, Caso
+    from banco_benchmark import uri_banco_benchmark, criar_tabelas_em_banco_vazio
+    from cnj_streaming import RespostaEmStreaming
+    import cnj_ingestao
+
+    diretorio_tmp = tempfile.mkdtemp()
+
+    class ConfigBenchmark:
+        SQLALCHEMY_DATABASE_URI = uri_banco_benchmark(diretorio_tmp)
+        SQLALCHEMY_TRACK_MODIFICATIONS = False
+        CNJ_JOB_ENABLED = False
+        LOG_LEVEL = 'WARNING'
+
+    app = create_app(ConfigBenchmark)
+    with app.app_context():
+        criar_tabelas_em_banco_vazio(db)
+        user = User(username='bench', email='bench@exemplo.com', password_hash='x')
+        db.session.add(user)
+        db.session.flush()
+        cliente = Cliente(nome='Cliente benchmark', user_id=user.id)
+        db.session.add(cliente)
+        db.session.flush()
+        caso = Caso(nome_caso='Caso benchmark', numero_processo=NUMERO_PROCESSO, cliente_id=cliente.id, user_id=user.id)
+        db.session.add(caso)
+        db.session.commit()
+
+        rss_base = pico_rss_mb()
+        inicio = time.perf_counter()
+        if modo == 'streaming':
+            resultado = cnj_ingestao.ingerir_resposta_em_streaming(caso.numero_processo_digits, RespostaEmStreaming(open(caminho, 'rb')))
+        else:
+            with open(caminho, 'rb') as arquivo:
+                dados = json.load(arquivo)
+            resultado = cnj_ingestao.ingerir_resposta_processo(caso.numero_processo_digits, dados)
+            del dados
+        db.session.commit()
+        duracao = time.perf_counter() - inicio
+        novas = resultado['novas_movimentacoes']
+        db.session.remove()
+        db.drop_all()
+
+    print(json.dumps({'modo': modo, 'segundos': round(duracao, 2), 'novas': novas,
+                      'rss_base_mb': round(rss_base, 1), 'pico_rss_mb': round(pico_rss_mb(), 1)}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Memória da ingestão de uma resposta grande: completa x streaming.')
+    parser.add_argument('--megabytes', type=int, default=50)
+    parser.add_argument('--modo', choices=MODOS, help=argparse.SUPPRESS) # Uso interno (subprocesso)
+    parser.add_argument('--arquivo', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.modo:
+        executar_modo(args.modo, args.arquivo)
+        return
+
+    with tempfile.TemporaryDirectory() as diretorio:
+        caminho = os.path.join(diretorio, 'resposta.json')
+        quantidade = gerar_resposta(caminho, args.megabytes)
+        tamanho_mb = os.path.getsize(caminho) / (1024 * 1024)
+        print(f"Resposta sintética: {tamanho_mb:.1f} MB, {quantidade} movimentos")
+        print(f"{'modo':<10} {'segundos':>9} {'novas':>8} {'RSS base MB':>12} {'pico RSS MB':>12} {'acréscimo MB':>13}")
+        for modo in MODOS:
+            saida = subprocess.run([sys.executable, os.path.abspath(__file__), '--modo', modo, '--arquivo', caminho],
+                                   check=True, capture_output=True, text=True).stdout
+            medicao = json.loads(saida.strip().splitlines()[-1])
+            acrescimo = medicao['pico_rss_mb'] - medicao['rss_base_mb']
+            print(f"{modo:<10} {medicao['segundos']:>9} {medicao['novas']:>8} {medicao['rss_base_mb']:>12} {medicao['pico_rss_mb']:>12} {acrescimo:>13.1f}")
+
+
+if __name__ == '__main__':
+    main()
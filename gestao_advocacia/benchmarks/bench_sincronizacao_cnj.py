@@ -0,0 +1,272 @@
+# ==============================================================================
+# ARQUIVO: gestao_advocacia/benchmarks/bench_sincronizacao_cnj.py
+# Benchmark ponta a ponta da sincronização CNJ contra o DataJud falso
+# (datajud_falso.py, em um processo separado):
+#   - job agendado: job_verificar_processos_cnj sobre N casos, em várias rodadas
+#     (a primeira ingere os históricos; as seguintes só as novidades);
+#   - API: POST /api/casos/<id>/atualizar-cnj para M casos, acompanhando os jobs.
+# Relata casos/minuto, latência p50/p95 das consultas ao DataJud (e dos jobs da
+# API) e o pico de memória (RSS) do processo sincronizador. Com --min-casos-por-minuto,
+# --max-p95-ms e --max-rss-mb o script sai com código 1 se algum limite for violado,
+# para barrar regressões de desempenho antes do deploy.
+#
+# Uso (a partir de gestao_advocacia/):
+#     python benchmarks/bench_sincronizacao_cnj.py --casos 2000 --latencia-ms 50 --jitter-ms 30
+#     python benchmarks/bench_sincronizacao_cnj.py --taxa-429 0.02 --taxa-erro 0.01 --json
+#     BENCH_DATABASE_URL=postgresql://... python benchmarks/bench_sincronizacao_cnj.py --max-p95-ms 300
+# O banco precisa estar vazio (ver banco_benchmark.py); sem BENCH_DATABASE_URL, usa SQLite temporário.
+# ==============================================================================
+import argparse
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+import requests
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from flask_jwt_extended import create_access_token  # noqa: E402
+from config import Config  # noqa: E402
+from app import create_app, db, User, Cliente, Caso, CnjJob  # noqa: E402
+from cnj_service import calcular_digitos_verificadores  # noqa: E402
+import cnj_service  # noqa: E402
+import cnj_cache_negativo  # noqa: E402
+import tasks  # noqa: E402
+import datajud_falso  # noqa: E402
+from banco_benchmark import uri_banco_benchmark, criar_tabelas_em_banco_vazio  # noqa: E402
+
+# (J, TR) dos tribunais usados nos números sintéticos: estaduais, trabalho e federal
+TRIBUNAIS = [('8', '26'), ('8', '19'), ('8', '13'), ('5', '02'), ('4', '03')]
+
+
+def pico_rss_mb():
+    """Pico de memória residente deste processo (ru_maxrss: KB no Linux, bytes no macOS)."""
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return pico / (1024 * 1024) if sys.platform == 'darwin' else pico / 1024
+
+
+def percentil(valores, p):
+    """Percentil pelo método do posto mais próximo (None se não houver valores)."""
+    if not valores:
+        return None
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, max(0, int(round(p / 100 * len(ordenados) + 0.5)) - 1))]
+
+
+def numero_sintetico(indice):
+    """Número CNJ formatado, com DD válido, distribuído entre os TRIBUNAIS."""
+    justica, tribunal = TRIBUNAIS[indice % len(TRIBUNAIS)]
+    sequencial = f'{indice + 1:07d}'
+    dd = calcular_digitos_verificadores(f'{sequencial}2023{justica}{tribunal}0001')
+    return f'{sequencial}-{dd}.2023.{justica}.{tribunal}.0001'
+
+
+@contextmanager
+def latencias_datajud():
+    """Cronometra cada _search enviado pelo cnj_service (job e API), ignorando os barrados pelo disjuntor."""
+    original = cnj_service._executar_busca_datajud
+    latencias = []
+
+    def busca_cronometrada(*args, **kwargs):
+        inicio = time.perf_counter()
+        dados, status = original(*args, **kwargs)
+        if not (isinstance(dados, dict) and dados.get('circuito_aberto')):
+            latencias.append(time.perf_counter() - inicio)
+        return dados, status
+
+    cnj_service._executar_busca_datajud = busca_cronometrada
+    try:
+        yield latencias
+    finally:
+        cnj_service._executar_busca_datajud = original
+
+
+def criar_aplicacao(args, url_datajud, diretorio_tmp):
+    class ConfigBenchmark(Config):
+        SQLALCHEMY_DATABASE_URI = uri_banco_benchmark(diretorio_tmp)
+        CNJ_JOB_ENABLED = False # Sem scheduler; o job é habilitado e chamado diretamente abaixo
+        LOG_LEVEL = 'CRITICAL'
+        CNJ_API_KEY = 'chave-benchmark'
+        CNJ_API_BASE_URL = url_datajud
+        CNJ_JOB_MAX_CASES_PER_RUN = args.casos
+        CNJ_JOB_MAX_WORKERS = args.workers
+        CNJ_JOB_BATCH_SIZE = args.lote
+        CNJ_JOB_RATE_PER_ALIAS = args.taxa_por_tribunal
+        CNJ_JOB_BURST_PER_ALIAS = max(1, args.workers)
+        CNJ_HTTP_POOL_MAXSIZE = max(4, args.workers, args.workers_api)
+        CNJ_ASYNC_MAX_WORKERS = args.workers_api
+        CNJ_CIRCUITO_ESPERA_INICIAL_SEGUNDOS = args.retry_after
+        CNJ_STREAMING_ENABLED = args.streaming
+
+    app = create_app(ConfigBenchmark)
+    app.config['CNJ_JOB_ENABLED'] = True
+    return app
+
+
+def popular_casos(args):
+    user = User(username='bench', email='bench@exemplo.com', password_hash='x')
+    db.session.add(user)
+    db.session.flush()
+    cliente = Cliente(nome='Cliente benchmark', user_id=user.id)
+    db.session.add(cliente)
+    db.session.flush()
+    for i in range(args.casos):
+        db.session.add(Caso(nome_caso=f'Caso {i}', numero_processo=numero_sintetico(i // args.casos_por_processo),
+                            cliente_id=cliente.id, user_id=user.id))
+    db.session.commit()
+    return user.id
+
+
+def tornar_todos_elegiveis():
+    db.session.execute(db.update(Caso).values(proxima_verificacao_cnj=None))
+    db.session.commit()
+
+
+def medir_job(args):
+    """Rodadas de job_verificar_processos_cnj; retorna uma lista de medições por rodada."""
+    rodadas = []
+    for rodada in range(1, args.rodadas + 1):
+        tornar_todos_elegiveis()
+        cnj_service.reiniciar_disjuntores()
+        evitadas_antes = cnj_cache_negativo.obter_estatisticas_cache_negativo()['consultas_evitadas']
+        with latencias_datajud() as latencias:
+            inicio = time.perf_counter()
+            casos_verificados = tasks.job_verificar_processos_cnj()
+            duracao = time.perf_counter() - inicio
+        rodadas.append({
+            'cenario': f'job (rodada {rodada})',
+            'casos': casos_verificados,
+            'segundos': round(duracao, 3),
+            'casos_por_minuto': round(casos_verificados / duracao * 60, 1) if duracao else None,
+            'consultas_datajud': len(latencias),
+            'consultas_evitadas': cnj_cache_negativo.obter_estatisticas_cache_negativo()['consultas_evitadas'] - evitadas_antes,
+            'p50_ms': _ms(percentil(latencias, 50)),
+            'p95_ms': _ms(percentil(latencias, 95)),
+            'pico_rss_mb': round(pico_rss_mb(), 1),
+        })
+    return rodadas
+
+
+def medir_api(app, args, user_id):
+    """POST atualizar-cnj para os primeiros casos e acompanhamento dos jobs até o fim."""
+    tornar_todos_elegiveis()
+    cnj_service.reiniciar_disjuntores()
+    with app.test_request_context():
+        headers = {'Authorization': f'Bearer {create_access_token(identity=str(user_id))}'}
+    caso_ids = [caso_id for (caso_id,) in db.session.execute(db.select(Caso.id).order_by(Caso.id).limit(args.casos_api))]
+    client = app.test_client()
+
+    with latencias_datajud() as latencias:
+        inicio = time.perf_counter()
+        job_ids = set()
+        for caso_id in caso_ids:
+            resposta = client.post(f'/api/casos/{caso_id}/atualizar-cnj', headers=headers)
+            if resposta.status_code == 202:
+                job_ids.add(resposta.get_json()['job_id'])
+        pendentes = set(job_ids)
+        limite = time.monotonic() + args.timeout_api
+        while pendentes and time.monotonic() < limite:
+            for job_id in list(pendentes):
+                if client.get(f'/api/cnj-jobs/{job_id}', headers=headers).get_json()['status'] in ('concluido', 'erro'):
+                    pendentes.discard(job_id)
+            time.sleep(0.05)
+        duracao = time.perf_counter() - inicio
+
+    db.session.expire_all()
+    jobs = CnjJob.query.filter(CnjJob.id.in_(job_ids), CnjJob.concluido_em.isnot(None)).all()
+    latencias_jobs = [(job.concluido_em - job.criado_em).total_seconds() for job in jobs]
+    casos_concluidos = sum(1 for job in jobs if job.status == 'concluido')
+    return {
+        'cenario': 'api atualizar-cnj',
+        'casos': casos_concluidos,
+        'jobs_com_erro': sum(1 for job in jobs if job.status == 'erro'),
+        'jobs_sem_conclusao': len(pendentes),
+        'segundos': round(duracao, 3),
+        'casos_por_minuto': round(casos_concluidos / duracao * 60, 1) if duracao else None,
+        'consultas_datajud': len(latencias),
+        'p50_ms': _ms(percentil(latencias, 50)),
+        'p95_ms': _ms(percentil(latencias, 95)),
+        'job_p50_ms': _ms(percentil(latencias_jobs, 50)),
+        'job_p95_ms': _ms(percentil(latencias_jobs, 95)),
+        'pico_rss_mb': round(pico_rss_mb(), 1),
+    }
+
+
+def _ms(segundos):
+    return round(segundos * 1000, 1) if segundos is not None else None
+
+
+def verificar_limites(args, medicoes):
+    """Mensagens das medições que violam os limites pedidos na linha de comando."""
+    violacoes = []
+    for medicao in medicoes:
+        cenario = medicao['cenario']
+        if args.min_casos_por_minuto is not None and (medicao['casos_por_minuto'] or 0) < args.min_casos_por_minuto:
+            violacoes.append(f"{cenario}: {medicao['casos_por_minuto']} casos/min < {args.min_casos_por_minuto}")
+        if args.max_p95_ms is not None and medicao['p95_ms'] is not None and medicao['p95_ms'] > args.max_p95_ms:
+            violacoes.append(f"{cenario}: p95 {medicao['p95_ms']} ms > {args.max_p95_ms} ms")
+        if args.max_rss_mb is not None and medicao['pico_rss_mb'] > args.max_rss_mb:
+            violacoes.append(f"{cenario}: pico de RSS {medicao['pico_rss_mb']} MB > {args.max_rss_mb} MB")
+    return violacoes
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark ponta a ponta da sincronização CNJ contra o DataJud falso.')
+    parser.add_argument('--casos', type=int, default=1000, help='Casos criados e verificados pelo job.')
+    parser.add_argument('--casos-por-processo', type=int, default=1, help='Casos que compartilham cada número de processo.')
+    parser.add_argument('--rodadas', type=int, default=2, help='Execuções do job (a 1ª ingere os históricos).')
+    parser.add_argument('--casos-api', type=int, default=100, help='Casos atualizados por POST atualizar-cnj (0 desliga o cenário).')
+    parser.add_argument('--workers', type=int, default=4, help='CNJ_JOB_MAX_WORKERS.')
+    parser.add_argument('--workers-api', type=int, default=4, help='CNJ_ASYNC_MAX_WORKERS.')
+    parser.add_argument('--lote', type=int, default=100, help='CNJ_JOB_BATCH_SIZE.')
+    parser.add_argument('--taxa-por-tribunal', type=float, default=1000.0, help='CNJ_JOB_RATE_PER_ALIAS (consultas/s).')
+    parser.add_argument('--streaming', action='store_true', help='Lê as respostas em streaming (CNJ_STREAMING_ENABLED).')
+    parser.add_argument('--timeout-api', type=float, default=600, help='Espera máxima pelos jobs da API (segundos).')
+    parser.add_argument('--min-casos-por-minuto', type=float, default=None)
+    parser.add_argument('--max-p95-ms', type=float, default=None)
+    parser.add_argument('--max-rss-mb', type=float, default=None)
+    parser.add_argument('--json', action='store_true', help='Imprime as medições em JSON.')
+    datajud_falso.adicionar_argumentos(parser)
+    args = parser.parse_args()
+
+    processo_datajud, url_datajud = datajud_falso.iniciar_em_processo(**datajud_falso.opcoes_do_servidor(args))
+    diretorio_tmp = tempfile.mkdtemp()
+    app = criar_aplicacao(args, url_datajud, diretorio_tmp)
+    try:
+        with app.app_context():
+            criar_tabelas_em_banco_vazio(db)
+            user_id = popular_casos(args)
+            medicoes = medir_job(args)
+            if args.casos_api:
+                medicoes.append(medir_api(app, args, user_id))
+            estatisticas_datajud = requests.get(f'{url_datajud}/_estatisticas', timeout=5).json()
+            db.session.remove()
+            db.drop_all()
+    finally:
+        processo_datajud.terminate()
+
+    if args.json:
+        print(json.dumps({'inicio': datetime.utcnow().isoformat(), 'parametros': vars(args),
+                          'medicoes': medicoes, 'datajud_falso': estatisticas_datajud}, indent=2, ensure_ascii=False))
+    else:
+        print(f"{'cenário':<20} {'casos':>7} {'segundos':>9} {'casos/min':>10} {'consultas':>10} {'p50 ms':>8} {'p95 ms':>8} {'RSS MB':>8}")
+        for m in medicoes:
+            print(f"{m['cenario']:<20} {m['casos']:>7} {m['segundos']:>9} {m['casos_por_minuto'] or 0:>10} "
+                  f"{m['consultas_datajud']:>10} {m['p50_ms'] or 0:>8} {m['p95_ms'] or 0:>8} {m['pico_rss_mb']:>8}")
+            if 'job_p95_ms' in m:
+                print(f"{'':<20} jobs da API: p50 {m['job_p50_ms']} ms, p95 {m['job_p95_ms']} ms, "
+                      f"{m['jobs_com_erro']} com erro, {m['jobs_sem_conclusao']} sem conclusão")
+        print(f"DataJud falso: {estatisticas_datajud}")
+
+    violacoes = verificar_limites(args, medicoes)
+    for violacao in violacoes:
+        print(f"LIMITE VIOLADO: {violacao}", file=sys.stderr)
+    sys.exit(1 if violacoes else 0)
+
+
+if __name__ == '__main__':
+    main()
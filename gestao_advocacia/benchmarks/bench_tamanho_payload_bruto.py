@@ -0,0 +1,149 @@
+# ==============================================================================
+# ARQUIVO: gestao_advocacia/benchmarks/bench_tamanho_payload_bruto.py
+# Relatório de tamanho: JSON bruto das movimentações gravado na própria linha
+# (layout antigo, coluna dados_integra_cnj) versus a tabela payload_cnj
+# comprimida e endereçada pelo conteúdo (cnj_payload_bruto).
+#
+# Gera movimentos sintéticos no formato do DataJud; uma fração dos processos é
+# acompanhada por mais de um caso (mesmo JSON gravado para casos diferentes).
+#
+# Uso (a partir de gestao_advocacia/):
+#     python benchmarks/bench_tamanho_payload_bruto.py --casos 200 --movimentos 100
+# ==============================================================================
+import argparse
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from app import create_app, db, ProcessoCNJ, PayloadCNJ  # noqa: E402
+from cnj_ingestao import inserir_movimentacoes_em_lote, montar_descricao_movimento  # noqa: E402
+from cnj_service import calcular_hash_movimentacao  # noqa: E402
+
+MOVIMENTOS_NACIONAIS = [
+    (26, "Distribuição"), (51, "Conclusão"), (11010, "Mero expediente"), (85, "Petição"),
+    (60, "Expedição de documento"), (123, "Remessa"), (132, "Recebimento"), (193, "Juntada"),
+    (970, "Audiência"), (22, "Baixa Definitiva"), (848, "Trânsito em julgado"), (219, "Procedência"),
+]
+ORGAOS = [f"{n}ª VARA CÍVEL DA COMARCA DE {cidade}" for n in range(1, 6) for cidade in ("SÃO PAULO", "NITERÓI", "CAMPINAS", "BELO HORIZONTE")]
+
+
+def gerar_movimentos(semente, quantidade):
+    gerador = random.Random(semente)
+    orgao_codigo = gerador.randint(1000, 99999)
+    orgao = {"codigoMunicipioIBGE": gerador.randint(3100000, 3599999), "codigoOrgao": orgao_codigo, "nome": gerador.choice(ORGAOS)}
+    data_hora = datetime(2015, 1, 1, tzinfo=timezone.utc) + timedelta(days=gerador.randint(0, 900))
+    movimentos = []
+    for _ in range(quantidade):
+        data_hora += timedelta(hours=gerador.randint(1, 400), seconds=gerador.randint(0, 59))
+        codigo, nome = gerador.choice(MOVIMENTOS_NACIONAIS)
+        movimento = {
+            "codigo": codigo, "nome": nome,
+            "dataHora": data_hora.strftime('%Y-%m-%dT%H:%M:%S.000Z'),
+            "orgaoJulgador": orgao,
+        }
+        if gerador.random() < 0.6:
+            movimento["complementosTabelados"] = [{
+                "codigo": gerador.choice((2, 3, 4, 18)), "valor": gerador.randint(1, 80),
+                "nome": gerador.choice(("competência exclusiva", "decisão", "despacho", "outros motivos")),
+                "descricao": gerador.choice(("tipo_de_distribuicao_redistribuicao", "tipo_de_documento", "motivo_da_remessa")),
+            }]
+        movimentos.append(movimento)
+    return movimentos
+
+
+def tamanho_apos_vacuum(caminho):
+    conexao = sqlite3.connect(caminho)
+    conexao.execute('VACUUM')
+    conexao.close()
+    return os.path.getsize(caminho)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--casos', type=int, default=200)
+    parser.add_argument('--movimentos', type=int, default=100, help='Movimentos por processo')
+    parser.add_argument('--fracao-repetidos', type=float, default=0.2,
+                        help='Fração dos casos que acompanham um processo já acompanhado por outro caso')
+    args = parser.parse_args()
+
+    gerador = random.Random(42)
+    sementes = []
+    for i in range(args.casos):
+        sementes.append(gerador.choice(sementes) if sementes and gerador.random() < args.fracao_repetidos else i)
+
+    diretorio_tmp = tempfile.mkdtemp()
+    caminho_antigo = os.path.join(diretorio_tmp, 'antigo.db')
+    caminho_novo = os.path.join(diretorio_tmp, 'novo.db')
+
+    # Layout antigo: JSON na própria linha (serializado como o db.JSON do SQLAlchemy faz: json.dumps padrão).
+    conexao = sqlite3.connect(caminho_antigo)
+    conexao.execute(
+        'CREATE TABLE movimentacao_cnj (id INTEGER PRIMARY KEY, caso_id INTEGER NOT NULL, data_movimentacao DATETIME NOT NULL, '
+        'descricao TEXT NOT NULL, dados_integra_cnj JSON, data_registro_sistema DATETIME, hash_movimentacao VARCHAR(64) NOT NULL)'
+    )
+    conexao.execute('CREATE UNIQUE INDEX ix_movimentacao_cnj_caso_hash ON movimentacao_cnj (caso_id, hash_movimentacao)')
+    conexao.execute('CREATE INDEX ix_movimentacao_cnj_caso_id ON movimentacao_cnj (caso_id)')
+    conexao.execute('CREATE INDEX ix_movimentacao_cnj_data_movimentacao ON movimentacao_cnj (data_movimentacao)')
+    agora = datetime.utcnow().isoformat(' ')
+    for caso_id, semente in enumerate(sementes, start=1):
+        conexao.executemany(
+            'INSERT INTO movimentacao_cnj (caso_id, data_movimentacao, descricao, dados_integra_cnj, data_registro_sistema, hash_movimentacao) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            [(caso_id, m['dataHora'], montar_descricao_movimento(m), json.dumps(m), agora, calcular_hash_movimentacao(caso_id, m))
+             for m in gerar_movimentos(semente, args.movimentos)]
+        )
+    conexao.commit()
+    conexao.close()
+
+    class ConfigBenchmark:
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + caminho_novo
+        SQLALCHEMY_TRACK_MODIFICATIONS = False
+        CNJ_JOB_ENABLED = False
+        LOG_LEVEL = 'WARNING'
+
+    app = create_app(ConfigBenchmark)
+    with app.app_context():
+        db.create_all()
+        lotes = []
+        for indice, semente in enumerate(sementes, start=1):
+            processo = ProcessoCNJ(numero_processo_digits=f'{indice:020d}')
+            db.session.add(processo)
+            db.session.flush()
+            lotes.append([
+                {'processo_cnj_id': processo.id, 'data_movimentacao': datetime.fromisoformat(m['dataHora'].replace('Z', '+00:00')),
+                 'descricao': montar_descricao_movimento(m), 'dados_integra_cnj': m,
+                 'hash_movimentacao': calcular_hash_movimentacao(processo.id, m)}
+                for m in gerar_movimentos(semente, args.movimentos)
+            ])
+        db.session.commit()
+        inicio = time.perf_counter()
+        for linhas in lotes:
+            inserir_movimentacoes_em_lote(linhas)
+        db.session.commit()
+        tempo_insercao = time.perf_counter() - inicio
+        payloads, bytes_comprimidos, bytes_originais = db.session.query(
+            db.func.count(PayloadCNJ.hash), db.func.sum(db.func.length(PayloadCNJ.conteudo)), db.func.sum(PayloadCNJ.tamanho_original)
+        ).one()
+        db.session.remove()
+        db.engine.dispose()
+
+    total_movimentos = args.casos * args.movimentos
+    tamanho_antigo = tamanho_apos_vacuum(caminho_antigo)
+    tamanho_novo = tamanho_apos_vacuum(caminho_novo)
+    print(f"{args.casos} casos x {args.movimentos} movimentos = {total_movimentos} movimentações; {payloads} JSON distintos")
+    print(f"JSON compacto (total distinto)     : {bytes_originais / 1024:10.1f} KiB")
+    print(f"JSON comprimido em payload_cnj     : {bytes_comprimidos / 1024:10.1f} KiB ({bytes_comprimidos / bytes_originais:.0%} do compacto)")
+    print(f"banco - JSON na linha (antigo)     : {tamanho_antigo / 1024:10.1f} KiB")
+    print(f"banco - payload_cnj (novo)         : {tamanho_novo / 1024:10.1f} KiB")
+    print(f"redução                            : {1 - tamanho_novo / tamanho_antigo:10.0%}")
+    print(f"inserção no layout novo            : {tempo_insercao:10.3f} s ({total_movimentos / tempo_insercao:.0f} linhas/s)")
+
+
+if __name__ == '__main__':
+    main()
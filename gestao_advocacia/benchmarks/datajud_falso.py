@@ -0,0 +1,238 @@
+# ==============================================================================
+# ARQUIVO: gestao_advocacia/benchmarks/datajud_falso.py
+# Servidor DataJud falso, local, para benchmarks e testes de carga da
+# sincronização CNJ. Atende POST /<alias>/_search (queries 'match' e 'terms'
+# sobre numeroProcesso, como o cnj_service envia) com:
+#   - latência configurável (fixa + variação aleatória);
+#   - taxa de erros 500 e taxa de respostas 429 com Retry-After;
+#   - históricos sintéticos de movimentações, determinísticos por número de
+#     processo, com tamanho configurável e que podem crescer a cada consulta;
+#   - uma fração de números "não indexados" (consulta sem hits).
+# GET /_estatisticas devolve os contadores de requisições por status.
+#
+# Uso avulso (a partir de gestao_advocacia/), apontando CNJ_API_BASE_URL para ele:
+#     python benchmarks/datajud_falso.py --porta 9200 --latencia-ms 80 --taxa-429 0.01
+#     CNJ_API_BASE_URL=http://127.0.0.1:9200 CNJ_API_KEY=x flask cnj-sync
+# Também é importável: iniciar_em_thread(...) e iniciar_em_processo(...).
+# ==============================================================================
+import argparse
+import json
+import multiprocessing
+import random
+import re
+import threading
+import time
+import zlib
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+ROTA_SEARCH = re.compile(r'^/([\w.-]+)/_search/?$')
+INICIO_HISTORICOS = datetime(2015, 1, 1, tzinfo=timezone.utc)
+
+
+class ServidorDataJudFalso(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, endereco, latencia_ms=0, jitter_ms=0, taxa_erro=0.0, taxa_429=0.0, retry_after=1,
+                 movimentos=50, novos_por_consulta=0, fracao_sem_resultado=0.0, semente=0):
+        super().__init__(endereco, ManipuladorDataJudFalso)
+        self.latencia_ms = latencia_ms
+        self.jitter_ms = jitter_ms
+        self.taxa_erro = taxa_erro
+        self.taxa_429 = taxa_429
+        self.retry_after = retry_after
+        self.movimentos = movimentos
+        self.novos_por_consulta = novos_por_consulta
+        self.fracao_sem_resultado = fracao_sem_resultado
+        self.semente = semente
+        self.estatisticas = Counter()
+        self._consultas_por_numero = Counter()
+        self._sorteio = random.Random(semente)
+        self._lock = threading.Lock()
+
+    @property
+    def url(self):
+        host, porta = self.server_address[:2]
+        return f'http://{host}:{porta}'
+
+    def sortear(self):
+        with self._lock:
+            return self._sorteio.random()
+
+    def registrar(self, chave, quantidade=1):
+        with self._lock:
+            self.estatisticas[chave] += quantidade
+
+    def indexado(self, numero):
+        """Se o número 'existe' no DataJud falso: decisão fixa por número (e semente)."""
+        return (zlib.crc32(f'{self.semente}:{numero}'.encode()) % 10000) / 10000 >= self.fracao_sem_resultado
+
+    def documento_do_processo(self, alias, numero):
+        """_source sintético do processo: o histórico cresce 'novos_por_consulta' movimentos a cada consulta."""
+        with self._lock:
+            consultas = self._consultas_por_numero[numero]
+            self._consultas_por_numero[numero] += 1
+        quantidade = self.movimentos + consultas * self.novos_por_consulta
+        deslocamento = zlib.crc32(numero.encode()) % 1000
+        movimentos = []
+        for i in range(quantidade):
+            codigo = 1000 + (i + deslocamento) % 80
+            movimentos.append({
+                "codigo": codigo,
+                "nome": f"Movimento {codigo}",
+                "dataHora": (INICIO_HISTORICOS + timedelta(days=deslocamento, hours=6 * i)).strftime('%Y-%m-%dT%H:%M:%S.000Z'),
+                "complementosTabelados": [{"codigo": 3, "valor": i % 7, "nome": "tipo", "descricao": "complemento"}],
+            })
+        return {
+            "numeroProcesso": numero,
+            "tribunal": alias.rsplit('_', 1)[-1].upper(),
+            "grau": "G1",
+            "classe": {"codigo": 7, "nome": "Procedimento Comum Cível"},
+            "orgaoJulgador": {"codigo": deslocamento, "nome": f"{deslocamento}ª Vara Cível"},
+            "dataAjuizamento": (INICIO_HISTORICOS + timedelta(days=deslocamento)).strftime('%Y%m%d%H%M%S'),
+            "dataHoraUltimaAtualizacao": movimentos[-1]["dataHora"] if movimentos else None,
+            "movimentos": movimentos,
+        }
+
+
+class ManipuladorDataJudFalso(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True # Evita o atraso de ~40 ms (Nagle + ACK atrasado) em conexões keep-alive
+
+    def do_GET(self):
+        if self.path.rstrip('/') != '/_estatisticas':
+            return self._responder(404, {"error": "rota inexistente"})
+        with self.server._lock:
+            estatisticas = dict(self.server.estatisticas)
+        self._responder(200, estatisticas)
+
+    def do_POST(self):
+        corpo = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        rota = ROTA_SEARCH.match(self.path)
+        if not rota:
+            return self._responder(404, {"error": "rota inexistente"})
+        try:
+            numeros, tamanho = _numeros_da_consulta(json.loads(corpo))
+        except (ValueError, AttributeError, TypeError):
+            self.server.registrar('status_400')
+            return self._responder(400, {"error": {"type": "parsing_exception"}})
+
+        servidor = self.server
+        espera_ms = servidor.latencia_ms + (servidor.sortear() * servidor.jitter_ms if servidor.jitter_ms else 0)
+        if espera_ms > 0:
+            time.sleep(espera_ms / 1000)
+
+        servidor.registrar('requisicoes')
+        sorteio = servidor.sortear()
+        if sorteio < servidor.taxa_429:
+            servidor.registrar('status_429')
+            return self._responder(429, {"error": "too many requests"}, {'Retry-After': str(servidor.retry_after)})
+        if sorteio < servidor.taxa_429 + servidor.taxa_erro:
+            servidor.registrar('status_500')
+            return self._responder(500, {"error": {"type": "internal_server_error"}})
+
+        alias = rota.group(1)
+        inicio = time.perf_counter()
+        hits = [
+            {"_index": alias, "_id": f"{alias}_{numero}", "_source": servidor.documento_do_processo(alias, numero)}
+            for numero in numeros if servidor.indexado(numero)
+        ][:tamanho]
+        servidor.registrar('status_200')
+        servidor.registrar('processos_consultados', len(numeros))
+        servidor.registrar('hits', len(hits))
+        self._responder(200, {
+            "took": int((time.perf_counter() - inicio) * 1000), "timed_out": False,
+            "hits": {"total": {"value": len(hits), "relation": "eq"}, "hits": hits}
+        })
+
+    def _responder(self, status, dados, cabecalhos=None):
+        corpo = json.dumps(dados).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(corpo)))
+        for nome, valor in (cabecalhos or {}).items():
+            self.send_header(nome, valor)
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def log_message(self, *args):
+        pass
+
+
+def _numeros_da_consulta(consulta):
+    """Extrai (números, size) de {"query": {"terms"|"match": {"numeroProcesso": ...}}, "size": n}."""
+    query = consulta['query']
+    if 'terms' in query:
+        numeros = [str(numero) for numero in query['terms']['numeroProcesso']]
+    else:
+        valor = query['match']['numeroProcesso']
+        numeros = [str(valor['query'] if isinstance(valor, dict) else valor)]
+    return numeros, int(consulta.get('size', 10))
+
+
+def iniciar_em_thread(host='127.0.0.1', porta=0, **opcoes):
+    """Sobe o servidor em uma thread daemon deste processo e o retorna (use servidor.url e servidor.shutdown())."""
+    servidor = ServidorDataJudFalso((host, porta), **opcoes)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor
+
+
+def _servir(host, porta, opcoes, fila):
+    servidor = ServidorDataJudFalso((host, porta), **opcoes)
+    fila.put(servidor.url)
+    servidor.serve_forever()
+
+
+def iniciar_em_processo(host='127.0.0.1', porta=0, **opcoes):
+    """
+    Sobe o servidor em um processo separado, para que a CPU e a memória dele não se misturem
+    às medições do processo sincronizador. Retorna (processo, url); encerre com processo.terminate().
+    """
+    fila = multiprocessing.Queue()
+    processo = multiprocessing.Process(target=_servir, args=(host, porta, opcoes, fila), daemon=True)
+    processo.start()
+    return processo, fila.get(timeout=30)
+
+
+def adicionar_argumentos(parser):
+    """Opções do servidor falso, compartilhadas com os benchmarks que o sobem."""
+    parser.add_argument('--latencia-ms', type=float, default=0, help='Latência fixa de cada _search.')
+    parser.add_argument('--jitter-ms', type=float, default=0, help='Variação aleatória somada à latência (0 a N ms).')
+    parser.add_argument('--taxa-erro', type=float, default=0.0, help='Fração das requisições respondidas com 500.')
+    parser.add_argument('--taxa-429', type=float, default=0.0, help='Fração das requisições respondidas com 429.')
+    parser.add_argument('--retry-after', type=int, default=1, help='Valor do Retry-After (segundos) nas respostas 429.')
+    parser.add_argument('--movimentos', type=int, default=50, help='Tamanho do histórico de cada processo na primeira consulta.')
+    parser.add_argument('--novos-por-consulta', type=int, default=0, help='Movimentos acrescentados ao histórico a cada nova consulta.')
+    parser.add_argument('--sem-resultado', type=float, default=0.0, help='Fração dos números sem hits (não indexados).')
+    parser.add_argument('--semente', type=int, default=0)
+
+
+def opcoes_do_servidor(args):
+    return {
+        'latencia_ms': args.latencia_ms, 'jitter_ms': args.jitter_ms, 'taxa_erro': args.taxa_erro,
+        'taxa_429': args.taxa_429, 'retry_after': args.retry_after, 'movimentos': args.movimentos,
+        'novos_por_consulta': args.novos_por_consulta, 'fracao_sem_resultado': args.sem_resultado,
+        'semente': args.semente,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Servidor DataJud falso (POST /<alias>/_search).')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--porta', type=int, default=9200)
+    adicionar_argumentos(parser)
+    args = parser.parse_args()
+
+    servidor = ServidorDataJudFalso((args.host, args.porta), **opcoes_do_servidor(args))
+    print(f"DataJud falso em {servidor.url} (Ctrl+C para encerrar)")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,328 @@
+# ==============================================================================
+# ARQUIVO: gestao_advocacia/cnj_arquivo.py
+# Arquivo das respostas brutas do DataJud (CNJ_ARQUIVO_ENABLED) e o seu
+# reprocessamento ('flask cnj-replay').
+#
+# Cada resposta _search bem-sucedida é acrescentada, como recebida, a um segmento
+# NDJSON comprimido (zstd; gzip se o pacote 'zstandard' não estiver instalado):
+#     CNJ_ARQUIVO_DIR/AAAA/MM/DD/cnj-AAAAMMDDTHHMMSS-<pid>-<aleatório>.ndjson.zst
+# uma linha por resposta:
+#     {"alias": ..., "numeros": [números consultados], "obtido_em": "...Z", "resposta": {...}}
+# O segmento é trocado ao atingir CNJ_ARQUIVO_SEGMENTO_MAX_BYTES (descomprimidos)
+# ou CNJ_ARQUIVO_SEGMENTO_MAX_SEGUNDOS. Cada linha é descarregada em um bloco
+# próprio do compressor, então um processo que morre perde no máximo a linha que
+# estava gravando e o segmento continua legível até ela.
+#
+# Com o arquivo, uma correção na ingestão (descrição dos movimentos, datas) pode
+# ser aplicada às movimentações já gravadas sem consultar o DataJud de novo:
+#     flask cnj-replay --desde 2024-01-01 --processos 8
+# Os segmentos são divididos entre processos (multiprocessing, um app por
+# processo) e cada resposta é lida em streaming, como em cnj_streaming.py.
+# ==============================================================================
+import atexit
+import gzip
+import json
+import multiprocessing
+import os
+import pickle
+import threading
+import time
+import uuid
+import zlib
+from collections import Counter
+from datetime import datetime
+from itertools import chain
+
+from flask import current_app
+
+from cnj_streaming import LeitorJSONIncremental, RespostaEmStreaming, blocos_de_texto, iterar_sources
+
+try:
+    import zstandard
+except ImportError: # Dependência opcional: sem ela os segmentos são gravados em gzip
+    zstandard = None
+
+EXTENSAO_ZSTD = '.ndjson.zst'
+EXTENSAO_GZIP = '.ndjson.gz'
+
+# Erros de leitura de um segmento truncado ou corrompido (processo que morreu no meio da gravação): só
+# descompressão e JSON. Erros de disco ou de permissão (OSError) não são tratados como segmento truncado.
+ERROS_SEGMENTO = (json.JSONDecodeError, UnicodeDecodeError, EOFError, gzip.BadGzipFile, zlib.error) + ((zstandard.ZstdError,) if zstandard else ())
+
+# Gravador do processo, compartilhado por todas as threads (job, endpoints, 'flask cnj-sync').
+_arquivo = None
+_lock_arquivo = threading.Lock()
+
+
+class ArquivoRespostasCNJ:
+    """Grava respostas em segmentos NDJSON comprimidos, trocando de segmento por tamanho ou idade. Thread-safe."""
+
+    def __init__(self, diretorio, compressao='zstd', max_bytes=256 * 1024 * 1024, max_segundos=3600):
+        self.diretorio = diretorio
+        self.compressao = compressao if compressao == 'gzip' or zstandard is not None else 'gzip'
+        self.max_bytes = max_bytes
+        self.max_segundos = max_segundos
+        self.caminho_segmento = None
+        self._lock = threading.Lock()
+        self._bruto = None
+        self._saida = None
+        self._bytes_segmento = 0
+        self._aberto_em = None
+
+    def _abrir_segmento(self, agora):
+        pasta = os.path.join(self.diretorio, agora.strftime('%Y'), agora.strftime('%m'), agora.strftime('%d'))
+        os.makedirs(pasta, exist_ok=True)
+        extensao = EXTENSAO_ZSTD if self.compressao == 'zstd' else EXTENSAO_GZIP
+        nome = f"cnj-{agora.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}-{uuid.uuid4().hex[:8]}{extensao}"
+        self.caminho_segmento = os.path.join(pasta, nome)
+        self._bruto = open(self.caminho_segmento, 'xb')
+        if self.compressao == 'zstd':
+            self._saida = zstandard.ZstdCompressor().stream_writer(self._bruto, closefd=False)
+        else:
+            self._saida = gzip.GzipFile(fileobj=self._bruto, mode='wb')
+        self._bytes_segmento = 0
+        self._aberto_em = time.monotonic()
+
+    def _fechar_segmento(self):
+        if self._saida is None:
+            return
+        try:
+            self._saida.close()
+        finally:
+            self._bruto.close()
+            self._saida = self._bruto = None
+
+    def _descarregar(self):
+        if self.compressao == 'zstd':
+            self._saida.flush(zstandard.FLUSH_BLOCK)
+        else:
+            self._saida.flush() # zlib.Z_SYNC_FLUSH
+        self._bruto.flush()
+
+    def gravar(self, alias, numeros, partes_resposta, obtido_em=None):
+        """
+        Acrescenta uma resposta ao segmento atual. 'partes_resposta' são os bytes (UTF-8) do JSON da
+        resposta, em um ou mais pedaços; quebras de linha fora de strings são removidas.
+        """
+        obtido_em = obtido_em or datetime.utcnow()
+        cabecalho = json.dumps({'alias': alias, 'numeros': list(numeros or []),
+                                'obtido_em': obtido_em.isoformat(timespec='milliseconds') + 'Z'},
+                               ensure_ascii=False, separators=(',', ':'))
+        with self._lock:
+            if self._saida is not None and (self._bytes_segmento >= self.max_bytes
+                                            or time.monotonic() - self._aberto_em >= self.max_segundos):
+                self._fechar_segmento()
+            if self._saida is None:
+                self._abrir_segmento(obtido_em)
+            try:
+                escritos = self._saida.write(cabecalho[:-1].encode('utf-8') + b',"resposta":')
+                for parte in partes_resposta:
+                    # Em JSON válido, \n e \r crus só aparecem como espaço entre valores
+                    escritos += self._saida.write(parte.replace(b'\n', b'').replace(b'\r', b''))
+                escritos += self._saida.write(b'}\n')
+                self._descarregar()
+            except BaseException:
+                # A linha incompleta fica no fim deste segmento; as próximas vão para um novo
+                self._fechar_segmento()
+                raise
+            self._bytes_segmento += escritos
+
+    def fechar(self):
+        with self._lock:
+            self._fechar_segmento()
+
+
+def obter_arquivo_respostas(config=None):
+    """Retorna o gravador do processo, criando-o com a configuração na primeira chamada."""
+    global _arquivo
+    with _lock_arquivo:
+        if _arquivo is None:
+            if config is None:
+                config = current_app.config if current_app else {}
+            compressao = config.get('CNJ_ARQUIVO_COMPRESSAO', 'zstd')
+            if compressao == 'zstd' and zstandard is None and current_app:
+                current_app.logger.warning("ARQUIVO CNJ: pacote 'zstandard' não instalado; os segmentos serão gravados em gzip.")
+            _arquivo = ArquivoRespostasCNJ(
+                config.get('CNJ_ARQUIVO_DIR') or 'arquivo_cnj',
+                compressao=compressao,
+                max_bytes=int(config.get('CNJ_ARQUIVO_SEGMENTO_MAX_BYTES', 256 * 1024 * 1024)),
+                max_segundos=int(config.get('CNJ_ARQUIVO_SEGMENTO_MAX_SEGUNDOS', 3600))
+            )
+        return _arquivo
+
+
+def fechar_arquivo_respostas():
+    """Fecha o segmento atual e descarta o gravador (no fim do processo, em testes ou ao recarregar configurações)."""
+    global _arquivo
+    with _lock_arquivo:
+        if _arquivo is not None:
+            _arquivo.fechar()
+            _arquivo = None
+
+
+atexit.register(fechar_arquivo_respostas)
+
+
+def arquivar_resposta(alias_tribunal, numeros_digitos, dados_resposta, config, logger):
+    """
+    Acrescenta ao arquivo uma resposta bem-sucedida (dict ou RespostaEmStreaming, que volta ao início
+    depois da cópia), se CNJ_ARQUIVO_ENABLED. Falhas são registradas no log e não afetam a consulta.
+    """
+    if not config.get('CNJ_ARQUIVO_ENABLED', False):
+        return
+    try:
+        if isinstance(dados_resposta, RespostaEmStreaming):
+            partes = dados_resposta.blocos_utf8()
+        else:
+            partes = [json.dumps(dados_resposta, ensure_ascii=False, separators=(',', ':')).encode('utf-8')]
+        obter_arquivo_respostas(config).gravar(alias_tribunal, numeros_digitos, partes)
+    except Exception as e:
+        logger.error(f"ARQUIVO CNJ: falha ao arquivar a resposta de '{alias_tribunal}': {e}", exc_info=True)
+
+
+def listar_segmentos(diretorio, ate=None):
+    """Caminhos dos segmentos do arquivo, em ordem de abertura; com 'ate', só os abertos até essa data."""
+    segmentos = []
+    for pasta, _, arquivos in os.walk(diretorio):
+        for nome in arquivos:
+            if not nome.startswith('cnj-') or not nome.endswith((EXTENSAO_ZSTD, EXTENSAO_GZIP)):
+                continue
+            if ate is not None and nome[4:19] > ate.strftime('%Y%m%dT%H%M%S'):
+                continue
+            segmentos.append(os.path.join(pasta, nome))
+    return sorted(segmentos, key=os.path.basename)
+
+
+def abrir_segmento(caminho):
+    """Abre um segmento para leitura (binário, descomprimido)."""
+    if caminho.endswith(EXTENSAO_ZSTD):
+        if zstandard is None:
+            raise RuntimeError(f"O segmento '{caminho}' é zstd, mas o pacote 'zstandard' não está instalado.")
+        return zstandard.ZstdDecompressor().stream_reader(open(caminho, 'rb'), closefd=True)
+    return gzip.open(caminho, 'rb')
+
+
+def ler_registros(arquivo):
+    """
+    Percorre as linhas de um segmento aberto e gera, para cada uma, (cabeçalho, sources): o dict com
+    'alias', 'numeros' e 'obtido_em' (datetime UTC sem fuso) e um gerador de cnj_streaming.SourceEmStreaming
+    da resposta. O que não for lido de 'sources' é descartado antes da próxima linha.
+    """
+    leitor = LeitorJSONIncremental(blocos_de_texto(arquivo))
+    while leitor.proximo_caractere():
+        cabecalho = {}
+        for chave in leitor.iterar_objeto():
+            if chave != 'resposta':
+                cabecalho[chave] = leitor.ler_valor()
+                continue
+            obtido_em = cabecalho.get('obtido_em')
+            cabecalho['obtido_em'] = datetime.fromisoformat(obtido_em.rstrip('Z')) if obtido_em else None
+            sources = iterar_sources(leitor)
+            yield cabecalho, sources
+            for _ in sources:
+                pass
+
+
+def reprocessar_segmento(caminho, desde=None, ate=None, numeros=None):
+    """
+    Reprocessa as respostas de um segmento com reprocessar_movimentos, sem consultar o DataJud.
+    Filtra pela data em que foram obtidas ('desde'/'ate') e pelos números (só dígitos) em 'numeros'.
+    Os movimentos de todos os documentos (graus) de cada número são reprocessados, como na ingestão.
+    Faz commit a cada resposta. Um segmento truncado é lido até o último registro completo. Retorna um Counter.
+    """
+    from app import db
+    from cnj_ingestao import agrupar_documentos_em_streaming, reprocessar_movimentos
+
+    numeros = set(numeros) if numeros else None
+    contadores = Counter(segmentos=1)
+    try:
+        with abrir_segmento(caminho) as arquivo:
+            for cabecalho, sources in ler_registros(arquivo):
+                obtido_em = cabecalho['obtido_em']
+                if (desde is not None and (obtido_em is None or obtido_em < desde)) or (ate is not None and (obtido_em is None or obtido_em > ate)):
+                    continue
+                if numeros is not None and not numeros.intersection(cabecalho.get('numeros') or []):
+                    continue
+                contadores['respostas'] += 1
+                vistos = set()
+                for numero, documentos in agrupar_documentos_em_streaming(sources):
+                    if numeros is not None and numero not in numeros:
+                        continue
+                    # Respostas arquivadas antes da consulta ordenada podem trazer os documentos de um número
+                    # separados; cada grupo é reprocessado (a gravação ignora duplicatas), mas o número conta uma vez
+                    resultado = reprocessar_movimentos(numero, chain.from_iterable(source.movimentos() for source in documentos))
+                    primeira_vez = numero not in vistos
+                    vistos.add(numero)
+                    if resultado is None:
+                        contadores['sem_caso'] += primeira_vez
+                        continue
+                    contadores['processos'] += primeira_vez
+                    contadores.update(resultado)
+                db.session.commit()
+    except ERROS_SEGMENTO as e:
+        db.session.rollback()
+        contadores['segmentos_truncados'] += 1
+        current_app.logger.warning(f"ARQUIVO CNJ: segmento '{caminho}' lido só até o último registro completo: {e}")
+    except BaseException:
+        db.session.rollback()
+        raise
+    return contadores
+
+
+# App de cada processo do pool de 'flask cnj-replay' (criado em _inicializar_processo_replay)
+_app_replay = None
+
+
+def _inicializar_processo_replay(config):
+    global _app_replay
+    from app import create_app
+
+    _app_replay = create_app(type('ConfigReplay', (), config))
+
+
+def _reprocessar_segmento_no_processo(argumentos):
+    caminho, desde, ate, numeros = argumentos
+    with _app_replay.app_context():
+        return caminho, reprocessar_segmento(caminho, desde, ate, numeros)
+
+
+def _config_para_processos(config):
+    """Configuração do app para os processos do replay: só os valores serializáveis, sem scheduler nem arquivo."""
+    copia = {}
+    for chave, valor in config.items():
+        if not chave.isupper():
+            continue
+        try:
+            pickle.dumps(valor)
+        except Exception:
+            continue
+        copia[chave] = valor
+    copia.update(CNJ_JOB_ENABLED=False, CNJ_ARQUIVO_ENABLED=False, SCHEDULER_LEADER_ELECTION_ENABLED=False)
+    return copia
+
+
+def reprocessar_arquivo(segmentos, processos=1, desde=None, ate=None, numeros=None, ao_concluir=None):
+    """
+    Reprocessa os segmentos informados, divididos entre 'processos' processos (cada um com o seu app e
+    a sua conexão ao banco; com 1, no processo atual). 'ao_concluir(caminho, contadores)' é chamado
+    à medida que cada segmento termina. Retorna o Counter com os totais.
+    """
+    totais = Counter()
+
+    def registrar(caminho, contadores):
+        totais.update(contadores)
+        if ao_concluir:
+            ao_concluir(caminho, contadores)
+
+    if processos <= 1 or len(segmentos) <= 1:
+        for caminho in segmentos:
+            registrar(caminho, reprocessar_segmento(caminho, desde, ate, numeros))
+        return totais
+
+    contexto = multiprocessing.get_context('spawn') # Sem herdar conexões e threads do processo atual
+    with contexto.Pool(min(processos, len(segmentos)), initializer=_inicializar_processo_replay,
+                       initargs=(_config_para_processos(current_app.config),)) as pool:
+        tarefas = [(caminho, desde, ate, numeros) for caminho in segmentos]
+        for caminho, contadores in pool.imap_unordered(_reprocessar_segmento_no_processo, tarefas):
+            registrar(caminho, contadores)
+    return totais
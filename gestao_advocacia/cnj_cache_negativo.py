@@ -0,0 +1,132 @@
+# ==============================================================================
+# ARQUIVO: gestao_advocacia/cnj_cache_negativo.py
+# Cache negativo das consultas ao DataJud: números de processo que não retornam
+# nenhum hit (processos em segredo de justiça, tribunais ainda não indexados,
+# números errados) deixam de ser consultados a cada ciclo.
+#
+# Cada número normalizado (só dígitos) sem resultado ganha uma linha na tabela
+# 'cache_negativo_cnj', válida por um prazo que cresce a cada nova consulta sem
+# resultado (1 dia, 1 semana, 1 mês por padrão; CNJ_CACHE_NEGATIVO_TTLS_DIAS).
+# A sincronização agendada e a atualização em lote consultam o cache antes de
+# qualquer chamada HTTP. A linha é removida quando o processo aparece no
+# DataJud ou quando o usuário edita o número do processo do caso.
+# ==============================================================================
+import threading
+from collections import Counter
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import insert
+
+# Assim como em tasks.py, db e os modelos são importados de 'app' dentro das funções
+# para evitar importação circular.
+
+TTLS_PADRAO_DIAS = (1, 7, 30)
+# Quantidade máxima de números por cláusula IN.
+TAMANHO_LOTE_NUMEROS = 500
+
+# Contadores acumulados (por processo): consultas de processo evitadas e números registrados sem resultado.
+_estatisticas_cache_negativo = Counter()
+_lock_estatisticas = threading.Lock()
+
+
+def obter_estatisticas_cache_negativo():
+    """Retorna uma cópia dos contadores acumulados do cache negativo ('consultas_evitadas', 'registros')."""
+    with _lock_estatisticas:
+        return {'consultas_evitadas': _estatisticas_cache_negativo['consultas_evitadas'],
+                'registros': _estatisticas_cache_negativo['registros']}
+
+
+def _contabilizar(chave, quantidade):
+    with _lock_estatisticas:
+        _estatisticas_cache_negativo[chave] += quantidade
+
+
+def obter_ttls():
+    """Prazos de validade (timedelta) por consulta seguida sem resultado; o último vale dali em diante."""
+    ttls_dias = current_app.config.get('CNJ_CACHE_NEGATIVO_TTLS_DIAS') or TTLS_PADRAO_DIAS
+    return [timedelta(days=float(dias)) for dias in ttls_dias]
+
+
+def _em_blocos(numeros):
+    for inicio in range(0, len(numeros), TAMANHO_LOTE_NUMEROS):
+        yield numeros[inicio:inicio + TAMANHO_LOTE_NUMEROS]
+
+
+def numeros_em_cache_negativo(numeros_digitos, agora=None):
+    """
+    Verifica quais dos números (só dígitos) estão no cache negativo e ainda válidos.
+    Retorna {numero: valido_ate} apenas para esses; a quantidade entra em 'consultas_evitadas'.
+    """
+    from app import db, CacheNegativoCNJ
+
+    agora = agora or datetime.utcnow()
+    numeros_digitos = [numero for numero in set(numeros_digitos) if numero]
+    em_cache = {}
+    for bloco in _em_blocos(numeros_digitos):
+        em_cache.update(db.session.query(CacheNegativoCNJ.numero_processo_digits, CacheNegativoCNJ.valido_ate).filter(
+            CacheNegativoCNJ.numero_processo_digits.in_(bloco), CacheNegativoCNJ.valido_ate > agora
+        ))
+    if em_cache:
+        _contabilizar('consultas_evitadas', len(em_cache))
+    return em_cache
+
+
+def registrar_resultados(resultados_por_numero, agora=None):
+    """
+    Atualiza o cache com as respostas de uma consulta: {numero (só dígitos): (dados_cnj, status_http)}.
+    Números sem nenhum hit entram (ou sobem de prazo) no cache; números encontrados saem dele.
+    Respostas com erro não alteram o cache. Não faz commit.
+    """
+    sem_resultado, com_resultado = [], []
+    for numero, (dados_cnj, status_http) in resultados_por_numero.items():
+        if not numero or status_http >= 400:
+            continue
+        hits = (dados_cnj or {}).get("hits", {}).get("hits", [])
+        (com_resultado if hits else sem_resultado).append(numero)
+    invalidar(com_resultado)
+    _registrar_sem_resultado(sem_resultado, agora or datetime.utcnow())
+
+
+def _registrar_sem_resultado(numeros, agora):
+    from app import db, CacheNegativoCNJ
+
+    if not numeros:
+        return
+    ttls = obter_ttls()
+    existentes = {}
+    for bloco in _em_blocos(numeros):
+        existentes.update((linha.numero_processo_digits, linha) for linha in
+                          CacheNegativoCNJ.query.filter(CacheNegativoCNJ.numero_processo_digits.in_(bloco)))
+    novos = []
+    for numero in numeros:
+        linha = existentes.get(numero)
+        if linha is None:
+            novos.append({'numero_processo_digits': numero, 'consultas_sem_resultado': 1,
+                          'valido_ate': agora + ttls[0], 'atualizado_em': agora})
+        else:
+            linha.consultas_sem_resultado += 1
+            linha.valido_ate = agora + ttls[min(linha.consultas_sem_resultado, len(ttls)) - 1]
+            linha.atualizado_em = agora
+    if novos:
+        tabela = CacheNegativoCNJ.__table__
+        dialeto = db.session.get_bind().dialect.name
+        if dialeto == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert as insert_dialeto
+        elif dialeto == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert as insert_dialeto
+        else:
+            insert_dialeto = None
+        # Outra sincronização pode ter registrado o mesmo número ao mesmo tempo: basta uma linha.
+        comando = insert_dialeto(tabela).on_conflict_do_nothing(index_elements=['numero_processo_digits']) if insert_dialeto else insert(tabela)
+        db.session.execute(comando, novos)
+    _contabilizar('registros', len(numeros))
+
+
+def invalidar(numeros_digitos):
+    """Remove os números (só dígitos) do cache negativo. Não faz commit."""
+    from app import db, CacheNegativoCNJ
+
+    numeros_digitos = [numero for numero in set(numeros_digitos) if numero]
+    for bloco in _em_blocos(numeros_digitos):
+        db.session.query(CacheNegativoCNJ).filter(CacheNegativoCNJ.numero_processo_digits.in_(bloco)).delete(synchronize_session=False)
@@ -0,0 +1,180 @@
+# ==============================================================================
+# ARQUIVO: gestao_advocacia/cnj_fila.py
+# Fila durável de atualizações CNJ (tabela 'cnj_sync_queue', CNJ_FILA_ENABLED).
+#
+# Os pedidos do usuário (POST atualizar-cnj) e as verificações periódicas da
+# agenda adaptativa entram na mesma fila, um item por caso, e dividem a mesma
+# capacidade de consulta ao DataJud: os pedidos do usuário têm prioridade maior
+# e passam à frente dos periódicos. Qualquer quantidade de workers (threads da
+# API, o job do scheduler, 'flask cnj-sync --fila') consome a fila ao mesmo
+# tempo sem repetir trabalho:
+#
+# - cada worker reserva um punhado de itens, gravando neles um token e um prazo
+#   (lease, CNJ_FILA_RESERVA_SEGUNDOS); itens reservados por outro worker só
+#   voltam a ser elegíveis quando o prazo vence (worker que morreu no meio);
+# - PostgreSQL: os itens são escolhidos com SELECT ... FOR UPDATE SKIP LOCKED,
+#   então workers reservando no mesmo instante pulam as linhas uns dos outros
+#   em vez de esperar por elas;
+# - SQLite: a escolha e a reserva são um único UPDATE com subconsulta, que roda
+#   inteiro sob o lock de escrita do banco.
+# Ao terminar, o worker remove os itens que ainda carregam o seu token.
+# ==============================================================================
+import uuid
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import select, update, delete, insert, or_, func
+
+# Assim como em tasks.py, db e os modelos são importados de 'app' dentro das funções
+# para evitar importação circular.
+
+# Verificações periódicas (agenda adaptativa) e pedidos explícitos do usuário.
+PRIORIDADE_PERIODICA = 0
+PRIORIDADE_MANUAL = 100
+
+
+def _insert_ignorando_duplicatas(tabela):
+    from app import db
+
+    dialeto = db.session.get_bind().dialect.name
+    if dialeto == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as insert_dialeto
+    elif dialeto == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as insert_dialeto
+    else:
+        return None
+    return insert_dialeto(tabela).on_conflict_do_nothing(index_elements=['caso_id'])
+
+
+def enfileirar_casos(caso_ids, prioridade=PRIORIDADE_PERIODICA, cnj_job_id=None):
+    """
+    Põe os casos na fila (um item por caso). Um caso já enfileirado tem a prioridade elevada, se
+    a nova for maior; com 'cnj_job_id' (pedido do usuário) o item passa a carregar o job e volta a
+    ficar livre, para que seja atendido mesmo se um worker já o estiver processando como periódico.
+    Não faz commit.
+    """
+    from app import db, FilaSincronizacaoCNJ
+
+    caso_ids = sorted(set(caso_ids))
+    if not caso_ids:
+        return
+    tabela = FilaSincronizacaoCNJ.__table__
+    agora = datetime.utcnow()
+    comando = _insert_ignorando_duplicatas(tabela)
+    if comando is None:
+        existentes = set(db.session.execute(select(tabela.c.caso_id).where(tabela.c.caso_id.in_(caso_ids))).scalars())
+        caso_ids_novos = [caso_id for caso_id in caso_ids if caso_id not in existentes]
+        comando = insert(tabela)
+    else:
+        caso_ids_novos = caso_ids
+    if caso_ids_novos:
+        db.session.execute(comando, [
+            {'caso_id': caso_id, 'prioridade': prioridade, 'cnj_job_id': cnj_job_id, 'enfileirado_em': agora, 'tentativas': 0}
+            for caso_id in caso_ids_novos
+        ])
+    db.session.execute(
+        update(tabela).where(tabela.c.caso_id.in_(caso_ids), tabela.c.prioridade < prioridade).values(prioridade=prioridade)
+    )
+    if cnj_job_id is not None:
+        db.session.execute(
+            update(tabela).where(tabela.c.caso_id.in_(caso_ids), or_(tabela.c.cnj_job_id.is_(None), tabela.c.cnj_job_id != cnj_job_id))
+            .values(cnj_job_id=cnj_job_id, reserva=None, reservado_ate=None, tentativas=0)
+        )
+
+
+def reservar_itens(quantidade, prioridade_minima=None, duracao_reserva=None, agora=None):
+    """
+    Reserva (com commit) até 'quantidade' itens livres, os de maior prioridade e mais antigos
+    primeiro. Retorna (token da reserva, linhas com id, caso_id, cnj_job_id, prioridade e tentativas).
+    """
+    from app import db, FilaSincronizacaoCNJ
+
+    tabela = FilaSincronizacaoCNJ.__table__
+    agora = agora or datetime.utcnow()
+    if duracao_reserva is None:
+        duracao_reserva = current_app.config.get('CNJ_FILA_RESERVA_SEGUNDOS', 600)
+    token = uuid.uuid4().hex
+    livre = or_(tabela.c.reservado_ate.is_(None), tabela.c.reservado_ate < agora)
+    ordem = (tabela.c.prioridade.desc(), tabela.c.enfileirado_em, tabela.c.id)
+    candidatos = select(tabela.c.id).where(livre)
+    if prioridade_minima is not None:
+        candidatos = candidatos.where(tabela.c.prioridade >= prioridade_minima)
+    candidatos = candidatos.order_by(*ordem).limit(quantidade)
+    reserva = update(tabela).values(
+        reserva=token, reservado_ate=agora + timedelta(seconds=duracao_reserva), tentativas=tabela.c.tentativas + 1
+    )
+
+    if db.session.get_bind().dialect.name == 'sqlite':
+        # Escolha e reserva no mesmo UPDATE: dois workers nunca reservam o mesmo item
+        db.session.execute(reserva.where(tabela.c.id.in_(candidatos), livre))
+    else:
+        # Linhas travadas por outro worker que está reservando agora são puladas (SKIP LOCKED)
+        ids = db.session.execute(candidatos.with_for_update(skip_locked=True)).scalars().all()
+        if ids:
+            db.session.execute(reserva.where(tabela.c.id.in_(ids)))
+    db.session.commit()
+
+    linhas = db.session.execute(
+        select(tabela.c.id, tabela.c.caso_id, tabela.c.cnj_job_id, tabela.c.prioridade, tabela.c.tentativas)
+        .where(tabela.c.reserva == token).order_by(*ordem)
+    ).all()
+    db.session.commit()
+    return token, linhas
+
+
+def concluir_itens(token, ids=None):
+    """Remove (com commit) os itens ainda reservados com 'token' (todos, ou só os de 'ids'). Retorna quantos."""
+    from app import db, FilaSincronizacaoCNJ
+
+    tabela = FilaSincronizacaoCNJ.__table__
+    comando = delete(tabela).where(tabela.c.reserva == token)
+    if ids is not None:
+        comando = comando.where(tabela.c.id.in_(list(ids)))
+    removidos = db.session.execute(comando).rowcount
+    db.session.commit()
+    return removidos
+
+
+def liberar_itens(token):
+    """Devolve à fila (com commit) os itens reservados com 'token', sem esperar o prazo da reserva vencer."""
+    from app import db, FilaSincronizacaoCNJ
+
+    tabela = FilaSincronizacaoCNJ.__table__
+    db.session.execute(update(tabela).where(tabela.c.reserva == token).values(reserva=None, reservado_ate=None))
+    db.session.commit()
+
+
+def descartar_itens_esgotados(max_tentativas=None, agora=None):
+    """
+    Remove (com commit) os itens livres que já foram reservados 'max_tentativas' vezes sem serem
+    concluídos (o worker morreu durante o processamento em todas elas). Retorna os cnj_job_id
+    dos itens removidos que carregavam um pedido do usuário.
+    """
+    from app import db, FilaSincronizacaoCNJ
+
+    tabela = FilaSincronizacaoCNJ.__table__
+    agora = agora or datetime.utcnow()
+    if max_tentativas is None:
+        max_tentativas = current_app.config.get('CNJ_FILA_MAX_TENTATIVAS', 5)
+    esgotado = (tabela.c.tentativas >= max_tentativas, or_(tabela.c.reservado_ate.is_(None), tabela.c.reservado_ate < agora))
+    esgotados = db.session.execute(select(tabela.c.id, tabela.c.cnj_job_id).where(*esgotado)).all()
+    if esgotados:
+        db.session.execute(delete(tabela).where(tabela.c.id.in_([linha.id for linha in esgotados]), *esgotado))
+        current_app.logger.error(f"FILA CNJ: {len(esgotados)} item(ns) descartado(s) após {max_tentativas} tentativa(s) sem conclusão.")
+    db.session.commit()
+    return [linha.cnj_job_id for linha in esgotados if linha.cnj_job_id]
+
+
+def obter_estatisticas_fila(agora=None):
+    """Itens na fila: total, reservados no momento e pedidos do usuário (prioridade manual) aguardando."""
+    from app import db, FilaSincronizacaoCNJ
+
+    tabela = FilaSincronizacaoCNJ.__table__
+    agora = agora or datetime.utcnow()
+    livre = or_(tabela.c.reservado_ate.is_(None), tabela.c.reservado_ate < agora)
+    total, reservados, manuais = db.session.execute(select(
+        func.count(),
+        func.count().filter(tabela.c.reservado_ate >= agora),
+        func.count().filter(tabela.c.prioridade >= PRIORIDADE_MANUAL, livre),
+    ).select_from(tabela)).one()
+    return {'itens': total, 'reservados': reservados, 'pedidos_manuais_aguardando': manuais}
@@ -0,0 +1,109 @@
+# ==============================================================================
+# ARQUIVO: gestao_advocacia/cnj_incremental.py
+# Sincronização incremental por tribunal (CNJ_INCREMENTAL_ENABLED).
+#
+# Em vez de baixar de novo o documento de cada caso vencido, cada tribunal é
+# consultado apenas pelos documentos com dataHoraUltimaAtualizacao posterior à
+# marca (high-water mark) do tribunal, tabela 'cnj_sync_watermark', entre os
+# números acompanhados, em páginas ordenadas por essa data e pelo 'id' do
+# documento (search_after). Os documentos que vierem são ingeridos (os vários
+# graus de um mesmo processo, juntos); os demais casos vencidos do tribunal
+# ficam registrados como verificados sem nenhuma consulta própria. As páginas
+# passam pelo motor de cnj_sync.py, com o limite de taxa de cada tribunal.
+#
+# Só entram os casos já sincronizados com sucesso ao menos uma vez (com
+# ProcessoCNJ): casos novos e os que nunca tiveram resposta continuam na
+# sincronização normal. A primeira marca de um tribunal é a sincronização mais
+# antiga entre os seus processos acompanhados; depois, a maior data vista. Cada
+# consulta recua CNJ_INCREMENTAL_MARGEM_SEGUNDOS da marca, cobrindo a demora de
+# indexação do DataJud e diferenças de relógio (documentos repetidos não geram
+# trabalho: o cache de payload da ingestão os descarta).
+# ==============================================================================
+from datetime import datetime
+
+# Assim como em tasks.py, db e os modelos são importados de 'app' dentro das funções
+# para evitar importação circular.
+
+# Quantidade máxima de ids por cláusula IN.
+TAMANHO_LOTE_CASOS = 500
+
+
+def _filtros_casos_acompanhados(alias_tribunal=None):
+    from app import Caso
+
+    filtros = [Caso.processo_cnj_id.isnot(None), Caso.numero_processo_digits.isnot(None), Caso.alias_tribunal_cnj.isnot(None)]
+    if alias_tribunal is not None:
+        filtros.append(Caso.alias_tribunal_cnj == alias_tribunal)
+    return filtros
+
+
+def aliases_acompanhados():
+    """Tribunais (alias do DataJud) com ao menos um caso acompanhado pela sincronização incremental, em ordem."""
+    from app import db, Caso
+
+    return list(db.session.execute(
+        db.select(Caso.alias_tribunal_cnj).where(*_filtros_casos_acompanhados()).distinct().order_by(Caso.alias_tribunal_cnj)
+    ).scalars())
+
+
+def casos_acompanhados(alias_tribunal):
+    """Retorna {numero (só dígitos): [ids dos casos]} dos casos do tribunal acompanhados pela sincronização incremental."""
+    from app import db, Caso
+
+    casos_por_numero = {}
+    for caso_id, numero_digitos in db.session.execute(
+            db.select(Caso.id, Caso.numero_processo_digits).where(*_filtros_casos_acompanhados(alias_tribunal)).order_by(Caso.id)):
+        casos_por_numero.setdefault(numero_digitos, []).append(caso_id)
+    return casos_por_numero
+
+
+def obter_marca(alias_tribunal):
+    """
+    Marca do tribunal: a gravada ou, na primeira vez, a sincronização mais antiga entre os processos
+    acompanhados do tribunal (nada mudou neles antes disso sem ter sido ingerido). None se não há nenhum.
+    """
+    from app import db, Caso, ProcessoCNJ, MarcaSincronizacaoCNJ
+
+    marca = db.session.get(MarcaSincronizacaoCNJ, alias_tribunal)
+    if marca is not None:
+        return marca.data_hora_ultima_atualizacao
+    return db.session.execute(
+        db.select(db.func.min(ProcessoCNJ.data_ultima_sincronizacao_cnj))
+        .join(Caso, Caso.processo_cnj_id == ProcessoCNJ.id).where(*_filtros_casos_acompanhados(alias_tribunal))
+    ).scalar()
+
+
+def gravar_marca(alias_tribunal, data_hora):
+    """Grava a marca do tribunal, sem nunca recuá-la. Não faz commit."""
+    from app import db, MarcaSincronizacaoCNJ
+
+    marca = db.session.get(MarcaSincronizacaoCNJ, alias_tribunal)
+    if marca is None:
+        db.session.add(MarcaSincronizacaoCNJ(alias_tribunal=alias_tribunal, data_hora_ultima_atualizacao=data_hora, atualizado_em=datetime.utcnow()))
+    elif data_hora > marca.data_hora_ultima_atualizacao:
+        marca.data_hora_ultima_atualizacao = data_hora
+        marca.atualizado_em = datetime.utcnow()
+
+
+def registrar_casos_em_dia(alias_tribunal, numeros_ignorados, agora=None):
+    """
+    Registra como verificados (sem movimentações novas) os casos acompanhados do tribunal com a
+    verificação vencida cujos números não estão em 'numeros_ignorados' (os já ingeridos nesta
+    passada): a consulta incremental mostrou que os documentos deles não mudaram. Faz commit a cada
+    bloco. Retorna quantos casos.
+    """
+    from app import db, Caso
+    from cnj_prioridade import registrar_verificacao_cnj
+
+    agora = agora or datetime.utcnow()
+    caso_ids = [caso_id for caso_id, numero_digitos in db.session.execute(
+        db.select(Caso.id, Caso.numero_processo_digits).where(
+            *_filtros_casos_acompanhados(alias_tribunal),
+            db.or_(Caso.proxima_verificacao_cnj.is_(None), Caso.proxima_verificacao_cnj <= agora)
+        )
+    ) if numero_digitos not in numeros_ignorados]
+    for inicio in range(0, len(caso_ids), TAMANHO_LOTE_CASOS):
+        for caso in Caso.query.filter(Caso.id.in_(caso_ids[inicio:inicio + TAMANHO_LOTE_CASOS])):
+            registrar_verificacao_cnj(caso, 0, agora)
+        db.session.commit()
+    return len(caso_ids)
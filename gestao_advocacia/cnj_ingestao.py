@@ -0,0 +1,631 @@
+# ==============================================================================
+# ARQUIVO: gestao_advocacia/cnj_ingestao.py
+# Ingestão das movimentações recebidas do DataJud (CNJ), usada tanto pelo job
+# agendado (tasks.py) quanto pelo endpoint atualizar-cnj (app.py).
+#
+# As movimentações pertencem ao processo (ProcessoCNJ, um por número), não ao
+# caso: vários advogados acompanhando o mesmo processo têm casos distintos, mas
+# a resposta do DataJud é ingerida e gravada uma única vez e o resultado é
+# repassado a todos os casos com aquele número (ingerir_resposta_processo).
+# O DataJud indexa um documento por grau de jurisdição do processo; todos são
+# mesclados em um único '_source' antes da ingestão (mesclar_documentos_processo).
+#
+# Dividida em duas etapas:
+#   1. analisar_movimentos: etapa pura (sem banco), percorre os movimentos a
+#      partir do mais recente, calcula data e hash e para ao alcançar movimentos
+#      mais antigos que o último já registrado para o processo (só com um único
+#      documento; com vários, a data não vale para cada grau e o diff decide).
+#   2. persistir_movimentacoes: descarta os candidatos já registrados (diff por
+#      hash), monta a descrição apenas dos novos e grava tudo em lote.
+#
+# Antes das duas etapas, a impressão digital do '_source' (e o
+# dataHoraUltimaAtualizacao) é comparada com a da última sincronização do
+# processo; se nada mudou, a resposta é descartada sem análise.
+#
+# Com CNJ_STREAMING_ENABLED os documentos chegam como cnj_streaming.SourceEmStreaming,
+# agrupados por processo (agrupar_documentos_em_streaming, ingerir_documentos_em_streaming):
+# os movimentos são analisados na ordem em que são lidos e gravados em blocos, sem a
+# lista inteira em memória; a impressão digital só é conhecida no fim da leitura,
+# então serve apenas para a estatística do cache.
+#
+# reprocessar_movimentos refaz a gravação a partir de movimentos já recebidos
+# (arquivo de respostas, 'flask cnj-replay'), sem consultar o DataJud.
+# ==============================================================================
+import threading
+from collections import Counter
+from itertools import groupby
+from datetime import datetime, timezone
+
+from sqlalchemy import insert, update, func
+from sqlalchemy.orm import load_only
+
+from cnj_service import calcular_hash_movimentacao, calcular_hash_payload, calcular_hash_payload_resumido, normalizar_numero_processo
+from cnj_payload_bruto import comprimir_payload, gravar_payloads
+from cnj_streaming import DocumentosEmStreaming, RespostaEmStreaming
+
+# Assim como em tasks.py, db e os modelos são importados de 'app' dentro das funções
+# para evitar importação circular.
+
+# Quantidade máxima de hashes por cláusula IN na consulta de diff.
+TAMANHO_LOTE_DIFF_HASHES = 500
+# Movimentos candidatos acumulados antes de cada gravação na ingestão em streaming.
+TAMANHO_BLOCO_STREAMING = 1000
+
+# Contadores acumulados (por processo) do cache de payload: 'acertos' e 'falhas'.
+_estatisticas_cache_payload = Counter()
+_lock_estatisticas = threading.Lock()
+
+
+def obter_estatisticas_cache_payload():
+    """Retorna uma cópia dos contadores acumulados de acertos/falhas do cache de payload."""
+    with _lock_estatisticas:
+        return {'acertos': _estatisticas_cache_payload['acertos'], 'falhas': _estatisticas_cache_payload['falhas']}
+
+
+def _contabilizar_cache_payload(chave):
+    with _lock_estatisticas:
+        _estatisticas_cache_payload[chave] += 1
+
+
+def extrair_documentos(dados_cnj):
+    """'_source' de cada hit de uma resposta do DataJud: um documento por grau de jurisdição do processo."""
+    return [hit.get('_source') or {} for hit in (dados_cnj or {}).get("hits", {}).get("hits", [])]
+
+
+def _ordem_documento(campos):
+    """Ordem dos documentos de um processo: atualizado por último no fim, desempate pelo 'id' do documento."""
+    return str(campos.get('dataHoraUltimaAtualizacao') or ''), str(campos.get('id') or '')
+
+
+def mesclar_documentos_processo(documentos):
+    """
+    Junta os documentos ('_source') de um processo, um por grau de jurisdição, em um único '_source'
+    para a ingestão: os campos do atualizado por último (dataHoraUltimaAtualizacao) e os movimentos
+    de todos. A ordem não depende da resposta, então a impressão digital do resultado também não.
+    Com um único documento, retorna o próprio.
+    """
+    if len(documentos) == 1:
+        return documentos[0]
+    ordenados = sorted(documentos, key=_ordem_documento)
+    source = dict(ordenados[-1])
+    source['movimentos'] = [movimento for documento in ordenados if isinstance(documento.get('movimentos'), list)
+                            for movimento in documento['movimentos']]
+    return source
+
+
+def agrupar_documentos_em_streaming(sources):
+    """
+    Agrupa os hits de uma resposta lida em streaming por processo: gera (numero, DocumentosEmStreaming)
+    para cada sequência de hits consecutivos com o mesmo número (a consulta em lote os ordena por
+    numeroProcesso). Os documentos de um grupo são lidos antes do grupo seguinte.
+    """
+    for numero, documentos in groupby(sources, key=numero_do_source):
+        yield numero, DocumentosEmStreaming(documentos)
+
+
+def extrair_source(dados_cnj):
+    """'_source' do processo em uma resposta do DataJud (documentos mesclados), ou None se não houver hits."""
+    documentos = extrair_documentos(dados_cnj)
+    if not documentos:
+        return None
+    return mesclar_documentos_processo(documentos)
+
+
+def extrair_movimentos(dados_cnj):
+    """
+    Extrai a lista 'movimentos' de uma resposta do DataJud (de todos os documentos do processo).
+    Retorna (processo_encontrado, movimentos).
+    """
+    source = extrair_source(dados_cnj)
+    if source is None:
+        return False, []
+    movimentos = source.get('movimentos', [])
+    if not isinstance(movimentos, list):
+        movimentos = []
+    return True, movimentos
+
+
+def montar_descricao_movimento(movimento_json):
+    """Monta a descrição gravada em MovimentacaoCNJ.descricao a partir do JSON do movimento."""
+    desc_parts = []
+    mov_nacional = movimento_json.get('movimentoNacional')
+    if mov_nacional and isinstance(mov_nacional, dict) and mov_nacional.get('descricao'):
+        desc_parts.append(mov_nacional['descricao'])
+
+    mov_local = movimento_json.get('movimentoLocal')
+    if not desc_parts and mov_local and isinstance(mov_local, dict) and mov_local.get('descricao'):
+        desc_parts.append(mov_local['descricao'])
+
+    complementos = movimento_json.get('complementos', [])
+    if isinstance(complementos, list):
+        for complemento in complementos:
+            if isinstance(complemento, dict) and complemento.get('descricao'):
+                desc_parts.append(complemento['descricao'])
+
+    descricao = " | ".join(filter(None, desc_parts))
+    if not descricao:
+        codigo_nacional = movimento_json.get('codigoNacional')
+        codigo = codigo_nacional.get('codigo', 'N/A') if isinstance(codigo_nacional, dict) else 'N/A'
+        descricao = movimento_json.get('descricao') or f"Movimento Cód: {codigo}"
+    return descricao
+
+
+def _para_utc_naive(data_hora):
+    """Normaliza para UTC sem tzinfo, o formato em que as datas são comparadas com o banco."""
+    if data_hora is not None and data_hora.tzinfo is not None:
+        return data_hora.astimezone(timezone.utc).replace(tzinfo=None)
+    return data_hora
+
+
+def _ordem_cronologica(movimentos):
+    """
+    Verifica, comparando apenas as strings 'dataHora' (sem parse nem cópia da lista), se os
+    movimentos já vêm em ordem cronológica. Retorna 1 (crescente), -1 (decrescente) ou
+    0 (fora de ordem ou sem movimentos datados).
+    """
+    crescente = decrescente = True
+    anterior = None
+    for movimento in movimentos:
+        atual = movimento.get('dataHora') if isinstance(movimento, dict) else None
+        if not atual:
+            continue
+        if anterior is not None:
+            if atual < anterior:
+                crescente = False
+            elif atual > anterior:
+                decrescente = False
+            if not crescente and not decrescente:
+                return 0
+        anterior = atual
+    if anterior is None:
+        return 0
+    return 1 if crescente else -1
+
+
+def _data_do_movimento(movimento_json):
+    """'dataHora' do movimento como datetime; None se ausente, ValueError se inválida."""
+    data_mov_str = movimento_json.get('dataHora') if isinstance(movimento_json, dict) else None
+    if not data_mov_str:
+        return None
+    return datetime.fromisoformat(data_mov_str.replace('Z', '+00:00'))
+
+
+def analisar_movimentos(processo_id, movimentos, data_limite=None):
+    """
+    Etapa pura da ingestão: não acessa o banco nem monta descrições.
+    Percorre os movimentos do mais recente para o mais antigo (sem ordenar a lista) e, quando
+    'data_limite' (data do último movimento já registrado) é informada e a lista está em ordem
+    cronológica, para no primeiro movimento anterior a ela. Movimentos com a mesma data do
+    limite continuam sendo analisados; o diff por hash decide se são novos.
+    Retorna (candidatos, ignorados): candidatos é uma lista de tuplas
+    (hash_movimentacao, data_movimentacao, movimento_json) sem hashes repetidos e ignorados é a
+    quantidade de movimentos com 'dataHora' inválida.
+    """
+    ordem = _ordem_cronologica(movimentos)
+    sequencia = reversed(movimentos) if ordem == 1 else movimentos
+    pode_parar = ordem != 0
+    data_limite = _para_utc_naive(data_limite)
+
+    candidatos = []
+    hashes_vistos = set()
+    ignorados = 0
+    for movimento_json in sequencia:
+        try:
+            data_mov = _data_do_movimento(movimento_json)
+        except ValueError:
+            ignorados += 1
+            continue
+        if data_mov is None:
+            continue
+
+        if data_limite is not None and _para_utc_naive(data_mov) < data_limite:
+            if pode_parar:
+                break
+            continue
+
+        hash_mov = calcular_hash_movimentacao(processo_id, movimento_json)
+        if hash_mov not in hashes_vistos:
+            hashes_vistos.add(hash_mov)
+            candidatos.append((hash_mov, data_mov, movimento_json))
+    return candidatos, ignorados
+
+
+def analisar_movimentos_em_streaming(processo_id, movimentos, data_limite=None, contadores=None,
+                                     tamanho_bloco=TAMANHO_BLOCO_STREAMING):
+    """
+    Versão de analisar_movimentos para um iterável lido em streaming: percorre os movimentos na
+    ordem em que chegam, sem guardá-los, descarta os anteriores a 'data_limite' e gera os
+    candidatos (mesmo formato) em blocos de até 'tamanho_bloco'. Hashes repetidos são descartados
+    também entre blocos. Movimentos com 'dataHora' inválida são somados em contadores['ignorados'].
+    """
+    data_limite = _para_utc_naive(data_limite)
+    if contadores is None:
+        contadores = Counter()
+
+    bloco = []
+    hashes_vistos = set()
+    for movimento_json in movimentos:
+        try:
+            data_mov = _data_do_movimento(movimento_json)
+        except ValueError:
+            contadores['ignorados'] += 1
+            continue
+        if data_mov is None or (data_limite is not None and _para_utc_naive(data_mov) < data_limite):
+            continue
+
+        hash_mov = calcular_hash_movimentacao(processo_id, movimento_json)
+        if hash_mov not in hashes_vistos:
+            hashes_vistos.add(hash_mov)
+            bloco.append((hash_mov, data_mov, movimento_json))
+            if len(bloco) >= tamanho_bloco:
+                yield bloco
+                bloco = []
+    if bloco:
+        yield bloco
+
+
+def _hashes_ja_registrados(processo_id, hashes):
+    """Consulta, em blocos, quais dos hashes informados já estão registrados para o processo."""
+    from app import db, MovimentacaoCNJ
+
+    registrados = set()
+    for inicio in range(0, len(hashes), TAMANHO_LOTE_DIFF_HASHES):
+        bloco = hashes[inicio:inicio + TAMANHO_LOTE_DIFF_HASHES]
+        registrados.update(
+            hash_mov for (hash_mov,) in db.session.query(MovimentacaoCNJ.hash_movimentacao)
+            .filter(MovimentacaoCNJ.processo_cnj_id == processo_id, MovimentacaoCNJ.hash_movimentacao.in_(bloco))
+        )
+    return registrados
+
+
+def persistir_movimentacoes(processo, candidatos, ha_registros=True):
+    """
+    Etapa de persistência: grava os candidatos ainda não registrados para o processo.
+    'ha_registros=False' dispensa a consulta de diff (primeira sincronização do processo).
+    Não faz commit. Retorna (quantidade_de_novas, descricao_da_mais_recente, data_da_mais_recente).
+    """
+    registrados = set()
+    if ha_registros and candidatos:
+        registrados = _hashes_ja_registrados(processo.id, [candidato[0] for candidato in candidatos])
+
+    novas_linhas = []
+    data_mov_recente = None
+    desc_mov_recente = None
+    for hash_mov, data_mov, movimento_json in candidatos:
+        if hash_mov in registrados:
+            continue
+        descricao = montar_descricao_movimento(movimento_json)
+        novas_linhas.append({
+            'processo_cnj_id': processo.id,
+            'data_movimentacao': data_mov,
+            'descricao': descricao,
+            'dados_integra_cnj': movimento_json,
+            'hash_movimentacao': hash_mov
+        })
+        if data_mov_recente is None or data_mov > data_mov_recente:
+            data_mov_recente = data_mov
+            desc_mov_recente = descricao
+
+    # Um único INSERT em lote (executemany) em vez de um db.session.add por movimentação
+    inserir_movimentacoes_em_lote(novas_linhas)
+    return len(novas_linhas), desc_mov_recente, data_mov_recente
+
+
+def obter_processos_cnj(numeros_digitos):
+    """
+    Retorna {numero (só dígitos): ProcessoCNJ}, criando os processos que ainda não existem.
+    Não faz commit.
+    """
+    from app import db, ProcessoCNJ
+
+    numeros_digitos = [numero for numero in set(numeros_digitos) if numero]
+    processos = {}
+    for inicio in range(0, len(numeros_digitos), TAMANHO_LOTE_DIFF_HASHES):
+        bloco = numeros_digitos[inicio:inicio + TAMANHO_LOTE_DIFF_HASHES]
+        processos.update((processo.numero_processo_digits, processo) for processo in
+                         ProcessoCNJ.query.filter(ProcessoCNJ.numero_processo_digits.in_(bloco)))
+    novos = [{'numero_processo_digits': numero} for numero in numeros_digitos if numero not in processos]
+    if not novos:
+        return processos
+
+    tabela = ProcessoCNJ.__table__
+    dialeto = db.session.get_bind().dialect.name
+    if dialeto == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as insert_dialeto
+    elif dialeto == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as insert_dialeto
+    else:
+        insert_dialeto = None
+    # Outra sincronização pode criar o mesmo processo ao mesmo tempo: basta uma linha.
+    comando = insert_dialeto(tabela).on_conflict_do_nothing(index_elements=['numero_processo_digits']) if insert_dialeto else insert(tabela)
+    db.session.execute(comando, novos)
+    processos.update((processo.numero_processo_digits, processo) for processo in ProcessoCNJ.query.filter(
+        ProcessoCNJ.numero_processo_digits.in_([linha['numero_processo_digits'] for linha in novos])
+    ))
+    return processos
+
+
+def vincular_casos_ao_processo(processo, casos):
+    """
+    Vincula os casos ao processo. Um caso recém-vinculado a um processo que já tem movimentações
+    (outro caso com o mesmo número já foi sincronizado) recebe o status da mais recente, como se
+    as tivesse ingerido. Não faz commit.
+    """
+    from app import MovimentacaoCNJ
+
+    recem_vinculados = [caso for caso in casos if caso.processo_cnj_id != processo.id]
+    if not recem_vinculados:
+        return
+    mais_recente = processo.movimentacoes.options(
+        load_only(MovimentacaoCNJ.descricao, MovimentacaoCNJ.data_movimentacao)
+    ).order_by(MovimentacaoCNJ.data_movimentacao.desc(), MovimentacaoCNJ.id.desc()).first()
+    for caso in recem_vinculados:
+        caso.processo_cnj = processo
+        if mais_recente is not None:
+            caso.status = mais_recente.descricao[:255]
+            caso.data_atualizacao = mais_recente.data_movimentacao
+
+
+def _ingerir_no_processo(processo, documentos, resultado):
+    """Mescla os documentos, compara a impressão digital do '_source' e, se mudou, analisa e persiste os movimentos no processo."""
+    from app import db, MovimentacaoCNJ
+
+    source = mesclar_documentos_processo(documentos)
+    movimentos = source.get('movimentos', [])
+    if not isinstance(movimentos, list):
+        movimentos = []
+    resultado['movimentos_recebidos'] = len(movimentos)
+
+    hash_payload = calcular_hash_payload(source)
+    data_hora_ultima_atualizacao = source.get('dataHoraUltimaAtualizacao')
+    processo.data_ultima_sincronizacao_cnj = datetime.utcnow()
+    if processo.hash_payload_cnj == hash_payload and processo.data_hora_ultima_atualizacao_cnj == data_hora_ultima_atualizacao:
+        _contabilizar_cache_payload('acertos')
+        resultado['payload_inalterado'] = True
+        return
+    _contabilizar_cache_payload('falhas')
+
+    if movimentos:
+        ultima_registrada = db.session.query(func.max(MovimentacaoCNJ.data_movimentacao)).filter_by(processo_cnj_id=processo.id).scalar()
+        # Data do último movimento já registrado: ponto de parada da análise. Ela vale para o processo,
+        # não para cada grau; com mais de um documento, um grau novo (ou atualizado) pode trazer
+        # movimentos anteriores a ela, então o diff por hash decide sozinho.
+        data_limite = ultima_registrada if len(documentos) == 1 else None
+        candidatos, resultado['movimentos_ignorados'] = analisar_movimentos(processo.id, movimentos, data_limite)
+        resultado['novas_movimentacoes'], resultado['descricao_ultima_movimentacao_nova'], resultado['data_ultima_movimentacao_nova'] = \
+            persistir_movimentacoes(processo, candidatos, ha_registros=ultima_registrada is not None)
+
+    processo.hash_payload_cnj = hash_payload
+    processo.data_hora_ultima_atualizacao_cnj = data_hora_ultima_atualizacao
+
+
+def ingerir_resposta_processo(numero_digitos, dados_cnj):
+    """
+    Registra as novas movimentações de um processo a partir de uma resposta (bem-sucedida) do
+    DataJud, com os documentos de todos os graus de jurisdição mesclados (mesclar_documentos_processo),
+    e repassa o resultado a todos os casos com esse número: cada um é vinculado ao processo e, se
+    houver novidade, recebe status e data_atualizacao da movimentação mais recente.
+    Se o '_source' e o dataHoraUltimaAtualizacao forem os mesmos da última sincronização do
+    processo, não analisa nem persiste nada ('payload_inalterado'). Não faz commit.
+    Retorna um dict com 'processo_encontrado', 'payload_inalterado', 'movimentos_recebidos',
+    'novas_movimentacoes', 'descricao_ultima_movimentacao_nova', 'data_ultima_movimentacao_nova',
+    'movimentos_ignorados' (dataHora inválida) e 'casos' (os casos com o número, a registrar como
+    verificados pelo chamador).
+    """
+    documentos = extrair_documentos(dados_cnj)
+    resultado = _novo_resultado(numero_digitos, bool(documentos))
+    if not documentos:
+        return resultado
+
+    processo = obter_processos_cnj([numero_digitos])[numero_digitos]
+    vincular_casos_ao_processo(processo, resultado['casos'])
+    _ingerir_no_processo(processo, documentos, resultado)
+    _repassar_aos_casos(resultado)
+    return resultado
+
+
+def ingerir_documentos_em_streaming(numero_digitos, documentos):
+    """
+    Equivalente a ingerir_resposta_processo para os documentos de um processo lidos em streaming
+    (cnj_streaming.DocumentosEmStreaming, vazio se o processo não veio na resposta): os movimentos
+    de cada documento são analisados à medida que são lidos e gravados em blocos de
+    TAMANHO_BLOCO_STREAMING, de modo que só os candidatos de um bloco ficam em memória. Como só no
+    fim se sabe quantos documentos (graus) o processo tem, não há data limite: o diff por hash
+    decide. A impressão digital (a mesma de calcular_hash_payload sobre mesclar_documentos_processo)
+    é calculada durante a leitura e gravada no processo; como só é conhecida no fim,
+    'payload_inalterado' indica apenas que a resposta era idêntica à anterior. Não faz commit.
+    Retorna o mesmo dict de ingerir_resposta_processo.
+    """
+    from app import db, MovimentacaoCNJ
+
+    resultado = processo = None
+    lidos = []
+    contadores = Counter()
+    for source in documentos:
+        if processo is None:
+            resultado = _novo_resultado(numero_digitos, True)
+            processo = obter_processos_cnj([numero_digitos])[numero_digitos]
+            vincular_casos_ao_processo(processo, resultado['casos'])
+            ha_registros = db.session.query(MovimentacaoCNJ.id).filter_by(processo_cnj_id=processo.id).first() is not None
+        for candidatos in analisar_movimentos_em_streaming(processo.id, source.movimentos(), None, contadores):
+            novas, descricao, data_mov = persistir_movimentacoes(processo, candidatos, ha_registros=ha_registros)
+            ha_registros = ha_registros or novas > 0
+            resultado['novas_movimentacoes'] += novas
+            if data_mov is not None and (resultado['data_ultima_movimentacao_nova'] is None or data_mov > resultado['data_ultima_movimentacao_nova']):
+                resultado['descricao_ultima_movimentacao_nova'], resultado['data_ultima_movimentacao_nova'] = descricao, data_mov
+        source.consumir()
+        resultado['movimentos_recebidos'] += source.quantidade_movimentos
+        lidos.append(source)
+    if processo is None:
+        return _novo_resultado(numero_digitos, False)
+    resultado['movimentos_ignorados'] = contadores['ignorados']
+
+    lidos.sort(key=lambda source: _ordem_documento(source.campos))
+    hash_payload = _hash_payload_em_streaming(lidos)
+    data_hora_ultima_atualizacao = lidos[-1].campos.get('dataHoraUltimaAtualizacao')
+    processo.data_ultima_sincronizacao_cnj = datetime.utcnow()
+    if processo.hash_payload_cnj == hash_payload and processo.data_hora_ultima_atualizacao_cnj == data_hora_ultima_atualizacao:
+        _contabilizar_cache_payload('acertos')
+        resultado['payload_inalterado'] = not resultado['novas_movimentacoes']
+    else:
+        _contabilizar_cache_payload('falhas')
+    processo.hash_payload_cnj = hash_payload
+    processo.data_hora_ultima_atualizacao_cnj = data_hora_ultima_atualizacao
+    _repassar_aos_casos(resultado)
+    return resultado
+
+
+def _hash_payload_em_streaming(lidos):
+    """Impressão digital dos documentos lidos em streaming (em _ordem_documento), igual à do '_source' mesclado."""
+    if len(lidos) == 1:
+        return calcular_hash_payload_resumido(lidos[0].campos, lidos[0].resumo_movimentos())
+    com_movimentos = [source for source in lidos if source.quantidade_movimentos]
+    resumo = [0, [], []]
+    if com_movimentos:
+        resumo = [sum(source.quantidade_movimentos for source in com_movimentos),
+                  [com_movimentos[0].primeiro_movimento], [com_movimentos[-1].ultimo_movimento]]
+    return calcular_hash_payload_resumido(lidos[-1].campos, resumo)
+
+
+def reprocessar_movimentos(numero_digitos, movimentos, tamanho_bloco=TAMANHO_BLOCO_STREAMING):
+    """
+    Reprocessa com o código atual movimentos já recebidos do DataJud (ex.: do arquivo de respostas,
+    em 'flask cnj-replay'), sem consultar o DataJud: grava os que ainda não estão registrados para o
+    processo e recalcula descrição e data dos já registrados (mesmo hash), atualizando os que mudaram.
+    'movimentos' pode ser uma lista ou um iterável lido em streaming; é percorrido em blocos de
+    'tamanho_bloco'. Não altera o status dos casos, a impressão digital nem a agenda do processo.
+    Não faz commit. Retorna um Counter com 'inseridas', 'atualizadas' e 'ignorados' (dataHora
+    inválida), ou None se nenhum processo ou caso tem o número.
+    """
+    from app import db, Caso, ProcessoCNJ, MovimentacaoCNJ
+
+    processo = ProcessoCNJ.query.filter_by(numero_processo_digits=numero_digitos).first()
+    if processo is None:
+        casos = Caso.query.filter(Caso.numero_processo_digits == numero_digitos).order_by(Caso.id).all()
+        if not casos:
+            return None
+        processo = obter_processos_cnj([numero_digitos])[numero_digitos]
+        vincular_casos_ao_processo(processo, casos)
+
+    contadores = Counter()
+    for candidatos in analisar_movimentos_em_streaming(processo.id, movimentos, None, contadores, tamanho_bloco):
+        hashes = [candidato[0] for candidato in candidatos]
+        registrados = {}
+        for inicio in range(0, len(hashes), TAMANHO_LOTE_DIFF_HASHES):
+            registrados.update((linha.hash_movimentacao, linha) for linha in db.session.query(
+                MovimentacaoCNJ.id, MovimentacaoCNJ.hash_movimentacao, MovimentacaoCNJ.descricao, MovimentacaoCNJ.data_movimentacao
+            ).filter(MovimentacaoCNJ.processo_cnj_id == processo.id, MovimentacaoCNJ.hash_movimentacao.in_(hashes[inicio:inicio + TAMANHO_LOTE_DIFF_HASHES])))
+
+        novas_linhas, alteradas = [], []
+        for hash_mov, data_mov, movimento_json in candidatos:
+            descricao = montar_descricao_movimento(movimento_json)
+            registrada = registrados.get(hash_mov)
+            if registrada is None:
+                novas_linhas.append({'processo_cnj_id': processo.id, 'data_movimentacao': data_mov, 'descricao': descricao,
+                                     'dados_integra_cnj': movimento_json, 'hash_movimentacao': hash_mov})
+            elif registrada.descricao != descricao or _para_utc_naive(registrada.data_movimentacao) != _para_utc_naive(data_mov):
+                alteradas.append({'id': registrada.id, 'descricao': descricao, 'data_movimentacao': data_mov})
+        # Outro processo do replay pode gravar o mesmo movimento ao mesmo tempo (mesma resposta em dois segmentos)
+        contadores['inseridas'] += inserir_movimentacoes_em_lote(novas_linhas, ignorar_duplicatas=True)
+        if alteradas:
+            db.session.execute(update(MovimentacaoCNJ), alteradas)
+            contadores['atualizadas'] += len(alteradas)
+    return contadores
+
+
+def numero_do_source(source):
+    """Número do processo (só dígitos) de um hit lido em streaming."""
+    return normalizar_numero_processo(str(source.campo('numeroProcesso') or ''))
+
+
+def _novo_resultado(numero_digitos, processo_encontrado):
+    from app import Caso
+
+    return {
+        'processo_encontrado': processo_encontrado,
+        'payload_inalterado': False,
+        'movimentos_recebidos': 0,
+        'novas_movimentacoes': 0,
+        'descricao_ultima_movimentacao_nova': None,
+        'data_ultima_movimentacao_nova': None,
+        'movimentos_ignorados': 0,
+        'casos': Caso.query.filter(Caso.numero_processo_digits == numero_digitos).order_by(Caso.id).all(),
+    }
+
+
+def _repassar_aos_casos(resultado):
+    """Se houve movimentação nova, cada caso do processo recebe status e data_atualizacao da mais recente."""
+    if resultado['novas_movimentacoes']:
+        for caso in resultado['casos']:
+            caso.status = resultado['descricao_ultima_movimentacao_nova'][:255]
+            caso.data_atualizacao = resultado['data_ultima_movimentacao_nova']
+
+
+def ingerir_resposta_cnj(caso, dados_cnj):
+    """
+    Registra as novas movimentações do processo do caso a partir de uma resposta (bem-sucedida)
+    do DataJud, decodificada ou em streaming; ver ingerir_resposta_processo (o resultado vale para
+    todos os casos com o mesmo número, inclusive este). Não faz commit.
+    """
+    if not caso.numero_processo_digits:
+        raise ValueError(f"Caso {caso.id} não possui número de processo.")
+    if isinstance(dados_cnj, RespostaEmStreaming):
+        return ingerir_resposta_em_streaming(caso.numero_processo_digits, dados_cnj)
+    return ingerir_resposta_processo(caso.numero_processo_digits, dados_cnj)
+
+
+def ingerir_resposta_em_streaming(numero_digitos, resposta):
+    """
+    Ingere os hits (documentos do processo) de uma consulta individual lida em streaming
+    (cnj_streaming.RespostaEmStreaming), como ingerir_resposta_processo faz com a resposta
+    decodificada, e fecha a resposta. Ver ingerir_documentos_em_streaming.
+    """
+    with resposta:
+        return ingerir_documentos_em_streaming(numero_digitos, DocumentosEmStreaming(resposta.sources()))
+
+
+def inserir_movimentacoes_em_lote(linhas, ignorar_duplicatas=False):
+    """
+    Grava várias movimentações de uma vez, sem passar pela unit of work do ORM objeto a objeto.
+    'linhas' é uma lista de dicts com as colunas de MovimentacaoCNJ; o JSON bruto pode vir em
+    'dados_integra_cnj', e é então comprimido e gravado em payload_cnj (ver cnj_payload_bruto.py).
+    Um único execute com a lista vira executemany no driver (no PostgreSQL o SQLAlchemy ainda
+    agrupa em INSERTs de várias linhas - "insertmanyvalues").
+    Não faz commit. Duplicatas (processo_cnj_id, hash_movimentacao) geram IntegrityError, como no ORM,
+    ou são descartadas com 'ignorar_duplicatas' (PostgreSQL e SQLite). Os dicts de 'linhas' não são
+    alterados. Retorna a quantidade de linhas inseridas (sem as duplicatas descartadas).
+    """
+    from app import db, MovimentacaoCNJ
+
+    if not linhas:
+        return 0
+
+    agora = datetime.utcnow()
+    payloads = [comprimir_payload(linha['dados_integra_cnj']) if linha.get('dados_integra_cnj') is not None else None
+                for linha in linhas]
+    ids_payloads = gravar_payloads([payload for payload in payloads if payload is not None])
+
+    linhas_insert = []
+    for linha, payload in zip(linhas, payloads):
+        linha_insert = {coluna: valor for coluna, valor in linha.items() if coluna != 'dados_integra_cnj'}
+        linha_insert.setdefault('data_registro_sistema', agora)
+        if payload is not None:
+            linha_insert['payload_cnj_id'] = ids_payloads[payload['hash']]
+        else:
+            linha_insert.setdefault('payload_cnj_id', None)
+        linhas_insert.append(linha_insert)
+
+    tabela = MovimentacaoCNJ.__table__
+    dialeto = db.session.get_bind().dialect.name
+    if ignorar_duplicatas and dialeto == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as insert_dialeto
+    elif ignorar_duplicatas and dialeto == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as insert_dialeto
+    else:
+        insert_dialeto = None
+    if insert_dialeto is None:
+        db.session.execute(insert(tabela), linhas_insert)
+        return len(linhas_insert)
+    # As linhas descartadas pelo ON CONFLICT DO NOTHING não voltam no RETURNING
+    comando = insert_dialeto(tabela).on_conflict_do_nothing(index_elements=['processo_cnj_id', 'hash_movimentacao']).returning(tabela.c.id)
+    return len(db.session.execute(comando, linhas_insert).all())
@@ -0,0 +1,408 @@
+# ==============================================================================
+# ARQUIVO: gestao_advocacia/cnj_jobs.py
+# Atualizações CNJ assíncronas disparadas pela API: o endpoint atualizar-cnj
+# registra um CnjJob, enfileira a execução em um pool de threads e responde 202;
+# o cliente acompanha o resultado por GET /api/cnj-jobs/<id>.
+#
+# Pedidos simultâneos para o mesmo caso compartilham o mesmo job (single-flight):
+# dentro do processo por um dicionário caso -> job em andamento, e entre processos
+# pela tabela cnj_job (job pendente/em execução recente do mesmo caso).
+#
+# Com CNJ_FILA_ENABLED o job entra na fila durável (cnj_fila.py) com prioridade
+# de pedido do usuário, à frente das verificações periódicas, e é executado pelo
+# primeiro worker que o reservar: uma thread deste pool ou um 'flask cnj-sync --fila'.
+#
+# Também contém a atualização em lote (POST /api/casos/atualizar-cnj-lote), que
+# agrupa os casos por tribunal, consulta o DataJud em lotes concorrentes e
+# devolve o progresso caso a caso à medida que cada lote termina.
+# ==============================================================================
+import json
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+
+from cnj_service import consultar_processo_cnj, consultar_processo_cnj_em_streaming, consultar_lote_por_alias, dividir_em_lotes_por_alias, obter_disjuntores
+from cnj_sync import executar_por_tribunal, LimitadorPorTribunal, TribunalIndisponivel
+from cnj_ingestao import ingerir_resposta_cnj, ingerir_resposta_processo
+from cnj_prioridade import registrar_verificacao_cnj
+from cnj_streaming import RespostaEmStreaming
+import cnj_cache_negativo
+import cnj_fila
+
+# Assim como em tasks.py, db e os modelos são importados de 'app' dentro das funções
+# para evitar importação circular.
+
+STATUS_PENDENTE = 'pendente'
+STATUS_EXECUTANDO = 'executando'
+STATUS_CONCLUIDO = 'concluido'
+STATUS_ERRO = 'erro'
+STATUS_EM_ANDAMENTO = (STATUS_PENDENTE, STATUS_EXECUTANDO)
+
+_executor = None
+_lock = threading.Lock()
+_jobs_em_andamento = {} # caso_id -> id do CnjJob em andamento neste processo
+
+
+def obter_executor():
+    """Pool de threads (único por processo) que executa as atualizações CNJ da API."""
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=current_app.config.get('CNJ_ASYNC_MAX_WORKERS', 4), thread_name_prefix='cnj-job'
+            )
+        return _executor
+
+
+def atualizar_caso_cnj(caso):
+    """
+    Consulta o DataJud e registra as novas movimentações do processo do caso (com commit); os
+    outros casos com o mesmo número também são atualizados e registrados como verificados.
+    Retorna (corpo, status_http), no formato que o endpoint síncrono devolvia.
+    """
+    from app import db
+
+    logger = current_app.logger
+    caso_id = caso.id
+    if current_app.config.get('CNJ_STREAMING_ENABLED', False):
+        dados_resposta_cnj, status_http_cnj = consultar_processo_cnj_em_streaming(caso.numero_processo)
+    else:
+        dados_resposta_cnj, status_http_cnj = consultar_processo_cnj(caso.numero_processo)
+
+    if status_http_cnj >= 400:
+        logger.error(f"API CNJ: Falha na consulta ao cnj_service para caso {caso_id}. Status: {status_http_cnj}. Erro: {dados_resposta_cnj.get('erro')}")
+        response_status_api = status_http_cnj if status_http_cnj in [400, 401, 403, 404, 429, 500, 502, 503, 504] else 500
+        corpo_erro = {
+            "message": "Falha ao consultar o serviço do CNJ.",
+            "details": dados_resposta_cnj.get("erro", "Detalhes do erro indisponíveis."),
+            "cnj_service_response_details": dados_resposta_cnj.get("detalhes_servico_cnj")
+        }
+        if dados_resposta_cnj.get("circuito_aberto"):
+            corpo_erro["tentar_novamente_em"] = dados_resposta_cnj.get("tentar_novamente_em")
+        return corpo_erro, response_status_api
+
+    try:
+        resultado_ingestao = ingerir_resposta_cnj(caso, dados_resposta_cnj)
+        if isinstance(dados_resposta_cnj, RespostaEmStreaming):
+            # O corpo lido em streaming não fica em memória: para o cache negativo basta saber se houve hit
+            dados_resposta_cnj = {"hits": {"hits": [{}] if resultado_ingestao['processo_encontrado'] else []}}
+        for caso_do_numero in resultado_ingestao['casos']:
+            registrar_verificacao_cnj(caso_do_numero, resultado_ingestao['novas_movimentacoes'])
+        # O pedido explícito do usuário sempre consulta o DataJud, mas o resultado alimenta o cache negativo
+        cnj_cache_negativo.registrar_resultados({caso.numero_processo_digits: (dados_resposta_cnj, status_http_cnj)})
+        db.session.commit()
+
+        if not resultado_ingestao['processo_encontrado']:
+            logger.info(f"API CNJ: Nenhum 'hit' encontrado para '{caso.numero_processo}' (caso {caso_id}).")
+            return {"message": "Nenhum dado de processo encontrado no CNJ para o número fornecido.", "cnj_raw_response": dados_resposta_cnj}, 200
+
+        if not resultado_ingestao['movimentos_recebidos']:
+            logger.info(f"API CNJ: Processo '{caso.numero_processo}' encontrado, mas sem lista 'movimentos'.")
+            return {"message": "Processo encontrado no CNJ, mas sem detalhamento de movimentações."}, 200
+
+        if resultado_ingestao['movimentos_ignorados']:
+            logger.warning(f"API CNJ: {resultado_ingestao['movimentos_ignorados']} movimento(s) com 'dataHora' inválida ignorado(s) para caso {caso_id}.")
+        novas_movs_count = resultado_ingestao['novas_movimentacoes']
+        desc_mov_recente_lote = resultado_ingestao['descricao_ultima_movimentacao_nova']
+
+        msg_final = f"Caso atualizado. {novas_movs_count} nova(s) movimentação(ões) registrada(s)." if novas_movs_count > 0 else "Nenhuma nova movimentação encontrada para registrar."
+        logger.info(f"API CNJ: Atualização para caso {caso_id} concluída. {msg_final}")
+        return {
+            "message": msg_final,
+            "novas_movimentacoes_registradas": novas_movs_count,
+            "descricao_ultima_movimentacao_nova": desc_mov_recente_lote if novas_movs_count > 0 else None
+        }, 200
+
+    except IntegrityError:
+        # O índice único (processo_cnj_id, hash_movimentacao) barrou duplicatas: outra sincronização
+        # deste processo registrou as mesmas movimentações ao mesmo tempo.
+        db.session.rollback()
+        logger.warning(f"API CNJ: Sincronização concorrente detectada para caso {caso_id}; movimentações já registradas por outra execução.")
+        return {"message": "Outra atualização deste caso foi concluída ao mesmo tempo. As movimentações já estão registradas."}, 409
+    except json.JSONDecodeError as e_json:
+        # Na leitura em streaming o JSON só é decodificado durante a ingestão
+        db.session.rollback()
+        logger.error(f"API CNJ: Resposta do CNJ com JSON inválido para caso {caso_id}: {str(e_json)}")
+        return {"message": "A resposta do serviço do CNJ não estava em formato JSON válido."}, 502
+    except (KeyError, IndexError, TypeError, AttributeError) as e_proc:
+        db.session.rollback()
+        logger.error(f"API CNJ: Erro crítico ao processar dados da resposta CNJ para caso {caso_id}: {str(e_proc)}. Resposta CNJ (parcial): {str(dados_resposta_cnj)[:500]}", exc_info=True)
+        return {"message": "Erro interno ao processar os dados recebidos do CNJ.", "error_details": str(e_proc)}, 500
+
+
+def _job_em_andamento_no_banco(caso_id):
+    """Job pendente/em execução do caso registrado por qualquer processo, se ainda não for considerado abandonado."""
+    from app import CnjJob
+
+    limite = datetime.utcnow() - timedelta(seconds=current_app.config.get('CNJ_ASYNC_JOB_STALE_SECONDS', 300))
+    return CnjJob.query.filter(
+        CnjJob.caso_id == caso_id, CnjJob.status.in_(STATUS_EM_ANDAMENTO), CnjJob.criado_em >= limite
+    ).order_by(CnjJob.criado_em.desc()).first()
+
+
+def enfileirar_atualizacao_caso(caso, user_id):
+    """
+    Enfileira a atualização CNJ do caso, ou reaproveita a que já estiver em andamento.
+    Retorna (job, criado), onde 'criado' indica se um novo job foi enfileirado.
+    """
+    from app import db, CnjJob
+
+    app = current_app._get_current_object()
+    usar_fila = current_app.config.get('CNJ_FILA_ENABLED', False)
+    # O lock protege só o dicionário: as consultas e o commit ficam fora dele
+    with _lock:
+        job_id = _jobs_em_andamento.get(caso.id)
+    job = db.session.get(CnjJob, job_id) if job_id else _job_em_andamento_no_banco(caso.id)
+    if job is not None and job.status in STATUS_EM_ANDAMENTO:
+        return job, False
+
+    job = CnjJob(id=str(uuid.uuid4()), tipo='atualizar_caso', caso_id=caso.id, user_id=user_id, status=STATUS_PENDENTE)
+    db.session.add(job)
+    if usar_fila:
+        db.session.flush()
+        cnj_fila.enfileirar_casos([caso.id], cnj_fila.PRIORIDADE_MANUAL, job.id)
+    db.session.commit()
+    with _lock:
+        job_id = _jobs_em_andamento.setdefault(caso.id, job.id)
+    if job_id != job.id:
+        # Outro pedido deste processo registrou um job para o caso entre a consulta e o commit
+        return _descartar_job_duplicado(job, job_id, usar_fila), False
+
+    if usar_fila:
+        obter_executor().submit(_atender_pedidos_da_fila, app)
+    else:
+        obter_executor().submit(executar_job_atualizacao, app, job.id, caso.id)
+    return job, True
+
+
+def _descartar_job_duplicado(job, job_id_vencedor, usar_fila):
+    """Apaga (com commit) o job criado por um pedido simultâneo e retorna o job que o caso já tinha em andamento."""
+    from app import db, CnjJob
+
+    if usar_fila:
+        # O item da fila do caso é único e carrega o job do último pedido: volta a apontar para o vencedor
+        cnj_fila.enfileirar_casos([job.caso_id], cnj_fila.PRIORIDADE_MANUAL, job_id_vencedor)
+    db.session.delete(job)
+    db.session.commit()
+    return db.session.get(CnjJob, job_id_vencedor)
+
+
+def _atender_pedidos_da_fila(app):
+    """
+    Executado no pool de threads no modo fila: reserva e executa, um a um, os pedidos do usuário
+    pendentes na fila (deste ou de outro processo) até não restar nenhum livre. As verificações
+    periódicas ficam para os workers de sincronização.
+    """
+    from app import db
+
+    with app.app_context():
+        try:
+            while True:
+                token, itens = cnj_fila.reservar_itens(1, prioridade_minima=cnj_fila.PRIORIDADE_MANUAL)
+                if not itens:
+                    break
+                item = itens[0]
+                try:
+                    if item.cnj_job_id:
+                        executar_job_atualizacao(app, item.cnj_job_id, item.caso_id)
+                except BaseException:
+                    cnj_fila.liberar_itens(token)
+                    raise
+                cnj_fila.concluir_itens(token)
+        except Exception as e_fila:
+            db.session.rollback()
+            app.logger.error(f"API CNJ: Falha ao consumir a fila de atualizações CNJ: {str(e_fila)}", exc_info=True)
+        finally:
+            db.session.remove()
+
+
+def _marcar_jobs_com_erro(job_ids, mensagem):
+    """Marca como erro (com commit) os jobs de 'job_ids' que ainda estiverem pendentes/em execução."""
+    from app import db, CnjJob
+
+    CnjJob.query.filter(CnjJob.id.in_(job_ids), CnjJob.status.in_(STATUS_EM_ANDAMENTO)).update({
+        'status': STATUS_ERRO, 'http_status': 500, 'concluido_em': datetime.utcnow(), 'resultado': {"message": mensagem},
+    }, synchronize_session=False)
+    db.session.commit()
+
+
+def registrar_jobs_descartados(job_ids):
+    """Marca como erro (com commit) os jobs cujos itens foram descartados da fila após várias tentativas sem conclusão."""
+    if not job_ids:
+        return
+    _marcar_jobs_com_erro(job_ids, "A atualização foi interrompida repetidas vezes e foi descartada da fila. Tente novamente.")
+
+
+def expirar_job_abandonado(job):
+    """
+    Marca como erro (com commit) o job pendente/em execução criado há mais de CNJ_ASYNC_JOB_STALE_SECONDS
+    que não está em andamento neste processo nem na fila: o processo que o executava foi reiniciado
+    (os jobs da fila são tratados por registrar_jobs_descartados). Retorna o job atualizado.
+    """
+    from app import db, FilaSincronizacaoCNJ
+
+    limite = datetime.utcnow() - timedelta(seconds=current_app.config.get('CNJ_ASYNC_JOB_STALE_SECONDS', 300))
+    if job.status not in STATUS_EM_ANDAMENTO or job.criado_em >= limite:
+        return job
+    with _lock:
+        em_andamento_neste_processo = job.id in _jobs_em_andamento.values()
+    if em_andamento_neste_processo or FilaSincronizacaoCNJ.query.filter_by(cnj_job_id=job.id).first() is not None:
+        return job
+    current_app.logger.warning(f"API CNJ: Job {job.id} do caso {job.caso_id} abandonado ({job.status} desde {job.criado_em.isoformat()}); marcado como erro.")
+    _marcar_jobs_com_erro([job.id], "A atualização foi interrompida antes de terminar (o servidor foi reiniciado). Tente novamente.")
+    db.session.refresh(job)
+    return job
+
+
+def executar_job_atualizacao(app, job_id, caso_id):
+    """Executa um CnjJob de atualização de caso (no pool de threads ou por um worker da fila), registrando status e resultado."""
+    from app import db, Caso, CnjJob
+
+    with app.app_context():
+        try:
+            job = db.session.get(CnjJob, job_id)
+            job.status = STATUS_EXECUTANDO
+            job.iniciado_em = datetime.utcnow()
+            db.session.commit()
+
+            caso = db.session.get(Caso, caso_id)
+            if caso is None:
+                corpo, status_http = {"message": f"Caso com ID {caso_id} não encontrado."}, 404
+            else:
+                corpo, status_http = atualizar_caso_cnj(caso)
+        except Exception as e_job:
+            db.session.rollback()
+            app.logger.critical(f"API CNJ: Erro geral INESPERADO no job {job_id} de atualização CNJ do caso {caso_id}: {str(e_job)}", exc_info=True)
+            corpo, status_http = {"message": f"Ocorreu um erro geral e inesperado no sistema: {str(e_job)}"}, 500
+
+        try:
+            job = db.session.get(CnjJob, job_id)
+            job.status = STATUS_CONCLUIDO if status_http < 400 else STATUS_ERRO
+            job.http_status = status_http
+            job.resultado = corpo
+            job.concluido_em = datetime.utcnow()
+            db.session.commit()
+        except Exception as e_registro:
+            db.session.rollback()
+            app.logger.error(f"API CNJ: Falha ao registrar o resultado do job {job_id}: {str(e_registro)}")
+        finally:
+            with _lock:
+                if _jobs_em_andamento.get(caso_id) == job_id:
+                    del _jobs_em_andamento[caso_id]
+            db.session.remove()
+
+
+def _registrar_processo_do_lote(numero_digitos, casos_do_numero, resultados_lote, excecao_lote):
+    """
+    Ingere a resposta de um número de processo dentro de um SAVEPOINT, sem commit: um erro desfaz
+    só este processo, e o commit é feito uma vez por lote. As movimentações são gravadas uma vez e
+    repassadas a todos os casos com o número. Retorna os eventos de progresso dos casos pedidos
+    ('casos_do_numero', lista de (caso_id, numero_processo)).
+    """
+    from app import db
+
+    evento = {"tipo": "caso"}
+    if isinstance(excecao_lote, TribunalIndisponivel):
+        evento.update(status="tribunal_indisponivel", message=str(excecao_lote), tentar_novamente_em=round(excecao_lote.segundos))
+        return _eventos_dos_casos(evento, casos_do_numero)
+    if excecao_lote is not None:
+        evento.update(status="erro", message=f"Falha ao consultar o serviço do CNJ: {str(excecao_lote)}")
+        return _eventos_dos_casos(evento, casos_do_numero)
+    dados_cnj, status_http = resultados_lote.get(numero_digitos, ({"erro": "Processo ausente da resposta do lote."}, 500))
+    if dados_cnj.get("circuito_aberto"):
+        evento.update(status="tribunal_indisponivel", message=dados_cnj.get("erro"), tentar_novamente_em=dados_cnj.get("tentar_novamente_em"))
+        return _eventos_dos_casos(evento, casos_do_numero)
+    if status_http >= 400:
+        evento.update(status="erro", http_status=status_http, message="Falha ao consultar o serviço do CNJ.", details=dados_cnj.get("erro"))
+        return _eventos_dos_casos(evento, casos_do_numero)
+
+    try:
+        with db.session.begin_nested():
+            resultado = ingerir_resposta_processo(numero_digitos, dados_cnj)
+            for caso in resultado['casos']:
+                registrar_verificacao_cnj(caso, resultado['novas_movimentacoes'])
+    except IntegrityError:
+        evento.update(status="conflito", message="Outra atualização deste processo foi concluída ao mesmo tempo.")
+        return _eventos_dos_casos(evento, casos_do_numero)
+    except Exception as e_processo:
+        current_app.logger.error(f"API CNJ LOTE: Erro ao processar o processo '{numero_digitos}': {str(e_processo)}", exc_info=True)
+        evento.update(status="erro", message=f"Erro interno ao processar os dados recebidos do CNJ: {str(e_processo)}")
+        return _eventos_dos_casos(evento, casos_do_numero)
+
+    if not resultado['processo_encontrado']:
+        evento.update(status="nao_encontrado_no_cnj", novas_movimentacoes=0)
+    else:
+        evento.update(
+            status="atualizado", novas_movimentacoes=resultado['novas_movimentacoes'],
+            descricao_ultima_movimentacao_nova=resultado['descricao_ultima_movimentacao_nova']
+        )
+    return _eventos_dos_casos(evento, casos_do_numero)
+
+
+def _eventos_dos_casos(evento, casos_do_numero):
+    return [{**evento, "caso_id": caso_id, "numero_processo": numero_processo} for caso_id, numero_processo in casos_do_numero]
+
+
+def atualizar_casos_em_lote(casos):
+    """
+    Atualiza no CNJ vários casos, informados como (caso_id, numero_processo, numero_processo_digits,
+    alias_tribunal_cnj). Cada número distinto é consultado uma vez; os números são agrupados por
+    tribunal em lotes (um _search por lote), consultados em paralelo com limite de taxa por
+    tribunal, e cada lote é gravado com um único commit.
+    Gerador: devolve um evento por caso, na ordem em que os lotes terminam.
+    """
+    from app import db
+
+    app = current_app._get_current_object()
+    casos_por_numero, alias_por_numero = {}, {}
+    for caso_id, numero_processo, numero_digitos, alias_tribunal in casos:
+        casos_por_numero.setdefault(numero_digitos, []).append((caso_id, numero_processo))
+        alias_por_numero[numero_digitos] = alias_tribunal
+    # Números sem resultado recente no DataJud (cache negativo) não são consultados
+    for numero_digitos, valido_ate in cnj_cache_negativo.numeros_em_cache_negativo(list(casos_por_numero)).items():
+        for caso_id, numero_processo in casos_por_numero.pop(numero_digitos):
+            yield {
+                "tipo": "caso", "caso_id": caso_id, "numero_processo": numero_processo, "status": "sem_resultado_em_cache",
+                "message": "Processo sem resultado no CNJ em consulta recente; nova consulta após 'valido_ate'.",
+                "valido_ate": valido_ate.isoformat()
+            }
+    lotes = dividir_em_lotes_por_alias(
+        ((alias_por_numero[numero], numero) for numero in casos_por_numero), current_app.config.get('CNJ_JOB_BATCH_SIZE', 100)
+    )
+    limitador = LimitadorPorTribunal(
+        current_app.config.get('CNJ_JOB_RATE_PER_ALIAS', 0.2),
+        current_app.config.get('CNJ_JOB_BURST_PER_ALIAS', 1)
+    )
+
+    def buscar_lote_no_cnj(lote):
+        alias_tribunal, numeros_lote = lote
+        with app.app_context():
+            return consultar_lote_por_alias(alias_tribunal, numeros_lote)
+
+    tarefas = [(alias_tribunal, (alias_tribunal, numeros_lote)) for alias_tribunal, numeros_lote in lotes]
+    max_workers = current_app.config.get('CNJ_JOB_MAX_WORKERS', 4)
+    disjuntores = obter_disjuntores()
+    for (alias_tribunal, numeros_lote), resultados_lote, excecao_lote in executar_por_tribunal(
+            tarefas, buscar_lote_no_cnj, max_workers, limitador, disjuntores=disjuntores):
+        eventos = [
+            evento for numero_digitos in numeros_lote
+            for evento in _registrar_processo_do_lote(numero_digitos, casos_por_numero[numero_digitos], resultados_lote, excecao_lote)
+        ]
+        try:
+            if excecao_lote is None:
+                cnj_cache_negativo.registrar_resultados(resultados_lote)
+            db.session.commit()
+        except Exception as e_commit:
+            db.session.rollback()
+            current_app.logger.error(f"API CNJ LOTE: Falha ao gravar o lote do tribunal '{alias_tribunal}': {str(e_commit)}", exc_info=True)
+            for evento in eventos:
+                if evento['status'] not in ('erro', 'conflito', 'tribunal_indisponivel'):
+                    evento.update(status="erro", message="Falha ao gravar as movimentações do lote.")
+                    evento.pop('novas_movimentacoes', None)
+                    evento.pop('descricao_ultima_movimentacao_nova', None)
+        for evento in eventos:
+            yield evento
@@ -0,0 +1,281 @@
+# ==============================================================================
+# ARQUIVO: gestao_advocacia/cnj_metricas.py
+# Métricas da sincronização com o DataJud: por tribunal, consultas HTTP por
+# status, histograma de latência, casos verificados e movimentações novas.
+#
+# As métricas são coletadas por execução da sincronização (job agendado ou uma
+# passada de 'flask cnj-sync'), abertas com registrar_execucao(...) e gravadas,
+# ao final, em uma linha da tabela 'cnj_sync_run'. Tudo o que é exposto (GET
+# /api/admin/cnj-sync/stats e, no formato do Prometheus, /metrics) sai dessa
+# tabela, compartilhada por todos os processos: o job roda só no processo líder
+# do scheduler, e a coleta não pode depender de qual worker do gunicorn responde.
+# A execução em andamento fica em uma ContextVar, que o pool de threads de
+# cnj_sync.executar_por_tribunal repassa às threads das consultas: consultas
+# feitas ao mesmo tempo pela API, fora de uma execução, não são contabilizadas.
+# ==============================================================================
+import contextvars
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+# Assim como em tasks.py, db e os modelos são importados de 'app' dentro das funções
+# para evitar importação circular.
+
+# Limites superiores (segundos) das faixas do histograma de latência das consultas ao DataJud.
+LIMITES_LATENCIA_SEGUNDOS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Tribunal registrado para consultas sem alias identificado.
+TRIBUNAL_DESCONHECIDO = 'desconhecido'
+
+_execucao_atual = contextvars.ContextVar('execucao_sincronizacao_cnj', default=None)
+
+
+class MetricasCNJ:
+    """Contadores por tribunal da sincronização com o DataJud. Thread-safe."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tribunais = {}
+
+    def _tribunal(self, alias):
+        alias = alias or TRIBUNAL_DESCONHECIDO
+        tribunal = self._tribunais.get(alias)
+        if tribunal is None:
+            tribunal = self._tribunais[alias] = {
+                'consultas': Counter(), # Por status HTTP, ou 'timeout', 'conexao', 'json_invalido', 'erro', 'circuito_aberto'
+                'latencia_faixas': [0] * (len(LIMITES_LATENCIA_SEGUNDOS) + 1), # Não cumulativas; a última é +Inf
+                'latencia_soma': 0.0,
+                'casos_verificados': 0,
+                'casos_adiados': 0,
+                'novas_movimentacoes': 0,
+            }
+        return tribunal
+
+    def registrar_consulta(self, alias, status, segundos=None):
+        """Registra uma consulta ao DataJud e, se foi enviada, a sua latência."""
+        with self._lock:
+            tribunal = self._tribunal(alias)
+            tribunal['consultas'][str(status)] += 1
+            if segundos is not None:
+                tribunal['latencia_faixas'][bisect_left(LIMITES_LATENCIA_SEGUNDOS, segundos)] += 1
+                tribunal['latencia_soma'] += segundos
+
+    def registrar_casos(self, alias, verificados=0, novas_movimentacoes=0, adiados=0):
+        with self._lock:
+            tribunal = self._tribunal(alias)
+            tribunal['casos_verificados'] += verificados
+            tribunal['novas_movimentacoes'] += novas_movimentacoes
+            tribunal['casos_adiados'] += adiados
+
+    def instantaneo(self):
+        """Cópia dos contadores: {alias: {...}}, com as consultas por status em dict e 'erros' (status que não são 2xx)."""
+        with self._lock:
+            copia = {}
+            for alias, tribunal in self._tribunais.items():
+                consultas = dict(tribunal['consultas'])
+                copia[alias] = {
+                    'consultas': sum(consultas.values()),
+                    'consultas_por_status': consultas,
+                    'erros': sum(quantidade for status, quantidade in consultas.items() if not status.startswith('2')),
+                    'latencia': {'limites_segundos': list(LIMITES_LATENCIA_SEGUNDOS), 'faixas': list(tribunal['latencia_faixas']),
+                                 'soma_segundos': round(tribunal['latencia_soma'], 6)},
+                    'casos_verificados': tribunal['casos_verificados'],
+                    'casos_adiados': tribunal['casos_adiados'],
+                    'novas_movimentacoes': tribunal['novas_movimentacoes'],
+                }
+            return copia
+
+
+def registrar_consulta(alias, status, segundos=None):
+    """Registra uma consulta ao DataJud na execução em andamento neste contexto, se houver."""
+    execucao = _execucao_atual.get()
+    if execucao is not None:
+        execucao.registrar_consulta(alias, status, segundos)
+
+
+def registrar_casos(alias, verificados=0, novas_movimentacoes=0, adiados=0):
+    """Registra, na execução em andamento, casos verificados (e as movimentações novas deles) ou adiados de um tribunal."""
+    execucao = _execucao_atual.get()
+    if execucao is not None:
+        execucao.registrar_casos(alias, verificados, novas_movimentacoes, adiados)
+
+
+def _somar_tribunais(totais, tribunais):
+    """Acumula em 'totais' os contadores por tribunal de uma execução (formato de MetricasCNJ.instantaneo)."""
+    for alias, tribunal in (tribunais or {}).items():
+        total = totais.get(alias)
+        if total is None:
+            total = totais[alias] = {
+                'consultas': 0, 'consultas_por_status': {}, 'erros': 0,
+                'latencia': {'limites_segundos': list(LIMITES_LATENCIA_SEGUNDOS), 'faixas': [0] * (len(LIMITES_LATENCIA_SEGUNDOS) + 1), 'soma_segundos': 0.0},
+                'casos_verificados': 0, 'casos_adiados': 0, 'novas_movimentacoes': 0,
+            }
+        for chave in ('consultas', 'erros', 'casos_verificados', 'casos_adiados', 'novas_movimentacoes'):
+            total[chave] += tribunal.get(chave, 0)
+        for status, quantidade in tribunal.get('consultas_por_status', {}).items():
+            total['consultas_por_status'][status] = total['consultas_por_status'].get(status, 0) + quantidade
+        latencia = tribunal.get('latencia') or {}
+        if latencia.get('limites_segundos') == total['latencia']['limites_segundos']: # Execuções com outras faixas ficam fora do histograma
+            total['latencia']['faixas'] = [a + b for a, b in zip(total['latencia']['faixas'], latencia['faixas'])]
+            total['latencia']['soma_segundos'] = round(total['latencia']['soma_segundos'] + latencia.get('soma_segundos', 0.0), 6)
+    return totais
+
+
+def agregar_execucoes(janela_segundos, agora=None):
+    """
+    Soma os contadores por tribunal das execuções registradas em 'cnj_sync_run' concluídas nos
+    últimos 'janela_segundos'. Retorna {'janela_segundos', 'execucoes', 'tribunais'}.
+    """
+    from app import db, ExecucaoSincronizacaoCNJ
+
+    agora = agora or datetime.utcnow()
+    totais, execucoes = {}, 0
+    for tribunais in db.session.execute(
+            db.select(ExecucaoSincronizacaoCNJ.tribunais).where(ExecucaoSincronizacaoCNJ.concluido_em >= agora - timedelta(seconds=janela_segundos))
+    ).scalars():
+        _somar_tribunais(totais, tribunais)
+        execucoes += 1
+    return {'janela_segundos': janela_segundos, 'execucoes': execucoes, 'tribunais': totais}
+
+
+def calcular_atraso_verificacoes(agora=None):
+    """
+    Casos com a verificação no CNJ vencida e há quanto tempo o mais atrasado espera: desde a data
+    prevista ou, se nunca foi verificado, desde a criação do caso. Retorna
+    {'casos_pendentes', 'casos_nunca_verificados', 'atraso_maximo_segundos' (None sem pendentes)}.
+    """
+    from app import db, Caso
+
+    agora = agora or datetime.utcnow()
+    com_numero = Caso.numero_processo_digits.isnot(None)
+    vencidos, mais_antiga = db.session.execute(
+        db.select(db.func.count(), db.func.min(Caso.proxima_verificacao_cnj)).where(com_numero, Caso.proxima_verificacao_cnj <= agora)
+    ).one()
+    nunca_verificados, criacao_mais_antiga = db.session.execute(
+        db.select(db.func.count(), db.func.min(Caso.data_criacao)).where(com_numero, Caso.proxima_verificacao_cnj.is_(None))
+    ).one()
+    atrasos = [(agora - data).total_seconds() for data in (mais_antiga, criacao_mais_antiga) if data is not None]
+    return {'casos_pendentes': vencidos + nunca_verificados, 'casos_nunca_verificados': nunca_verificados,
+            'atraso_maximo_segundos': max(max(atrasos), 0.0) if atrasos else None}
+
+
+def _gravar_execucao(origem, iniciado_em, concluido_em, duracao, metricas, erro):
+    from app import db, ExecucaoSincronizacaoCNJ
+
+    tribunais = metricas.instantaneo()
+    atraso = calcular_atraso_verificacoes(concluido_em)
+    db.session.add(ExecucaoSincronizacaoCNJ(
+        origem=origem, iniciado_em=iniciado_em, concluido_em=concluido_em, duracao_segundos=round(duracao, 3),
+        casos_verificados=sum(tribunal['casos_verificados'] for tribunal in tribunais.values()),
+        novas_movimentacoes=sum(tribunal['novas_movimentacoes'] for tribunal in tribunais.values()),
+        consultas_http=sum(tribunal['consultas'] for tribunal in tribunais.values()),
+        erros_http=sum(tribunal['erros'] for tribunal in tribunais.values()),
+        casos_pendentes=atraso['casos_pendentes'], atraso_maximo_segundos=atraso['atraso_maximo_segundos'],
+        tribunais=tribunais, erro=erro[:1000] if erro else None
+    ))
+    retencao_dias = current_app.config.get('CNJ_SYNC_RUN_RETENCAO_DIAS', 30)
+    if retencao_dias:
+        db.session.execute(db.delete(ExecucaoSincronizacaoCNJ).where(
+            ExecucaoSincronizacaoCNJ.iniciado_em < concluido_em - timedelta(days=retencao_dias)
+        ))
+    db.session.commit()
+
+
+@contextmanager
+def registrar_execucao(origem):
+    """
+    Coleta as métricas de uma execução da sincronização ('job', 'cli') feita no bloco e grava a
+    linha em 'cnj_sync_run' ao final, mesmo se o bloco falhar (o que ele deixou pendente na sessão
+    é descartado antes: a transação pode ter falhado). Falhas na gravação só vão para o log.
+    """
+    from app import db
+
+    metricas = MetricasCNJ()
+    token = _execucao_atual.set(metricas)
+    iniciado_em = datetime.utcnow()
+    inicio = time.perf_counter()
+    erro = None
+    try:
+        yield metricas
+    except BaseException as e:
+        erro = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _execucao_atual.reset(token)
+        try:
+            if erro is not None:
+                db.session.rollback()
+            _gravar_execucao(origem, iniciado_em, datetime.utcnow(), time.perf_counter() - inicio, metricas, erro)
+        except Exception as e_gravar:
+            db.session.rollback()
+            current_app.logger.error(f"MÉTRICAS CNJ: Falha ao gravar a execução da sincronização: {str(e_gravar)}")
+
+
+def _escapar_rotulo(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _rotulos(**rotulos):
+    if not rotulos:
+        return ''
+    return '{' + ','.join(f'{nome}="{_escapar_rotulo(valor)}"' for nome, valor in rotulos.items()) + '}'
+
+
+def _numero(valor):
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+def formatar_prometheus(janela, atraso, ultima_execucao=None):
+    """
+    Texto no formato de exposição do Prometheus (text/plain; version=0.0.4) com os totais por
+    tribunal das execuções na janela ('janela', de agregar_execucoes), o atraso das verificações e a
+    última execução registrada (ExecucaoSincronizacaoCNJ ou None). Os totais são gauges da janela,
+    não contadores: a retenção de 'cnj_sync_run' os faria diminuir.
+    """
+    linhas = []
+    tribunais = sorted(janela['tribunais'].items())
+
+    def metrica(nome, ajuda, amostras):
+        linhas.append(f'# HELP {nome} {ajuda}')
+        linhas.append(f'# TYPE {nome} gauge')
+        for rotulos, valor in amostras:
+            linhas.append(f'{nome}{_rotulos(**rotulos)} {_numero(valor)}')
+
+    metrica('cnj_sync_janela_segundos', 'Janela das execuções somadas nas métricas cnj_*_janela.', [({}, janela['janela_segundos'])])
+    metrica('cnj_sync_execucoes_janela', 'Execuções da sincronização concluídas na janela.', [({}, janela['execucoes'])])
+    metrica('cnj_datajud_consultas_janela', 'Consultas ao DataJud na janela, por tribunal e status (HTTP ou tipo de falha).',
+            [({'tribunal': alias, 'status': status}, quantidade)
+             for alias, tribunal in tribunais for status, quantidade in sorted(tribunal['consultas_por_status'].items())])
+    # Histograma da latência na janela, no formato de faixas cumulativas (le) aceito por histogram_quantile
+    faixas, somas, quantidades = [], [], []
+    for alias, tribunal in tribunais:
+        acumulado = 0
+        limites = [_numero(limite) for limite in tribunal['latencia']['limites_segundos']] + ['+Inf']
+        for limite, quantidade in zip(limites, tribunal['latencia']['faixas']):
+            acumulado += quantidade
+            faixas.append(({'tribunal': alias, 'le': limite}, acumulado))
+        somas.append(({'tribunal': alias}, float(tribunal['latencia']['soma_segundos'])))
+        quantidades.append(({'tribunal': alias}, acumulado))
+    metrica('cnj_datajud_latencia_janela_segundos_bucket', 'Consultas ao DataJud na janela com latência até o limite (le), por tribunal.', faixas)
+    metrica('cnj_datajud_latencia_janela_segundos_sum', 'Soma das latências das consultas ao DataJud na janela, por tribunal.', somas)
+    metrica('cnj_datajud_latencia_janela_segundos_count', 'Consultas ao DataJud com latência medida na janela, por tribunal.', quantidades)
+    metrica('cnj_casos_verificados_janela', 'Casos verificados no CNJ na janela, por tribunal.',
+            [({'tribunal': alias}, tribunal['casos_verificados']) for alias, tribunal in tribunais])
+    metrica('cnj_casos_adiados_janela', 'Casos adiados por tribunal indisponível na janela, por tribunal.',
+            [({'tribunal': alias}, tribunal['casos_adiados']) for alias, tribunal in tribunais])
+    metrica('cnj_movimentacoes_novas_janela', 'Movimentações novas registradas na janela, por tribunal.',
+            [({'tribunal': alias}, tribunal['novas_movimentacoes']) for alias, tribunal in tribunais])
+    metrica('cnj_casos_pendentes', 'Casos com a verificação no CNJ vencida (inclui os nunca verificados).',
+            [({}, atraso['casos_pendentes'])])
+    metrica('cnj_atraso_verificacao_segundos', 'Há quanto tempo espera o caso com a verificação mais atrasada.',
+            [({}, float(atraso['atraso_maximo_segundos'] or 0.0))])
+    if ultima_execucao is not None:
+        metrica('cnj_sync_ultima_execucao_timestamp_segundos', 'Fim da última execução registrada da sincronização (Unix, UTC).',
+                [({'origem': ultima_execucao.origem}, float((ultima_execucao.concluido_em - datetime(1970, 1, 1)).total_seconds()))])
+        metrica('cnj_sync_ultima_execucao_duracao_segundos', 'Duração da última execução registrada da sincronização.',
+                [({'origem': ultima_execucao.origem}, float(ultima_execucao.duracao_segundos or 0.0))])
+    return '\n'.join(linhas) + '\n'
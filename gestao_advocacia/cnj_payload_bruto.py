@@ -0,0 +1,117 @@
+# ==============================================================================
+# ARQUIVO: gestao_advocacia/cnj_payload_bruto.py
+# Armazenamento dos JSON brutos recebidos do DataJud (dados_integra_cnj) fora
+# da tabela de movimentações, comprimidos e endereçados pelo conteúdo.
+#
+# - Cada JSON é serializado de forma compacta e canônica (chaves ordenadas, sem
+#   espaços) e identificado pelo SHA-256 dessa serialização: JSONs idênticos
+#   (ex.: o mesmo processo acompanhado por casos diferentes) ficam gravados uma
+#   única vez na tabela 'payload_cnj'. O hash é guardado em binário (32 bytes)
+#   e as movimentações referenciam o id inteiro do payload: com movimentos de
+#   poucas centenas de bytes, chaves textuais repetidas em linha e índices
+#   anulariam o ganho da compressão.
+# - A compressão é zlib com um dicionário pré-definido com as chaves e trechos
+#   mais comuns de um movimento do DataJud; como cada movimento é pequeno, o
+#   dicionário é o que torna a compressão efetiva. O formato usado fica gravado
+#   em cada linha, para que um dicionário novo não invalide os blobs antigos.
+# ==============================================================================
+import hashlib
+import json
+import zlib
+
+from sqlalchemy import insert
+
+# Assim como em tasks.py, db e os modelos são importados de 'app' dentro das funções
+# para evitar importação circular.
+
+# Trechos frequentes de um movimento do DataJud, do menos para o mais comum (o zlib
+# alcança com mais facilidade o fim do dicionário). NÃO altere: crie um novo formato.
+_DICIONARIO_ZLIB_V1 = (
+    b'"movimentoLocal":{"codigo":,"descricao":""},"codigoPai":'
+    b'"complementos":[{"codigo":,"descricao":"","nome":"","valor":}],'
+    b'"orgaoJulgador":{"codigoMunicipioIBGE":,"codigoOrgao":,"nome":"VARA CIVEL DA COMARCA DE JUIZADO ESPECIAL"},'
+    b'"movimentoNacional":{"codigoNacional":,"descricao":""},'
+    b'{"codigo":,"complementosTabelados":[{"codigo":,"descricao":"","nome":"","valor":}],'
+    b'"dataHora":"T:00.000Z","nome":""}'
+)
+
+FORMATO_ZLIB_V1 = 'zlib-d1'
+FORMATO_ATUAL = FORMATO_ZLIB_V1
+NIVEL_COMPRESSAO = 6
+
+# Quantidade máxima de hashes por cláusula IN ao verificar quais payloads já existem.
+TAMANHO_LOTE_HASHES = 500
+
+
+def serializar_json_compacto(dados):
+    """Serialização canônica (chaves ordenadas, sem espaços, UTF-8) usada no hash e na compressão."""
+    return json.dumps(dados, separators=(',', ':'), sort_keys=True, ensure_ascii=False).encode('utf-8')
+
+
+def comprimir_payload(dados):
+    """
+    Serializa e comprime um JSON bruto do DataJud.
+    Retorna a linha da tabela payload_cnj (sem o id): {'hash', 'formato', 'conteudo', 'tamanho_original'}.
+    """
+    serializado = serializar_json_compacto(dados)
+    compressor = zlib.compressobj(NIVEL_COMPRESSAO, zlib.DEFLATED, zlib.MAX_WBITS, 9, zlib.Z_DEFAULT_STRATEGY, _DICIONARIO_ZLIB_V1)
+    return {
+        'hash': hashlib.sha256(serializado).digest(),
+        'formato': FORMATO_ATUAL,
+        'conteudo': compressor.compress(serializado) + compressor.flush(),
+        'tamanho_original': len(serializado),
+    }
+
+
+def descomprimir_payload(conteudo, formato=FORMATO_ATUAL):
+    """Reverte comprimir_payload, devolvendo o JSON original (dict/list)."""
+    if formato != FORMATO_ZLIB_V1:
+        raise ValueError(f"Formato de payload CNJ desconhecido: '{formato}'")
+    descompressor = zlib.decompressobj(zlib.MAX_WBITS, _DICIONARIO_ZLIB_V1)
+    return json.loads(descompressor.decompress(conteudo) + descompressor.flush())
+
+
+def _ids_por_hash(hashes):
+    from app import db, PayloadCNJ
+
+    ids = {}
+    for inicio in range(0, len(hashes), TAMANHO_LOTE_HASHES):
+        bloco = hashes[inicio:inicio + TAMANHO_LOTE_HASHES]
+        ids.update((hash_payload, id_payload) for id_payload, hash_payload in
+                   db.session.query(PayloadCNJ.id, PayloadCNJ.hash).filter(PayloadCNJ.hash.in_(bloco)))
+    return ids
+
+
+def gravar_payloads(linhas):
+    """
+    Grava na tabela payload_cnj as linhas (de comprimir_payload) cujo hash ainda não existe.
+    Linhas repetidas na própria lista são gravadas uma vez. Não faz commit.
+    Retorna {hash: id do payload} para todas as linhas recebidas.
+    """
+    from app import db, PayloadCNJ
+
+    unicas = {}
+    for linha in linhas:
+        unicas.setdefault(linha['hash'], linha)
+    if not unicas:
+        return {}
+
+    ids = _ids_por_hash(list(unicas))
+    novas = [linha for hash_payload, linha in unicas.items() if hash_payload not in ids]
+    if not novas:
+        return ids
+
+    tabela = PayloadCNJ.__table__
+    dialeto = db.session.get_bind().dialect.name
+    if dialeto == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as insert_dialeto
+    elif dialeto == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as insert_dialeto
+    else:
+        insert_dialeto = None
+    # O mesmo payload pode ser gravado ao mesmo tempo por outra sincronização: como o conteúdo
+    # é idêntico por definição, o conflito no hash é simplesmente ignorado.
+    comando = insert_dialeto(tabela).on_conflict_do_nothing(index_elements=['hash']) if insert_dialeto else insert(tabela)
+    db.session.execute(comando, novas)
+    ids.update(_ids_por_hash([linha['hash'] for linha in novas]))
+    return ids
@@ -0,0 +1,143 @@
+# ==============================================================================
+# ARQUIVO: gestao_advocacia/cnj_prioridade.py
+# Agenda adaptativa das verificações no CNJ: cada caso tem uma prioridade e a
+# data da próxima verificação (Caso.proxima_verificacao_cnj, indexada), que o
+# job usa para escolher quem consultar. Assim o limite de consultas ao DataJud
+# vai para os processos em que uma novidade é mais provável.
+#
+# A prioridade combina três fatores:
+#   - atividade: taxa de movimentações por dia, uma média móvel exponencial
+#     atualizada a cada ingestão (sem reler o histórico do caso);
+#   - status do caso (que também recebe a descrição da última movimentação):
+#     arquivados/encerrados/baixados são verificados bem menos, suspensos menos;
+#   - agenda: eventos (EventoAgenda) próximos vinculados ao caso.
+# O intervalo até a próxima verificação é o intervalo padrão do job
+# (CNJ_JOB_VERIFICATION_INTERVAL_DAYS) dividido pela prioridade, limitado a
+# [CNJ_PRIORIDADE_INTERVALO_MIN_HORAS, CNJ_PRIORIDADE_INTERVALO_MAX_DIAS].
+# ==============================================================================
+import unicodedata
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+# Assim como em tasks.py, db e os modelos são importados de 'app' dentro das funções
+# para evitar importação circular.
+
+# Meia-vida (dias) da média móvel da taxa de movimentações.
+MEIA_VIDA_TAXA_DIAS = 30
+# Janela (dias) usada para estimar a taxa quando o caso ainda não tem uma (primeira sincronização).
+JANELA_TAXA_INICIAL_DIAS = 90
+# Intervalo mínimo (dias) considerado entre duas verificações no cálculo da taxa.
+INTERVALO_MINIMO_TAXA_DIAS = 1.0 / 24
+# Quanto cada movimentação/dia multiplica a prioridade (0,1/dia, ~3 por mês, dobra a prioridade).
+PESO_TAXA = 10.0
+
+# Trechos do status (sem acentos, minúsculo) -> peso. O primeiro que aparecer vale.
+PESOS_STATUS = (
+    ('arquivad', 0.05), ('baixa definitiva', 0.05), ('encerrad', 0.05), ('transito em julgado', 0.1),
+    ('suspens', 0.25), ('sobrestad', 0.25),
+)
+# Dias até o próximo evento da agenda do caso -> fator. O primeiro limite alcançado vale.
+FATORES_AGENDA = ((7, 4.0), (30, 2.0))
+
+
+def _sem_acentos(texto):
+    return unicodedata.normalize('NFKD', texto).encode('ascii', 'ignore').decode('ascii').lower()
+
+
+def peso_status(status):
+    """Peso do status do caso na prioridade (1.0 para ativos ou status desconhecido)."""
+    if not status:
+        return 1.0
+    status_normalizado = _sem_acentos(status)
+    for trecho, peso in PESOS_STATUS:
+        if trecho in status_normalizado:
+            return peso
+    return 1.0
+
+
+def fator_agenda(dias_ate_proximo_evento):
+    """Fator da agenda: maior quanto mais próximo o próximo evento do caso (None = sem evento)."""
+    if dias_ate_proximo_evento is None:
+        return 1.0
+    for limite_dias, fator in FATORES_AGENDA:
+        if dias_ate_proximo_evento <= limite_dias:
+            return fator
+    return 1.0
+
+
+def atualizar_taxa_movimentacoes(taxa_anterior, novas_movimentacoes, dias_decorridos):
+    """
+    Média móvel exponencial (meia-vida MEIA_VIDA_TAXA_DIAS) da taxa de movimentações por dia,
+    a partir da taxa anterior e das movimentações novas encontradas em 'dias_decorridos'.
+    Para um processo com ritmo constante, converge para esse ritmo.
+    """
+    dias = max(dias_decorridos, INTERVALO_MINIMO_TAXA_DIAS)
+    decaimento = 0.5 ** (dias / MEIA_VIDA_TAXA_DIAS)
+    return (taxa_anterior or 0.0) * decaimento + novas_movimentacoes * (1 - decaimento) / dias
+
+
+def calcular_prioridade(taxa_movimentacoes, status, dias_ate_proximo_evento):
+    """Prioridade do caso (1.0 = caso ativo sem movimentações nem eventos próximos)."""
+    return peso_status(status) * (1 + PESO_TAXA * (taxa_movimentacoes or 0.0)) * fator_agenda(dias_ate_proximo_evento)
+
+
+def calcular_intervalo_verificacao(prioridade, config=None):
+    """Intervalo até a próxima verificação: o intervalo padrão do job dividido pela prioridade, com limites."""
+    config = config or current_app.config
+    intervalo_padrao = timedelta(days=config.get('CNJ_JOB_VERIFICATION_INTERVAL_DAYS', 1))
+    intervalo_minimo = timedelta(hours=config.get('CNJ_PRIORIDADE_INTERVALO_MIN_HORAS', 6))
+    intervalo_maximo = timedelta(days=config.get('CNJ_PRIORIDADE_INTERVALO_MAX_DIAS', 30))
+    return min(max(intervalo_padrao / max(prioridade, 1e-6), intervalo_minimo), intervalo_maximo)
+
+
+def _dias_ate_proximo_evento(caso_id, agora):
+    from app import db, EventoAgenda
+
+    proximo_evento = db.session.query(db.func.min(EventoAgenda.data_inicio)).filter(
+        EventoAgenda.caso_id == caso_id, EventoAgenda.data_inicio >= agora
+    ).scalar()
+    return (proximo_evento - agora).total_seconds() / 86400 if proximo_evento else None
+
+
+def _taxa_inicial(processo_id, agora):
+    # Primeira estimativa (caso sem taxa): movimentações por dia do processo na janela recente, pelo
+    # índice (processo_cnj_id, data_movimentacao).
+    from app import db, MovimentacaoCNJ
+
+    if processo_id is None:
+        return 0.0
+    quantidade = db.session.query(db.func.count(MovimentacaoCNJ.id)).filter(
+        MovimentacaoCNJ.processo_cnj_id == processo_id,
+        MovimentacaoCNJ.data_movimentacao >= agora - timedelta(days=JANELA_TAXA_INICIAL_DIAS)
+    ).scalar()
+    return quantidade / JANELA_TAXA_INICIAL_DIAS
+
+
+def reagendar_verificacao_cnj(caso, agora=None):
+    """
+    Recalcula prioridade e próxima verificação do caso a partir da taxa atual (sem atualizá-la),
+    contando a partir da última verificação. Usada quando mudam o status ou a agenda do caso.
+    Não faz commit.
+    """
+    agora = agora or datetime.utcnow()
+    caso.prioridade_cnj = calcular_prioridade(caso.taxa_movimentacoes_cnj, caso.status, _dias_ate_proximo_evento(caso.id, agora))
+    if caso.data_ultima_verificacao_cnj is None:
+        caso.proxima_verificacao_cnj = None # Nunca verificado: fica na frente da fila
+    else:
+        caso.proxima_verificacao_cnj = caso.data_ultima_verificacao_cnj + calcular_intervalo_verificacao(caso.prioridade_cnj)
+
+
+def registrar_verificacao_cnj(caso, novas_movimentacoes=0, agora=None):
+    """
+    Registra uma verificação do caso no CNJ: atualiza a data da última verificação, a taxa de
+    movimentações (incremental) e agenda a próxima verificação. Não faz commit.
+    """
+    agora = agora or datetime.utcnow()
+    if caso.taxa_movimentacoes_cnj is None or caso.data_ultima_verificacao_cnj is None:
+        caso.taxa_movimentacoes_cnj = _taxa_inicial(caso.processo_cnj_id, agora)
+    else:
+        dias_decorridos = (agora - caso.data_ultima_verificacao_cnj).total_seconds() / 86400
+        caso.taxa_movimentacoes_cnj = atualizar_taxa_movimentacoes(caso.taxa_movimentacoes_cnj, novas_movimentacoes, dias_decorridos)
+    caso.data_ultima_verificacao_cnj = agora
+    reagendar_verificacao_cnj(caso, agora)
@@ -2,165 +2,614 @@
 # ARQUIVO: gestao_advocacia/cnj_service.py
 # Módulo para encapsular a lógica de comunicação com a API do CNJ (DataJud).
 # ==============================================================================
+import hashlib
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from collections import namedtuple
+from types import MappingProxyType
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+from email.utils import parsedate_to_datetime
 from flask import current_app # Para acessar app.config (configurações e logger)
-from datetime import datetime
-
-# Mapeamento de códigos de Tribunal (segmento TR do número do processo) para aliases da API DataJud.
-# Este mapeamento é CRUCIAL e deve ser o mais completo e preciso possível.
-# Consulte a documentação oficial do DataJud para a lista correta de aliases.
-TRIBUNAL_ALIASES_CNJ = {
-    "01": "api_publica_tjac",  # TJAC - Acre
-    "02": "api_publica_tjal",  # TJAL - Alagoas
-    "03": "api_publica_tjap",  # TJAP - Amapá
-    "04": "api_publica_tjam",  # TJAM - Amazonas
-    "05": "api_publica_tjba",  # TJBA - Bahia
-    "06": "api_publica_tjce",  # TJCE - Ceará
-    "07": "api_publica_tjdft", # TJDFT - Distrito Federal e Territórios
-    "08": "api_publica_tjes",  # TJES - Espírito Santo
-    "09": "api_publica_tjgo",  # TJGO - Goiás
-    "10": "api_publica_tjma",  # TJMA - Maranhão
-    "11": "api_publica_tjmt",  # TJMT - Mato Grosso
-    "12": "api_publica_tjms",  # TJMS - Mato Grosso do Sul
-    "13": "api_publica_tjmg",  # TJMG - Minas Gerais
-    "14": "api_publica_tjpa",  # TJPA - Pará
-    "15": "api_publica_tjpb",  # TJPB - Paraíba
-    "16": "api_publica_tjpr",  # TJPR - Paraná
-    "17": "api_publica_tjpe",  # TJPE - Pernambuco
-    "18": "api_publica_tjpi",  # TJPI - Piauí
-    "19": "api_publica_tjrj",  # TJRJ - Rio de Janeiro
-    "20": "api_publica_tjrn",  # TJRN - Rio Grande do Norte
-    "21": "api_publica_tjrs",  # TJRS - Rio Grande do Sul
-    "22": "api_publica_tjro",  # TJRO - Rondônia
-    "23": "api_publica_tjrr",  # TJRR - Roraima
-    "24": "api_publica_tjsc",  # TJSC - Santa Catarina
-    "25": "api_publica_tjsp",  # TJSP - São Paulo
-    "26": "api_publica_tjse",  # TJSE - Sergipe
-    "27": "api_publica_tjto",  # TJTO - Tocantins
-    # Adicione outros tribunais (TRFs, TRTs, etc.) conforme necessário,
-    # verificando o código TR e o alias correspondente na documentação do DataJud.
-}
+from datetime import datetime, timezone
+from cnj_sync import DisjuntoresPorTribunal
+from cnj_streaming import receber_resposta_em_streaming
+from cnj_arquivo import arquivar_resposta
+from cnj_metricas import registrar_consulta as registrar_consulta_metricas
+
+CNJ_API_BASE_URL_PADRAO = "https://api-publica.datajud.cnj.jus.br"
+
+# Registro dos tribunais do número único CNJ, por (segmento de justiça J, tribunal TR), carregado uma
+# vez, na importação, de dados/tribunais_cnj.json. As estruturas são imutáveis (MappingProxyType) e
+# podem ser lidas por várias threads sem lock.
+CAMINHO_REGISTRO_TRIBUNAIS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'dados', 'tribunais_cnj.json')
+
+Tribunal = namedtuple('Tribunal', ['segmento_justica', 'tribunal_tr', 'sigla', 'alias'])
+
+
+def carregar_registro_tribunais(caminho=CAMINHO_REGISTRO_TRIBUNAIS):
+    """Lê o arquivo de tribunais e retorna um mapeamento imutável (J, TR) -> Tribunal."""
+    with open(caminho, encoding='utf-8') as arquivo:
+        entradas = json.load(arquivo)['tribunais']
+    registro = {}
+    for entrada in entradas:
+        tribunal = Tribunal(entrada['j'], entrada['tr'], entrada['sigla'], entrada['alias'])
+        if len(tribunal.segmento_justica) != 1 or len(tribunal.tribunal_tr) != 2:
+            raise ValueError(f"Entrada inválida no registro de tribunais: {entrada}")
+        if (tribunal.segmento_justica, tribunal.tribunal_tr) in registro:
+            raise ValueError(f"Tribunal duplicado no registro: J={tribunal.segmento_justica} TR={tribunal.tribunal_tr}")
+        registro[(tribunal.segmento_justica, tribunal.tribunal_tr)] = tribunal
+    return MappingProxyType(registro)
+
+
+TRIBUNAIS_CNJ = carregar_registro_tribunais()
+# Mesmo registro indexado pelos 3 dígitos "J TR" (posições 14 a 16 do número), para a consulta direta.
+_ALIAS_POR_JTR = MappingProxyType({j + tr: tribunal.alias for (j, tr), tribunal in TRIBUNAIS_CNJ.items()})
+# Compatibilidade: TR -> alias apenas da Justiça Estadual (J = 8), como no mapeamento antigo.
+TRIBUNAL_ALIASES_CNJ = MappingProxyType({tr: tribunal.alias for (j, tr), tribunal in TRIBUNAIS_CNJ.items() if j == '8'})
+
+
+def normalizar_numero_processo(numero_processo):
+    """Retorna apenas os dígitos do número do processo (formato aceito pela API do DataJud)."""
+    if numero_processo and len(numero_processo) == 20 and numero_processo.isdigit():
+        return numero_processo
+    return "".join(filter(str.isdigit, numero_processo or ""))
+
 
 def extrair_segmento_tr_processo(numero_processo_completo):
     """
     Extrai o segmento 'TR' (identificador do tribunal) do número do processo CNJ.
-    Formato CNJ: NNNNNNN-DD.AAAA.J.TR.OOOO
-    Retorna a string do TR (ex: '02') ou None se o formato for inesperado.
+    Formato CNJ: NNNNNNN-DD.AAAA.J.TR.OOOO (aceita também só os 20 dígitos).
+    Retorna a string do TR (ex: '02') ou None se o número não tiver 20 dígitos.
     """
-    try:
-        partes = numero_processo_completo.split('.')
-        if len(partes) == 5: # Formato NNNNNNN-DD.AAAA.J.TR.OOOO tem 5 partes
-            return partes[3] # O quarto segmento é o TR
-        else:
-            # Verifica se current_app está disponível (pode não estar se este módulo for importado fora de um contexto de app)
-            if current_app:
-                current_app.logger.warning(f"Formato inesperado do número do processo CNJ '{numero_processo_completo}' ao tentar extrair TR (esperava 5 partes, obteve {len(partes)}).")
-            else:
-                print(f"AVISO (cnj_service): Formato inesperado do número do processo CNJ '{numero_processo_completo}' ao tentar extrair TR.")
-            return None
-    except Exception as e:
-        if current_app:
-            current_app.logger.error(f"Erro ao extrair segmento TR de '{numero_processo_completo}': {str(e)}")
-        else:
-            print(f"ERRO (cnj_service): Erro ao extrair segmento TR de '{numero_processo_completo}': {str(e)}")
-        return None
+    digitos = normalizar_numero_processo(numero_processo_completo)
+    return digitos[14:16] if len(digitos) == 20 else None
+
 
 def obter_alias_tribunal_por_numero(numero_processo):
     """
-    Obtém o alias do tribunal para a API DataJud a partir do número do processo CNJ.
+    Obtém o alias do tribunal para a API DataJud a partir do número do processo CNJ (pelo par J, TR).
+    Retorna None se o número não tiver 20 dígitos ou o tribunal não estiver no registro.
     """
-    segmento_tr = extrair_segmento_tr_processo(numero_processo)
-    if segmento_tr:
-        alias = TRIBUNAL_ALIASES_CNJ.get(segmento_tr)
-        if alias:
-            return alias
-        else:
-            if current_app:
-                current_app.logger.warning(f"Segmento TR '{segmento_tr}' (do processo '{numero_processo}') não foi encontrado no mapeamento de aliases TRIBUNAL_ALIASES_CNJ.")
-            else:
-                print(f"AVISO (cnj_service): Segmento TR '{segmento_tr}' (do processo '{numero_processo}') não encontrado no mapeamento.")
-            return None
-    return None
+    digitos = normalizar_numero_processo(numero_processo)
+    if len(digitos) != 20:
+        return None
+    return _ALIAS_POR_JTR.get(digitos[13:16])
+
 
-def consultar_processo_cnj(numero_processo_formatado_entrada):
+def decompor_numero_processo(numero_processo):
     """
-    Consulta um processo na API Pública do DataJud do CNJ.
-    Utiliza o número do processo formatado (com pontos e traço) para identificar o tribunal,
-    mas envia o número normalizado (apenas dígitos) para a API.
-    Retorna um tuple: (dados_json_resposta, status_code_http)
+    Decompõe o número do processo, em qualquer formatação, a partir dos seus dígitos
+    (NNNNNNN DD AAAA J TR OOOO). Retorna (digitos, segmento_justica, tribunal_tr, alias_datajud);
+    'digitos' é None se não houver dígitos, e os demais são None se não forem 20 dígitos
+    (o alias também se o tribunal não estiver no registro). Usada para preencher as colunas
+    normalizadas de Caso.
+    """
+    digitos = normalizar_numero_processo(numero_processo) or None
+    if digitos is None or len(digitos) != 20:
+        return digitos, None, None, None
+    return digitos, digitos[13], digitos[14:16], _ALIAS_POR_JTR.get(digitos[13:16])
+
+
+def validar_digitos_verificadores(numeros_processo):
+    """
+    Valida em lote os dígitos verificadores (DD) de números CNJ pelo módulo 97 (ISO 7064 MOD 97-10,
+    Resolução CNJ 65/2008): com o DD movido para o fim, NNNNNNN AAAA J TR OOOO DD deixa resto 1.
+    Aceita qualquer formatação; retorna uma lista de booleanos na ordem recebida (False se o
+    número não tiver 20 dígitos). Feita para importações em massa: uma passada, sem regex nem log.
+    """
+    resultado = []
+    anexar = resultado.append
+    for numero in numeros_processo:
+        digitos = numero if numero and len(numero) == 20 and numero.isdigit() else normalizar_numero_processo(numero)
+        anexar(len(digitos) == 20 and int(digitos[:7] + digitos[9:] + digitos[7:9]) % 97 == 1)
+    return resultado
+
+
+def calcular_digitos_verificadores(numero_sem_dv):
+    """Calcula o DD ('02' a '98') a partir dos 18 dígitos NNNNNNN AAAA J TR OOOO (sem o DD)."""
+    digitos = normalizar_numero_processo(numero_sem_dv)
+    if len(digitos) != 18:
+        raise ValueError(f"Esperados 18 dígitos (número sem o DD), obtidos {len(digitos)}: '{numero_sem_dv}'")
+    return f"{98 - int(digitos + '00') % 97:02d}"
+
+
+def _codigo_movimento(movimento_json):
+    codigo = movimento_json.get('codigo')
+    if codigo is None:
+        for chave in ('movimentoNacional', 'movimentoLocal', 'codigoNacional'):
+            sub = movimento_json.get(chave)
+            if isinstance(sub, dict) and sub.get('codigo') is not None:
+                return sub['codigo']
+    return codigo
+
+
+def calcular_hash_movimentacao(processo_id, movimento_json):
+    """
+    Calcula a impressão digital (SHA-256 hex) de uma movimentação do DataJud, a partir do processo,
+    da dataHora, do código do movimento e dos complementos. É determinística: a mesma
+    movimentação recebida em sincronizações diferentes gera sempre o mesmo hash.
+    """
+    data_hora = movimento_json.get('dataHora') or ''
+    try:
+        data_hora = datetime.fromisoformat(data_hora.replace('Z', '+00:00')).isoformat()
+    except ValueError:
+        pass
+
+    codigo = _codigo_movimento(movimento_json)
+    complementos = movimento_json.get('complementosTabelados') or movimento_json.get('complementos') or []
+    partes = [str(processo_id), data_hora, '' if codigo is None else str(codigo),
+              json.dumps(complementos, sort_keys=True, separators=(',', ':'), ensure_ascii=False)]
+    if codigo is None:
+        # Sem código, o nome/descrição do movimento é o que distingue dois movimentos no mesmo instante.
+        nomes = [movimento_json.get('nome')]
+        for chave in ('movimentoNacional', 'movimentoLocal'):
+            sub = movimento_json.get(chave)
+            nomes.append(sub.get('descricao') if isinstance(sub, dict) else None)
+        nomes.append(movimento_json.get('descricao'))
+        partes.append('|'.join(str(n) for n in nomes if n))
+    return hashlib.sha256('\x1f'.join(partes).encode('utf-8')).hexdigest()
+
+
+def calcular_hash_payload(source_processo):
+    """
+    Calcula a impressão digital (SHA-256 hex) do '_source' de um processo retornado pelo DataJud.
+    Usada para reconhecer, sem analisar os movimentos, uma resposta idêntica à da última sincronização.
+    Serializar milhares de movimentos custaria mais do que a própria ingestão incremental, então a
+    lista 'movimentos' entra resumida (quantidade, primeiro e último); o restante do '_source' entra
+    inteiro. Junto com o dataHoraUltimaAtualizacao, que o DataJud altera a cada reindexação do
+    processo, isso identifica a resposta.
+    """
+    campos = {chave: valor for chave, valor in source_processo.items() if chave != 'movimentos'}
+    movimentos = source_processo.get('movimentos')
+    resumo_movimentos = [len(movimentos), movimentos[:1], movimentos[-1:]] if isinstance(movimentos, list) else None
+    return calcular_hash_payload_resumido(campos, resumo_movimentos)
+
+
+def calcular_hash_payload_resumido(campos, resumo_movimentos):
+    """
+    Mesma impressão digital de calcular_hash_payload, a partir dos campos do '_source' sem
+    'movimentos' e do resumo [quantidade, [primeiro], [último]] da lista (None se o '_source' não
+    a tinha). Usada na leitura em streaming (cnj_streaming.py), em que a lista não fica em memória.
+    """
+    resumo = dict(campos)
+    if resumo_movimentos is not None:
+        resumo['movimentos'] = resumo_movimentos
+    serializado = json.dumps(resumo, sort_keys=True, separators=(',', ':'), ensure_ascii=False, default=str)
+    return hashlib.sha256(serializado.encode('utf-8')).hexdigest()
+
+
+# --- Camada de conexões HTTP persistentes ---
+# Cada alias de tribunal tem sua própria requests.Session, com um pool de conexões keep-alive
+# reaproveitado entre chamadas (evita novo DNS + handshake TCP/TLS a cada consulta).
+_sessoes_http_por_alias = {}
+_lock_sessoes_http = threading.Lock()
+
+
+class AdaptadorHTTPKeepAlive(HTTPAdapter):
+    """HTTPAdapter que habilita TCP keep-alive nos sockets do pool (quando suportado pelo SO)."""
+
+    def __init__(self, keepalive_idle_segundos=None, **kwargs):
+        self.keepalive_idle_segundos = keepalive_idle_segundos
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        if self.keepalive_idle_segundos:
+            opcoes_socket = list(HTTPConnection.default_socket_options) + [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+            if hasattr(socket, 'TCP_KEEPIDLE'):
+                opcoes_socket.append((socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, int(self.keepalive_idle_segundos)))
+            kwargs['socket_options'] = opcoes_socket
+        super().init_poolmanager(*args, **kwargs)
+
+
+def _criar_sessao_http(config):
+    sessao = requests.Session()
+    tamanho_pool = int(config.get('CNJ_HTTP_POOL_MAXSIZE', 4))
+    keepalive = config.get('CNJ_HTTP_KEEPALIVE', True)
+    adaptador = AdaptadorHTTPKeepAlive(
+        keepalive_idle_segundos=config.get('CNJ_HTTP_KEEPALIVE_IDLE_SECONDS', 60) if keepalive else None,
+        pool_connections=1, pool_maxsize=tamanho_pool, pool_block=False, max_retries=0
+    )
+    sessao.mount('https://', adaptador)
+    sessao.mount('http://', adaptador)
+    if not keepalive:
+        sessao.headers['Connection'] = 'close'
+    return sessao
+
+
+def obter_sessao_http(alias_tribunal, config=None):
     """
+    Retorna a sessão HTTP compartilhada (com pool de conexões) do alias de tribunal informado,
+    criando-a na primeira chamada. Seguro para uso a partir de várias threads.
+    """
+    sessao = _sessoes_http_por_alias.get(alias_tribunal)
+    if sessao is None:
+        with _lock_sessoes_http:
+            sessao = _sessoes_http_por_alias.get(alias_tribunal)
+            if sessao is None:
+                if config is None:
+                    config = current_app.config if current_app else {}
+                sessao = _criar_sessao_http(config)
+                _sessoes_http_por_alias[alias_tribunal] = sessao
+    return sessao
+
+
+def fechar_sessoes_http():
+    """Fecha todas as sessões HTTP do módulo (útil em testes ou ao recarregar configurações)."""
+    with _lock_sessoes_http:
+        for sessao in _sessoes_http_por_alias.values():
+            sessao.close()
+        _sessoes_http_por_alias.clear()
+
+
+def obter_timeout_http(config):
+    """Retorna a tupla (connect, read) de timeouts configurada para as chamadas ao DataJud."""
+    return (float(config.get('CNJ_HTTP_CONNECT_TIMEOUT', 5)), float(config.get('CNJ_HTTP_READ_TIMEOUT', 30)))
+
+
+# --- Disjuntores (circuit breakers) por tribunal ---
+# Compartilhados por todas as consultas do processo (job, endpoints e 'flask cnj-sync'): um tribunal fora
+# do ar ou respondendo 429 deixa de ser consultado por um tempo, em vez de custar um timeout por caso.
+_disjuntores = None
+_lock_disjuntores = threading.Lock()
+# Respostas que indicam tribunal indisponível/sobrecarregado (as demais, como 400 e 404, mostram que ele responde)
+STATUS_FALHA_TRIBUNAL = (429, 500, 502, 503, 504)
+
+
+def obter_disjuntores(config=None):
+    """Retorna os disjuntores por tribunal do processo, criando-os com a configuração na primeira chamada."""
+    global _disjuntores
+    with _lock_disjuntores:
+        if _disjuntores is None:
+            if config is None:
+                config = current_app.config if current_app else {}
+            _disjuntores = DisjuntoresPorTribunal(
+                limite_falhas=config.get('CNJ_CIRCUITO_LIMITE_FALHAS', 5),
+                espera_inicial=config.get('CNJ_CIRCUITO_ESPERA_INICIAL_SEGUNDOS', 30),
+                espera_maxima=config.get('CNJ_CIRCUITO_ESPERA_MAXIMA_SEGUNDOS', 1800)
+            )
+        return _disjuntores
+
+
+def reiniciar_disjuntores():
+    """Descarta o estado de todos os disjuntores (útil em testes ou ao recarregar configurações)."""
+    global _disjuntores
+    with _lock_disjuntores:
+        _disjuntores = None
+
+
+def interpretar_retry_after(valor, agora=None):
+    """Segundos pedidos pelo cabeçalho Retry-After (em segundos ou data HTTP); None se ausente ou inválido."""
+    if not valor:
+        return None
+    valor = valor.strip()
+    if valor.isdigit():
+        return float(valor)
+    try:
+        data = parsedate_to_datetime(valor)
+    except (TypeError, ValueError):
+        return None
+    if data is None:
+        return None
+    if data.tzinfo is None:
+        data = data.replace(tzinfo=timezone.utc)
+    return max((data - (agora or datetime.now(timezone.utc))).total_seconds(), 0.0)
+
+
+def _contexto_servico():
     # Acessa config e logger através do current_app. Se current_app não estiver disponível
-    # (ex: rodando este script isoladamente sem um app Flask), precisaria de uma alternativa.
+    # (ex: rodando este script isoladamente sem um app Flask), usa alternativas padrão.
     logger = current_app.logger if current_app else logging.getLogger(__name__) # Fallback para logger padrão
     config = current_app.config if current_app else {} # Fallback para config vazia
+    return logger, config
 
-    api_key_config = config.get('CNJ_API_KEY')
-    if not api_key_config:
-        logger.critical("CRÍTICO: CNJ_API_KEY não está configurada na aplicação. A consulta ao CNJ não pode prosseguir.")
-        return {"erro": "Erro de configuração interna do sistema: A chave da API do CNJ não foi fornecida ao sistema."}, 500
 
-    numero_processo_para_api = "".join(filter(str.isdigit, numero_processo_formatado_entrada))
-    
-    if len(numero_processo_para_api) != 20:
-        logger.warning(
-            f"Número de processo '{numero_processo_formatado_entrada}' resultou em '{numero_processo_para_api}' "
-            f"({len(numero_processo_para_api)} dígitos) após normalização. Esperava-se 20 dígitos. "
-            "A consulta à API do CNJ pode falhar ou retornar dados incorretos."
-        )
+def _erro_configuracao_api_key(logger):
+    logger.critical("CRÍTICO: CNJ_API_KEY não está configurada na aplicação. A consulta ao CNJ não pode prosseguir.")
+    return {"erro": "Erro de configuração interna do sistema: A chave da API do CNJ não foi fornecida ao sistema."}, 500
 
-    alias_tribunal_para_api = obter_alias_tribunal_por_numero(numero_processo_formatado_entrada)
-    if not alias_tribunal_para_api:
-        logger.error(f"Não foi possível determinar o alias do tribunal para o processo '{numero_processo_formatado_entrada}'.")
-        return {"erro": f"Não foi possível identificar o tribunal para o processo '{numero_processo_formatado_entrada}'. Verifique o formato do número e o mapeamento de tribunais."}, 400
 
-    url_endpoint_api = f"https://api-publica.datajud.cnj.jus.br/{alias_tribunal_para_api}/_search"
+def _executar_busca_datajud(alias_tribunal, payload_query_api, descricao_consulta, config, logger, streaming=False,
+                            numeros_consultados=None):
+    """
+    Envia uma consulta ao endpoint _search do alias informado, usando a sessão HTTP com pool.
+    Retorna um tuple: (dados_json_resposta, status_code_http), convertendo falhas em {"erro": ...}.
+    Com 'streaming', o corpo de uma resposta bem-sucedida não é decodificado: vem como
+    cnj_streaming.RespostaEmStreaming (o chamador deve fechá-la); as falhas continuam como dict.
+    Respostas bem-sucedidas vão para o arquivo de respostas (cnj_arquivo.py, CNJ_ARQUIVO_ENABLED),
+    identificadas pelos 'numeros_consultados' (só dígitos). Cada consulta entra nas métricas do
+    tribunal (cnj_metricas.py): status ou tipo de falha e latência.
+    """
+    url_base_api = config.get('CNJ_API_BASE_URL') or CNJ_API_BASE_URL_PADRAO
+    url_endpoint_api = f"{url_base_api.rstrip('/')}/{alias_tribunal}/_search"
     
     headers_http = {
-        "Authorization": f"APIKey {api_key_config}",
+        "Authorization": f"APIKey {config.get('CNJ_API_KEY')}",
         "Content-Type": "application/json",
         "User-Agent": f"AppGestaoAdvocacia/{config.get('APP_VERSION', '1.0.0')}"
     }
     
-    payload_query_api = {
-        "query": {
-            "match": {
-                "numeroProcesso": numero_processo_para_api
-            }
-        },
-        "size": 1 
-    }
-    
+    disjuntor = obter_disjuntores(config).disjuntor(alias_tribunal)
+    if not disjuntor.permitir():
+        segundos = disjuntor.segundos_bloqueado()
+        logger.warning(f"Circuito aberto para '{alias_tribunal}': consulta de {descricao_consulta} não enviada (nova tentativa em {segundos:.0f} s).")
+        registrar_consulta_metricas(alias_tribunal, 'circuito_aberto')
+        return {"erro": "O tribunal está temporariamente indisponível no serviço do CNJ. Tente novamente mais tarde.",
+                "circuito_aberto": True, "tentar_novamente_em": round(segundos)}, 503
+
     logger.info(f"Preparando para consultar API do CNJ: URL='{url_endpoint_api}', Payload='{str(payload_query_api)[:200]}'")
 
+    rotulo_metricas = 'erro'
+    inicio_consulta = time.perf_counter()
     try:
-        resposta_http = requests.post(url_endpoint_api, headers=headers_http, json=payload_query_api, timeout=30)
+        sessao_http = obter_sessao_http(alias_tribunal, config)
+        resposta_http = sessao_http.post(url_endpoint_api, headers=headers_http, json=payload_query_api,
+                                         timeout=obter_timeout_http(config), stream=streaming)
         resposta_http.raise_for_status()
         
-        logger.info(f"Resposta da API do CNJ ({resposta_http.status_code}) recebida para o processo '{numero_processo_formatado_entrada}'.")
-        return resposta_http.json(), resposta_http.status_code
+        logger.info(f"Resposta da API do CNJ ({resposta_http.status_code}) recebida para {descricao_consulta}.")
+        if streaming:
+            dados_resposta = receber_resposta_em_streaming(resposta_http, int(config.get('CNJ_STREAMING_SPOOL_MAX_BYTES', 8 * 1024 * 1024)))
+        else:
+            dados_resposta = resposta_http.json()
+        rotulo_metricas = str(resposta_http.status_code)
+        disjuntor.registrar_sucesso()
+        arquivar_resposta(alias_tribunal, numeros_consultados, dados_resposta, config, logger)
+        return dados_resposta, resposta_http.status_code
         
     except requests.exceptions.HTTPError as e_http:
+        rotulo_metricas = str(e_http.response.status_code)
         logger.error(
-            f"Erro HTTP ao consultar CNJ para '{numero_processo_formatado_entrada}': Status {e_http.response.status_code}. "
+            f"Erro HTTP ao consultar CNJ para {descricao_consulta}: Status {e_http.response.status_code}. "
             f"Resposta do servidor CNJ: {e_http.response.text[:500]}"
         )
+        if e_http.response.status_code in STATUS_FALHA_TRIBUNAL:
+            retry_after = interpretar_retry_after(e_http.response.headers.get('Retry-After'))
+            disjuntor.registrar_falha(retry_after, abrir_imediatamente=e_http.response.status_code == 429)
+        else:
+            disjuntor.registrar_sucesso()
         status_retorno = e_http.response.status_code if e_http.response.status_code in [400, 401, 403, 404, 429, 500, 502, 503, 504] else 502
         return {"erro": f"Erro {e_http.response.status_code} ao comunicar com o serviço do CNJ.", 
                 "detalhes_servico_cnj": e_http.response.text}, status_retorno
     except requests.exceptions.ConnectionError as e_conn:
-        logger.error(f"Erro de conexão ao consultar CNJ para '{numero_processo_formatado_entrada}': {str(e_conn)}")
+        rotulo_metricas = 'conexao'
+        disjuntor.registrar_falha()
+        logger.error(f"Erro de conexão ao consultar CNJ para {descricao_consulta}: {str(e_conn)}")
         return {"erro": "Não foi possível conectar ao serviço do CNJ. Verifique sua conexão de rede ou o status do serviço do CNJ."}, 503
     except requests.exceptions.Timeout as e_timeout:
-        logger.error(f"Timeout ao consultar CNJ para '{numero_processo_formatado_entrada}': {str(e_timeout)}")
+        rotulo_metricas = 'timeout'
+        disjuntor.registrar_falha()
+        logger.error(f"Timeout ao consultar CNJ para {descricao_consulta}: {str(e_timeout)}")
         return {"erro": "O serviço do CNJ demorou muito para responder (timeout). Tente novamente mais tarde."}, 504
     except requests.exceptions.RequestException as e_req:
-        logger.error(f"Erro de requisição (biblioteca requests) ao consultar CNJ para '{numero_processo_formatado_entrada}': {str(e_req)}")
+        disjuntor.registrar_falha()
+        logger.error(f"Erro de requisição (biblioteca requests) ao consultar CNJ para {descricao_consulta}: {str(e_req)}")
         return {"erro": "Ocorreu um erro inesperado na biblioteca de comunicação ao tentar acessar o serviço do CNJ."}, 500
     except ValueError as e_json: 
+        rotulo_metricas = 'json_invalido'
+        disjuntor.registrar_falha() # Ex.: página HTML de erro do gateway no lugar do JSON
         resposta_texto = resposta_http.text if 'resposta_http' in locals() else 'N/A (resposta não capturada)'
-        logger.error(f"Erro ao decodificar JSON da resposta do CNJ para '{numero_processo_formatado_entrada}': {str(e_json)}. Resposta bruta (início): {resposta_texto[:200]}")
+        logger.error(f"Erro ao decodificar JSON da resposta do CNJ para {descricao_consulta}: {str(e_json)}. Resposta bruta (início): {resposta_texto[:200]}")
         return {"erro": "A resposta do serviço do CNJ não estava em formato JSON válido."}, 502
     except Exception as e_geral:
-        logger.critical(f"Erro GERAL e INESPERADO durante a consulta ao CNJ para '{numero_processo_formatado_entrada}': {str(e_geral)}", exc_info=True)
+        disjuntor.registrar_falha() # Também libera a sondagem, se esta era a consulta do meio-aberto
+        logger.critical(f"Erro GERAL e INESPERADO durante a consulta ao CNJ para {descricao_consulta}: {str(e_geral)}", exc_info=True)
         return {"erro": "Ocorreu um erro interno inesperado no sistema ao processar a solicitação para o CNJ."}, 500
+    finally:
+        registrar_consulta_metricas(alias_tribunal, rotulo_metricas, time.perf_counter() - inicio_consulta)
+
+
+def consultar_processo_cnj(numero_processo_formatado_entrada, streaming=False):
+    """
+    Consulta um processo na API Pública do DataJud do CNJ.
+    Utiliza o número do processo formatado (com pontos e traço) para identificar o tribunal,
+    mas envia o número normalizado (apenas dígitos) para a API.
+    Retorna um tuple: (dados_json_resposta, status_code_http); com 'streaming', a resposta
+    bem-sucedida vem como RespostaEmStreaming (ver _executar_busca_datajud).
+    """
+    logger, config = _contexto_servico()
+
+    if not config.get('CNJ_API_KEY'):
+        return _erro_configuracao_api_key(logger)
+
+    numero_processo_para_api = normalizar_numero_processo(numero_processo_formatado_entrada)
+    
+    if len(numero_processo_para_api) != 20:
+        logger.warning(
+            f"Número de processo '{numero_processo_formatado_entrada}' resultou em '{numero_processo_para_api}' "
+            f"({len(numero_processo_para_api)} dígitos) após normalização. Esperava-se 20 dígitos. "
+            "A consulta à API do CNJ pode falhar ou retornar dados incorretos."
+        )
+
+    alias_tribunal_para_api = obter_alias_tribunal_por_numero(numero_processo_formatado_entrada)
+    if not alias_tribunal_para_api:
+        logger.error(f"Não foi possível determinar o alias do tribunal para o processo '{numero_processo_formatado_entrada}'.")
+        return {"erro": f"Não foi possível identificar o tribunal para o processo '{numero_processo_formatado_entrada}'. Verifique o formato do número e o mapeamento de tribunais."}, 400
+
+    payload_query_api = {
+        "query": {
+            "match": {
+                "numeroProcesso": numero_processo_para_api
+            }
+        },
+        "size": 1 
+    }
+    
+    return _executar_busca_datajud(
+        alias_tribunal_para_api, payload_query_api,
+        f"o processo '{numero_processo_formatado_entrada}'", config, logger, streaming=streaming,
+        numeros_consultados=[numero_processo_para_api]
+    )
+
+
+def consultar_processo_cnj_em_streaming(numero_processo_formatado_entrada):
+    """consultar_processo_cnj com a resposta bem-sucedida lida em streaming (RespostaEmStreaming, a fechar pelo chamador)."""
+    return consultar_processo_cnj(numero_processo_formatado_entrada, streaming=True)
+
+
+def agrupar_numeros_por_alias(numeros_processo, tamanho_lote):
+    """
+    Agrupa números de processo pelo alias do tribunal e divide cada grupo em lotes de até 'tamanho_lote'.
+    Retorna uma lista de tuplas (alias, [numeros]); números sem tribunal identificado ficam no alias None.
+    """
+    return dividir_em_lotes_por_alias(((obter_alias_tribunal_por_numero(numero), numero) for numero in numeros_processo), tamanho_lote)
 
+
+def dividir_em_lotes_por_alias(pares_alias_numero, tamanho_lote):
+    """
+    Como agrupar_numeros_por_alias, para pares (alias, numero) cujo alias já é conhecido
+    (ex.: Caso.alias_tribunal_cnj), sem derivá-lo de novo do número.
+    """
+    tamanho_lote = max(int(tamanho_lote), 1)
+    grupos = {}
+    for alias, numero in pares_alias_numero:
+        grupos.setdefault(alias, []).append(numero)
+    lotes = []
+    for alias, numeros in grupos.items():
+        for inicio in range(0, len(numeros), tamanho_lote):
+            lotes.append((alias, numeros[inicio:inicio + tamanho_lote]))
+    return lotes
+
+
+def consultar_lote_por_alias(alias_tribunal, numeros_processo, streaming=False):
+    """
+    Consulta vários processos de um mesmo tribunal com uma única chamada _search (query 'terms').
+    Retorna um dict {numero_processo_entrada: (dados_json, status_code)}, em que cada 'dados_json'
+    tem o mesmo formato da resposta de consultar_processo_cnj (todos os hits, um por grau de
+    jurisdição, daquele processo; a ingestão os mescla).
+    Com 'streaming', uma resposta bem-sucedida é devolvida inteira, sem separar os hits por número,
+    como RespostaEmStreaming (o chamador percorre os hits na ordem e a fecha); falhas continuam
+    no formato de dict.
+    """
+    logger, config = _contexto_servico()
+    numeros_processo = list(numeros_processo)
+
+    if not numeros_processo:
+        return {}
+    if not config.get('CNJ_API_KEY'):
+        erro = _erro_configuracao_api_key(logger)
+        return {numero: erro for numero in numeros_processo}
+    if not alias_tribunal:
+        return {
+            numero: ({"erro": f"Não foi possível identificar o tribunal para o processo '{numero}'. Verifique o formato do número e o mapeamento de tribunais."}, 400)
+            for numero in numeros_processo
+        }
+
+    digitos_por_numero = {numero: normalizar_numero_processo(numero) for numero in numeros_processo}
+    digitos_distintos = sorted(set(digitos_por_numero.values()))
+    # Um mesmo processo pode ter mais de um documento no DataJud (um por grau de jurisdição).
+    hits_por_processo = int(config.get('CNJ_LOTE_HITS_POR_PROCESSO', 3))
+
+    payload_query_api = {
+        "query": {
+            "terms": {
+                "numeroProcesso": digitos_distintos
+            }
+        },
+        # Documentos (graus) do mesmo processo consecutivos: a leitura em streaming os agrupa por número
+        "sort": [{"numeroProcesso": {"order": "asc"}}, {"@timestamp": {"order": "asc"}}],
+        "size": min(len(digitos_distintos) * hits_por_processo, 10000)
+    }
+
+    dados_resposta, status_http = _executar_busca_datajud(
+        alias_tribunal, payload_query_api,
+        f"lote de {len(digitos_distintos)} processo(s) em '{alias_tribunal}'", config, logger, streaming=streaming,
+        numeros_consultados=digitos_distintos
+    )
+    if status_http >= 400:
+        return {numero: (dados_resposta, status_http) for numero in numeros_processo}
+    if streaming:
+        return dados_resposta
+
+    hits_por_digitos = {digitos: [] for digitos in digitos_distintos}
+    for hit in dados_resposta.get("hits", {}).get("hits", []):
+        digitos_hit = normalizar_numero_processo(str((hit.get('_source') or {}).get('numeroProcesso', '')))
+        if digitos_hit in hits_por_digitos:
+            hits_por_digitos[digitos_hit].append(hit)
+
+    return {
+        numero: ({"hits": {"hits": hits_por_digitos[digitos]}}, status_http)
+        for numero, digitos in digitos_por_numero.items()
+    }
+
+
+def consultar_lote_por_alias_em_streaming(alias_tribunal, numeros_processo):
+    """consultar_lote_por_alias com a resposta bem-sucedida lida em streaming (RespostaEmStreaming, a fechar pelo chamador)."""
+    return consultar_lote_por_alias(alias_tribunal, numeros_processo, streaming=True)
+
+
+def formatar_data_hora_datajud(data_hora):
+    """datetime UTC (sem fuso) no formato de dataHoraUltimaAtualizacao do DataJud (ex.: 2024-06-01T10:00:00.000Z)."""
+    return data_hora.strftime('%Y-%m-%dT%H:%M:%S.') + f"{data_hora.microsecond // 1000:03d}Z"
+
+
+def interpretar_data_hora_datajud(valor):
+    """Converte um dataHoraUltimaAtualizacao do DataJud em datetime UTC sem fuso (None se ausente ou inválido)."""
+    if not isinstance(valor, str) or not valor:
+        return None
+    try:
+        data_hora = datetime.fromisoformat(valor.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    if data_hora.tzinfo is not None:
+        data_hora = data_hora.astimezone(timezone.utc).replace(tzinfo=None)
+    return data_hora
+
+
+def consultar_atualizacoes_por_alias(alias_tribunal, numeros_processo, atualizados_desde, search_after=None, tamanho_pagina=100):
+    """
+    Consulta uma página dos documentos de um tribunal, entre os 'numeros_processo', com
+    dataHoraUltimaAtualizacao posterior a 'atualizados_desde' (datetime UTC), em ordem crescente
+    dessa data (sincronização incremental, ver cnj_incremental.py). 'search_after' é o 'sort' do
+    último hit da página anterior (None na primeira). Retorna (dados_json, status_code); cada hit
+    traz o seu 'sort'.
+    """
+    logger, config = _contexto_servico()
+
+    if not config.get('CNJ_API_KEY'):
+        return _erro_configuracao_api_key(logger)
+
+    digitos_distintos = sorted({normalizar_numero_processo(numero) for numero in numeros_processo})
+    desde = formatar_data_hora_datajud(atualizados_desde)
+    payload_query_api = {
+        "query": {
+            "bool": {
+                "filter": [
+                    {"terms": {"numeroProcesso": digitos_distintos}},
+                    {"range": {"dataHoraUltimaAtualizacao": {"gt": desde}}}
+                ]
+            }
+        },
+        # O 'id' do documento (único, ao contrário do numeroProcesso, comum aos graus de um processo)
+        # desempata documentos com a mesma data entre uma página e a seguinte
+        "sort": [{"dataHoraUltimaAtualizacao": {"order": "asc"}}, {"id": {"order": "asc"}}],
+        "size": tamanho_pagina
+    }
+    if search_after:
+        payload_query_api["search_after"] = list(search_after)
+
+    return _executar_busca_datajud(
+        alias_tribunal, payload_query_api,
+        f"atualizações de {len(digitos_distintos)} processo(s) em '{alias_tribunal}' desde {desde}", config, logger,
+        numeros_consultados=digitos_distintos
+    )
+
+
+def consultar_processos_cnj_lote(numeros_processo, tamanho_lote=None):
+    """
+    Consulta vários processos no DataJud, emitindo um _search por grupo de até 'tamanho_lote'
+    números do mesmo tribunal (em vez de uma chamada por processo).
+    Retorna um dict {numero_processo_entrada: (dados_json, status_code)}.
+    """
+    _, config = _contexto_servico()
+    if tamanho_lote is None:
+        tamanho_lote = config.get('CNJ_JOB_BATCH_SIZE', 100)
+    resultados = {}
+    for alias_tribunal, numeros in agrupar_numeros_por_alias(numeros_processo, tamanho_lote):
+        resultados.update(consultar_lote_por_alias(alias_tribunal, numeros))
+    return resultados
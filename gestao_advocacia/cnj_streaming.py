@@ -0,0 +1,316 @@
+# ==============================================================================
+# ARQUIVO: gestao_advocacia/cnj_streaming.py
+# Leitura em streaming das respostas _search do DataJud (CNJ_STREAMING_ENABLED).
+#
+# Processos com dezenas de milhares de movimentações geram respostas de dezenas
+# de MB; com resposta_http.json() o documento inteiro vira objetos Python de uma
+# vez (várias vezes o tamanho do JSON). Aqui o corpo da resposta é copiado para
+# um arquivo temporário (em memória até CNJ_STREAMING_SPOOL_MAX_BYTES, depois em
+# disco) e lido aos poucos por um parser incremental: os hits são percorridos um
+# a um e a lista '_source.movimentos' é entregue movimento a movimento, sem que o
+# documento inteiro seja materializado.
+#
+# O parser usa só a biblioteca padrão: json.JSONDecoder.raw_decode (o scanner em
+# C) decodifica cada valor "folha" (um movimento, um campo do _source) direto do
+# buffer de texto, que é recarregado do arquivo quando um valor cruza o fim dele.
+# ==============================================================================
+import codecs
+import json
+import re
+import tempfile
+
+TAMANHO_BLOCO_LEITURA = 64 * 1024
+
+_ESPACOS = re.compile(r'[ \t\n\r]*')
+_decodificador = json.JSONDecoder()
+
+
+class LeitorJSONIncremental:
+    """
+    Lê um documento JSON a partir de blocos de texto, valor a valor. Objetos e arrays podem ser
+    percorridos (iterar_objeto/iterar_array) em vez de decodificados inteiros (ler_valor).
+    Erros de sintaxe geram ValueError (json.JSONDecodeError).
+    """
+
+    def __init__(self, blocos):
+        self._blocos = iter(blocos)
+        self._buffer = ''
+        self._pos = 0
+        self._esgotado = False
+
+    def _carregar(self):
+        """Acrescenta o próximo bloco ao buffer (descartando o que já foi lido). False no fim do fluxo."""
+        if self._esgotado:
+            return False
+        bloco = next(self._blocos, None)
+        if bloco is None:
+            self._esgotado = True
+            return False
+        self._buffer = self._buffer[self._pos:] + bloco
+        self._pos = 0
+        return True
+
+    def _erro(self, mensagem):
+        return json.JSONDecodeError(mensagem, self._buffer, self._pos)
+
+    def proximo_caractere(self):
+        """Pula espaços e retorna, sem consumir, o próximo caractere significativo ('' no fim do documento)."""
+        while True:
+            self._pos = _ESPACOS.match(self._buffer, self._pos).end()
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._carregar():
+                return ''
+
+    def consumir(self, esperado):
+        if self.proximo_caractere() != esperado:
+            raise self._erro(f"Esperado '{esperado}'")
+        self._pos += 1
+
+    def ler_valor(self):
+        """Decodifica inteiro o próximo valor JSON."""
+        self.proximo_caractere()
+        while True:
+            try:
+                valor, fim = _decodificador.raw_decode(self._buffer, self._pos)
+            except json.JSONDecodeError:
+                if self._carregar():
+                    continue
+                raise
+            # Um número no fim do buffer pode continuar no próximo bloco
+            if fim == len(self._buffer) and self._carregar():
+                continue
+            self._pos = fim
+            return valor
+
+    def iterar_array(self):
+        """Percorre um array: a cada passo o chamador deve ler (ou percorrer) o elemento antes de avançar."""
+        self.consumir('[')
+        if self.proximo_caractere() == ']':
+            self._pos += 1
+            return
+        while True:
+            yield
+            separador = self.proximo_caractere()
+            self._pos += 1
+            if separador == ']':
+                return
+            if separador != ',':
+                self._pos -= 1
+                raise self._erro("Esperado ',' ou ']'")
+
+    def iterar_objeto(self):
+        """Percorre um objeto devolvendo as chaves: o chamador deve ler (ou percorrer) o valor antes de avançar."""
+        self.consumir('{')
+        if self.proximo_caractere() == '}':
+            self._pos += 1
+            return
+        while True:
+            if self.proximo_caractere() != '"':
+                raise self._erro("Esperada uma chave")
+            chave = self.ler_valor()
+            self.consumir(':')
+            yield chave
+            separador = self.proximo_caractere()
+            self._pos += 1
+            if separador == '}':
+                return
+            if separador != ',':
+                self._pos -= 1
+                raise self._erro("Esperado ',' ou '}'")
+
+
+class SourceEmStreaming:
+    """
+    '_source' de um hit lido aos poucos. movimentos() entrega os movimentos um a um; os demais
+    campos ficam em 'campos' à medida que são lidos (todos, depois de movimentos() esgotado).
+    campo(nome) lê adiante até o campo; se a lista de movimentos vier antes dele, ela é guardada
+    em memória para o movimentos() seguinte (o DataJud costuma enviar 'movimentos' depois dos
+    campos de identificação, então isso é a exceção).
+    """
+
+    def __init__(self, leitor):
+        self._leitor = leitor
+        self._chaves = leitor.iterar_objeto()
+        self._terminado = False
+        self._movimentos_lidos_antes = None
+        self._gerador_movimentos = None
+        self.campos = {}
+        self.movimentos_em_lista = False
+        self.quantidade_movimentos = 0
+        self.primeiro_movimento = None
+        self.ultimo_movimento = None
+
+    def _proxima_chave(self):
+        chave = next(self._chaves, None)
+        if chave is None:
+            self._terminado = True
+        return chave
+
+    def _ler_movimentos(self):
+        if self._leitor.proximo_caractere() != '[':
+            self._leitor.ler_valor() # 'movimentos' que não é lista: ignorado, como em extrair_movimentos
+            return
+        self.movimentos_em_lista = True
+        for _ in self._leitor.iterar_array():
+            movimento = self._leitor.ler_valor()
+            if self.quantidade_movimentos == 0:
+                self.primeiro_movimento = movimento
+            self.quantidade_movimentos += 1
+            self.ultimo_movimento = movimento
+            yield movimento
+
+    def campo(self, nome):
+        """Valor de um campo do '_source' (None se ausente), lendo adiante até encontrá-lo. Use antes de movimentos()."""
+        while nome not in self.campos and not self._terminado:
+            chave = self._proxima_chave()
+            if chave == 'movimentos':
+                self._movimentos_lidos_antes = list(self._ler_movimentos())
+            elif chave is not None:
+                self.campos[chave] = self._leitor.ler_valor()
+        return self.campos.get(nome)
+
+    def movimentos(self):
+        """
+        Gera os movimentos na ordem da resposta e termina de ler o '_source'. Chamadas seguintes
+        devolvem o mesmo gerador, que continua de onde parou.
+        """
+        if self._gerador_movimentos is None:
+            self._gerador_movimentos = self._gerar_movimentos()
+        return self._gerador_movimentos
+
+    def _gerar_movimentos(self):
+        if self._movimentos_lidos_antes is not None:
+            lidos_antes, self._movimentos_lidos_antes = self._movimentos_lidos_antes, None
+            yield from lidos_antes
+        while not self._terminado:
+            chave = self._proxima_chave()
+            if chave == 'movimentos':
+                yield from self._ler_movimentos()
+            elif chave is not None:
+                self.campos[chave] = self._leitor.ler_valor()
+
+    def consumir(self):
+        """Lê o restante do '_source' (movimentos não pedidos são descartados)."""
+        for _ in self.movimentos():
+            pass
+
+    def resumo_movimentos(self):
+        """[quantidade, [primeiro], [último]] dos movimentos, como em cnj_service.calcular_hash_payload (None sem a lista)."""
+        if not self.movimentos_em_lista:
+            return None
+        if not self.quantidade_movimentos:
+            return [0, [], []]
+        return [self.quantidade_movimentos, [self.primeiro_movimento], [self.ultimo_movimento]]
+
+
+class DocumentosEmStreaming:
+    """
+    Documentos (SourceEmStreaming) de um mesmo processo, um por grau de jurisdição, na ordem da
+    resposta. Iterável uma única vez; cada documento deve ser lido antes de pedir o próximo.
+    """
+
+    def __init__(self, sources):
+        self._sources = iter(sources)
+
+    def __iter__(self):
+        return self._sources
+
+
+def iterar_sources(leitor):
+    """Percorre uma resposta _search ({"hits": {"hits": [...]}}) e gera um SourceEmStreaming por hit."""
+    for chave in leitor.iterar_objeto():
+        if chave != 'hits' or leitor.proximo_caractere() != '{':
+            leitor.ler_valor()
+            continue
+        for chave_hits in leitor.iterar_objeto():
+            if chave_hits != 'hits' or leitor.proximo_caractere() != '[':
+                leitor.ler_valor()
+                continue
+            for _ in leitor.iterar_array():
+                if leitor.proximo_caractere() != '{':
+                    leitor.ler_valor()
+                    continue
+                for chave_hit in leitor.iterar_objeto():
+                    if chave_hit != '_source' or leitor.proximo_caractere() != '{':
+                        leitor.ler_valor()
+                        continue
+                    source = SourceEmStreaming(leitor)
+                    yield source
+                    source.consumir()
+
+
+def blocos_de_texto(arquivo, tamanho_bloco=TAMANHO_BLOCO_LEITURA, encoding='utf-8'):
+    """Lê um arquivo binário em blocos de texto (caracteres multibyte divididos entre blocos são remontados)."""
+    decodificador = codecs.getincrementaldecoder(encoding)()
+    while True:
+        bloco = arquivo.read(tamanho_bloco)
+        if not bloco:
+            final = decodificador.decode(b'', final=True)
+            if final:
+                yield final
+            return
+        texto = decodificador.decode(bloco)
+        if texto:
+            yield texto
+
+
+class RespostaEmStreaming:
+    """
+    Corpo de uma resposta _search guardado em arquivo (binário, posicionado no início) e lido sob
+    demanda. Use como context manager, ou chame fechar(), para liberar o arquivo temporário.
+    """
+
+    def __init__(self, arquivo, tamanho_bloco=TAMANHO_BLOCO_LEITURA, encoding='utf-8'):
+        self._arquivo = arquivo
+        self._tamanho_bloco = tamanho_bloco
+        self._encoding = encoding
+
+    def sources(self):
+        """Gera um SourceEmStreaming por hit, na ordem da resposta (uma única passada pelo arquivo)."""
+        return iterar_sources(LeitorJSONIncremental(blocos_de_texto(self._arquivo, self._tamanho_bloco, self._encoding)))
+
+    def blocos_utf8(self):
+        """
+        Gera o corpo da resposta em blocos de bytes UTF-8 (ex.: para o arquivo de respostas, cnj_arquivo.py),
+        sem decodificá-lo como JSON. O arquivo volta ao início ao final, para a leitura por sources().
+        """
+        self._arquivo.seek(0)
+        try:
+            if codecs.lookup(self._encoding).name == 'utf-8':
+                while True:
+                    bloco = self._arquivo.read(self._tamanho_bloco)
+                    if not bloco:
+                        return
+                    yield bloco
+            else:
+                for texto in blocos_de_texto(self._arquivo, self._tamanho_bloco, self._encoding):
+                    yield texto.encode('utf-8')
+        finally:
+            self._arquivo.seek(0)
+
+    def fechar(self):
+        self._arquivo.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.fechar()
+
+
+def receber_resposta_em_streaming(resposta_http, limite_memoria, tamanho_bloco=TAMANHO_BLOCO_LEITURA):
+    """
+    Copia o corpo de uma resposta do requests (feita com stream=True) para um arquivo temporário,
+    em memória até 'limite_memoria' bytes e em disco a partir daí, liberando a conexão para o pool.
+    Erros de rede durante a leitura propagam como exceções do requests.
+    """
+    arquivo = tempfile.SpooledTemporaryFile(max_size=limite_memoria)
+    try:
+        for bloco in resposta_http.iter_content(chunk_size=tamanho_bloco):
+            arquivo.write(bloco)
+    except BaseException:
+        arquivo.close()
+        raise
+    arquivo.seek(0)
+    return RespostaEmStreaming(arquivo, tamanho_bloco, resposta_http.encoding or 'utf-8')
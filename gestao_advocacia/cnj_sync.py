@@ -0,0 +1,256 @@
+# ==============================================================================
+# ARQUIVO: gestao_advocacia/cnj_sync.py
+# Motor de sincronização concorrente com o DataJud: executa as consultas em um
+# pool de threads limitado, respeitando um limite de taxa (token bucket)
+# independente para cada alias de tribunal.
+#
+# Cada tribunal também tem um disjuntor (circuit breaker): depois de falhas
+# seguidas (ou de um 429) o circuito abre e o tribunal deixa de ser consultado
+# por um tempo com backoff exponencial e jitter, que respeita o Retry-After.
+# Enquanto o circuito está aberto, os itens do tribunal são devolvidos sem
+# consulta e o pool fica para os tribunais saudáveis.
+# ==============================================================================
+import contextvars
+import random
+import threading
+import time
+from collections import deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+
+class TokenBucket:
+    """
+    Limitador de taxa no estilo 'token bucket'.
+    'taxa_por_segundo' tokens são repostos por segundo, até o máximo de 'capacidade'.
+    """
+
+    def __init__(self, taxa_por_segundo, capacidade=1, relogio=time.monotonic):
+        if taxa_por_segundo <= 0:
+            raise ValueError("A taxa do token bucket deve ser positiva.")
+        self.taxa_por_segundo = float(taxa_por_segundo)
+        self.capacidade = max(float(capacidade), 1.0)
+        self._relogio = relogio
+        self._tokens = self.capacidade
+        self._ultima_reposicao = relogio()
+        self._lock = threading.Lock()
+
+    def _repor(self):
+        agora = self._relogio()
+        decorrido = agora - self._ultima_reposicao
+        if decorrido > 0:
+            self._tokens = min(self.capacidade, self._tokens + decorrido * self.taxa_por_segundo)
+            self._ultima_reposicao = agora
+
+    def tentar_consumir(self):
+        """
+        Tenta consumir um token sem bloquear.
+        Retorna 0 se o token foi consumido, ou quantos segundos faltam para o próximo token.
+        """
+        with self._lock:
+            self._repor()
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.taxa_por_segundo
+
+
+class LimitadorPorTribunal:
+    """Mantém um TokenBucket independente para cada alias de tribunal do DataJud."""
+
+    def __init__(self, taxa_por_segundo, capacidade=1, relogio=time.monotonic):
+        self.taxa_por_segundo = taxa_por_segundo
+        self.capacidade = capacidade
+        self._relogio = relogio
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, alias):
+        with self._lock:
+            bucket = self._buckets.get(alias)
+            if bucket is None:
+                bucket = TokenBucket(self.taxa_por_segundo, self.capacidade, relogio=self._relogio)
+                self._buckets[alias] = bucket
+            return bucket
+
+    def tentar_consumir(self, alias):
+        # Itens sem alias não geram chamada HTTP ao DataJud (a consulta falha antes), então não são limitados.
+        if alias is None:
+            return 0.0
+        return self.bucket(alias).tentar_consumir()
+
+
+ESTADO_FECHADO = 'fechado'
+ESTADO_ABERTO = 'aberto'
+ESTADO_MEIO_ABERTO = 'meio_aberto'
+
+
+class TribunalIndisponivel(Exception):
+    """O circuito do tribunal está aberto: a consulta não foi feita. 'segundos' até a próxima tentativa."""
+
+    def __init__(self, alias, segundos):
+        super().__init__(f"Tribunal '{alias}' temporariamente indisponível (circuito aberto); nova tentativa em {segundos:.0f} s.")
+        self.alias = alias
+        self.segundos = segundos
+
+
+class DisjuntorTribunal:
+    """
+    Circuit breaker de um tribunal: 'fechado' (consultas liberadas), 'aberto' (nenhuma consulta
+    até o fim da espera) e 'meio_aberto' (uma única consulta de sondagem decide se fecha ou reabre).
+    Abre após 'limite_falhas' falhas seguidas, ou na hora em um 429 ou se a resposta pedir um Retry-After.
+    A espera dobra a cada reabertura (de 'espera_inicial' até 'espera_maxima'), com jitter
+    ("equal jitter": entre metade e o total), e nunca é menor que o Retry-After recebido.
+    """
+
+    def __init__(self, limite_falhas=5, espera_inicial=30.0, espera_maxima=1800.0, relogio=time.monotonic, aleatorio=random.random):
+        self.limite_falhas = max(int(limite_falhas), 1)
+        self.espera_inicial = float(espera_inicial)
+        self.espera_maxima = float(espera_maxima)
+        self._relogio = relogio
+        self._aleatorio = aleatorio
+        self._lock = threading.Lock()
+        self.estado = ESTADO_FECHADO
+        self.falhas_seguidas = 0
+        self.aberturas_seguidas = 0
+        self._reabre_em = 0.0
+        self._sondagem_em_andamento = False
+
+    def _abrir(self, retry_after):
+        self.aberturas_seguidas += 1
+        espera = min(self.espera_inicial * 2 ** (self.aberturas_seguidas - 1), self.espera_maxima)
+        espera = espera / 2 + self._aleatorio() * espera / 2
+        if retry_after:
+            espera = max(espera, float(retry_after))
+        self.estado = ESTADO_ABERTO
+        self._reabre_em = self._relogio() + espera
+        self._sondagem_em_andamento = False
+
+    def segundos_bloqueado(self):
+        """
+        Quanto tempo (segundos) falta para o tribunal aceitar consultas; 0 se já aceita.
+        Não reserva a sondagem (ver permitir).
+        """
+        with self._lock:
+            if self.estado == ESTADO_FECHADO:
+                return 0.0
+            restante = self._reabre_em - self._relogio()
+            if restante > 0:
+                return restante
+            # Espera vencida: livre, a menos que outra consulta já esteja sondando o tribunal
+            return self.espera_inicial if self._sondagem_em_andamento else 0.0
+
+    def permitir(self):
+        """Indica se uma consulta pode ser feita agora; no meio-aberto, só a primeira (a sondagem) passa."""
+        with self._lock:
+            if self.estado == ESTADO_FECHADO:
+                return True
+            if self._reabre_em - self._relogio() > 0 or self._sondagem_em_andamento:
+                return False
+            self.estado = ESTADO_MEIO_ABERTO
+            self._sondagem_em_andamento = True
+            return True
+
+    def registrar_sucesso(self):
+        with self._lock:
+            self.estado = ESTADO_FECHADO
+            self.falhas_seguidas = 0
+            self.aberturas_seguidas = 0
+            self._sondagem_em_andamento = False
+
+    def registrar_falha(self, retry_after=None, abrir_imediatamente=False):
+        """
+        Registra uma falha do tribunal (timeout, conexão, 5xx). 'abrir_imediatamente' (429) ou um
+        Retry-After abrem o circuito sem esperar o limite de falhas seguidas.
+        """
+        with self._lock:
+            self.falhas_seguidas += 1
+            if (self.estado == ESTADO_MEIO_ABERTO or abrir_imediatamente or retry_after
+                    or self.falhas_seguidas >= self.limite_falhas):
+                self._abrir(retry_after)
+
+
+class DisjuntoresPorTribunal:
+    """Mantém um DisjuntorTribunal independente para cada alias de tribunal do DataJud."""
+
+    def __init__(self, limite_falhas=5, espera_inicial=30.0, espera_maxima=1800.0, relogio=time.monotonic, aleatorio=random.random):
+        self._parametros = dict(limite_falhas=limite_falhas, espera_inicial=espera_inicial, espera_maxima=espera_maxima,
+                                relogio=relogio, aleatorio=aleatorio)
+        self._disjuntores = {}
+        self._lock = threading.Lock()
+
+    def disjuntor(self, alias):
+        with self._lock:
+            disjuntor = self._disjuntores.get(alias)
+            if disjuntor is None:
+                disjuntor = DisjuntorTribunal(**self._parametros)
+                self._disjuntores[alias] = disjuntor
+            return disjuntor
+
+    def segundos_bloqueado(self, alias):
+        # Itens sem alias não geram chamada HTTP ao DataJud, então nunca ficam bloqueados.
+        if alias is None:
+            return 0.0
+        return self.disjuntor(alias).segundos_bloqueado()
+
+    def estados(self):
+        """Retorna {alias: estado} dos tribunais já consultados."""
+        with self._lock:
+            return {alias: disjuntor.estado for alias, disjuntor in self._disjuntores.items()}
+
+
+def executar_por_tribunal(tarefas, funcao_busca, max_workers, limitador, dormir=time.sleep, disjuntores=None):
+    """
+    Executa 'funcao_busca(item)' em um pool de threads limitado a 'max_workers'.
+    'tarefas' é um iterável de tuplas (alias, item). Cada alias tem seu próprio limite
+    de taxa (via 'limitador'), de modo que tribunais diferentes são consultados em paralelo
+    sem que um mesmo tribunal receba mais requisições do que o configurado.
+
+    É um gerador: produz (item, resultado, excecao) na ordem em que as buscas terminam,
+    para que o chamador persista os resultados na sua própria thread (a sessão do
+    SQLAlchemy não deve ser compartilhada entre threads).
+
+    Com 'disjuntores' (DisjuntoresPorTribunal), os itens de um tribunal com o circuito aberto
+    não são consultados: saem na hora com a exceção TribunalIndisponivel.
+    """
+    max_workers = max(int(max_workers), 1)
+    filas_por_alias = OrderedDict()
+    for alias, item in tarefas:
+        filas_por_alias.setdefault(alias, deque()).append(item)
+
+    if not filas_por_alias:
+        return
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='cnj-sync') as executor:
+        em_andamento = {}
+        while filas_por_alias or em_andamento:
+            espera_minima = None
+
+            # Percorre os tribunais em rodízio, despachando no máximo um item de cada por volta.
+            for alias in list(filas_por_alias.keys()):
+                bloqueio = disjuntores.segundos_bloqueado(alias) if disjuntores is not None else 0.0
+                if bloqueio > 0:
+                    for item in filas_por_alias.pop(alias):
+                        yield item, None, TribunalIndisponivel(alias, bloqueio)
+                    continue
+                if len(em_andamento) >= max_workers:
+                    break
+                espera = limitador.tentar_consumir(alias)
+                if espera > 0:
+                    espera_minima = espera if espera_minima is None else min(espera_minima, espera)
+                    continue
+                fila = filas_por_alias[alias]
+                item = fila.popleft()
+                if not fila:
+                    del filas_por_alias[alias]
+                # A busca roda com o contexto (contextvars) de quem chamou, ex.: a execução em cnj_metricas
+                em_andamento[executor.submit(contextvars.copy_context().run, funcao_busca, item)] = item
+
+            if em_andamento:
+                # Se há tribunais esperando token, acorda a tempo de despachá-los mesmo sem conclusões.
+                concluidos, _ = wait(list(em_andamento.keys()), timeout=espera_minima, return_when=FIRST_COMPLETED)
+                for futuro in concluidos:
+                    item = em_andamento.pop(futuro)
+                    excecao = futuro.exception()
+                    yield item, (None if excecao else futuro.result()), excecao
+            elif espera_minima:
+                dormir(espera_minima)
@@ -0,0 +1,128 @@
+# ==============================================================================
+# ARQUIVO: gestao_advocacia/comandos_cnj.py
+# Comandos de linha de comando (flask <comando>) da integração com o CNJ.
+#
+# Exemplo: sincronização fora dos processos web, dividida em 8 shards:
+#     flask cnj-sync --shard 0/8 --loop
+#     ...
+#     flask cnj-sync --shard 7/8 --loop
+#
+# Ou, com CNJ_FILA_ENABLED, quantos workers forem necessários consumindo a fila
+# durável (cnj_fila.py), que também recebe os pedidos feitos pela API:
+#     flask cnj-sync --fila --loop
+#
+# Com --incremental, cada passada começa pela sincronização incremental por
+# tribunal (cnj_incremental.py), e só o que ela não cobre vai pela normal.
+# Cada passada fica registrada em 'cnj_sync_run' (cnj_metricas.py).
+#
+# Reprocessamento do arquivo de respostas (cnj_arquivo.py), sem consultar o DataJud:
+#     flask cnj-replay --desde 2024-01-01 --processos 8
+# ==============================================================================
+import os
+import time
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from tasks import sincronizar_casos_cnj, sincronizar_pela_fila, sincronizar_incremental_cnj
+from cnj_cache_negativo import obter_estatisticas_cache_negativo
+from cnj_fila import obter_estatisticas_fila
+from cnj_metricas import registrar_execucao
+from cnj_arquivo import EXTENSAO_ZSTD, listar_segmentos, reprocessar_arquivo, zstandard
+from cnj_service import normalizar_numero_processo
+
+
+def interpretar_shard(valor):
+    """Converte 'i/N' em (i, N), com 0 <= i < N."""
+    try:
+        indice_texto, total_texto = valor.split('/')
+        indice, total = int(indice_texto), int(total_texto)
+    except ValueError:
+        raise click.BadParameter(f"'{valor}' não está no formato i/N (ex.: 2/8).")
+    if total < 1 or not 0 <= indice < total:
+        raise click.BadParameter(f"Shard '{valor}' inválido: use 0 <= i < N.")
+    return indice, total
+
+
+@click.command('cnj-sync')
+@click.option('--shard', 'shard_texto', default=None, metavar='i/N',
+              help='Processa só os casos com id % N == i (0 <= i < N). Sem a opção, processa todos.')
+@click.option('--fila', 'usar_fila', is_flag=True, default=False,
+              help='Enfileira os casos elegíveis e consome a fila durável (cnj_sync_queue) junto com os demais workers.')
+@click.option('--incremental', 'incremental', is_flag=True, default=False,
+              help='Antes de cada passada, consulta por tribunal só os documentos atualizados desde a última sincronização.')
+@click.option('--loop', 'em_loop', is_flag=True, default=False,
+              help='Repete a sincronização continuamente, aguardando CNJ_SYNC_LOOP_INTERVAL_SECONDS quando não há casos.')
+@click.option('--max-casos', type=int, default=None,
+              help='Máximo de casos por execução (padrão: CNJ_JOB_MAX_CASES_PER_RUN).')
+@with_appcontext
+def cnj_sync_command(shard_texto, usar_fila, incremental, em_loop, max_casos):
+    """Sincroniza com o DataJud os casos elegíveis, fora dos processos web."""
+    if usar_fila and shard_texto:
+        raise click.UsageError("--fila e --shard não podem ser usados juntos: os workers da fila já dividem o trabalho entre si.")
+    if incremental and shard_texto:
+        raise click.UsageError("--incremental e --shard não podem ser usados juntos: a passada incremental cobre todos os casos de cada tribunal.")
+    shard = interpretar_shard(shard_texto) if shard_texto else None
+    intervalo = current_app.config.get('CNJ_SYNC_LOOP_INTERVAL_SECONDS', 60)
+
+    while True:
+        # Cada passada é registrada em 'cnj_sync_run' (cnj_metricas.py)
+        with registrar_execucao('cli'):
+            if incremental:
+                click.echo(f"cnj-sync: {sincronizar_incremental_cnj()} caso(s) verificado(s) pela sincronização incremental.")
+            if usar_fila:
+                processados = sincronizar_pela_fila(max_casos=max_casos)
+                estatisticas = obter_estatisticas_fila()
+                click.echo(f"cnj-sync: {processados} item(ns) da fila processado(s); {estatisticas['itens']} na fila, {estatisticas['reservados']} reservado(s) por outros workers.")
+            else:
+                evitadas_antes = obter_estatisticas_cache_negativo()['consultas_evitadas']
+                processados = sincronizar_casos_cnj(shard=shard, max_casos=max_casos)
+                consultas_evitadas = obter_estatisticas_cache_negativo()['consultas_evitadas'] - evitadas_antes
+                click.echo(f"cnj-sync: {processados} caso(s) verificado(s), {consultas_evitadas} consulta(s) evitada(s) pelo cache negativo.")
+        if not em_loop:
+            break
+        if not processados:
+            try:
+                time.sleep(intervalo)
+            except KeyboardInterrupt:
+                break
+
+
+@click.command('cnj-replay')
+@click.option('--desde', type=click.DateTime(), default=None,
+              help='Só as respostas obtidas a partir desta data/hora (UTC).')
+@click.option('--ate', type=click.DateTime(), default=None,
+              help='Só as respostas obtidas até esta data/hora (UTC).')
+@click.option('--numero', 'numeros', multiple=True,
+              help='Só este número de processo (pode ser repetida).')
+@click.option('--processos', type=click.IntRange(min=1), default=None,
+              help='Processos em paralelo (padrão: um por núcleo).')
+@click.option('--diretorio', default=None,
+              help='Diretório do arquivo (padrão: CNJ_ARQUIVO_DIR).')
+@with_appcontext
+def cnj_replay_command(desde, ate, numeros, processos, diretorio):
+    """Reprocessa o arquivo de respostas do DataJud nas movimentações, sem consultar o DataJud."""
+    diretorio = diretorio or current_app.config.get('CNJ_ARQUIVO_DIR')
+    if not diretorio or not os.path.isdir(diretorio):
+        raise click.UsageError(f"Diretório do arquivo de respostas não encontrado: '{diretorio}'.")
+    segmentos = listar_segmentos(diretorio, ate=ate)
+    if zstandard is None and any(caminho.endswith(EXTENSAO_ZSTD) for caminho in segmentos):
+        raise click.ClickException("O arquivo tem segmentos zstd, mas o pacote 'zstandard' não está instalado.")
+    processos = processos or os.cpu_count() or 1
+    click.echo(f"cnj-replay: {len(segmentos)} segmento(s) em '{diretorio}', {min(processos, max(len(segmentos), 1))} processo(s).")
+
+    concluidos = 0
+
+    def ao_concluir(caminho, contadores):
+        nonlocal concluidos
+        concluidos += 1
+        click.echo(f"cnj-replay: [{concluidos}/{len(segmentos)}] {os.path.basename(caminho)}: {contadores['respostas']} resposta(s), "
+                   f"{contadores['inseridas']} movimentação(ões) inserida(s), {contadores['atualizadas']} atualizada(s).")
+
+    totais = reprocessar_arquivo(segmentos, processos=processos, desde=desde, ate=ate,
+                                 numeros=[normalizar_numero_processo(numero) for numero in numeros] or None,
+                                 ao_concluir=ao_concluir)
+    click.echo(f"cnj-replay: {totais['respostas']} resposta(s) e {totais['processos']} processo(s) reprocessado(s); "
+               f"{totais['inseridas']} movimentação(ões) inserida(s), {totais['atualizadas']} atualizada(s), "
+               f"{totais['sem_caso']} processo(s) sem caso, {totais['segmentos_truncados']} segmento(s) truncado(s).")
@@ -37,6 +37,27 @@ class Config:
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16 MB
 
     CNJ_API_KEY = os.environ.get('CNJ_API_KEY')
+    CNJ_API_BASE_URL = os.environ.get('CNJ_API_BASE_URL', 'https://api-publica.datajud.cnj.jus.br')
+
+    # --- Conexões HTTP com o DataJud (pool persistente por alias de tribunal) ---
+    CNJ_HTTP_POOL_MAXSIZE = int(os.environ.get('CNJ_HTTP_POOL_MAXSIZE', 4)) # Conexões mantidas por alias
+    CNJ_HTTP_KEEPALIVE = os.environ.get('CNJ_HTTP_KEEPALIVE', 'True').lower() == 'true'
+    CNJ_HTTP_KEEPALIVE_IDLE_SECONDS = int(os.environ.get('CNJ_HTTP_KEEPALIVE_IDLE_SECONDS', 60))
+    CNJ_HTTP_CONNECT_TIMEOUT = float(os.environ.get('CNJ_HTTP_CONNECT_TIMEOUT', 5))
+    CNJ_HTTP_READ_TIMEOUT = float(os.environ.get('CNJ_HTTP_READ_TIMEOUT', 30))
+    # Leitura em streaming das respostas (cnj_streaming.py) no job e no atualizar-cnj: os movimentos são
+    # ingeridos à medida que são lidos, sem decodificar o documento inteiro. O corpo fica em memória até
+    # CNJ_STREAMING_SPOOL_MAX_BYTES e, acima disso, em arquivo temporário.
+    CNJ_STREAMING_ENABLED = os.environ.get('CNJ_STREAMING_ENABLED', 'False').lower() == 'true'
+    CNJ_STREAMING_SPOOL_MAX_BYTES = int(os.environ.get('CNJ_STREAMING_SPOOL_MAX_BYTES', 8 * 1024 * 1024))
+    # Arquivo das respostas brutas do DataJud (cnj_arquivo.py), reprocessável com 'flask cnj-replay'.
+    # Segmentos NDJSON comprimidos com zstd (gzip se 'zstandard' não estiver instalado, ou com 'gzip'),
+    # trocados ao atingir o tamanho (bytes descomprimidos) ou a idade configurados.
+    CNJ_ARQUIVO_ENABLED = os.environ.get('CNJ_ARQUIVO_ENABLED', 'False').lower() == 'true'
+    CNJ_ARQUIVO_DIR = os.environ.get('CNJ_ARQUIVO_DIR') or os.path.join(os.path.abspath(os.path.dirname(__file__)), 'arquivo_cnj')
+    CNJ_ARQUIVO_COMPRESSAO = os.environ.get('CNJ_ARQUIVO_COMPRESSAO', 'zstd').lower()
+    CNJ_ARQUIVO_SEGMENTO_MAX_BYTES = int(os.environ.get('CNJ_ARQUIVO_SEGMENTO_MAX_BYTES', 256 * 1024 * 1024))
+    CNJ_ARQUIVO_SEGMENTO_MAX_SEGUNDOS = int(os.environ.get('CNJ_ARQUIVO_SEGMENTO_MAX_SEGUNDOS', 3600))
     APP_VERSION = os.environ.get('APP_VERSION') or '1.0.0'
 
     LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
@@ -46,10 +67,74 @@ class Config:
     CNJ_JOB_INTERVAL_HOURS = int(os.environ.get('CNJ_JOB_INTERVAL_HOURS', 12))
     CNJ_JOB_INTERVAL_MINUTES = int(os.environ.get('CNJ_JOB_INTERVAL_MINUTES', 0))
     CNJ_JOB_REQUEST_DELAY_SECONDS = int(os.environ.get('CNJ_JOB_REQUEST_DELAY_SECONDS', 5))
-    CNJ_JOB_MAX_CASES_PER_RUN = int(os.environ.get('CNJ_JOB_MAX_CASES_PER_RUN', 10))
+    CNJ_JOB_MAX_CASES_PER_RUN = int(os.environ.get('CNJ_JOB_MAX_CASES_PER_RUN', 1000))
+    # Quantos números de processo do mesmo tribunal vão em cada consulta em lote (_search com 'terms')
+    CNJ_JOB_BATCH_SIZE = int(os.environ.get('CNJ_JOB_BATCH_SIZE', 100))
+    # Documentos esperados por processo no DataJud (um por grau de jurisdição); dimensiona o 'size' do lote
+    CNJ_LOTE_HITS_POR_PROCESSO = int(os.environ.get('CNJ_LOTE_HITS_POR_PROCESSO', 3))
+    # Concorrência do motor de sincronização (threads consultando o DataJud ao mesmo tempo)
+    CNJ_JOB_MAX_WORKERS = int(os.environ.get('CNJ_JOB_MAX_WORKERS', 4))
+    # Limite de taxa independente por alias de tribunal (token bucket): requisições/segundo e rajada máxima.
+    # O padrão mantém o ritmo antigo de uma requisição a cada CNJ_JOB_REQUEST_DELAY_SECONDS, mas por tribunal.
+    CNJ_JOB_RATE_PER_ALIAS = float(os.environ.get('CNJ_JOB_RATE_PER_ALIAS', 1.0 / max(CNJ_JOB_REQUEST_DELAY_SECONDS, 1)))
+    CNJ_JOB_BURST_PER_ALIAS = int(os.environ.get('CNJ_JOB_BURST_PER_ALIAS', 1))
+    # Casos lidos por vez (cursor do lado do servidor no PostgreSQL) e processados como um bloco
+    CNJ_JOB_STREAM_CHUNK_SIZE = int(os.environ.get('CNJ_JOB_STREAM_CHUNK_SIZE', 500))
+    # Pausa entre execuções do 'flask cnj-sync --loop' quando não há casos elegíveis no shard
+    CNJ_SYNC_LOOP_INTERVAL_SECONDS = int(os.environ.get('CNJ_SYNC_LOOP_INTERVAL_SECONDS', 60))
+    # Atualizações CNJ disparadas pela API (POST atualizar-cnj): threads por processo e tempo após o qual
+    # um job pendente/em execução é considerado abandonado (não é mais reaproveitado por novos pedidos e,
+    # fora da fila, GET /api/cnj-jobs/<id> o informa como erro)
+    CNJ_ASYNC_MAX_WORKERS = int(os.environ.get('CNJ_ASYNC_MAX_WORKERS', 4))
+    CNJ_ASYNC_JOB_STALE_SECONDS = int(os.environ.get('CNJ_ASYNC_JOB_STALE_SECONDS', 300))
+    # Fila durável de atualizações CNJ (cnj_fila.py): pedidos do usuário e verificações periódicas na mesma fila,
+    # consumida pelas threads da API, pelo job e por 'flask cnj-sync --fila'. Itens reservados por vez por worker,
+    # prazo da reserva (após o qual um item de um worker que morreu volta à fila) e reservas sem conclusão
+    # após as quais o item é descartado
+    CNJ_FILA_ENABLED = os.environ.get('CNJ_FILA_ENABLED', 'False').lower() == 'true'
+    CNJ_FILA_ITENS_POR_RESERVA = int(os.environ.get('CNJ_FILA_ITENS_POR_RESERVA', 100))
+    CNJ_FILA_RESERVA_SEGUNDOS = int(os.environ.get('CNJ_FILA_RESERVA_SEGUNDOS', 600))
+    CNJ_FILA_MAX_TENTATIVAS = int(os.environ.get('CNJ_FILA_MAX_TENTATIVAS', 5))
+    # Sincronização incremental por tribunal (cnj_incremental.py): só os documentos com dataHoraUltimaAtualizacao
+    # posterior à marca do tribunal, menos a margem, entre os números acompanhados (até NUMEROS_POR_CONSULTA por
+    # consulta), em páginas de TAMANHO_PAGINA documentos.
+    CNJ_INCREMENTAL_ENABLED = os.environ.get('CNJ_INCREMENTAL_ENABLED', 'False').lower() == 'true'
+    CNJ_INCREMENTAL_TAMANHO_PAGINA = int(os.environ.get('CNJ_INCREMENTAL_TAMANHO_PAGINA', 100))
+    CNJ_INCREMENTAL_NUMEROS_POR_CONSULTA = int(os.environ.get('CNJ_INCREMENTAL_NUMEROS_POR_CONSULTA', 1000))
+    CNJ_INCREMENTAL_MARGEM_SEGUNDOS = int(os.environ.get('CNJ_INCREMENTAL_MARGEM_SEGUNDOS', 3600))
+    # Observabilidade da sincronização (cnj_metricas.py): dias de retenção das linhas de 'cnj_sync_run' (0 = sem
+    # limpeza), usuários (ids separados por vírgula) com acesso a GET /api/admin/cnj-sync/stats e o token (Bearer)
+    # de GET /api/admin/cnj-sync/metrics, formato do Prometheus; sem token, o endpoint de métricas fica desativado.
+    # Os dois endpoints somam as execuções de 'cnj_sync_run' concluídas nos últimos CNJ_METRICAS_JANELA_SEGUNDOS.
+    CNJ_SYNC_RUN_RETENCAO_DIAS = int(os.environ.get('CNJ_SYNC_RUN_RETENCAO_DIAS', 30))
+    CNJ_ADMIN_USER_IDS = [int(user_id) for user_id in os.environ.get('CNJ_ADMIN_USER_IDS', '').split(',') if user_id.strip()]
+    CNJ_METRICAS_TOKEN = os.environ.get('CNJ_METRICAS_TOKEN')
+    CNJ_METRICAS_JANELA_SEGUNDOS = int(os.environ.get('CNJ_METRICAS_JANELA_SEGUNDOS', 86400))
+    # Máximo de casos por pedido a POST /api/casos/atualizar-cnj-lote
+    CNJ_LOTE_API_MAX_CASOS = int(os.environ.get('CNJ_LOTE_API_MAX_CASOS', 500))
+    # Paginação de GET /api/casos/<id>/movimentacoes-cnj: itens por página (padrão e máximo)
+    CNJ_MOVIMENTACOES_LIMITE_PADRAO = int(os.environ.get('CNJ_MOVIMENTACOES_LIMITE_PADRAO', 50))
+    CNJ_MOVIMENTACOES_LIMITE_MAXIMO = int(os.environ.get('CNJ_MOVIMENTACOES_LIMITE_MAXIMO', 500))
+    # Agenda adaptativa (cnj_prioridade.py): intervalo base entre verificações de um caso ativo sem
+    # movimentações nem eventos próximos, dividido pela prioridade do caso e limitado ao mínimo/máximo
+    CNJ_JOB_VERIFICATION_INTERVAL_DAYS = float(os.environ.get('CNJ_JOB_VERIFICATION_INTERVAL_DAYS', 1))
+    CNJ_PRIORIDADE_INTERVALO_MIN_HORAS = float(os.environ.get('CNJ_PRIORIDADE_INTERVALO_MIN_HORAS', 6))
+    CNJ_PRIORIDADE_INTERVALO_MAX_DIAS = float(os.environ.get('CNJ_PRIORIDADE_INTERVALO_MAX_DIAS', 30))
+    # Disjuntor (circuit breaker) por tribunal: falhas seguidas (timeout, conexão, 5xx) que abrem o circuito
+    # (um 429 abre na hora) e espera inicial/máxima do backoff exponencial, que respeita o Retry-After
+    CNJ_CIRCUITO_LIMITE_FALHAS = int(os.environ.get('CNJ_CIRCUITO_LIMITE_FALHAS', 5))
+    CNJ_CIRCUITO_ESPERA_INICIAL_SEGUNDOS = float(os.environ.get('CNJ_CIRCUITO_ESPERA_INICIAL_SEGUNDOS', 30))
+    CNJ_CIRCUITO_ESPERA_MAXIMA_SEGUNDOS = float(os.environ.get('CNJ_CIRCUITO_ESPERA_MAXIMA_SEGUNDOS', 1800))
+    # Cache negativo (cnj_cache_negativo.py): validade, em dias, após 1, 2, 3+ consultas seguidas sem resultado no DataJud
+    CNJ_CACHE_NEGATIVO_TTLS_DIAS = [float(dias) for dias in os.environ.get('CNJ_CACHE_NEGATIVO_TTLS_DIAS', '1,7,30').split(',')]
 
     # Configurações do APScheduler
     SCHEDULER_API_ENABLED = True # Permite gerenciar jobs via API REST (opcional, provido pelo Flask-APScheduler)
     SCHEDULER_TIMEZONE = os.environ.get('SCHEDULER_TIMEZONE', "America/Sao_Paulo") # Fuso horário para o scheduler
+    # Eleição de líder: só um processo (entre workers e réplicas) executa os jobs do scheduler.
+    # PostgreSQL usa advisory lock; os demais bancos usam um lease renovado a cada heartbeat.
+    SCHEDULER_LEADER_ELECTION_ENABLED = os.environ.get('SCHEDULER_LEADER_ELECTION_ENABLED', 'True').lower() == 'true'
+    SCHEDULER_LEADER_LEASE_SECONDS = int(os.environ.get('SCHEDULER_LEADER_LEASE_SECONDS', 60))
+    SCHEDULER_LEADER_HEARTBEAT_SECONDS = int(os.environ.get('SCHEDULER_LEADER_HEARTBEAT_SECONDS', 15))
 
 
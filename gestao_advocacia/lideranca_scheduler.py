@@ -0,0 +1,195 @@
+# ==============================================================================
+# ARQUIVO: gestao_advocacia/lideranca_scheduler.py
+# Eleição de líder entre os processos da aplicação (workers do gunicorn,
+# réplicas), para que apenas um deles execute os jobs do APScheduler.
+#
+# - PostgreSQL: advisory lock de sessão (pg_try_advisory_lock) mantido por uma
+#   conexão dedicada. Se o processo líder morrer, o servidor encerra a sessão e
+#   libera o lock; outro processo o obtém na próxima tentativa.
+# - Demais bancos (SQLite): lease na tabela 'lideranca_scheduler', renovado a
+#   cada heartbeat. Se o líder parar de renovar, o lease expira e outro
+#   processo assume.
+# ==============================================================================
+import atexit
+import hashlib
+import logging
+import os
+import socket
+import threading
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import text, update, insert, or_
+from sqlalchemy.exc import IntegrityError
+
+# Assim como em tasks.py, db e os modelos são importados de 'app' dentro das funções
+# para evitar importação circular.
+
+
+def gerar_id_instancia():
+    """Identificador único deste processo (host, pid e um sufixo aleatório)."""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def chave_advisory_lock(nome):
+    """Converte o nome da eleição na chave bigint usada pelo pg_try_advisory_lock."""
+    return int.from_bytes(hashlib.sha256(nome.encode('utf-8')).digest()[:8], 'big', signed=True)
+
+
+class EleicaoLider:
+    """
+    Mantém (ou disputa) a liderança de 'nome' em uma thread de heartbeat.
+    'ao_assumir' e 'ao_perder' são chamados, na thread de heartbeat, quando este processo
+    ganha ou perde a liderança.
+    """
+
+    def __init__(self, app, nome, ao_assumir=None, ao_perder=None, duracao_lease=60, intervalo_heartbeat=15,
+                 id_instancia=None, relogio=datetime.utcnow):
+        self.app = app
+        self.nome = nome
+        self.ao_assumir = ao_assumir
+        self.ao_perder = ao_perder
+        self.duracao_lease = duracao_lease
+        self.intervalo_heartbeat = intervalo_heartbeat
+        self.id_instancia = id_instancia or gerar_id_instancia()
+        self._relogio = relogio
+        self._lider = False
+        self._conexao_lock = None
+        self._parar = threading.Event()
+        self._thread = None
+        self.logger = app.logger if app is not None else logging.getLogger(__name__)
+
+    def e_lider(self):
+        return self._lider
+
+    def _engine(self):
+        from app import db
+        with self.app.app_context():
+            return db.engine
+
+    def _usa_advisory_lock(self):
+        return self._engine().dialect.name == 'postgresql'
+
+    # --- PostgreSQL: advisory lock ---
+    def _tentar_advisory_lock(self):
+        if self._conexao_lock is not None:
+            # Já é líder: o heartbeat só confirma que a sessão que segura o lock continua viva.
+            try:
+                self._conexao_lock.execute(text("SELECT 1"))
+                self._conexao_lock.commit()
+                return True
+            except Exception as e_heartbeat:
+                self.logger.error(f"LIDERANÇA: Conexão que segurava o advisory lock '{self.nome}' caiu: {str(e_heartbeat)}")
+                self._fechar_conexao_lock()
+                return False
+
+        conexao = self._engine().connect()
+        try:
+            obtido = conexao.execute(text("SELECT pg_try_advisory_lock(:chave)"), {"chave": chave_advisory_lock(self.nome)}).scalar()
+            conexao.commit()
+        except Exception:
+            conexao.close()
+            raise
+        if obtido:
+            self._conexao_lock = conexao
+            return True
+        conexao.close()
+        return False
+
+    def _fechar_conexao_lock(self):
+        if self._conexao_lock is not None:
+            try:
+                self._conexao_lock.invalidate()
+                self._conexao_lock.close()
+            except Exception:
+                pass
+            self._conexao_lock = None
+
+    # --- Demais bancos: lease com heartbeat ---
+    def _tentar_lease(self):
+        from app import LiderancaScheduler
+
+        tabela = LiderancaScheduler.__table__
+        agora = self._relogio()
+        expira_em = agora + timedelta(seconds=self.duracao_lease)
+        with self._engine().begin() as conexao:
+            # Renova o próprio lease ou toma um lease expirado, de forma atômica.
+            resultado = conexao.execute(
+                update(tabela)
+                .where(tabela.c.nome == self.nome, or_(tabela.c.dono == self.id_instancia, tabela.c.expira_em < agora))
+                .values(dono=self.id_instancia, expira_em=expira_em)
+            )
+            if resultado.rowcount:
+                return True
+        try:
+            with self._engine().begin() as conexao:
+                conexao.execute(insert(tabela).values(nome=self.nome, dono=self.id_instancia, expira_em=expira_em))
+            return True
+        except IntegrityError:
+            # Outro processo detém um lease válido.
+            return False
+
+    def _liberar_lease(self):
+        from app import LiderancaScheduler
+
+        tabela = LiderancaScheduler.__table__
+        with self._engine().begin() as conexao:
+            conexao.execute(
+                update(tabela)
+                .where(tabela.c.nome == self.nome, tabela.c.dono == self.id_instancia)
+                .values(expira_em=self._relogio())
+            )
+
+    # --- Ciclo de vida ---
+    def verificar(self):
+        """Executa uma rodada de eleição/heartbeat e dispara os callbacks se a liderança mudou."""
+        try:
+            lider_agora = self._tentar_advisory_lock() if self._usa_advisory_lock() else self._tentar_lease()
+        except Exception as e_eleicao:
+            self.logger.error(f"LIDERANÇA: Falha ao disputar a liderança de '{self.nome}': {str(e_eleicao)}")
+            lider_agora = False
+
+        if lider_agora and not self._lider:
+            self._lider = True
+            self.logger.info(f"LIDERANÇA: Instância {self.id_instancia} assumiu a liderança de '{self.nome}'.")
+            if self.ao_assumir:
+                self.ao_assumir()
+        elif not lider_agora and self._lider:
+            self._lider = False
+            self.logger.warning(f"LIDERANÇA: Instância {self.id_instancia} perdeu a liderança de '{self.nome}'.")
+            if self.ao_perder:
+                self.ao_perder()
+        return self._lider
+
+    def _executar(self):
+        while not self._parar.is_set():
+            self.verificar()
+            self._parar.wait(self.intervalo_heartbeat)
+
+    def iniciar(self):
+        """Inicia a thread de heartbeat (daemon) e registra a liberação da liderança na saída do processo."""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._executar, name=f"lideranca-{self.nome}", daemon=True)
+        self._thread.start()
+        atexit.register(self.parar)
+
+    def parar(self):
+        """Para o heartbeat e libera a liderança, para que outro processo assuma sem esperar o lease expirar."""
+        self._parar.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=self.intervalo_heartbeat)
+        if not self._lider:
+            return
+        try:
+            if self._conexao_lock is not None:
+                self._conexao_lock.execute(text("SELECT pg_advisory_unlock(:chave)"), {"chave": chave_advisory_lock(self.nome)})
+                self._conexao_lock.commit()
+                self._fechar_conexao_lock()
+            else:
+                self._liberar_lease()
+        except Exception as e_liberar:
+            self.logger.warning(f"LIDERANÇA: Falha ao liberar a liderança de '{self.nome}': {str(e_liberar)}")
+        self._lider = False
+        if self.ao_perder:
+            self.ao_perder()
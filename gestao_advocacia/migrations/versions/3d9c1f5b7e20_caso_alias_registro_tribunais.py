@@ -0,0 +1,94 @@
+"""Recalcula o alias DataJud de Caso a partir do registro completo de tribunais (todos os segmentos)
+
+Revision ID: 3d9c1f5b7e20
+Revises: 7a6b3f0c2e84
+Create Date: 2026-10-17 19:12:27.903415
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3d9c1f5b7e20'
+down_revision = '7a6b3f0c2e84'
+branch_labels = None
+depends_on = None
+
+TAMANHO_LOTE_BACKFILL = 1000
+
+caso = sa.table(
+    'caso',
+    sa.column('id', sa.Integer),
+    sa.column('numero_processo_digits', sa.String(20)),
+    sa.column('alias_tribunal_cnj', sa.String(60)),
+)
+
+# Cópia congelada de dados/tribunais_cnj.json nesta revisão ("J" + "TR" -> alias DataJud).
+_ALIAS_POR_JTR = {
+    "300": "api_publica_stj", "401": "api_publica_trf1", "402": "api_publica_trf2", "403": "api_publica_trf3",
+    "404": "api_publica_trf4", "405": "api_publica_trf5", "406": "api_publica_trf6", "500": "api_publica_tst",
+    "501": "api_publica_trt1", "502": "api_publica_trt2", "503": "api_publica_trt3", "504": "api_publica_trt4",
+    "505": "api_publica_trt5", "506": "api_publica_trt6", "507": "api_publica_trt7", "508": "api_publica_trt8",
+    "509": "api_publica_trt9", "510": "api_publica_trt10", "511": "api_publica_trt11",
+    "512": "api_publica_trt12", "513": "api_publica_trt13", "514": "api_publica_trt14",
+    "515": "api_publica_trt15", "516": "api_publica_trt16", "517": "api_publica_trt17",
+    "518": "api_publica_trt18", "519": "api_publica_trt19", "520": "api_publica_trt20",
+    "521": "api_publica_trt21", "522": "api_publica_trt22", "523": "api_publica_trt23",
+    "524": "api_publica_trt24", "600": "api_publica_tse", "601": "api_publica_tre-ac",
+    "602": "api_publica_tre-al", "603": "api_publica_tre-ap", "604": "api_publica_tre-am",
+    "605": "api_publica_tre-ba", "606": "api_publica_tre-ce", "607": "api_publica_tre-df",
+    "608": "api_publica_tre-es", "609": "api_publica_tre-go", "610": "api_publica_tre-ma",
+    "611": "api_publica_tre-mt", "612": "api_publica_tre-ms", "613": "api_publica_tre-mg",
+    "614": "api_publica_tre-pa", "615": "api_publica_tre-pb", "616": "api_publica_tre-pr",
+    "617": "api_publica_tre-pe", "618": "api_publica_tre-pi", "619": "api_publica_tre-rj",
+    "620": "api_publica_tre-rn", "621": "api_publica_tre-rs", "622": "api_publica_tre-ro",
+    "623": "api_publica_tre-rr", "624": "api_publica_tre-sc", "625": "api_publica_tre-se",
+    "626": "api_publica_tre-sp", "627": "api_publica_tre-to", "700": "api_publica_stm",
+    "701": "api_publica_stm", "702": "api_publica_stm", "703": "api_publica_stm", "704": "api_publica_stm",
+    "705": "api_publica_stm", "706": "api_publica_stm", "707": "api_publica_stm", "708": "api_publica_stm",
+    "709": "api_publica_stm", "710": "api_publica_stm", "711": "api_publica_stm", "712": "api_publica_stm",
+    "801": "api_publica_tjac", "802": "api_publica_tjal", "803": "api_publica_tjap", "804": "api_publica_tjam",
+    "805": "api_publica_tjba", "806": "api_publica_tjce", "807": "api_publica_tjdft", "808": "api_publica_tjes",
+    "809": "api_publica_tjgo", "810": "api_publica_tjma", "811": "api_publica_tjmt", "812": "api_publica_tjms",
+    "813": "api_publica_tjmg", "814": "api_publica_tjpa", "815": "api_publica_tjpb", "816": "api_publica_tjpr",
+    "817": "api_publica_tjpe", "818": "api_publica_tjpi", "819": "api_publica_tjrj", "820": "api_publica_tjrn",
+    "821": "api_publica_tjrs", "822": "api_publica_tjro", "823": "api_publica_tjrr", "824": "api_publica_tjsc",
+    "825": "api_publica_tjse", "826": "api_publica_tjsp", "827": "api_publica_tjto", "913": "api_publica_tjmmg",
+    "921": "api_publica_tjmrs", "926": "api_publica_tjmsp",
+}
+
+
+def _recalcular_alias(conexao):
+    # Só os casos com os 20 dígitos têm J e TR; o alias é o único valor que muda nesta revisão.
+    ultimo_id = 0
+    while True:
+        linhas = conexao.execute(
+            sa.select(caso.c.id, caso.c.numero_processo_digits, caso.c.alias_tribunal_cnj)
+            .where(caso.c.id > ultimo_id, caso.c.numero_processo_digits.isnot(None))
+            .order_by(caso.c.id).limit(TAMANHO_LOTE_BACKFILL)
+        ).all()
+        if not linhas:
+            break
+        atualizacoes = []
+        for linha in linhas:
+            digitos = linha.numero_processo_digits
+            alias = _ALIAS_POR_JTR.get(digitos[13:16]) if len(digitos) == 20 else None
+            if alias != linha.alias_tribunal_cnj:
+                atualizacoes.append({'id_linha': linha.id, 'alias': alias})
+        if atualizacoes:
+            conexao.execute(
+                caso.update().where(caso.c.id == sa.bindparam('id_linha')).values(alias_tribunal_cnj=sa.bindparam('alias')),
+                atualizacoes
+            )
+        ultimo_id = linhas[-1].id
+
+
+def upgrade():
+    _recalcular_alias(op.get_bind())
+
+
+def downgrade():
+    # Sem alteração de esquema. Os aliases corrigidos (TJSP = 8.26, TJSE = 8.25 e os demais
+    # segmentos) não são revertidos para o mapeamento anterior, que estava errado.
+    pass
@@ -0,0 +1,28 @@
+"""Impressão digital da última resposta do DataJud por caso (cache de payload)
+
+Revision ID: 4b1f9e0a7c52
+Revises: cd7648e8e368
+Create Date: 2026-10-17 13:02:17.540913
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4b1f9e0a7c52'
+down_revision = 'cd7648e8e368'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('caso', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('data_hora_ultima_atualizacao_cnj', sa.String(length=40), nullable=True))
+        batch_op.add_column(sa.Column('hash_payload_cnj', sa.String(length=64), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('caso', schema=None) as batch_op:
+        batch_op.drop_column('hash_payload_cnj')
+        batch_op.drop_column('data_hora_ultima_atualizacao_cnj')
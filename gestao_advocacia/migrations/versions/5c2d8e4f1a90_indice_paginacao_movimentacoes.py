@@ -0,0 +1,32 @@
+"""Índice composto para a listagem paginada (keyset) das movimentações CNJ
+
+Revision ID: 5c2d8e4f1a90
+Revises: e41a7c93d2b5
+Create Date: 2026-10-17 17:22:05.917342
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5c2d8e4f1a90'
+down_revision = 'e41a7c93d2b5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # (caso_id, data_movimentacao DESC, id DESC) também atende as consultas que usavam os índices
+    # simples de caso_id e data_movimentacao (sempre filtradas por caso), que deixam de ser necessários.
+    with op.batch_alter_table('movimentacao_cnj', schema=None) as batch_op:
+        batch_op.create_index('ix_movimentacao_cnj_caso_data_id', ['caso_id', sa.text('data_movimentacao DESC'), sa.text('id DESC')], unique=False)
+        batch_op.drop_index('ix_movimentacao_cnj_caso_id')
+        batch_op.drop_index('ix_movimentacao_cnj_data_movimentacao')
+
+
+def downgrade():
+    with op.batch_alter_table('movimentacao_cnj', schema=None) as batch_op:
+        batch_op.create_index('ix_movimentacao_cnj_data_movimentacao', ['data_movimentacao'], unique=False)
+        batch_op.create_index('ix_movimentacao_cnj_caso_id', ['caso_id'], unique=False)
+        batch_op.drop_index('ix_movimentacao_cnj_caso_data_id')
@@ -0,0 +1,96 @@
+"""Número do processo normalizado, segmento de justiça, tribunal e alias DataJud em Caso
+
+Revision ID: 7a6b3f0c2e84
+Revises: 5c2d8e4f1a90
+Create Date: 2026-10-17 18:03:44.208116
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7a6b3f0c2e84'
+down_revision = '5c2d8e4f1a90'
+branch_labels = None
+depends_on = None
+
+TAMANHO_LOTE_BACKFILL = 1000
+
+caso = sa.table(
+    'caso',
+    sa.column('id', sa.Integer),
+    sa.column('numero_processo', sa.String(30)),
+    sa.column('numero_processo_digits', sa.String(20)),
+    sa.column('segmento_justica', sa.String(1)),
+    sa.column('tribunal_tr', sa.String(2)),
+    sa.column('alias_tribunal_cnj', sa.String(60)),
+)
+
+# Cópia congelada de cnj_service.TRIBUNAL_ALIASES_CNJ e decompor_numero_processo (versão desta revisão).
+_TRIBUNAL_ALIASES_CNJ = {
+    "01": "api_publica_tjac", "02": "api_publica_tjal", "03": "api_publica_tjap", "04": "api_publica_tjam",
+    "05": "api_publica_tjba", "06": "api_publica_tjce", "07": "api_publica_tjdft", "08": "api_publica_tjes",
+    "09": "api_publica_tjgo", "10": "api_publica_tjma", "11": "api_publica_tjmt", "12": "api_publica_tjms",
+    "13": "api_publica_tjmg", "14": "api_publica_tjpa", "15": "api_publica_tjpb", "16": "api_publica_tjpr",
+    "17": "api_publica_tjpe", "18": "api_publica_tjpi", "19": "api_publica_tjrj", "20": "api_publica_tjrn",
+    "21": "api_publica_tjrs", "22": "api_publica_tjro", "23": "api_publica_tjrr", "24": "api_publica_tjsc",
+    "25": "api_publica_tjsp", "26": "api_publica_tjse", "27": "api_publica_tjto",
+}
+
+
+def _decompor_numero_processo(numero_processo):
+    digitos = "".join(filter(str.isdigit, numero_processo or "")) or None
+    if digitos is None or len(digitos) != 20:
+        return digitos, None, None, None
+    segmento_justica, tribunal_tr = digitos[13], digitos[14:16]
+    alias = _TRIBUNAL_ALIASES_CNJ.get(tribunal_tr) if segmento_justica == '8' else None
+    return digitos, segmento_justica, tribunal_tr, alias
+
+
+def _backfill_numeros(conexao):
+    ultimo_id = 0
+    while True:
+        linhas = conexao.execute(
+            sa.select(caso.c.id, caso.c.numero_processo)
+            .where(caso.c.id > ultimo_id, caso.c.numero_processo.isnot(None))
+            .order_by(caso.c.id).limit(TAMANHO_LOTE_BACKFILL)
+        ).all()
+        if not linhas:
+            break
+        atualizacoes = []
+        for linha in linhas:
+            digitos, segmento, tribunal, alias = _decompor_numero_processo(linha.numero_processo)
+            atualizacoes.append({'id_linha': linha.id, 'digitos': digitos, 'segmento': segmento, 'tribunal': tribunal, 'alias': alias})
+        conexao.execute(
+            caso.update().where(caso.c.id == sa.bindparam('id_linha')).values(
+                numero_processo_digits=sa.bindparam('digitos'), segmento_justica=sa.bindparam('segmento'),
+                tribunal_tr=sa.bindparam('tribunal'), alias_tribunal_cnj=sa.bindparam('alias')
+            ),
+            atualizacoes
+        )
+        ultimo_id = linhas[-1].id
+
+
+def upgrade():
+    with op.batch_alter_table('caso', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('numero_processo_digits', sa.String(length=20), nullable=True))
+        batch_op.add_column(sa.Column('segmento_justica', sa.String(length=1), nullable=True))
+        batch_op.add_column(sa.Column('tribunal_tr', sa.String(length=2), nullable=True))
+        batch_op.add_column(sa.Column('alias_tribunal_cnj', sa.String(length=60), nullable=True))
+
+    _backfill_numeros(op.get_bind())
+
+    with op.batch_alter_table('caso', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_caso_numero_processo_digits'), ['numero_processo_digits'], unique=False)
+        batch_op.create_index('ix_caso_alias_verificacao', ['alias_tribunal_cnj', 'data_ultima_verificacao_cnj'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('caso', schema=None) as batch_op:
+        batch_op.drop_index('ix_caso_alias_verificacao')
+        batch_op.drop_index(batch_op.f('ix_caso_numero_processo_digits'))
+        batch_op.drop_column('alias_tribunal_cnj')
+        batch_op.drop_column('tribunal_tr')
+        batch_op.drop_column('segmento_justica')
+        batch_op.drop_column('numero_processo_digits')
@@ -0,0 +1,120 @@
+"""Agenda adaptativa das verificações CNJ (prioridade e próxima verificação) e caso do evento da agenda
+
+Revision ID: 8f2e6a1c4d73
+Revises: 3d9c1f5b7e20
+Create Date: 2026-10-17 19:48:06.331907
+
+"""
+import unicodedata
+from datetime import datetime, timedelta
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8f2e6a1c4d73'
+down_revision = '3d9c1f5b7e20'
+branch_labels = None
+depends_on = None
+
+TAMANHO_LOTE_BACKFILL = 1000
+
+caso = sa.table(
+    'caso',
+    sa.column('id', sa.Integer),
+    sa.column('status', sa.String(255)),
+    sa.column('data_ultima_verificacao_cnj', sa.DateTime),
+    sa.column('taxa_movimentacoes_cnj', sa.Float),
+    sa.column('prioridade_cnj', sa.Float),
+    sa.column('proxima_verificacao_cnj', sa.DateTime),
+)
+
+movimentacao_cnj = sa.table(
+    'movimentacao_cnj',
+    sa.column('id', sa.Integer),
+    sa.column('caso_id', sa.Integer),
+    sa.column('data_movimentacao', sa.DateTime),
+)
+
+# Cópia congelada de cnj_prioridade (versão desta revisão), com os limites padrão da configuração.
+# Nenhum evento da agenda está vinculado a casos ainda, então o fator da agenda é 1.
+JANELA_TAXA_INICIAL_DIAS = 90
+PESO_TAXA = 10.0
+PESOS_STATUS = (
+    ('arquivad', 0.05), ('baixa definitiva', 0.05), ('encerrad', 0.05), ('transito em julgado', 0.1),
+    ('suspens', 0.25), ('sobrestad', 0.25),
+)
+INTERVALO_PADRAO, INTERVALO_MINIMO, INTERVALO_MAXIMO = timedelta(days=1), timedelta(hours=6), timedelta(days=30)
+
+
+def _peso_status(status):
+    status_normalizado = unicodedata.normalize('NFKD', status or '').encode('ascii', 'ignore').decode('ascii').lower()
+    for trecho, peso in PESOS_STATUS:
+        if trecho in status_normalizado:
+            return peso
+    return 1.0
+
+
+def _backfill_agenda(conexao):
+    agora = datetime.utcnow()
+    ultimo_id = 0
+    while True:
+        linhas = conexao.execute(
+            sa.select(caso.c.id, caso.c.status, caso.c.data_ultima_verificacao_cnj)
+            .where(caso.c.id > ultimo_id).order_by(caso.c.id).limit(TAMANHO_LOTE_BACKFILL)
+        ).all()
+        if not linhas:
+            break
+        contagens = dict(conexao.execute(
+            sa.select(movimentacao_cnj.c.caso_id, sa.func.count(movimentacao_cnj.c.id))
+            .where(movimentacao_cnj.c.caso_id.in_([linha.id for linha in linhas]),
+                   movimentacao_cnj.c.data_movimentacao >= agora - timedelta(days=JANELA_TAXA_INICIAL_DIAS))
+            .group_by(movimentacao_cnj.c.caso_id)
+        ).all())
+        atualizacoes = []
+        for linha in linhas:
+            taxa = contagens.get(linha.id, 0) / JANELA_TAXA_INICIAL_DIAS
+            prioridade = _peso_status(linha.status) * (1 + PESO_TAXA * taxa)
+            proxima = None
+            if linha.data_ultima_verificacao_cnj is not None:
+                proxima = linha.data_ultima_verificacao_cnj + min(max(INTERVALO_PADRAO / prioridade, INTERVALO_MINIMO), INTERVALO_MAXIMO)
+            atualizacoes.append({'id_linha': linha.id, 'taxa': taxa, 'prioridade': prioridade, 'proxima': proxima})
+        conexao.execute(
+            caso.update().where(caso.c.id == sa.bindparam('id_linha')).values(
+                taxa_movimentacoes_cnj=sa.bindparam('taxa'), prioridade_cnj=sa.bindparam('prioridade'),
+                proxima_verificacao_cnj=sa.bindparam('proxima')
+            ),
+            atualizacoes
+        )
+        ultimo_id = linhas[-1].id
+
+
+def upgrade():
+    with op.batch_alter_table('caso', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('taxa_movimentacoes_cnj', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('prioridade_cnj', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('proxima_verificacao_cnj', sa.DateTime(), nullable=True))
+
+    _backfill_agenda(op.get_bind())
+
+    with op.batch_alter_table('caso', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_caso_proxima_verificacao_cnj'), ['proxima_verificacao_cnj'], unique=False)
+
+    with op.batch_alter_table('evento_agenda', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('caso_id', sa.Integer(), nullable=True))
+        batch_op.create_index('ix_evento_agenda_caso_data', ['caso_id', 'data_inicio'], unique=False)
+        batch_op.create_foreign_key('fk_evento_caso_id', 'caso', ['caso_id'], ['id'], ondelete='SET NULL')
+
+
+def downgrade():
+    with op.batch_alter_table('evento_agenda', schema=None) as batch_op:
+        batch_op.drop_constraint('fk_evento_caso_id', type_='foreignkey')
+        batch_op.drop_index('ix_evento_agenda_caso_data')
+        batch_op.drop_column('caso_id')
+
+    with op.batch_alter_table('caso', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_caso_proxima_verificacao_cnj'))
+        batch_op.drop_column('proxima_verificacao_cnj')
+        batch_op.drop_column('prioridade_cnj')
+        batch_op.drop_column('taxa_movimentacoes_cnj')
@@ -0,0 +1,29 @@
+"""Tabela de lease da eleição de líder do scheduler
+
+Revision ID: 9e3a5d27b8f1
+Revises: 4b1f9e0a7c52
+Create Date: 2026-10-17 13:41:05.662870
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9e3a5d27b8f1'
+down_revision = '4b1f9e0a7c52'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('lideranca_scheduler',
+    sa.Column('nome', sa.String(length=100), nullable=False),
+    sa.Column('dono', sa.String(length=255), nullable=False),
+    sa.Column('expira_em', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('nome')
+    )
+
+
+def downgrade():
+    op.drop_table('lideranca_scheduler')
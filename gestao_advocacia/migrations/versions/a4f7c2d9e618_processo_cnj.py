@@ -0,0 +1,315 @@
+"""Processo CNJ compartilhado entre os casos de mesmo número, com as movimentações gravadas uma vez por processo
+
+Revision ID: a4f7c2d9e618
+Revises: c6a4e9f2b185
+Create Date: 2026-10-17 22:31:47.902615
+
+"""
+import hashlib
+import json
+import zlib
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a4f7c2d9e618'
+down_revision = 'c6a4e9f2b185'
+branch_labels = None
+depends_on = None
+
+TAMANHO_LOTE_BACKFILL = 1000
+
+caso = sa.table(
+    'caso',
+    sa.column('id', sa.Integer),
+    sa.column('numero_processo_digits', sa.String(20)),
+    sa.column('processo_cnj_id', sa.Integer),
+    sa.column('hash_payload_cnj', sa.String(64)),
+    sa.column('data_hora_ultima_atualizacao_cnj', sa.String(40)),
+)
+
+processo_cnj = sa.table(
+    'processo_cnj',
+    sa.column('id', sa.Integer),
+    sa.column('numero_processo_digits', sa.String(20)),
+)
+
+movimentacao_cnj = sa.table(
+    'movimentacao_cnj',
+    sa.column('id', sa.Integer),
+    sa.column('caso_id', sa.Integer),
+    sa.column('processo_cnj_id', sa.Integer),
+    sa.column('data_movimentacao', sa.DateTime),
+    sa.column('descricao', sa.Text),
+    sa.column('payload_cnj_id', sa.Integer),
+    sa.column('data_registro_sistema', sa.DateTime),
+    sa.column('hash_movimentacao', sa.String(64)),
+)
+
+payload_cnj = sa.table(
+    'payload_cnj',
+    sa.column('id', sa.Integer),
+    sa.column('formato', sa.String(16)),
+    sa.column('conteudo', sa.LargeBinary),
+)
+
+
+# Cópias congeladas do formato 'zlib-d1' de cnj_payload_bruto e de cnj_service.calcular_hash_movimentacao
+# (versão desta revisão), para que a migração continue reproduzível mesmo que os módulos mudem no futuro.
+_DICIONARIO_ZLIB_V1 = (
+    b'"movimentoLocal":{"codigo":,"descricao":""},"codigoPai":'
+    b'"complementos":[{"codigo":,"descricao":"","nome":"","valor":}],'
+    b'"orgaoJulgador":{"codigoMunicipioIBGE":,"codigoOrgao":,"nome":"VARA CIVEL DA COMARCA DE JUIZADO ESPECIAL"},'
+    b'"movimentoNacional":{"codigoNacional":,"descricao":""},'
+    b'{"codigo":,"complementosTabelados":[{"codigo":,"descricao":"","nome":"","valor":}],'
+    b'"dataHora":"T:00.000Z","nome":""}'
+)
+
+
+def _descomprimir(conteudo):
+    descompressor = zlib.decompressobj(zlib.MAX_WBITS, _DICIONARIO_ZLIB_V1)
+    return json.loads(descompressor.decompress(conteudo) + descompressor.flush())
+
+
+def _codigo_movimento(movimento_json):
+    codigo = movimento_json.get('codigo')
+    if codigo is None:
+        for chave in ('movimentoNacional', 'movimentoLocal', 'codigoNacional'):
+            sub = movimento_json.get(chave)
+            if isinstance(sub, dict) and sub.get('codigo') is not None:
+                return sub['codigo']
+    return codigo
+
+
+def _calcular_hash_movimentacao(chave, movimento_json):
+    data_hora = movimento_json.get('dataHora') or ''
+    try:
+        data_hora = datetime.fromisoformat(data_hora.replace('Z', '+00:00')).isoformat()
+    except ValueError:
+        pass
+
+    codigo = _codigo_movimento(movimento_json)
+    complementos = movimento_json.get('complementosTabelados') or movimento_json.get('complementos') or []
+    partes = [str(chave), data_hora, '' if codigo is None else str(codigo),
+              json.dumps(complementos, sort_keys=True, separators=(',', ':'), ensure_ascii=False)]
+    if codigo is None:
+        nomes = [movimento_json.get('nome')]
+        for chave_sub in ('movimentoNacional', 'movimentoLocal'):
+            sub = movimento_json.get(chave_sub)
+            nomes.append(sub.get('descricao') if isinstance(sub, dict) else None)
+        nomes.append(movimento_json.get('descricao'))
+        partes.append('|'.join(str(n) for n in nomes if n))
+    return hashlib.sha256('\x1f'.join(partes).encode('utf-8')).hexdigest()
+
+
+def _hash_linha(chave, linha):
+    if linha.conteudo is not None and linha.formato == 'zlib-d1':
+        return _calcular_hash_movimentacao(chave, _descomprimir(linha.conteudo))
+    # Linhas sem o JSON original: usa a data e a descrição gravadas localmente.
+    partes = ['legado', str(chave), linha.data_movimentacao.isoformat() if linha.data_movimentacao else '', linha.descricao or '']
+    return hashlib.sha256('\x1f'.join(partes).encode('utf-8')).hexdigest()
+
+
+def _criar_processos(conexao):
+    # Um processo por número distinto dos casos.
+    ultimo_numero = ''
+    while True:
+        numeros = conexao.execute(
+            sa.select(caso.c.numero_processo_digits).distinct()
+            .where(caso.c.numero_processo_digits > ultimo_numero)
+            .order_by(caso.c.numero_processo_digits).limit(TAMANHO_LOTE_BACKFILL)
+        ).scalars().all()
+        if not numeros:
+            break
+        conexao.execute(processo_cnj.insert(), [{'numero_processo_digits': numero} for numero in numeros])
+        ultimo_numero = numeros[-1]
+    conexao.execute(caso.update().where(caso.c.numero_processo_digits.isnot(None)).values(
+        processo_cnj_id=sa.select(processo_cnj.c.id)
+        .where(processo_cnj.c.numero_processo_digits == caso.c.numero_processo_digits).scalar_subquery()
+    ))
+    # Casos que perderam o número mas têm histórico: cada um ganha um processo sem número, para não perder as movimentações.
+    casos_sem_numero = conexao.execute(
+        sa.select(caso.c.id).where(caso.c.processo_cnj_id.is_(None), sa.exists().where(movimentacao_cnj.c.caso_id == caso.c.id))
+    ).scalars().all()
+    for caso_id in casos_sem_numero:
+        conexao.execute(processo_cnj.insert().values(numero_processo_digits=None))
+        processo_id = conexao.execute(sa.select(sa.func.max(processo_cnj.c.id))).scalar()
+        conexao.execute(caso.update().where(caso.c.id == caso_id).values(processo_cnj_id=processo_id))
+    conexao.execute(movimentacao_cnj.update().values(
+        processo_cnj_id=sa.select(caso.c.processo_cnj_id).where(caso.c.id == movimentacao_cnj.c.caso_id).scalar_subquery()
+    ))
+
+
+def _rechavear_movimentacoes(conexao):
+    # Percorre as movimentações em ordem (processo_cnj_id, id), em lotes, recalculando o hash pelo processo.
+    # A mesma movimentação gravada para outro caso do mesmo processo é apagada (fica a mais antiga);
+    # duplicatas do próprio caso (deduplicação antiga) são mantidas com hash distinto, para não perder dados.
+    processo_atual, casos_por_hash, ultima_chave = None, {}, None
+    while True:
+        consulta = sa.select(
+            movimentacao_cnj.c.id, movimentacao_cnj.c.caso_id, movimentacao_cnj.c.processo_cnj_id,
+            movimentacao_cnj.c.data_movimentacao, movimentacao_cnj.c.descricao, payload_cnj.c.formato, payload_cnj.c.conteudo
+        ).select_from(movimentacao_cnj.outerjoin(payload_cnj, payload_cnj.c.id == movimentacao_cnj.c.payload_cnj_id))\
+            .order_by(movimentacao_cnj.c.processo_cnj_id, movimentacao_cnj.c.id).limit(TAMANHO_LOTE_BACKFILL)
+        if ultima_chave is not None:
+            consulta = consulta.where(sa.or_(
+                movimentacao_cnj.c.processo_cnj_id > ultima_chave[0],
+                sa.and_(movimentacao_cnj.c.processo_cnj_id == ultima_chave[0], movimentacao_cnj.c.id > ultima_chave[1])
+            ))
+        linhas = conexao.execute(consulta).all()
+        if not linhas:
+            break
+        atualizacoes, duplicadas = [], []
+        for linha in linhas:
+            if linha.processo_cnj_id != processo_atual:
+                processo_atual, casos_por_hash = linha.processo_cnj_id, {}
+            hash_mov = _hash_linha(linha.processo_cnj_id, linha)
+            if hash_mov in casos_por_hash:
+                if casos_por_hash[hash_mov] != linha.caso_id:
+                    duplicadas.append(linha.id)
+                    continue
+                hash_mov = hashlib.sha256(f'{hash_mov}:duplicada:{linha.id}'.encode('utf-8')).hexdigest()
+            casos_por_hash[hash_mov] = linha.caso_id
+            atualizacoes.append({'id_linha': linha.id, 'hash_linha': hash_mov})
+        if atualizacoes:
+            conexao.execute(
+                movimentacao_cnj.update()
+                .where(movimentacao_cnj.c.id == sa.bindparam('id_linha'))
+                .values(hash_movimentacao=sa.bindparam('hash_linha')),
+                atualizacoes
+            )
+        if duplicadas:
+            conexao.execute(movimentacao_cnj.delete().where(movimentacao_cnj.c.id.in_(duplicadas)))
+        ultima_chave = (linhas[-1].processo_cnj_id, linhas[-1].id)
+
+
+def _copiar_movimentacoes_para_os_casos(conexao):
+    # Inverso de _rechavear_movimentacoes: cada caso volta a ter a sua cópia das movimentações do processo
+    # (a primeira cópia reaproveita a linha existente), com o hash calculado pelo caso.
+    casos_por_processo = {}
+    for caso_id, processo_id in conexao.execute(
+            sa.select(caso.c.id, caso.c.processo_cnj_id).where(caso.c.processo_cnj_id.isnot(None)).order_by(caso.c.id)):
+        casos_por_processo.setdefault(processo_id, []).append(caso_id)
+    processo_atual, hashes_por_caso, ultima_chave = None, {}, None
+    while True:
+        consulta = sa.select(
+            movimentacao_cnj.c.id, movimentacao_cnj.c.processo_cnj_id, movimentacao_cnj.c.data_movimentacao,
+            movimentacao_cnj.c.descricao, movimentacao_cnj.c.payload_cnj_id, movimentacao_cnj.c.data_registro_sistema,
+            payload_cnj.c.formato, payload_cnj.c.conteudo
+        ).select_from(movimentacao_cnj.outerjoin(payload_cnj, payload_cnj.c.id == movimentacao_cnj.c.payload_cnj_id))\
+            .where(movimentacao_cnj.c.caso_id.is_(None))\
+            .order_by(movimentacao_cnj.c.processo_cnj_id, movimentacao_cnj.c.id).limit(TAMANHO_LOTE_BACKFILL)
+        if ultima_chave is not None:
+            consulta = consulta.where(sa.or_(
+                movimentacao_cnj.c.processo_cnj_id > ultima_chave[0],
+                sa.and_(movimentacao_cnj.c.processo_cnj_id == ultima_chave[0], movimentacao_cnj.c.id > ultima_chave[1])
+            ))
+        linhas = conexao.execute(consulta).all()
+        if not linhas:
+            break
+        atualizacoes, copias, orfas = [], [], []
+        for linha in linhas:
+            if linha.processo_cnj_id != processo_atual:
+                processo_atual, hashes_por_caso = linha.processo_cnj_id, {}
+            casos_do_processo = casos_por_processo.get(linha.processo_cnj_id)
+            if not casos_do_processo:
+                orfas.append(linha.id)
+                continue
+            for indice, caso_id in enumerate(casos_do_processo):
+                hash_mov = _hash_linha(caso_id, linha)
+                hashes_do_caso = hashes_por_caso.setdefault(caso_id, set())
+                if hash_mov in hashes_do_caso:
+                    hash_mov = hashlib.sha256(f'{hash_mov}:duplicada:{linha.id}'.encode('utf-8')).hexdigest()
+                hashes_do_caso.add(hash_mov)
+                if indice == 0:
+                    atualizacoes.append({'id_linha': linha.id, 'caso_linha': caso_id, 'hash_linha': hash_mov})
+                else:
+                    copias.append({
+                        'caso_id': caso_id, 'processo_cnj_id': linha.processo_cnj_id, 'data_movimentacao': linha.data_movimentacao,
+                        'descricao': linha.descricao, 'payload_cnj_id': linha.payload_cnj_id,
+                        'data_registro_sistema': linha.data_registro_sistema, 'hash_movimentacao': hash_mov,
+                    })
+        if atualizacoes:
+            conexao.execute(
+                movimentacao_cnj.update()
+                .where(movimentacao_cnj.c.id == sa.bindparam('id_linha'))
+                .values(caso_id=sa.bindparam('caso_linha'), hash_movimentacao=sa.bindparam('hash_linha')),
+                atualizacoes
+            )
+        if copias:
+            conexao.execute(movimentacao_cnj.insert(), copias)
+        if orfas:
+            conexao.execute(movimentacao_cnj.delete().where(movimentacao_cnj.c.id.in_(orfas)))
+        ultima_chave = (linhas[-1].processo_cnj_id, linhas[-1].id)
+
+
+def upgrade():
+    op.create_table('processo_cnj',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('numero_processo_digits', sa.String(length=20), nullable=True),
+    sa.Column('data_hora_ultima_atualizacao_cnj', sa.String(length=40), nullable=True),
+    sa.Column('hash_payload_cnj', sa.String(length=64), nullable=True),
+    sa.Column('data_ultima_sincronizacao_cnj', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('numero_processo_digits', name='uq_processo_cnj_numero')
+    )
+    with op.batch_alter_table('caso', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('processo_cnj_id', sa.Integer(), nullable=True))
+    with op.batch_alter_table('movimentacao_cnj', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('processo_cnj_id', sa.Integer(), nullable=True))
+
+    conexao = op.get_bind()
+    _criar_processos(conexao)
+    _rechavear_movimentacoes(conexao)
+
+    with op.batch_alter_table('movimentacao_cnj', schema=None) as batch_op:
+        batch_op.drop_index('ix_movimentacao_cnj_caso_hash')
+        batch_op.drop_index('ix_movimentacao_cnj_caso_data_id')
+        batch_op.drop_constraint('fk_movimentacao_cnj_caso_id', type_='foreignkey')
+        batch_op.drop_column('caso_id')
+        batch_op.alter_column('processo_cnj_id', existing_type=sa.Integer(), nullable=False)
+        batch_op.create_foreign_key('fk_movimentacao_cnj_processo_cnj_id', 'processo_cnj', ['processo_cnj_id'], ['id'])
+
+    with op.batch_alter_table('movimentacao_cnj', schema=None) as batch_op:
+        batch_op.create_index('ix_movimentacao_cnj_processo_hash', ['processo_cnj_id', 'hash_movimentacao'], unique=True)
+        batch_op.create_index('ix_movimentacao_cnj_processo_data_id', ['processo_cnj_id', sa.text('data_movimentacao DESC'), sa.text('id DESC')], unique=False)
+
+    # A última resposta ingerida passa a ser do processo; a primeira sincronização de cada processo refaz o diff.
+    with op.batch_alter_table('caso', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_caso_processo_cnj_id'), ['processo_cnj_id'], unique=False)
+        batch_op.create_foreign_key('fk_caso_processo_cnj_id', 'processo_cnj', ['processo_cnj_id'], ['id'], ondelete='SET NULL')
+        batch_op.drop_column('hash_payload_cnj')
+        batch_op.drop_column('data_hora_ultima_atualizacao_cnj')
+
+
+def downgrade():
+    with op.batch_alter_table('caso', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('data_hora_ultima_atualizacao_cnj', sa.String(length=40), nullable=True))
+        batch_op.add_column(sa.Column('hash_payload_cnj', sa.String(length=64), nullable=True))
+        batch_op.drop_constraint('fk_caso_processo_cnj_id', type_='foreignkey')
+        batch_op.drop_index(batch_op.f('ix_caso_processo_cnj_id'))
+
+    with op.batch_alter_table('movimentacao_cnj', schema=None) as batch_op:
+        batch_op.drop_index('ix_movimentacao_cnj_processo_data_id')
+        batch_op.drop_index('ix_movimentacao_cnj_processo_hash')
+        batch_op.drop_constraint('fk_movimentacao_cnj_processo_cnj_id', type_='foreignkey')
+        batch_op.add_column(sa.Column('caso_id', sa.Integer(), nullable=True))
+
+    _copiar_movimentacoes_para_os_casos(op.get_bind())
+
+    with op.batch_alter_table('movimentacao_cnj', schema=None) as batch_op:
+        batch_op.drop_column('processo_cnj_id')
+        batch_op.alter_column('caso_id', existing_type=sa.Integer(), nullable=False)
+        batch_op.create_foreign_key('fk_movimentacao_cnj_caso_id', 'caso', ['caso_id'], ['id'])
+
+    with op.batch_alter_table('movimentacao_cnj', schema=None) as batch_op:
+        batch_op.create_index('ix_movimentacao_cnj_caso_hash', ['caso_id', 'hash_movimentacao'], unique=True)
+        batch_op.create_index('ix_movimentacao_cnj_caso_data_id', ['caso_id', sa.text('data_movimentacao DESC'), sa.text('id DESC')], unique=False)
+
+    with op.batch_alter_table('caso', schema=None) as batch_op:
+        batch_op.drop_column('processo_cnj_id')
+
+    op.drop_table('processo_cnj')
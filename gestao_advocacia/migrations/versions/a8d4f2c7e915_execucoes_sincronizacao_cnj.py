@@ -0,0 +1,44 @@
+"""Execuções da sincronização com o DataJud e as suas métricas (cnj_sync_run)
+
+Revision ID: a8d4f2c7e915
+Revises: f5a9c3e1b742
+Create Date: 2026-10-17 13:40:02.517384
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a8d4f2c7e915'
+down_revision = 'f5a9c3e1b742'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('cnj_sync_run',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('origem', sa.String(length=20), nullable=False),
+    sa.Column('iniciado_em', sa.DateTime(), nullable=False),
+    sa.Column('concluido_em', sa.DateTime(), nullable=False),
+    sa.Column('duracao_segundos', sa.Float(), nullable=False),
+    sa.Column('casos_verificados', sa.Integer(), nullable=False),
+    sa.Column('novas_movimentacoes', sa.Integer(), nullable=False),
+    sa.Column('consultas_http', sa.Integer(), nullable=False),
+    sa.Column('erros_http', sa.Integer(), nullable=False),
+    sa.Column('casos_pendentes', sa.Integer(), nullable=False),
+    sa.Column('atraso_maximo_segundos', sa.Float(), nullable=True),
+    sa.Column('tribunais', sa.JSON(), nullable=True),
+    sa.Column('erro', sa.Text(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('cnj_sync_run', schema=None) as batch_op:
+        batch_op.create_index('ix_cnj_sync_run_iniciado_em', ['iniciado_em'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('cnj_sync_run', schema=None) as batch_op:
+        batch_op.drop_index('ix_cnj_sync_run_iniciado_em')
+
+    op.drop_table('cnj_sync_run')
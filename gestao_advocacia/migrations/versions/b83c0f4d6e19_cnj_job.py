@@ -0,0 +1,43 @@
+"""Jobs assíncronos de atualização CNJ disparados pela API
+
+Revision ID: b83c0f4d6e19
+Revises: 9e3a5d27b8f1
+Create Date: 2026-10-17 14:20:48.301764
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b83c0f4d6e19'
+down_revision = '9e3a5d27b8f1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('cnj_job',
+    sa.Column('id', sa.String(length=36), nullable=False),
+    sa.Column('tipo', sa.String(length=30), nullable=False),
+    sa.Column('caso_id', sa.Integer(), nullable=True),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('http_status', sa.Integer(), nullable=True),
+    sa.Column('resultado', sa.JSON(), nullable=True),
+    sa.Column('criado_em', sa.DateTime(), nullable=False),
+    sa.Column('iniciado_em', sa.DateTime(), nullable=True),
+    sa.Column('concluido_em', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['caso_id'], ['caso.id'], name='fk_cnj_job_caso_id', ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], name='fk_cnj_job_user_id'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('cnj_job', schema=None) as batch_op:
+        batch_op.create_index('ix_cnj_job_caso_status', ['caso_id', 'status'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('cnj_job', schema=None) as batch_op:
+        batch_op.drop_index('ix_cnj_job_caso_status')
+
+    op.drop_table('cnj_job')
@@ -0,0 +1,30 @@
+"""Cache negativo das consultas ao DataJud (números de processo sem resultado)
+
+Revision ID: c6a4e9f2b185
+Revises: 8f2e6a1c4d73
+Create Date: 2026-10-17 20:31:52.118047
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c6a4e9f2b185'
+down_revision = '8f2e6a1c4d73'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('cache_negativo_cnj',
+    sa.Column('numero_processo_digits', sa.String(length=20), nullable=False),
+    sa.Column('consultas_sem_resultado', sa.Integer(), nullable=False),
+    sa.Column('valido_ate', sa.DateTime(), nullable=False),
+    sa.Column('atualizado_em', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('numero_processo_digits')
+    )
+
+
+def downgrade():
+    op.drop_table('cache_negativo_cnj')
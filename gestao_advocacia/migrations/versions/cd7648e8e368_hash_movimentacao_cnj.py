@@ -0,0 +1,125 @@
+"""Impressão digital (hash) das movimentações CNJ, com índice único por caso
+
+Revision ID: cd7648e8e368
+Revises:
+Create Date: 2026-10-17 09:12:41.118204
+
+"""
+import hashlib
+import json
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'cd7648e8e368'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+TAMANHO_LOTE_BACKFILL = 1000
+
+movimentacao_cnj = sa.table(
+    'movimentacao_cnj',
+    sa.column('id', sa.Integer),
+    sa.column('caso_id', sa.Integer),
+    sa.column('data_movimentacao', sa.DateTime),
+    sa.column('descricao', sa.Text),
+    sa.column('dados_integra_cnj', sa.JSON),
+    sa.column('hash_movimentacao', sa.String(64)),
+)
+
+
+# Cópia congelada de cnj_service.calcular_hash_movimentacao (versão desta revisão), para que a
+# migração continue reproduzível mesmo que o serviço mude no futuro.
+def _codigo_movimento(movimento_json):
+    codigo = movimento_json.get('codigo')
+    if codigo is None:
+        for chave in ('movimentoNacional', 'movimentoLocal', 'codigoNacional'):
+            sub = movimento_json.get(chave)
+            if isinstance(sub, dict) and sub.get('codigo') is not None:
+                return sub['codigo']
+    return codigo
+
+
+def _calcular_hash_movimentacao(caso_id, movimento_json):
+    data_hora = movimento_json.get('dataHora') or ''
+    try:
+        data_hora = datetime.fromisoformat(data_hora.replace('Z', '+00:00')).isoformat()
+    except ValueError:
+        pass
+
+    codigo = _codigo_movimento(movimento_json)
+    complementos = movimento_json.get('complementosTabelados') or movimento_json.get('complementos') or []
+    partes = [str(caso_id), data_hora, '' if codigo is None else str(codigo),
+              json.dumps(complementos, sort_keys=True, separators=(',', ':'), ensure_ascii=False)]
+    if codigo is None:
+        nomes = [movimento_json.get('nome')]
+        for chave in ('movimentoNacional', 'movimentoLocal'):
+            sub = movimento_json.get(chave)
+            nomes.append(sub.get('descricao') if isinstance(sub, dict) else None)
+        nomes.append(movimento_json.get('descricao'))
+        partes.append('|'.join(str(n) for n in nomes if n))
+    return hashlib.sha256('\x1f'.join(partes).encode('utf-8')).hexdigest()
+
+
+def _hash_linha_legada(linha):
+    # Linhas sem o JSON original: usa a data e a descrição gravadas localmente.
+    partes = ['legado', str(linha.caso_id), linha.data_movimentacao.isoformat() if linha.data_movimentacao else '', linha.descricao or '']
+    return hashlib.sha256('\x1f'.join(partes).encode('utf-8')).hexdigest()
+
+
+def _backfill_hashes(conexao):
+    # Percorre a tabela em ordem (caso_id, id), em lotes, para que cada caso seja visitado uma única vez.
+    caso_atual, hashes_do_caso, ultima_chave = None, set(), None
+    colunas = (movimentacao_cnj.c.id, movimentacao_cnj.c.caso_id, movimentacao_cnj.c.data_movimentacao,
+               movimentacao_cnj.c.descricao, movimentacao_cnj.c.dados_integra_cnj)
+    while True:
+        consulta = sa.select(*colunas).order_by(movimentacao_cnj.c.caso_id, movimentacao_cnj.c.id).limit(TAMANHO_LOTE_BACKFILL)
+        if ultima_chave is not None:
+            consulta = consulta.where(sa.or_(
+                movimentacao_cnj.c.caso_id > ultima_chave[0],
+                sa.and_(movimentacao_cnj.c.caso_id == ultima_chave[0], movimentacao_cnj.c.id > ultima_chave[1])
+            ))
+        linhas = conexao.execute(consulta).all()
+        if not linhas:
+            break
+        atualizacoes = []
+        for linha in linhas:
+            if linha.caso_id != caso_atual:
+                caso_atual, hashes_do_caso = linha.caso_id, set()
+            if isinstance(linha.dados_integra_cnj, dict):
+                hash_mov = _calcular_hash_movimentacao(linha.caso_id, linha.dados_integra_cnj)
+            else:
+                hash_mov = _hash_linha_legada(linha)
+            if hash_mov in hashes_do_caso:
+                # Duplicata gravada pela deduplicação antiga: mantém a linha, com hash distinto, para não perder dados.
+                hash_mov = hashlib.sha256(f'{hash_mov}:duplicada:{linha.id}'.encode('utf-8')).hexdigest()
+            hashes_do_caso.add(hash_mov)
+            atualizacoes.append({'id_linha': linha.id, 'hash_linha': hash_mov})
+        conexao.execute(
+            movimentacao_cnj.update()
+            .where(movimentacao_cnj.c.id == sa.bindparam('id_linha'))
+            .values(hash_movimentacao=sa.bindparam('hash_linha')),
+            atualizacoes
+        )
+        ultima_chave = (linhas[-1].caso_id, linhas[-1].id)
+
+
+def upgrade():
+    with op.batch_alter_table('movimentacao_cnj', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('hash_movimentacao', sa.String(length=64), nullable=True))
+
+    _backfill_hashes(op.get_bind())
+
+    with op.batch_alter_table('movimentacao_cnj', schema=None) as batch_op:
+        batch_op.alter_column('hash_movimentacao', existing_type=sa.String(length=64), nullable=False)
+        batch_op.create_index('ix_movimentacao_cnj_caso_hash', ['caso_id', 'hash_movimentacao'], unique=True)
+
+
+def downgrade():
+    with op.batch_alter_table('movimentacao_cnj', schema=None) as batch_op:
+        batch_op.drop_index('ix_movimentacao_cnj_caso_hash')
+        batch_op.drop_column('hash_movimentacao')
@@ -0,0 +1,43 @@
+"""Fila durável e priorizada de atualizações CNJ (cnj_sync_queue)
+
+Revision ID: d2b7e5a3f961
+Revises: a4f7c2d9e618
+Create Date: 2026-10-17 23:48:13.604218
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd2b7e5a3f961'
+down_revision = 'a4f7c2d9e618'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('cnj_sync_queue',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('caso_id', sa.Integer(), nullable=False),
+    sa.Column('prioridade', sa.Integer(), nullable=False),
+    sa.Column('cnj_job_id', sa.String(length=36), nullable=True),
+    sa.Column('enfileirado_em', sa.DateTime(), nullable=False),
+    sa.Column('reserva', sa.String(length=64), nullable=True),
+    sa.Column('reservado_ate', sa.DateTime(), nullable=True),
+    sa.Column('tentativas', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['caso_id'], ['caso.id'], name='fk_cnj_sync_queue_caso_id', ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['cnj_job_id'], ['cnj_job.id'], name='fk_cnj_sync_queue_cnj_job_id', ondelete='SET NULL'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('caso_id', name='uq_cnj_sync_queue_caso')
+    )
+    # Ordem em que os workers reservam os itens: maior prioridade, depois os mais antigos
+    with op.batch_alter_table('cnj_sync_queue', schema=None) as batch_op:
+        batch_op.create_index('ix_cnj_sync_queue_prioridade', [sa.text('prioridade DESC'), 'enfileirado_em', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('cnj_sync_queue', schema=None) as batch_op:
+        batch_op.drop_index('ix_cnj_sync_queue_prioridade')
+
+    op.drop_table('cnj_sync_queue')
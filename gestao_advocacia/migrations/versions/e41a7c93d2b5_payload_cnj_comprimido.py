@@ -0,0 +1,158 @@
+"""JSON bruto das movimentações CNJ em tabela separada, comprimido e endereçado pelo conteúdo
+
+Revision ID: e41a7c93d2b5
+Revises: b83c0f4d6e19
+Create Date: 2026-10-17 16:05:12.584310
+
+"""
+import hashlib
+import json
+import zlib
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e41a7c93d2b5'
+down_revision = 'b83c0f4d6e19'
+branch_labels = None
+depends_on = None
+
+TAMANHO_LOTE_MIGRACAO = 1000
+
+movimentacao_cnj = sa.table(
+    'movimentacao_cnj',
+    sa.column('id', sa.Integer),
+    sa.column('dados_integra_cnj', sa.JSON),
+    sa.column('payload_cnj_id', sa.Integer),
+)
+
+payload_cnj = sa.table(
+    'payload_cnj',
+    sa.column('id', sa.Integer),
+    sa.column('hash', sa.LargeBinary),
+    sa.column('formato', sa.String(16)),
+    sa.column('conteudo', sa.LargeBinary),
+    sa.column('tamanho_original', sa.Integer),
+)
+
+
+# Cópia congelada do formato 'zlib-d1' de cnj_payload_bruto (dicionário incluído), para que a
+# migração continue reproduzível mesmo que o módulo mude no futuro.
+_DICIONARIO_ZLIB_V1 = (
+    b'"movimentoLocal":{"codigo":,"descricao":""},"codigoPai":'
+    b'"complementos":[{"codigo":,"descricao":"","nome":"","valor":}],'
+    b'"orgaoJulgador":{"codigoMunicipioIBGE":,"codigoOrgao":,"nome":"VARA CIVEL DA COMARCA DE JUIZADO ESPECIAL"},'
+    b'"movimentoNacional":{"codigoNacional":,"descricao":""},'
+    b'{"codigo":,"complementosTabelados":[{"codigo":,"descricao":"","nome":"","valor":}],'
+    b'"dataHora":"T:00.000Z","nome":""}'
+)
+
+
+def _comprimir(dados):
+    serializado = json.dumps(dados, separators=(',', ':'), sort_keys=True, ensure_ascii=False).encode('utf-8')
+    compressor = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS, 9, zlib.Z_DEFAULT_STRATEGY, _DICIONARIO_ZLIB_V1)
+    return {
+        'hash': hashlib.sha256(serializado).digest(),
+        'formato': 'zlib-d1',
+        'conteudo': compressor.compress(serializado) + compressor.flush(),
+        'tamanho_original': len(serializado),
+    }
+
+
+def _descomprimir(conteudo):
+    descompressor = zlib.decompressobj(zlib.MAX_WBITS, _DICIONARIO_ZLIB_V1)
+    return json.loads(descompressor.decompress(conteudo) + descompressor.flush())
+
+
+def _ids_por_hash(conexao, hashes):
+    return {hash_payload: id_payload for id_payload, hash_payload in conexao.execute(
+        sa.select(payload_cnj.c.id, payload_cnj.c.hash).where(payload_cnj.c.hash.in_(hashes))
+    )}
+
+
+def _mover_payloads(conexao):
+    # Percorre as movimentações por id, em lotes, gravando cada JSON distinto uma única vez.
+    ultimo_id = 0
+    while True:
+        linhas = conexao.execute(
+            sa.select(movimentacao_cnj.c.id, movimentacao_cnj.c.dados_integra_cnj)
+            .where(movimentacao_cnj.c.id > ultimo_id, movimentacao_cnj.c.dados_integra_cnj.isnot(None))
+            .order_by(movimentacao_cnj.c.id).limit(TAMANHO_LOTE_MIGRACAO)
+        ).all()
+        if not linhas:
+            break
+        novos_payloads, atualizacoes = {}, []
+        for linha in linhas:
+            if linha.dados_integra_cnj is None:
+                continue
+            payload = _comprimir(linha.dados_integra_cnj)
+            novos_payloads.setdefault(payload['hash'], payload)
+            atualizacoes.append({'id_linha': linha.id, 'hash_linha': payload['hash']})
+        ids = _ids_por_hash(conexao, list(novos_payloads))
+        faltantes = [payload for hash_payload, payload in novos_payloads.items() if hash_payload not in ids]
+        if faltantes:
+            conexao.execute(payload_cnj.insert(), faltantes)
+            ids.update(_ids_por_hash(conexao, [payload['hash'] for payload in faltantes]))
+        if atualizacoes:
+            conexao.execute(
+                movimentacao_cnj.update()
+                .where(movimentacao_cnj.c.id == sa.bindparam('id_linha'))
+                .values(payload_cnj_id=sa.bindparam('payload_linha')),
+                [{'id_linha': a['id_linha'], 'payload_linha': ids[a['hash_linha']]} for a in atualizacoes]
+            )
+        ultimo_id = linhas[-1].id
+
+
+def _restaurar_payloads(conexao):
+    ultimo_id = 0
+    while True:
+        linhas = conexao.execute(
+            sa.select(movimentacao_cnj.c.id, payload_cnj.c.conteudo)
+            .join(payload_cnj, payload_cnj.c.id == movimentacao_cnj.c.payload_cnj_id)
+            .where(movimentacao_cnj.c.id > ultimo_id)
+            .order_by(movimentacao_cnj.c.id).limit(TAMANHO_LOTE_MIGRACAO)
+        ).all()
+        if not linhas:
+            break
+        conexao.execute(
+            movimentacao_cnj.update()
+            .where(movimentacao_cnj.c.id == sa.bindparam('id_linha'))
+            .values(dados_integra_cnj=sa.bindparam('dados_linha')),
+            [{'id_linha': linha.id, 'dados_linha': _descomprimir(linha.conteudo)} for linha in linhas]
+        )
+        ultimo_id = linhas[-1].id
+
+
+def upgrade():
+    op.create_table('payload_cnj',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('hash', sa.LargeBinary(length=32), nullable=False),
+    sa.Column('formato', sa.String(length=16), nullable=False),
+    sa.Column('conteudo', sa.LargeBinary(), nullable=False),
+    sa.Column('tamanho_original', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('hash', name='uq_payload_cnj_hash')
+    )
+    with op.batch_alter_table('movimentacao_cnj', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('payload_cnj_id', sa.Integer(), nullable=True))
+
+    _mover_payloads(op.get_bind())
+
+    with op.batch_alter_table('movimentacao_cnj', schema=None) as batch_op:
+        batch_op.create_foreign_key('fk_movimentacao_cnj_payload', 'payload_cnj', ['payload_cnj_id'], ['id'])
+        batch_op.drop_column('dados_integra_cnj')
+
+
+def downgrade():
+    with op.batch_alter_table('movimentacao_cnj', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('dados_integra_cnj', sa.JSON(), nullable=True))
+
+    _restaurar_payloads(op.get_bind())
+
+    with op.batch_alter_table('movimentacao_cnj', schema=None) as batch_op:
+        batch_op.drop_constraint('fk_movimentacao_cnj_payload', type_='foreignkey')
+        batch_op.drop_column('payload_cnj_id')
+
+    op.drop_table('payload_cnj')
@@ -0,0 +1,29 @@
+"""Marca (high-water mark) por tribunal da sincronização incremental com o DataJud
+
+Revision ID: f5a9c3e1b742
+Revises: d2b7e5a3f961
+Create Date: 2026-10-17 13:33:16.218904
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f5a9c3e1b742'
+down_revision = 'd2b7e5a3f961'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('cnj_sync_watermark',
+    sa.Column('alias_tribunal', sa.String(length=60), nullable=False),
+    sa.Column('data_hora_ultima_atualizacao', sa.DateTime(), nullable=False),
+    sa.Column('atualizado_em', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('alias_tribunal')
+    )
+
+
+def downgrade():
+    op.drop_table('cnj_sync_watermark')
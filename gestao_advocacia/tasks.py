@@ -4,21 +4,39 @@
 # ==============================================================================
 from flask import current_app
 from datetime import datetime, timedelta
-import time
+from zoneinfo import ZoneInfo
 import logging 
+from collections import Counter
 
 # Importar o serviço CNJ no nível do módulo é seguro, 
 # pois cnj_service.py não importa de tasks.py, evitando ciclo.
 # Assume que cnj_service.py está no mesmo diretório que tasks.py.
-from cnj_service import consultar_processo_cnj
+from sqlalchemy.exc import IntegrityError
+from cnj_service import (consultar_lote_por_alias, consultar_lote_por_alias_em_streaming, dividir_em_lotes_por_alias, obter_disjuntores,
+                         consultar_atualizacoes_por_alias, interpretar_data_hora_datajud, normalizar_numero_processo)
+from cnj_sync import executar_por_tribunal, LimitadorPorTribunal, TribunalIndisponivel
+from cnj_ingestao import ingerir_resposta_processo, ingerir_documentos_em_streaming, agrupar_documentos_em_streaming
+from cnj_streaming import RespostaEmStreaming, DocumentosEmStreaming
+from cnj_prioridade import registrar_verificacao_cnj
+from cnj_jobs import executar_job_atualizacao, registrar_jobs_descartados
+import cnj_cache_negativo
+import cnj_fila
+import cnj_incremental
+import cnj_metricas
 
 # NÃO importe db, Caso, MovimentacaoCNJ de 'app' aqui no topo para evitar importação circular.
 # Eles serão importados dentro da função do job, quando o contexto da app estiver ativo.
 
+def _agora_no_fuso_do_scheduler():
+    """Data/hora atual no fuso SCHEDULER_TIMEZONE (nome IANA, ex.: 'America/Sao_Paulo'), para os logs do job."""
+    fuso = current_app.config.get('SCHEDULER_TIMEZONE')
+    return datetime.now(tz=ZoneInfo(fuso) if isinstance(fuso, str) else fuso)
+
+
 def job_verificar_processos_cnj():
     """
     Tarefa agendada para verificar atualizações de processos no CNJ.
-    Esta função é chamada pelo APScheduler.
+    Esta função é chamada pelo APScheduler. Retorna a quantidade de casos verificados.
     """
     # Importa db e modelos DENTRO da função para evitar importação circular
     # e garantir que o contexto da aplicação Flask esteja disponível.
@@ -38,142 +56,513 @@ def job_verificar_processos_cnj():
         if current_app: 
             logger = current_app.logger
         logger.critical(f"JOB CNJ: Falha crítica ao importar db/modelos de 'app' dentro do job: {e}. O job não pode continuar. Verifique a estrutura do projeto e os caminhos de importação.")
-        return
+        return 0
 
     logger = current_app.logger # Usa o logger da aplicação Flask
 
     if not current_app.config.get('CNJ_JOB_ENABLED', False):
-        logger.info(f"JOB CNJ [{datetime.now(tz=current_app.config.get('SCHEDULER_TIMEZONE'))}]: Job está DESABILITADO nas configurações. Pulando execução.")
-        return
+        logger.info(f"JOB CNJ [{_agora_no_fuso_do_scheduler()}]: Job está DESABILITADO nas configurações. Pulando execução.")
+        return 0
+
+    # Cada execução do job é registrada em 'cnj_sync_run' com as suas métricas (cnj_metricas.py)
+    with cnj_metricas.registrar_execucao('job'):
+        # No modo incremental, os casos cujos documentos não mudaram saem da agenda antes da sincronização normal
+        casos_verificados = sincronizar_incremental_cnj() if current_app.config.get('CNJ_INCREMENTAL_ENABLED', False) else 0
+        if current_app.config.get('CNJ_FILA_ENABLED', False):
+            return casos_verificados + sincronizar_pela_fila()
+        return casos_verificados + sincronizar_casos_cnj()
+
+
+def consulta_casos_para_verificar(shard=None, max_casos=None, caso_ids=None):
+    """
+    Monta (sem executar) a consulta dos casos elegíveis para verificação no CNJ: com número de
+    processo e com a próxima verificação (agenda adaptativa, ver cnj_prioridade.py) já vencida,
+    os mais atrasados primeiro; casos ainda sem agenda (nunca verificados) vêm antes de todos.
+    Seleciona apenas (id, numero_processo_digits, alias_tribunal_cnj), já normalizados na
+    gravação do caso.
+    'shard' = (indice, total) restringe aos casos com id % total == indice; 'caso_ids', aos casos
+    informados (itens reservados da fila).
+    """
+    from app import db, Caso
+
+    agora = datetime.utcnow()
+    if max_casos is None:
+        max_casos = current_app.config.get('CNJ_JOB_MAX_CASES_PER_RUN', 10)
+
+    consulta = db.select(Caso.id, Caso.numero_processo_digits, Caso.alias_tribunal_cnj).where(
+        Caso.numero_processo_digits.isnot(None),
+        db.or_(Caso.proxima_verificacao_cnj.is_(None), Caso.proxima_verificacao_cnj <= agora)
+    )
+    if shard is not None:
+        indice_shard, total_shards = shard
+        consulta = consulta.where(Caso.id % total_shards == indice_shard)
+    if caso_ids is not None:
+        consulta = consulta.where(Caso.id.in_(caso_ids))
+    return consulta.order_by(Caso.proxima_verificacao_cnj.asc().nulls_first(), Caso.id).limit(max_casos)
+
+
+def _iterar_blocos_de_casos(consulta, tamanho_bloco):
+    """
+    Executa a consulta e devolve as linhas em blocos de até 'tamanho_bloco'.
+    Em bancos com cursor do lado do servidor (PostgreSQL) as linhas vêm por streaming, em uma
+    conexão própria, para não carregar o shard inteiro na memória nem ser afetada pelos commits
+    feitos caso a caso. No SQLite (sem cursor no servidor, e onde uma leitura aberta bloquearia
+    as escritas) as linhas, só com três colunas curtas, são lidas de uma vez.
+    """
+    from app import db
+
+    if db.engine.dialect.supports_server_side_cursors:
+        with db.engine.connect() as conexao:
+            resultado = conexao.execution_options(stream_results=True, yield_per=tamanho_bloco).execute(consulta)
+            for bloco in resultado.partitions():
+                yield bloco
+    else:
+        linhas = db.session.execute(consulta).all()
+        for inicio in range(0, len(linhas), tamanho_bloco):
+            yield linhas[inicio:inicio + tamanho_bloco]
+
+
+def sincronizar_casos_cnj(shard=None, max_casos=None, caso_ids=None):
+    """
+    Verifica no CNJ os casos elegíveis (ver consulta_casos_para_verificar), opcionalmente só os
+    de um shard ou só os de 'caso_ids'. Usada pelo job agendado, pelo comando 'flask cnj-sync'
+    e, no modo fila, para os itens periódicos reservados.
+    Cada número de processo é consultado uma única vez por execução, e o resultado vale para
+    todos os casos com esse número (inclusive os que não estavam entre os elegíveis).
+    Retorna a quantidade de casos verificados.
+    """
+    logger = current_app.logger
+    descricao_shard = f" (shard {shard[0]}/{shard[1]})" if shard else ""
+    logger.info(f"JOB CNJ [{_agora_no_fuso_do_scheduler()}]: Iniciando verificação de processos no CNJ{descricao_shard}...")
+    casos_verificados = 0
+    casos_adiados = 0
+    consultas_evitadas = 0 # Números de processo não consultados por estarem no cache negativo
 
-    logger.info(f"JOB CNJ [{datetime.now(tz=current_app.config.get('SCHEDULER_TIMEZONE'))}]: Iniciando verificação de processos no CNJ...")
-    
     try:
-        intervalo_verificacao_dias = current_app.config.get('CNJ_JOB_VERIFICATION_INTERVAL_DAYS', 1)
-        limite_tempo_verificacao = datetime.utcnow() - timedelta(days=intervalo_verificacao_dias)
-        
-        max_casos_por_execucao = current_app.config.get('CNJ_JOB_MAX_CASES_PER_RUN', 10)
-        delay_entre_requisicoes = current_app.config.get('CNJ_JOB_REQUEST_DELAY_SECONDS', 5)
-
-        # É crucial que esta query seja executada dentro de um contexto de aplicação.
-        # Se o job for chamado fora de um contexto, isso falhará.
-        # Flask-APScheduler deve lidar com isso.
-        with current_app.app_context():
-            casos_para_verificar = Caso.query.filter(
-                Caso.numero_processo.isnot(None),
-                Caso.numero_processo != '',
-                db.or_(Caso.data_ultima_verificacao_cnj.is_(None), Caso.data_ultima_verificacao_cnj < limite_tempo_verificacao)
-            ).order_by(Caso.data_ultima_verificacao_cnj.asc().nulls_first()).limit(max_casos_por_execucao).all()
-
-        logger.info(f"JOB CNJ: Encontrados {len(casos_para_verificar)} casos para verificação (limite: {max_casos_por_execucao}).")
-
-        if not casos_para_verificar:
-            logger.info("JOB CNJ: Nenhum caso elegível para verificação no momento.")
-            return
-
-        for caso_item in casos_para_verificar:
-            logger.info(f"JOB CNJ: Verificando caso ID {caso_item.id}, processo '{caso_item.numero_processo}'")
-            try:
-                # Garante que as operações de banco de dados para cada caso sejam feitas no contexto da app
-                with current_app.app_context():
-                    dados_cnj_raw, status_code = consultar_processo_cnj(caso_item.numero_processo)
-
-                    if status_code < 400: # Sucesso na consulta
-                        hits = dados_cnj_raw.get("hits", {}).get("hits", [])
-                        if hits:
-                            source_data = hits[0].get('_source', {})
-                            movimentos_api = source_data.get('movimentos', []) 
-                            
-                            if not isinstance(movimentos_api, list): movimentos_api = []
-
-                            novas_movs_job_count = 0
-                            data_mov_recente_job = None
-                            desc_mov_recente_job = ""
-
-                            movimentos_api.sort(key=lambda m: m.get('dataHora', '1900-01-01T00:00:00Z'), reverse=True)
-
-                            for mov_json_job in movimentos_api:
-                                data_mov_str_job = mov_json_job.get('dataHora')
-                                if not data_mov_str_job: continue
-                                
-                                try:
-                                    data_mov_obj_job = datetime.fromisoformat(data_mov_str_job.replace('Z', '+00:00'))
-                                except ValueError:
-                                    logger.warning(f"JOB CNJ: Formato de 'dataHora' ('{data_mov_str_job}') inválido para caso {caso_item.id}. Movimento ignorado.")
-                                    continue
-                                
-                                desc_parts_job = []
-                                mov_nacional = mov_json_job.get('movimentoNacional')
-                                if mov_nacional and isinstance(mov_nacional, dict) and mov_nacional.get('descricao'):
-                                    desc_parts_job.append(mov_nacional['descricao'])
-                                
-                                mov_local = mov_json_job.get('movimentoLocal')
-                                if not desc_parts_job and mov_local and isinstance(mov_local, dict) and mov_local.get('descricao'):
-                                     desc_parts_job.append(mov_local['descricao'])
-
-                                complementos_job = mov_json_job.get('complementos', [])
-                                if isinstance(complementos_job, list):
-                                    for c_job in complementos_job:
-                                        if isinstance(c_job, dict) and c_job.get('descricao'):
-                                            desc_parts_job.append(c_job['descricao'])
-                                
-                                descricao_db_job = " | ".join(filter(None, desc_parts_job))
-                                if not descricao_db_job: 
-                                    descricao_db_job = mov_json_job.get('descricao') or str(mov_json_job.get('codigoNacional', {}).get('codigo', 'Movimento'))
-
-                                mov_existente_job = MovimentacaoCNJ.query.filter_by(
-                                    caso_id=caso_item.id,
-                                    data_movimentacao=data_mov_obj_job
-                                ).filter(MovimentacaoCNJ.descricao.startswith(descricao_db_job[:150])).first()
-
-                                if not mov_existente_job:
-                                    nova_mov_db_job = MovimentacaoCNJ(
-                                        caso_id=caso_item.id,
-                                        data_movimentacao=data_mov_obj_job,
-                                        descricao=descricao_db_job,
-                                        dados_integra_cnj=mov_json_job
-                                    )
-                                    db.session.add(nova_mov_db_job)
-                                    novas_movs_job_count += 1
-                                    if data_mov_recente_job is None or data_mov_obj_job > data_mov_recente_job:
-                                        data_mov_recente_job = data_mov_obj_job
-                                        desc_mov_recente_job = descricao_db_job
-                            
-                            if novas_movs_job_count > 0 and data_mov_recente_job:
-                                caso_item.status = desc_mov_recente_job[:255]
-                                caso_item.data_atualizacao = data_mov_recente_job
-                            
-                            logger.info(f"JOB CNJ: Caso {caso_item.id} processado, {novas_movs_job_count} nova(s) movimentação(ões) registrada(s).")
-                        else:
-                            logger.info(f"JOB CNJ: Nenhuma informação (hit) encontrada no CNJ para caso {caso_item.id} (processo {caso_item.numero_processo}).")
-                    
-                    elif status_code >= 400:
-                        logger.error(f"JOB CNJ: Erro ao consultar CNJ para caso {caso_item.id}. Status: {status_code}, Erro: {dados_cnj_raw.get('erro')}")
-                    
-                    caso_item.data_ultima_verificacao_cnj = datetime.utcnow()
-                    db.session.commit()
-
-            except Exception as e_job_item_proc:
-                logger.error(f"JOB CNJ: Exceção ao processar caso ID {caso_item.id} (processo '{caso_item.numero_processo}'): {str(e_job_item_proc)}", exc_info=True)
-                db.session.rollback()
-                try:
-                    # Re-attach e atualiza data_ultima_verificacao_cnj mesmo em erro
-                    # Garante que o contexto da app esteja ativo para esta operação de DB.
-                    with current_app.app_context():
-                        caso_item_reattached = db.session.get(Caso, caso_item.id) 
-                        if caso_item_reattached:
-                            caso_item_reattached.data_ultima_verificacao_cnj = datetime.utcnow()
-                            db.session.commit()
-                        else: 
-                            logger.error(f"JOB CNJ: Não foi possível re-attachar caso ID {caso_item.id} para atualizar data_ultima_verificacao_cnj após erro.")
-                except Exception as e_commit_on_error:
-                     logger.error(f"JOB CNJ: Falha crítica ao tentar atualizar data_ultima_verificacao_cnj APÓS ERRO para caso {caso_item.id}: {str(e_commit_on_error)}")
-                     db.session.rollback()
-            
-            time.sleep(delay_entre_requisicoes)
-
-        logger.info(f"JOB CNJ [{datetime.now(tz=current_app.config.get('SCHEDULER_TIMEZONE'))}]: Verificação de processos concluída.")
+        max_workers = current_app.config.get('CNJ_JOB_MAX_WORKERS', 4)
+        tamanho_bloco = current_app.config.get('CNJ_JOB_STREAM_CHUNK_SIZE', 500)
+
+        # Os casos são agrupados por tribunal em lotes (um _search por lote). As consultas HTTP rodam
+        # em um pool de threads limitado, com um token bucket por tribunal; a persistência é feita
+        # nesta thread, à medida que as consultas terminam.
+        app = current_app._get_current_object()
+        limitador = LimitadorPorTribunal(
+            current_app.config.get('CNJ_JOB_RATE_PER_ALIAS', 0.2),
+            current_app.config.get('CNJ_JOB_BURST_PER_ALIAS', 1)
+        )
+
+        # Em streaming, cada lote chega como RespostaEmStreaming e os hits são ingeridos na ordem da resposta
+        streaming = current_app.config.get('CNJ_STREAMING_ENABLED', False)
+
+        def buscar_lote_no_cnj(lote):
+            alias_tribunal, numeros_lote = lote
+            with app.app_context():
+                if streaming:
+                    return consultar_lote_por_alias_em_streaming(alias_tribunal, numeros_lote)
+                return consultar_lote_por_alias(alias_tribunal, numeros_lote)
+
+        # Tribunais com o circuito aberto (fora do ar ou respondendo 429) não são consultados
+        disjuntores = obter_disjuntores()
+        # Acertos/falhas do cache de payload nesta execução (respostas idênticas à sincronização anterior)
+        estatisticas_cache = Counter()
+        # Números já sincronizados nesta execução: casos com o mesmo número em blocos seguintes não geram nova consulta
+        numeros_sincronizados = set()
+        # É crucial que a consulta seja executada dentro de um contexto de aplicação
+        # (create_app registra o job com um wrapper que empurra o contexto da app).
+        consulta = consulta_casos_para_verificar(shard, max_casos, caso_ids)
+        for bloco_casos in _iterar_blocos_de_casos(consulta, tamanho_bloco):
+            # O número (só dígitos) e o tribunal vêm normalizados do banco; casos com o mesmo número
+            # compartilham a consulta.
+            casos_por_numero, alias_por_numero = {}, {}
+            for caso_id, numero_digitos, alias_tribunal in bloco_casos:
+                if numero_digitos in numeros_sincronizados:
+                    continue
+                casos_por_numero.setdefault(numero_digitos, []).append(caso_id)
+                alias_por_numero[numero_digitos] = alias_tribunal
+            # Números sem resultado recente no DataJud (cache negativo) não são consultados: os casos
+            # são reagendados para quando a entrada do cache vencer.
+            for numero, valido_ate in cnj_cache_negativo.numeros_em_cache_negativo(list(casos_por_numero)).items():
+                _adiar_verificacao(casos_por_numero.pop(numero), valido_ate, logger)
+                consultas_evitadas += 1
+            lotes = dividir_em_lotes_por_alias(
+                ((alias_por_numero[numero], numero) for numero in casos_por_numero), current_app.config.get('CNJ_JOB_BATCH_SIZE', 100)
+            )
+            logger.info(f"JOB CNJ: {len(bloco_casos)} caso(s) agrupados em {len(lotes)} consulta(s) em lote ao DataJud.")
+
+            tarefas = [(alias_tribunal, (alias_tribunal, numeros_lote)) for alias_tribunal, numeros_lote in lotes]
+            for (alias_tribunal, numeros_lote), resultados_lote, excecao_lote in executar_por_tribunal(
+                    tarefas, buscar_lote_no_cnj, max_workers, limitador, disjuntores=disjuntores):
+                segundos_indisponivel = segundos_tribunal_indisponivel(resultados_lote, excecao_lote)
+                if segundos_indisponivel is not None:
+                    caso_ids_lote = [caso_id for numero in numeros_lote for caso_id in casos_por_numero[numero]]
+                    _adiar_verificacao(caso_ids_lote, datetime.utcnow() + timedelta(seconds=segundos_indisponivel), logger)
+                    logger.warning(f"JOB CNJ: Circuito aberto para '{alias_tribunal}'; {len(caso_ids_lote)} caso(s) adiado(s) em {segundos_indisponivel:.0f} s.")
+                    casos_adiados += len(caso_ids_lote)
+                    cnj_metricas.registrar_casos(alias_tribunal, adiados=len(caso_ids_lote))
+                    continue
+                if excecao_lote is None and isinstance(resultados_lote, RespostaEmStreaming):
+                    respostas_lote = {}
+                    itens_lote = _iterar_lote_em_streaming(resultados_lote, numeros_lote, respostas_lote, logger)
+                else:
+                    respostas_lote = resultados_lote
+                    itens_lote = ((numero, resultados_lote) for numero in numeros_lote)
+                for numero_processo, resultados_numero in itens_lote:
+                    resultado, casos_do_numero = _registrar_resultado_processo(
+                        numero_processo, casos_por_numero[numero_processo], resultados_numero, excecao_lote, logger
+                    )
+                    casos_verificados += casos_do_numero
+                    cnj_metricas.registrar_casos(alias_tribunal, casos_do_numero, resultado['novas_movimentacoes'] if resultado else 0)
+                    numeros_sincronizados.add(numero_processo)
+                    if resultado and resultado['processo_encontrado']:
+                        estatisticas_cache['acertos' if resultado['payload_inalterado'] else 'falhas'] += 1
+                _atualizar_cache_negativo(respostas_lote, excecao_lote, logger)
+
+        if consultas_evitadas:
+            logger.info(f"JOB CNJ: Cache negativo: {consultas_evitadas} consulta(s) de processo sem resultado no DataJud evitada(s){descricao_shard}.")
+        if not casos_verificados:
+            if casos_adiados:
+                logger.info(f"JOB CNJ: Nenhum caso verificado{descricao_shard}; {casos_adiados} caso(s) adiado(s) por tribunal indisponível.")
+            elif not consultas_evitadas:
+                logger.info(f"JOB CNJ: Nenhum caso elegível para verificação no momento{descricao_shard}.")
+            return 0
+
+        logger.info(f"JOB CNJ: Cache de payload: {estatisticas_cache['acertos']} acerto(s) (resposta inalterada, ingestão pulada), {estatisticas_cache['falhas']} falha(s).")
+        logger.info(f"JOB CNJ [{_agora_no_fuso_do_scheduler()}]: Verificação de processos concluída. {casos_verificados} caso(s) verificado(s){descricao_shard}, {casos_adiados} adiado(s) por tribunal indisponível.")
 
     except Exception as e_job_geral:
-        logger.critical(f"JOB CNJ [{datetime.now(tz=current_app.config.get('SCHEDULER_TIMEZONE'))}]: Erro CRÍTICO durante a execução do job: {str(e_job_geral)}", exc_info=True)
+        logger.critical(f"JOB CNJ [{_agora_no_fuso_do_scheduler()}]: Erro CRÍTICO durante a execução do job: {str(e_job_geral)}", exc_info=True)
+
+    return casos_verificados
+
+
+def enfileirar_casos_elegiveis(max_casos=None):
+    """
+    Põe na fila (cnj_fila.py), com prioridade periódica, os casos elegíveis para verificação que
+    ainda não estão nela, na ordem de consulta_casos_para_verificar. Retorna quantos (com commit).
+    """
+    from app import db, Caso, FilaSincronizacaoCNJ
+
+    consulta = consulta_casos_para_verificar(max_casos=max_casos).where(
+        ~db.exists().where(FilaSincronizacaoCNJ.caso_id == Caso.id)
+    )
+    caso_ids = [linha.id for linha in db.session.execute(consulta)]
+    cnj_fila.enfileirar_casos(caso_ids, cnj_fila.PRIORIDADE_PERIODICA)
+    db.session.commit()
+    return len(caso_ids)
+
+
+def processar_fila_cnj(max_itens=None):
+    """
+    Consome a fila (cnj_fila.py) reservando CNJ_FILA_ITENS_POR_RESERVA itens por vez, os de
+    maior prioridade primeiro, até a fila não ter itens livres ou 'max_itens' serem processados.
+    Pedidos do usuário executam o CnjJob correspondente; os itens periódicos de cada reserva são
+    verificados juntos por sincronizar_casos_cnj (agrupados por tribunal em lotes). Outros
+    workers podem consumir a mesma fila ao mesmo tempo. Retorna a quantidade de itens processados.
+    """
+    logger = current_app.logger
+    app = current_app._get_current_object()
+    itens_por_reserva = current_app.config.get('CNJ_FILA_ITENS_POR_RESERVA', 100)
+    registrar_jobs_descartados(cnj_fila.descartar_itens_esgotados())
+
+    itens_processados = 0
+    while max_itens is None or itens_processados < max_itens:
+        quantidade = itens_por_reserva if max_itens is None else min(itens_por_reserva, max_itens - itens_processados)
+        token, itens = cnj_fila.reservar_itens(quantidade)
+        if not itens:
+            break
+        logger.info(f"FILA CNJ: {len(itens)} item(ns) reservado(s) ({sum(1 for item in itens if item.cnj_job_id)} pedido(s) do usuário).")
+        try:
+            for item in itens:
+                if item.cnj_job_id:
+                    executar_job_atualizacao(app, item.cnj_job_id, item.caso_id)
+            caso_ids_periodicos = [item.caso_id for item in itens if not item.cnj_job_id]
+            if caso_ids_periodicos:
+                sincronizar_casos_cnj(max_casos=len(caso_ids_periodicos), caso_ids=caso_ids_periodicos)
+        except BaseException:
+            cnj_fila.liberar_itens(token)
+            raise
+        cnj_fila.concluir_itens(token)
+        itens_processados += len(itens)
+    return itens_processados
+
+
+def sincronizar_pela_fila(max_casos=None):
+    """
+    Modo fila (CNJ_FILA_ENABLED), usado pelo job agendado e por 'flask cnj-sync --fila': enfileira
+    os casos elegíveis e consome a fila, pedidos do usuário primeiro. Retorna os itens processados.
+    """
+    if max_casos is None:
+        max_casos = current_app.config.get('CNJ_JOB_MAX_CASES_PER_RUN', 10)
+    enfileirar_casos_elegiveis(max_casos)
+    return processar_fila_cnj(max_casos)
+
+
+def sincronizar_incremental_cnj():
+    """
+    Sincronização incremental (ver cnj_incremental.py): para cada tribunal, ingere os documentos
+    atualizados desde a marca do tribunal entre os números acompanhados, registra os demais casos
+    vencidos como verificados e avança a marca. As páginas são consultadas em rodadas pelo motor de
+    cnj_sync (uma por cursor a cada rodada, com o limite de taxa e o disjuntor de cada tribunal), e
+    cada tribunal é concluído assim que as suas páginas terminam. Um tribunal com falha na consulta
+    não tem a marca nem os casos alterados (ficam para a sincronização normal). Retorna os casos
+    verificados.
+    """
+    from app import db
+
+    logger = current_app.logger
+    app = current_app._get_current_object()
+    limitador = LimitadorPorTribunal(
+        current_app.config.get('CNJ_JOB_RATE_PER_ALIAS', 0.2),
+        current_app.config.get('CNJ_JOB_BURST_PER_ALIAS', 1)
+    )
+    max_workers = current_app.config.get('CNJ_JOB_MAX_WORKERS', 4)
+    margem = timedelta(seconds=current_app.config.get('CNJ_INCREMENTAL_MARGEM_SEGUNDOS', 3600))
+    tamanho_pagina = current_app.config.get('CNJ_INCREMENTAL_TAMANHO_PAGINA', 100)
+    numeros_por_consulta = current_app.config.get('CNJ_INCREMENTAL_NUMEROS_POR_CONSULTA', 1000)
+
+    # Estado de cada tribunal durante a passada; 'paginas' é a lista de (alias, (alias, bloco de números, search_after))
+    tribunais, paginas = {}, []
+    for alias_tribunal in cnj_incremental.aliases_acompanhados():
+        marca = cnj_incremental.obter_marca(alias_tribunal)
+        if marca is None:
+            continue
+        casos_por_numero = cnj_incremental.casos_acompanhados(alias_tribunal)
+        numeros = sorted(casos_por_numero)
+        blocos = [tuple(numeros[inicio:inicio + numeros_por_consulta]) for inicio in range(0, len(numeros), numeros_por_consulta)]
+        tribunais[alias_tribunal] = {
+            'marca': marca, 'nova_marca': marca, 'desde': marca - margem, 'inicio': datetime.utcnow(),
+            'casos_por_numero': casos_por_numero, 'hits_por_numero': {}, 'consultas': 0,
+            'paginas_pendentes': len(blocos), 'falhou': False,
+        }
+        paginas.extend((alias_tribunal, (alias_tribunal, bloco, None)) for bloco in blocos)
+
+    def buscar_pagina(pagina):
+        alias_tribunal, bloco, search_after = pagina
+        with app.app_context():
+            return consultar_atualizacoes_por_alias(alias_tribunal, list(bloco), tribunais[alias_tribunal]['desde'], search_after, tamanho_pagina)
+
+    casos_verificados = 0
+    disjuntores = obter_disjuntores()
+    while paginas:
+        proximas_paginas = []
+        for (alias_tribunal, bloco, _), resposta, excecao in executar_por_tribunal(paginas, buscar_pagina, max_workers, limitador, disjuntores=disjuntores):
+            estado = tribunais[alias_tribunal]
+            estado['paginas_pendentes'] -= 1
+            if estado['falhou']:
+                continue
+            estado['consultas'] += 1
+            dados_cnj, status_code = resposta if excecao is None else ({}, None)
+            if excecao is not None or status_code >= 400:
+                estado['falhou'] = True
+                estado['hits_por_numero'].clear()
+                motivo = f"status {status_code}" if excecao is None else str(excecao)
+                logger.warning(f"JOB CNJ: Sincronização incremental de '{alias_tribunal}' interrompida ({motivo}); marca mantida em {estado['marca']}.")
+                continue
+            hits = dados_cnj.get('hits', {}).get('hits', [])
+            for hit in hits:
+                source = hit.get('_source') or {}
+                data_hora = interpretar_data_hora_datajud(source.get('dataHoraUltimaAtualizacao'))
+                if data_hora is not None and data_hora > estado['nova_marca']:
+                    estado['nova_marca'] = data_hora
+                numero = normalizar_numero_processo(str(source.get('numeroProcesso', '')))
+                if numero in estado['casos_por_numero']:
+                    # Um processo pode ter um documento por grau de jurisdição: todos são ingeridos juntos
+                    estado['hits_por_numero'].setdefault(numero, []).append(hit)
+            if len(hits) >= tamanho_pagina and hits[-1].get('sort'):
+                estado['paginas_pendentes'] += 1
+                proximas_paginas.append((alias_tribunal, (alias_tribunal, bloco, hits[-1]['sort'])))
+            elif not estado['paginas_pendentes']:
+                try:
+                    casos_verificados += _concluir_tribunal_incremental(alias_tribunal, estado, logger)
+                except Exception as e_tribunal:
+                    logger.error(f"JOB CNJ: Erro na sincronização incremental de '{alias_tribunal}': {str(e_tribunal)}", exc_info=True)
+                    db.session.rollback()
+        paginas = proximas_paginas
+    return casos_verificados
+
+
+def _concluir_tribunal_incremental(alias_tribunal, estado, logger):
+    """Ingere os documentos recebidos de um tribunal, registra os demais casos vencidos e grava a marca."""
+    from app import db
+
+    casos_por_numero = estado['casos_por_numero']
+    casos_verificados = 0
+    houve_falha = False # Um processo que falhou na ingestão é consultado de novo na próxima passada
+    for numero, hits in estado['hits_por_numero'].items():
+        resultado, casos_do_numero = _registrar_resultado_processo(
+            numero, casos_por_numero[numero], {numero: ({"hits": {"hits": hits}}, 200)}, None, logger
+        )
+        casos_verificados += casos_do_numero
+        cnj_metricas.registrar_casos(alias_tribunal, casos_do_numero, resultado['novas_movimentacoes'] if resultado else 0)
+        houve_falha = houve_falha or resultado is None
+
+    casos_em_dia = cnj_incremental.registrar_casos_em_dia(alias_tribunal, set(estado['hits_por_numero']), estado['inicio'])
+    cnj_metricas.registrar_casos(alias_tribunal, casos_em_dia)
+    cnj_incremental.gravar_marca(alias_tribunal, estado['marca'] if houve_falha else estado['nova_marca'])
+    db.session.commit()
+    logger.info(f"JOB CNJ: Sincronização incremental de '{alias_tribunal}': {estado['consultas']} consulta(s) para {len(casos_por_numero)} processo(s), "
+                f"{len(estado['hits_por_numero'])} atualizado(s), {casos_em_dia} caso(s) vencido(s) sem alteração; "
+                f"marca em {estado['marca'] if houve_falha else estado['nova_marca']}.")
+    estado['hits_por_numero'] = {}
+    return casos_verificados + casos_em_dia
+
+
+def segundos_tribunal_indisponivel(resultados_lote, excecao_lote):
+    """
+    Se o lote não foi consultado porque o circuito do tribunal estava aberto (no motor ou já dentro
+    de cnj_service), retorna os segundos até a próxima tentativa; senão, None.
+    """
+    if isinstance(excecao_lote, TribunalIndisponivel):
+        return excecao_lote.segundos
+    if excecao_lote is None and isinstance(resultados_lote, dict) and resultados_lote:
+        dados_cnj, _ = next(iter(resultados_lote.values()))
+        if dados_cnj.get('circuito_aberto'):
+            return float(dados_cnj.get('tentar_novamente_em') or 0)
+    return None
+
+
+def _iterar_lote_em_streaming(resposta, numeros_lote, respostas_lote, logger):
+    """
+    Percorre a resposta de um lote lida em streaming e gera (numero, {numero: (dados_cnj, status)})
+    para _registrar_resultado_processo: primeiro os números na ordem dos hits, com os documentos
+    (graus) do processo em um DocumentosEmStreaming (lido durante o registro), depois os que não
+    vieram, com uma resposta sem hits. Se o JSON da resposta for inválido, os números ainda não
+    registrados recebem erro.
+    'respostas_lote' recebe, por número, o resumo da resposta usado pelo cache negativo.
+    """
+    pendentes = set(numeros_lote)
+    try:
+        with resposta:
+            for numero, documentos in agrupar_documentos_em_streaming(resposta.sources()):
+                if numero not in pendentes:
+                    if numero in respostas_lote:
+                        logger.warning(f"JOB CNJ: Documentos do processo '{numero}' fora de sequência na resposta do lote; só os primeiros foram ingeridos.")
+                    continue
+                pendentes.discard(numero)
+                respostas_lote[numero] = ({"hits": {"hits": [{"_source": {"numeroProcesso": numero}}]}}, 200)
+                yield numero, {numero: (documentos, 200)}
+    except ValueError as e_json:
+        logger.error(f"JOB CNJ: Resposta do lote com JSON inválido; {len(pendentes)} processo(s) sem resultado: {str(e_json)}")
+        erro = ({"erro": "A resposta do serviço do CNJ não estava em formato JSON válido."}, 502)
+        for numero in numeros_lote:
+            if numero in pendentes:
+                yield numero, {numero: erro}
+        return
+    for numero in numeros_lote:
+        if numero in pendentes:
+            respostas_lote[numero] = ({"hits": {"hits": []}}, 200)
+            yield numero, respostas_lote
+
+
+def _adiar_verificacao(caso_ids, ate, logger):
+    """
+    Reagenda os casos para 'ate' (ex.: quando o circuito do tribunal deve reabrir) sem registrá-los
+    como verificados: a fila não fica presa neles, e eles voltam a ser elegíveis nessa data.
+    """
+    from app import db, Caso
 
+    try:
+        db.session.execute(
+            db.update(Caso).where(Caso.id.in_(caso_ids))
+            .values(proxima_verificacao_cnj=ate)
+        )
+        db.session.commit()
+    except Exception as e_adiar:
+        logger.error(f"JOB CNJ: Falha ao adiar a verificação dos casos {caso_ids}: {str(e_adiar)}")
+        db.session.rollback()
+
+
+def _atualizar_cache_negativo(resultados_lote, excecao_lote, logger):
+    """Registra no cache negativo os números do lote sem resultado no DataJud (e retira os encontrados)."""
+    from app import db
+
+    if excecao_lote is not None or not resultados_lote:
+        return
+    try:
+        cnj_cache_negativo.registrar_resultados(resultados_lote)
+        db.session.commit()
+    except Exception as e_cache:
+        logger.error(f"JOB CNJ: Falha ao atualizar o cache negativo: {str(e_cache)}")
+        db.session.rollback()
+
+
+def _registrar_resultado_processo(numero_processo, caso_ids, resultados_lote, excecao_lote, logger):
+    """
+    Persiste o resultado da consulta de um número de processo, com commit próprio (um erro não afeta
+    os demais): as movimentações são gravadas uma vez no processo e todos os casos com o número são
+    registrados como verificados. 'caso_ids' são os casos elegíveis que motivaram a consulta.
+    Retorna (resultado da ingestão ou None, quantidade de casos verificados).
+    """
+    from app import db
+
+    logger.info(f"JOB CNJ: Verificando processo '{numero_processo}' (caso(s) {caso_ids})")
+    try:
+        if excecao_lote is not None:
+            raise excecao_lote
+        dados_cnj_raw, status_code = resultados_lote[numero_processo]
+        resultado = _processar_resposta_processo(numero_processo, dados_cnj_raw, status_code, logger)
+        if resultado is None:
+            # Erro na consulta: só os casos elegíveis são reagendados
+            _marcar_verificacao_apos_erro(caso_ids, logger)
+            return None, len(caso_ids)
+        if not resultado['casos']:
+            logger.warning(f"JOB CNJ: Nenhum caso com o processo '{numero_processo}' existe mais. Resultado da consulta descartado.")
+        for caso_item in resultado['casos']:
+            registrar_verificacao_cnj(caso_item, resultado['novas_movimentacoes'])
+        db.session.commit()
+        return resultado, len(resultado['casos'])
+
+    except IntegrityError:
+        # O índice único (processo_cnj_id, hash_movimentacao) barrou duplicatas: outra sincronização
+        # (ex.: o endpoint atualizar-cnj) registrou as mesmas movimentações ao mesmo tempo.
+        db.session.rollback()
+        logger.warning(f"JOB CNJ: Sincronização concorrente detectada para o processo '{numero_processo}'; movimentações já registradas por outra execução.")
+        _marcar_verificacao_apos_erro(caso_ids, logger)
+
+    except Exception as e_job_item_proc:
+        logger.error(f"JOB CNJ: Exceção ao processar o processo '{numero_processo}' (caso(s) {caso_ids}): {str(e_job_item_proc)}", exc_info=True)
+        db.session.rollback()
+        _marcar_verificacao_apos_erro(caso_ids, logger)
+    return None, len(caso_ids)
+
+
+def _marcar_verificacao_apos_erro(caso_ids, logger):
+    """Registra a verificação dos casos mesmo após uma falha, para que não sejam retentados em seguida (reagendados pela prioridade atual)."""
+    from app import db, Caso
+
+    try:
+        # Re-attach e atualiza data_ultima_verificacao_cnj (e a próxima verificação) mesmo em erro
+        casos_reattached = Caso.query.filter(Caso.id.in_(caso_ids)).all()
+        for caso_item in casos_reattached:
+            registrar_verificacao_cnj(caso_item)
+        db.session.commit()
+        if len(casos_reattached) < len(caso_ids):
+            logger.error(f"JOB CNJ: Não foi possível re-attachar todos os casos {caso_ids} para atualizar data_ultima_verificacao_cnj após erro.")
+    except Exception as e_commit_on_error:
+        logger.error(f"JOB CNJ: Falha crítica ao tentar atualizar data_ultima_verificacao_cnj APÓS ERRO para casos {caso_ids}: {str(e_commit_on_error)}")
+        db.session.rollback()
+
+
+def _processar_resposta_processo(numero_processo, dados_cnj_raw, status_code, logger):
+    """
+    Registra as novas movimentações de um processo a partir da resposta do DataJud e as repassa aos
+    casos com o número. Não faz commit; o chamador é responsável pela transação. Retorna o resultado
+    da ingestão ou None em caso de erro na consulta.
+    """
+    if status_code < 400: # Sucesso na consulta
+        if isinstance(dados_cnj_raw, DocumentosEmStreaming):
+            resultado = ingerir_documentos_em_streaming(numero_processo, dados_cnj_raw)
+        else:
+            resultado = ingerir_resposta_processo(numero_processo, dados_cnj_raw)
+        if resultado['payload_inalterado']:
+            logger.info(f"JOB CNJ: Resposta do CNJ inalterada para o processo '{numero_processo}'; ingestão pulada.")
+        elif resultado['processo_encontrado']:
+            if resultado['movimentos_ignorados']:
+                logger.warning(f"JOB CNJ: {resultado['movimentos_ignorados']} movimento(s) com 'dataHora' inválida ignorado(s) para o processo '{numero_processo}'.")
+            logger.info(f"JOB CNJ: Processo '{numero_processo}' processado, {resultado['novas_movimentacoes']} nova(s) movimentação(ões) registrada(s) para {len(resultado['casos'])} caso(s).")
+        else:
+            logger.info(f"JOB CNJ: Nenhuma informação (hit) encontrada no CNJ para o processo '{numero_processo}'.")
+        return resultado
+    
+    logger.error(f"JOB CNJ: Erro ao consultar CNJ para o processo '{numero_processo}'. Status: {status_code}, Erro: {dados_cnj_raw.get('erro')}")
+    return None
@@ -4,15 +4,23 @@
 
 import sys
 import os
+import json
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
 import pytest
 
 # Adiciona o diretório pai (raiz do projeto backend, onde 'app.py' está) ao sys.path
 # para que o módulo 'app' possa ser encontrado pelos testes.
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from app import app as flask_app, db as _db # Importa a aplicação Flask e o objeto db
-from app import Cliente # Importa modelos que podem ser usados para criar dados de teste
+from app import create_app, db as _db # Importa a factory da aplicação Flask e o objeto db
+from app import User, Cliente, Caso # Importa modelos que podem ser usados para criar dados de teste
 from config_test import ConfigTest # Importa a configuração de teste (DEVE ESTAR NA RAIZ DO PROJETO BACKEND)
+from flask_jwt_extended import create_access_token
+import cnj_service
+
+flask_app = create_app(ConfigTest)
 
 
 @pytest.fixture(scope='session')
@@ -107,3 +115,99 @@ def db(app):
         _db.session.commit()
         yield _db
 
+
+# --- Dados, fixtures e auxiliares compartilhados pelos testes da integração com o CNJ ---
+
+def resposta_cnj(movimentos):
+    """Monta uma resposta no formato da API do DataJud com um único processo."""
+    return {"hits": {"hits": [{"_source": {"movimentos": movimentos}}]}}
+
+
+def criar_caso(db, numero_processo, sufixo=''):
+    """Cria usuário, cliente e caso diretamente no banco e retorna o caso."""
+    user = User(username=f'adv{sufixo}', email=f'adv{sufixo}@teste.com')
+    user.set_password('senha123')
+    db.session.add(user)
+    db.session.flush()
+    cliente = Cliente(nome='Cliente Job CNJ', user_id=user.id)
+    db.session.add(cliente)
+    db.session.flush()
+    caso = Caso(nome_caso=f'Caso {numero_processo}', numero_processo=numero_processo, cliente_id=cliente.id, user_id=user.id)
+    db.session.add(caso)
+    db.session.commit()
+    return caso
+
+
+@pytest.fixture()
+def job_habilitado(app):
+    """Habilita o job e remove o limite de taxa para os testes."""
+    chaves = ('CNJ_JOB_ENABLED', 'CNJ_JOB_RATE_PER_ALIAS', 'CNJ_JOB_MAX_CASES_PER_RUN')
+    valores_antigos = {k: app.config[k] for k in chaves if k in app.config}
+    app.config.update(CNJ_JOB_ENABLED=True, CNJ_JOB_RATE_PER_ALIAS=1000, CNJ_JOB_MAX_CASES_PER_RUN=10)
+    cnj_service.reiniciar_disjuntores()
+    yield app
+    cnj_service.reiniciar_disjuntores()
+    for k in chaves:
+        app.config.pop(k, None)
+    app.config.update(valores_antigos)
+
+
+class StubDataJudHandler(BaseHTTPRequestHandler):
+    """Servidor local mínimo que imita o endpoint /{alias}/_search do DataJud."""
+    protocol_version = 'HTTP/1.1' # Permite conexões keep-alive
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        tamanho = int(self.headers.get('Content-Length', 0))
+        consulta = json.loads(self.rfile.read(tamanho) or b'{}')
+        self.server.requisicoes.append({'path': self.path, 'consulta': consulta, 'cliente': self.client_address})
+        corpo = json.dumps(self.server.resposta).encode()
+        self.send_response(self.server.status)
+        for nome, valor in self.server.cabecalhos.items():
+            self.send_header(nome, valor)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture()
+def stub_datajud(app):
+    """Sobe o servidor stub e aponta a configuração da app para ele."""
+    servidor = ThreadingHTTPServer(('127.0.0.1', 0), StubDataJudHandler)
+    servidor.requisicoes = []
+    servidor.resposta = {"hits": {"hits": []}}
+    servidor.status = 200
+    servidor.cabecalhos = {}
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    valores_antigos = {k: app.config.get(k) for k in ('CNJ_API_BASE_URL', 'CNJ_API_KEY')}
+    app.config.update(CNJ_API_BASE_URL=f'http://127.0.0.1:{servidor.server_address[1]}', CNJ_API_KEY='chave-teste')
+    cnj_service.fechar_sessoes_http()
+    cnj_service.reiniciar_disjuntores()
+    yield servidor
+    cnj_service.fechar_sessoes_http()
+    cnj_service.reiniciar_disjuntores()
+    app.config.update(valores_antigos)
+    servidor.shutdown()
+    servidor.server_close()
+
+
+def cabecalho_autenticado(app, user_id):
+    """Gera o cabeçalho Authorization com um token JWT para o usuário informado."""
+    with app.app_context():
+        token = create_access_token(identity=str(user_id))
+    return {'Authorization': f'Bearer {token}'}
+
+
+def aguardar_job(client, headers, job_id, timeout=5):
+    """Consulta GET /api/cnj-jobs/<id> até o job terminar e retorna o JSON final."""
+    limite = time.monotonic() + timeout
+    while time.monotonic() < limite:
+        dados = client.get(f'/api/cnj-jobs/{job_id}', headers=headers).get_json()
+        if dados['status'] in ('concluido', 'erro'):
+            return dados
+        time.sleep(0.02)
+    raise AssertionError(f"Job {job_id} não terminou em {timeout}s")
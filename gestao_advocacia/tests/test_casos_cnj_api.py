@@ -0,0 +1,244 @@
+# Arquivo: tests/test_casos_cnj_api.py
+# Testes para as rotas CNJ da API de Casos (atualizar-cnj, atualizar-cnj-lote e movimentacoes-cnj).
+
+import json
+import threading
+import uuid
+from datetime import datetime, timedelta
+import cnj_ingestao
+import cnj_jobs
+import cnj_cache_negativo
+import cnj_fila
+from app import Caso, CacheNegativoCNJ, CnjJob, FilaSincronizacaoCNJ
+from tests.conftest import resposta_cnj, criar_caso, cabecalho_autenticado, aguardar_job
+
+
+def test_atualizar_cnj_registra_movimentacoes(app, client, db, monkeypatch):
+    """Testa POST /api/casos/<id>/atualizar-cnj registrando as movimentações do processo."""
+    caso = criar_caso(db, '0000010-11.2023.8.19.0001')
+    movimentos = [
+        {"dataHora": "2024-02-01T10:00:00Z", "codigo": 26, "movimentoNacional": {"descricao": "Distribuição"}},
+        {"dataHora": "2024-02-05T10:00:00Z", "codigo": 51, "movimentoNacional": {"descricao": "Conclusão"}},
+    ]
+    monkeypatch.setattr(cnj_jobs, 'consultar_processo_cnj', lambda numero: (resposta_cnj(movimentos), 200))
+    headers = cabecalho_autenticado(app, caso.user_id)
+
+    response = client.post(f'/api/casos/{caso.id}/atualizar-cnj', headers=headers)
+    assert response.status_code == 202
+    job_id = response.get_json()['job_id']
+    assert response.headers['Location'] == f'/api/cnj-jobs/{job_id}'
+    job = aguardar_job(client, headers, job_id)
+    assert job['status'] == 'concluido'
+    assert job['http_status'] == 200
+    assert job['resultado']['novas_movimentacoes_registradas'] == 2
+    assert job['resultado']['descricao_ultima_movimentacao_nova'] == 'Conclusão'
+
+    response = client.post(f'/api/casos/{caso.id}/atualizar-cnj', headers=headers)
+    job = aguardar_job(client, headers, response.get_json()['job_id'])
+    assert job['resultado']['novas_movimentacoes_registradas'] == 0
+    assert caso.movimentacoes_cnj.count() == 2
+
+    response = client.get(f'/api/casos/{caso.id}/movimentacoes-cnj', headers=headers)
+    assert response.status_code == 200
+    assert [m['descricao'] for m in response.get_json()] == ['Conclusão', 'Distribuição']
+
+
+def test_atualizar_cnj_pedidos_simultaneos_compartilham_o_job(app, client, db, monkeypatch):
+    """Testa o single-flight: pedidos para o mesmo caso enquanto a consulta está em andamento recebem o mesmo job."""
+    caso = criar_caso(db, '0000013-14.2023.8.19.0001')
+    liberar_consulta = threading.Event()
+    consultas = []
+
+    def consultar_lento(numero):
+        consultas.append(numero)
+        liberar_consulta.wait(5)
+        return {"erro": "Serviço indisponível"}, 503
+
+    monkeypatch.setattr(cnj_jobs, 'consultar_processo_cnj', consultar_lento)
+    headers = cabecalho_autenticado(app, caso.user_id)
+
+    ids = {client.post(f'/api/casos/{caso.id}/atualizar-cnj', headers=headers).get_json()['job_id'] for _ in range(3)}
+    liberar_consulta.set()
+    assert len(ids) == 1
+    job = aguardar_job(client, headers, ids.pop())
+    assert job['status'] == 'erro'
+    assert job['http_status'] == 503
+    assert len(consultas) == 1
+
+
+def test_pedido_concorrente_registrado_durante_a_consulta_reaproveita_o_job(app, db, monkeypatch):
+    """Testa que a consulta ao banco é feita fora do lock e que o job de um pedido simultâneo é reaproveitado."""
+    caso = criar_caso(db, '0000015-16.2023.8.19.0001')
+    vencedor = CnjJob(id=str(uuid.uuid4()), caso_id=caso.id, user_id=caso.user_id, status='executando')
+    db.session.add(vencedor)
+    db.session.commit()
+
+    def consulta_com_pedido_simultaneo(caso_id):
+        assert not cnj_jobs._lock.locked()
+        cnj_jobs._jobs_em_andamento[caso_id] = vencedor.id # Outro pedido deste processo chegou ao registro primeiro
+        return None
+
+    monkeypatch.setattr(cnj_jobs, '_job_em_andamento_no_banco', consulta_com_pedido_simultaneo)
+    try:
+        job, criado = cnj_jobs.enfileirar_atualizacao_caso(caso, caso.user_id)
+    finally:
+        cnj_jobs._jobs_em_andamento.pop(caso.id, None)
+    assert not criado and job.id == vencedor.id
+    assert CnjJob.query.count() == 1
+
+
+def test_job_abandonado_e_informado_como_erro(app, client, db):
+    """Testa que GET /api/cnj-jobs/<id> informa como erro o job parado há mais de CNJ_ASYNC_JOB_STALE_SECONDS fora da fila."""
+    caso = criar_caso(db, '0000016-17.2023.8.19.0001')
+    antigo = datetime.utcnow() - timedelta(seconds=app.config.get('CNJ_ASYNC_JOB_STALE_SECONDS', 300) + 60)
+    jobs = {nome: CnjJob(id=str(uuid.uuid4()), caso_id=caso.id, user_id=caso.user_id, status='executando', criado_em=criado_em)
+            for nome, criado_em in (('abandonado', antigo), ('na_fila', antigo), ('recente', datetime.utcnow()))}
+    db.session.add_all(jobs.values())
+    db.session.flush()
+    db.session.add(FilaSincronizacaoCNJ(caso_id=caso.id, prioridade=cnj_fila.PRIORIDADE_MANUAL, cnj_job_id=jobs['na_fila'].id))
+    db.session.commit()
+    headers = cabecalho_autenticado(app, caso.user_id)
+
+    dados = client.get(f"/api/cnj-jobs/{jobs['abandonado'].id}", headers=headers).get_json()
+    assert dados['status'] == 'erro' and dados['http_status'] == 500 and dados['concluido_em'] is not None
+    assert client.get(f"/api/cnj-jobs/{jobs['na_fila'].id}", headers=headers).get_json()['status'] == 'executando'
+    assert client.get(f"/api/cnj-jobs/{jobs['recente'].id}", headers=headers).get_json()['status'] == 'executando'
+
+
+def test_job_cnj_de_outro_usuario(app, client, db, monkeypatch):
+    """Testa que um usuário não enxerga o job de outro."""
+    caso = criar_caso(db, '0000014-15.2023.8.19.0001')
+    monkeypatch.setattr(cnj_jobs, 'consultar_processo_cnj', lambda numero: ({"hits": {"hits": []}}, 200))
+    job_id = client.post(f'/api/casos/{caso.id}/atualizar-cnj', headers=cabecalho_autenticado(app, caso.user_id)).get_json()['job_id']
+    response = client.get(f'/api/cnj-jobs/{job_id}', headers=cabecalho_autenticado(app, caso.user_id + 1))
+    assert response.status_code == 404
+    aguardar_job(client, cabecalho_autenticado(app, caso.user_id), job_id)
+
+
+def test_atualizar_cnj_caso_de_outro_usuario(app, client, db):
+    """Testa que um usuário não pode atualizar o caso de outro."""
+    caso = criar_caso(db, '0000011-12.2023.8.19.0001')
+    response = client.post(f'/api/casos/{caso.id}/atualizar-cnj', headers=cabecalho_autenticado(app, caso.user_id + 1))
+    assert response.status_code == 403
+
+
+def test_atualizar_cnj_lote_transmite_progresso_por_caso(app, client, db, monkeypatch):
+    """Testa POST /api/casos/atualizar-cnj-lote agrupando por tribunal e transmitindo uma linha NDJSON por caso."""
+    caso_rj = criar_caso(db, '0000020-21.2023.8.19.0001', 'lote')
+    caso_sp = Caso(nome_caso='Caso SP', numero_processo='0000021-22.2023.8.26.0100', cliente_id=caso_rj.cliente_id, user_id=caso_rj.user_id)
+    caso_falha = Caso(nome_caso='Caso falha', numero_processo='0000022-23.2023.8.26.0100', cliente_id=caso_rj.cliente_id, user_id=caso_rj.user_id)
+    db.session.add_all([caso_sp, caso_falha])
+    db.session.commit()
+    caso_alheio = criar_caso(db, '0000023-24.2023.8.19.0001', 'lote-outro')
+    lotes_consultados = []
+
+    def consultar_lote_falso(alias_tribunal, numeros_processo):
+        lotes_consultados.append((alias_tribunal, sorted(numeros_processo)))
+        return {
+            numero: ({"erro": "Serviço indisponível"}, 503) if numero == caso_falha.numero_processo_digits
+            else (resposta_cnj([{"dataHora": "2024-03-01T10:00:00Z", "movimentoNacional": {"descricao": "Sentença"}}]), 200)
+            for numero in numeros_processo
+        }
+
+    monkeypatch.setattr(cnj_jobs, 'consultar_lote_por_alias', consultar_lote_falso)
+    response = client.post('/api/casos/atualizar-cnj-lote', headers=cabecalho_autenticado(app, caso_rj.user_id),
+                           json={"caso_ids": [caso_rj.id, caso_sp.id, caso_falha.id, caso_alheio.id]})
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+    eventos = [json.loads(linha) for linha in response.get_data(as_text=True).splitlines()]
+
+    assert eventos[0] == {"tipo": "inicio", "total": 4}
+    assert eventos[-1]['tipo'] == 'fim'
+    assert eventos[-1]['resumo'] == {"nao_encontrado": 1, "atualizado": 2, "erro": 1}
+    por_caso = {e['caso_id']: e for e in eventos if e['tipo'] == 'caso'}
+    assert por_caso[caso_alheio.id]['status'] == 'nao_encontrado'
+    assert por_caso[caso_rj.id]['novas_movimentacoes'] == 1
+    assert por_caso[caso_sp.id]['status'] == 'atualizado'
+    assert por_caso[caso_falha.id]['http_status'] == 503
+    # Um lote por tribunal
+    assert len(lotes_consultados) == 2
+    assert caso_sp.movimentacoes_cnj.count() == 1
+    assert caso_falha.movimentacoes_cnj.count() == 0
+    assert caso_alheio.movimentacoes_cnj.count() == 0
+
+
+def test_atualizar_cnj_lote_todos_em_sse(app, client, db, monkeypatch):
+    """Testa o pedido com 'todos': true e a resposta como Server-Sent Events."""
+    caso = criar_caso(db, '0000024-25.2023.8.19.0001', 'lote-sse')
+    monkeypatch.setattr(cnj_jobs, 'consultar_lote_por_alias',
+                        lambda alias, numeros: {numero: ({"hits": {"hits": []}}, 200) for numero in numeros})
+    headers = dict(cabecalho_autenticado(app, caso.user_id), Accept='text/event-stream')
+    response = client.post('/api/casos/atualizar-cnj-lote', headers=headers, json={"todos": True})
+    assert response.mimetype == 'text/event-stream'
+    blocos = [b for b in response.get_data(as_text=True).split('\n\n') if b]
+    assert all(b.startswith('data: ') for b in blocos)
+    eventos = [json.loads(b[len('data: '):]) for b in blocos]
+    assert [e['tipo'] for e in eventos] == ['inicio', 'caso', 'fim']
+    assert eventos[1]['status'] == 'nao_encontrado_no_cnj'
+
+
+def test_atualizar_cnj_lote_corpo_invalido(app, client, db):
+    """Testa que o pedido sem 'caso_ids' nem 'todos' é recusado."""
+    caso = criar_caso(db, '0000025-26.2023.8.19.0001', 'lote-invalido')
+    response = client.post('/api/casos/atualizar-cnj-lote', headers=cabecalho_autenticado(app, caso.user_id), json={"caso_ids": "1"})
+    assert response.status_code == 400
+
+
+def test_movimentacoes_cnj_paginadas_por_cursor(app, client, db):
+    """Testa a listagem paginada por cursor, com desempate por id e o JSON bruto só com include_raw=true."""
+    caso = criar_caso(db, '0000026-27.2023.8.19.0001', 'paginacao')
+    movimentos = [{"dataHora": f"2024-04-{dia:02d}T10:00:00Z", "codigo": dia, "movimentoNacional": {"descricao": f"Mov {dia}"}}
+                  for dia in (1, 2, 2, 3, 4)]
+    movimentos[2]["codigo"] = 99
+    cnj_ingestao.ingerir_resposta_cnj(caso, resposta_cnj(movimentos))
+    db.session.commit()
+    headers = cabecalho_autenticado(app, caso.user_id)
+
+    paginas, cursor = [], None
+    while True:
+        url = f'/api/casos/{caso.id}/movimentacoes-cnj?limit=2' + (f'&cursor={cursor}' if cursor else '')
+        response = client.get(url, headers=headers)
+        assert response.status_code == 200
+        paginas.append(response.get_json())
+        cursor = response.headers.get('X-Next-Cursor')
+        if not cursor:
+            break
+    assert [len(p) for p in paginas] == [2, 2, 1]
+    ids = [m['id'] for p in paginas for m in p]
+    assert len(set(ids)) == 5
+    assert [m['descricao'] for p in paginas for m in p][:2] == ['Mov 4', 'Mov 3']
+    assert all('dados_integra_cnj' not in m for p in paginas for m in p)
+
+    response = client.get(f'/api/casos/{caso.id}/movimentacoes-cnj?limit=1&include_raw=true', headers=headers)
+    assert response.get_json()[0]['dados_integra_cnj'] == movimentos[4]
+    assert client.get(f'/api/casos/{caso.id}/movimentacoes-cnj?cursor=invalido', headers=headers).status_code == 400
+
+
+def test_caso_normaliza_numero_e_recusa_duplicata_em_outra_formatacao(app, client, db):
+    """Testa as colunas normalizadas do caso e a checagem de duplicidade pelos dígitos do número."""
+    caso = criar_caso(db, '0000027-28.2023.8.19.0001', 'normalizado')
+    assert (caso.numero_processo_digits, caso.segmento_justica, caso.tribunal_tr, caso.alias_tribunal_cnj) == \
+        ('00000272820238190001', '8', '19', 'api_publica_tjrj')
+
+    response = client.post('/api/casos/', headers=cabecalho_autenticado(app, caso.user_id),
+                           json={"nome_caso": "Duplicado", "cliente_id": caso.cliente_id, "numero_processo": "00000272820238190001"})
+    assert response.status_code == 409
+
+    caso.numero_processo = None
+    db.session.commit()
+    assert caso.numero_processo_digits is None and caso.alias_tribunal_cnj is None
+
+
+def test_editar_numero_do_processo_invalida_cache_negativo(app, client, db):
+    """Testa que PUT /api/casos/<id> com novo número remove esse número do cache negativo."""
+    caso = criar_caso(db, '0000020-21.2023.8.19.0001', 'cn')
+    novo_numero = '0000021-65.2023.8.19.0001'
+    cnj_cache_negativo.registrar_resultados({'00000216520238190001': ({"hits": {"hits": []}}, 200)})
+    db.session.commit()
+    assert db.session.get(CacheNegativoCNJ, '00000216520238190001') is not None
+
+    headers = cabecalho_autenticado(app, caso.user_id)
+    response = client.put(f'/api/casos/{caso.id}', json={'nome_caso': caso.nome_caso, 'cliente_id': caso.cliente_id, 'numero_processo': novo_numero}, headers=headers)
+    assert response.status_code == 200
+    db.session.expire_all()
+    assert db.session.get(CacheNegativoCNJ, '00000216520238190001') is None
@@ -0,0 +1,174 @@
+# Arquivo: tests/test_cnj_arquivo.py
+# Testes para o arquivo de respostas brutas do DataJud (cnj_arquivo.py) e o 'flask cnj-replay'.
+
+import json
+import os
+from datetime import datetime
+import pytest
+import cnj_arquivo
+import cnj_ingestao
+import cnj_service
+from app import MovimentacaoCNJ
+from tests.conftest import criar_caso
+
+NUMERO = '0000001-02.2023.8.19.0001'
+DIGITOS = '00000010220238190001'
+MOVIMENTOS = [
+    {"dataHora": "2024-03-01T10:00:00.000Z", "codigo": 1, "movimentoNacional": {"descricao": "Distribuição"}},
+    {"dataHora": "2024-03-05T10:00:00.000Z", "codigo": 2, "movimentoNacional": {"descricao": "Conclusão\npara despacho"}},
+    {"dataHora": "2024-03-09T10:00:00.000Z", "codigo": 3, "movimentoNacional": {"descricao": "Sentença"}},
+]
+
+
+def resposta_processo(numero_digitos, movimentos):
+    return {"hits": {"hits": [{"_source": {"numeroProcesso": numero_digitos, "movimentos": movimentos}}]}}
+
+
+def gravar_segmento(diretorio, registros, compressao='gzip'):
+    """Grava os registros (alias, numeros, resposta, obtido_em) em um segmento novo e retorna o caminho."""
+    arquivo = cnj_arquivo.ArquivoRespostasCNJ(str(diretorio), compressao=compressao)
+    for alias, numeros, resposta, obtido_em in registros:
+        arquivo.gravar(alias, numeros, [json.dumps(resposta, ensure_ascii=False, indent=2).encode('utf-8')], obtido_em)
+    caminho = arquivo.caminho_segmento
+    arquivo.fechar()
+    return caminho
+
+
+def ler_segmento(caminho):
+    with cnj_arquivo.abrir_segmento(caminho) as arquivo:
+        return [(cabecalho, [list(source.movimentos()) for source in sources])
+                for cabecalho, sources in cnj_arquivo.ler_registros(arquivo)]
+
+
+@pytest.mark.parametrize('compressao', ['gzip', 'zstd'])
+def test_gravacao_e_leitura_de_segmentos(tmp_path, compressao):
+    """Testa a ida e volta de respostas pelo segmento (JSON com quebras de linha, em vários pedaços) e a troca por tamanho."""
+    if compressao == 'zstd':
+        pytest.importorskip('zstandard')
+    caminho = gravar_segmento(tmp_path, [
+        ('api_publica_tjrj', [DIGITOS], resposta_processo(DIGITOS, MOVIMENTOS), datetime(2024, 3, 10, 12, 0)),
+        ('api_publica_tjrj', [], {"hits": {"hits": []}}, datetime(2024, 3, 10, 12, 5)),
+    ], compressao)
+    assert caminho.endswith('.ndjson.zst' if compressao == 'zstd' else '.ndjson.gz')
+    registros = ler_segmento(caminho)
+    assert [cabecalho['obtido_em'] for cabecalho, _ in registros] == [datetime(2024, 3, 10, 12, 0), datetime(2024, 3, 10, 12, 5)]
+    assert registros[0][0]['numeros'] == [DIGITOS]
+    assert registros[0][1] == [MOVIMENTOS] and registros[1][1] == []
+
+    arquivo = cnj_arquivo.ArquivoRespostasCNJ(str(tmp_path / 'pequeno'), compressao=compressao, max_bytes=1)
+    for _ in range(3):
+        arquivo.gravar('api_publica_tjrj', [DIGITOS], [b'{"hits":', b'{"hits":[]}}'])
+    arquivo.fechar()
+    segmentos = cnj_arquivo.listar_segmentos(str(tmp_path / 'pequeno'))
+    assert len(segmentos) == 3
+    assert all(len(ler_segmento(caminho)) == 1 for caminho in segmentos)
+    assert cnj_arquivo.listar_segmentos(str(tmp_path / 'pequeno'), ate=datetime(2000, 1, 1)) == []
+
+
+def test_consultas_bem_sucedidas_sao_arquivadas(app, stub_datajud, tmp_path, monkeypatch):
+    """Testa que respostas decodificadas e em streaming vão para o arquivo e que a resposta em streaming continua legível."""
+    monkeypatch.setitem(app.config, 'CNJ_ARQUIVO_ENABLED', True)
+    monkeypatch.setitem(app.config, 'CNJ_ARQUIVO_DIR', str(tmp_path))
+    monkeypatch.setitem(app.config, 'CNJ_ARQUIVO_COMPRESSAO', 'gzip')
+    cnj_arquivo.fechar_arquivo_respostas()
+    stub_datajud.resposta = resposta_processo(DIGITOS, MOVIMENTOS)
+
+    dados, status = cnj_service.consultar_processo_cnj(NUMERO)
+    assert status == 200 and dados == stub_datajud.resposta
+    with cnj_service.consultar_lote_por_alias_em_streaming('api_publica_tjrj', [NUMERO, '0000002-02.2023.8.19.0001']) as resposta:
+        assert [list(source.movimentos()) for source in resposta.sources()] == [MOVIMENTOS]
+    stub_datajud.status = 500
+    cnj_service.consultar_processo_cnj(NUMERO) # Falhas não são arquivadas
+    cnj_arquivo.fechar_arquivo_respostas()
+
+    segmentos = cnj_arquivo.listar_segmentos(str(tmp_path))
+    assert len(segmentos) == 1
+    registros = ler_segmento(segmentos[0])
+    assert [cabecalho['numeros'] for cabecalho, _ in registros] == [[DIGITOS], [DIGITOS, '00000020220238190001']]
+    assert all(cabecalho['alias'] == 'api_publica_tjrj' for cabecalho, _ in registros)
+    assert [movimentos for _, movimentos in registros] == [[MOVIMENTOS], [MOVIMENTOS]]
+
+
+def preparar_processo_desatualizado(db):
+    """Ingere MOVIMENTOS para um caso e então simula uma ingestão antiga: uma descrição errada e um movimento faltando."""
+    caso = criar_caso(db, NUMERO, 'replay')
+    cnj_ingestao.ingerir_resposta_processo(DIGITOS, resposta_processo(DIGITOS, MOVIMENTOS))
+    db.session.commit()
+    movimentacoes = MovimentacaoCNJ.query.order_by(MovimentacaoCNJ.data_movimentacao).all()
+    movimentacoes[0].descricao = 'Descrição antiga'
+    db.session.delete(movimentacoes[2])
+    db.session.commit()
+    return caso
+
+
+def descricoes_registradas():
+    return [m.descricao for m in MovimentacaoCNJ.query.order_by(MovimentacaoCNJ.data_movimentacao)]
+
+
+def test_replay_corrige_e_completa_movimentacoes(app, db, tmp_path):
+    """Testa 'flask cnj-replay': descrição recalculada, movimento faltante inserido, filtros e segmento truncado."""
+    preparar_processo_desatualizado(db)
+    esperadas = [cnj_ingestao.montar_descricao_movimento(m) for m in MOVIMENTOS]
+    gravar_segmento(tmp_path, [
+        ('api_publica_tjrj', [DIGITOS], resposta_processo(DIGITOS, MOVIMENTOS), datetime(2024, 3, 10, 12, 0)),
+        ('api_publica_tjrj', ['00000090220238190001'], resposta_processo('00000090220238190001', MOVIMENTOS), datetime(2024, 3, 10, 12, 1)),
+    ])
+    truncado = gravar_segmento(tmp_path, [('api_publica_tjrj', [DIGITOS], resposta_processo(DIGITOS, MOVIMENTOS), datetime(2024, 3, 11))])
+    with open(truncado, 'r+b') as arquivo:
+        arquivo.truncate(os.path.getsize(truncado) - 20)
+
+    # Fora do período: nada muda
+    resultado = app.test_cli_runner().invoke(args=['cnj-replay', '--diretorio', str(tmp_path), '--processos', '1', '--desde', '2024-04-01'])
+    assert resultado.exit_code == 0, resultado.output
+    assert descricoes_registradas() == ['Descrição antiga', esperadas[1]]
+
+    resultado = app.test_cli_runner().invoke(args=['cnj-replay', '--diretorio', str(tmp_path), '--processos', '1', '--numero', NUMERO])
+    assert resultado.exit_code == 0, resultado.output
+    assert descricoes_registradas() == esperadas
+    assert '1 movimentação(ões) inserida(s), 1 atualizada(s)' in resultado.output
+    assert '1 segmento(s) truncado(s)' in resultado.output
+
+    # Sem filtros: o processo sem caso é ignorado e a segunda passada não altera nada
+    resultado = app.test_cli_runner().invoke(args=['cnj-replay', '--diretorio', str(tmp_path), '--processos', '1'])
+    assert '0 movimentação(ões) inserida(s), 0 atualizada(s), 1 processo(s) sem caso' in resultado.output
+    assert MovimentacaoCNJ.query.count() == 3
+
+
+def test_replay_em_varios_processos(app, db, tmp_path):
+    """Testa o replay dividido entre processos do pool, com a mesma resposta em dois segmentos."""
+    preparar_processo_desatualizado(db)
+    for dia in (10, 11):
+        gravar_segmento(tmp_path, [('api_publica_tjrj', [DIGITOS], resposta_processo(DIGITOS, MOVIMENTOS), datetime(2024, 3, dia))])
+    db.session.remove()
+
+    resultado = app.test_cli_runner().invoke(args=['cnj-replay', '--diretorio', str(tmp_path), '--processos', '2'])
+    assert resultado.exit_code == 0, resultado.output
+    assert '2 processo(s) reprocessado(s); 1 movimentação(ões) inserida(s)' in resultado.output # A mesma inserção não conta duas vezes
+    assert descricoes_registradas() == [cnj_ingestao.montar_descricao_movimento(m) for m in MOVIMENTOS]
+
+
+def test_replay_usa_todos_os_graus_do_processo(app, db, tmp_path):
+    """Testa que o replay reprocessa os movimentos de todos os documentos (graus) de um número na resposta."""
+    preparar_processo_desatualizado(db)
+    resposta = {"hits": {"hits": [
+        {"_source": {"numeroProcesso": DIGITOS, "grau": "G1", "movimentos": MOVIMENTOS[:2]}},
+        {"_source": {"numeroProcesso": DIGITOS, "grau": "G2", "movimentos": MOVIMENTOS[2:]}},
+    ]}}
+    gravar_segmento(tmp_path, [('api_publica_tjrj', [DIGITOS], resposta, datetime(2024, 3, 10))])
+
+    resultado = app.test_cli_runner().invoke(args=['cnj-replay', '--diretorio', str(tmp_path), '--processos', '1'])
+    assert resultado.exit_code == 0, resultado.output
+    assert '1 processo(s) reprocessado(s); 1 movimentação(ões) inserida(s), 1 atualizada(s)' in resultado.output
+    assert descricoes_registradas() == [cnj_ingestao.montar_descricao_movimento(m) for m in MOVIMENTOS]
+
+
+def test_erro_de_disco_nao_e_tratado_como_segmento_truncado(app, db, tmp_path, monkeypatch):
+    """Testa que um erro de leitura do disco (OSError) interrompe o replay em vez de virar 'segmento truncado'."""
+    caminho = gravar_segmento(tmp_path, [('api_publica_tjrj', [DIGITOS], resposta_processo(DIGITOS, MOVIMENTOS), datetime(2024, 3, 10))])
+
+    def abrir_com_erro(caminho_segmento):
+        raise PermissionError(13, 'Permissão negada', caminho_segmento)
+
+    monkeypatch.setattr(cnj_arquivo, 'abrir_segmento', abrir_com_erro)
+    with pytest.raises(PermissionError):
+        cnj_arquivo.reprocessar_segmento(caminho)
@@ -0,0 +1,207 @@
+# Arquivo: tests/test_cnj_fila.py
+# Testes para a fila durável de atualizações CNJ (cnj_fila.py) e o seu consumo pelo job, pela API e pelo 'flask cnj-sync --fila'.
+
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+import pytest
+import cnj_fila
+import cnj_jobs
+import tasks
+from app import Caso, CnjJob, FilaSincronizacaoCNJ
+from tests.conftest import resposta_cnj, criar_caso, cabecalho_autenticado, aguardar_job
+
+
+@pytest.fixture()
+def fila_habilitada(app, monkeypatch):
+    monkeypatch.setitem(app.config, 'CNJ_FILA_ENABLED', True)
+    return app
+
+
+def criar_casos(db, quantidade, sufixo):
+    """Cria 'quantidade' casos do mesmo usuário e retorna os ids."""
+    primeiro = criar_caso(db, '0000100-01.2023.8.19.0001', sufixo)
+    casos = [primeiro] + [
+        Caso(nome_caso=f'Caso {i}', numero_processo=f'{100 + i:07d}-01.2023.8.19.0001', cliente_id=primeiro.cliente_id, user_id=primeiro.user_id)
+        for i in range(1, quantidade)
+    ]
+    db.session.add_all(casos[1:])
+    db.session.commit()
+    return [caso.id for caso in casos]
+
+
+def criar_job(db, caso_id):
+    job = CnjJob(id=str(uuid.uuid4()), caso_id=caso_id, user_id=db.session.get(Caso, caso_id).user_id, status='pendente')
+    db.session.add(job)
+    db.session.commit()
+    return job.id
+
+
+def test_pedido_do_usuario_passa_a_frente_dos_periodicos(db):
+    """Testa a ordem de reserva: prioridade manual primeiro, depois os periódicos mais antigos, sem itens duplicados por caso."""
+    ids = criar_casos(db, 4, 'ordem')
+    cnj_fila.enfileirar_casos(ids[:3])
+    cnj_fila.enfileirar_casos(ids[:2]) # Já enfileirados: nada muda
+    job_id = criar_job(db, ids[3])
+    cnj_fila.enfileirar_casos([ids[3]], cnj_fila.PRIORIDADE_MANUAL, job_id)
+    cnj_fila.enfileirar_casos([ids[2]], cnj_fila.PRIORIDADE_MANUAL) # Sobe a prioridade do item existente
+    db.session.commit()
+    assert FilaSincronizacaoCNJ.query.count() == 4
+
+    _, itens = cnj_fila.reservar_itens(10)
+    assert [item.caso_id for item in itens] == [ids[2], ids[3], ids[0], ids[1]]
+    assert itens[1].cnj_job_id == job_id and itens[0].cnj_job_id is None
+    assert cnj_fila.obter_estatisticas_fila()['reservados'] == 4
+
+
+def test_reservas_nao_se_sobrepoem_e_reserva_vencida_volta_a_fila(db):
+    """Testa que reservas simultâneas recebem itens distintos e que o item de um worker que morreu volta após o prazo."""
+    ids = criar_casos(db, 5, 'lease')
+    cnj_fila.enfileirar_casos(ids)
+    db.session.commit()
+
+    token_a, itens_a = cnj_fila.reservar_itens(3, duracao_reserva=60)
+    token_b, itens_b = cnj_fila.reservar_itens(3, duracao_reserva=60)
+    assert len(itens_a) == 3 and len(itens_b) == 2
+    assert not {item.id for item in itens_a} & {item.id for item in itens_b}
+    assert cnj_fila.reservar_itens(3)[1] == []
+
+    # O worker A "morreu": depois do prazo os itens dele são reservados de novo
+    _, itens_c = cnj_fila.reservar_itens(10, agora=datetime.utcnow() + timedelta(seconds=61))
+    assert sorted(item.id for item in itens_c) == sorted(item.id for item in itens_a + itens_b)
+    assert {item.tentativas for item in itens_c} == {2}
+    assert cnj_fila.concluir_itens(token_a) == 0 # A já não detém a reserva
+    assert cnj_fila.concluir_itens(token_b) == 0
+    assert FilaSincronizacaoCNJ.query.count() == 5
+
+
+def test_workers_concorrentes_consomem_cada_item_uma_vez(app, db):
+    """Testa vários workers (threads com sessões próprias) esvaziando a fila ao mesmo tempo, sem repetir itens."""
+    ids = criar_casos(db, 40, 'concorrente')
+    cnj_fila.enfileirar_casos(ids)
+    db.session.commit()
+    consumidos, erros = [], []
+
+    def worker():
+        with app.app_context():
+            try:
+                while True:
+                    token, itens = cnj_fila.reservar_itens(3)
+                    if not itens:
+                        break
+                    consumidos.extend(item.caso_id for item in itens)
+                    assert cnj_fila.concluir_itens(token) == len(itens)
+            except Exception as e:
+                erros.append(e)
+            finally:
+                db.session.remove()
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(30)
+    assert not erros
+    assert sorted(consumidos) == sorted(ids)
+    assert FilaSincronizacaoCNJ.query.count() == 0
+
+
+def test_pedido_durante_processamento_periodico_nao_se_perde(db):
+    """Testa que um pedido do usuário para um caso já reservado como periódico sobrevive à conclusão da reserva."""
+    ids = criar_casos(db, 1, 'pedido')
+    cnj_fila.enfileirar_casos(ids)
+    db.session.commit()
+    token, _ = cnj_fila.reservar_itens(1)
+
+    job_id = criar_job(db, ids[0])
+    cnj_fila.enfileirar_casos(ids, cnj_fila.PRIORIDADE_MANUAL, job_id)
+    db.session.commit()
+    assert cnj_fila.concluir_itens(token) == 0
+
+    _, itens = cnj_fila.reservar_itens(1, prioridade_minima=cnj_fila.PRIORIDADE_MANUAL)
+    assert [(item.caso_id, item.cnj_job_id) for item in itens] == [(ids[0], job_id)]
+
+
+def test_itens_esgotados_sao_descartados_e_job_marcado_com_erro(db):
+    """Testa o descarte de um item reservado CNJ_FILA_MAX_TENTATIVAS vezes sem conclusão, com o job do usuário encerrado em erro."""
+    ids = criar_casos(db, 2, 'esgotado')
+    job_id = criar_job(db, ids[0])
+    cnj_fila.enfileirar_casos([ids[0]], cnj_fila.PRIORIDADE_MANUAL, job_id)
+    cnj_fila.enfileirar_casos([ids[1]])
+    db.session.commit()
+    agora = datetime.utcnow()
+    for tentativa in range(2):
+        cnj_fila.reservar_itens(1, duracao_reserva=10, agora=agora + timedelta(seconds=20 * tentativa))
+
+    descartados = cnj_fila.descartar_itens_esgotados(max_tentativas=2, agora=agora + timedelta(seconds=40))
+    assert descartados == [job_id]
+    cnj_jobs.registrar_jobs_descartados(descartados)
+    assert [item.caso_id for item in FilaSincronizacaoCNJ.query] == [ids[1]]
+    job = db.session.get(CnjJob, job_id)
+    assert job.status == 'erro' and job.http_status == 500
+
+
+def test_job_em_modo_fila_enfileira_e_consome(app, db, job_habilitado, fila_habilitada, monkeypatch):
+    """Testa o job agendado no modo fila: pedidos do usuário já enfileirados são executados antes dos periódicos."""
+    ids = criar_casos(db, 3, 'job-fila')
+    job_id = criar_job(db, ids[0])
+    cnj_fila.enfileirar_casos([ids[0]], cnj_fila.PRIORIDADE_MANUAL, job_id)
+    db.session.commit()
+    ordem = []
+
+    def consultar_processo(numero):
+        ordem.append(('manual', numero))
+        return resposta_cnj([{"dataHora": "2024-05-01T10:00:00Z", "movimentoNacional": {"descricao": "Despacho"}}]), 200
+
+    def consultar_lote(alias_tribunal, numeros_processo):
+        ordem.append(('periodico', sorted(numeros_processo)))
+        return {numero: (resposta_cnj([{"dataHora": "2024-05-02T10:00:00Z", "movimentoNacional": {"descricao": "Conclusão"}}]), 200)
+                for numero in numeros_processo}
+
+    monkeypatch.setattr(cnj_jobs, 'consultar_processo_cnj', consultar_processo)
+    monkeypatch.setattr(tasks, 'consultar_lote_por_alias', consultar_lote)
+    assert tasks.job_verificar_processos_cnj() == 3
+
+    assert ordem[0][0] == 'manual' and ordem[1][0] == 'periodico'
+    assert len(ordem[1][1]) == 2 # O caso do pedido manual já foi verificado e não entra no lote periódico
+    assert db.session.get(CnjJob, job_id).status == 'concluido'
+    assert FilaSincronizacaoCNJ.query.count() == 0
+    for caso_id in ids:
+        assert db.session.get(Caso, caso_id).data_ultima_verificacao_cnj is not None
+    # Nada mais elegível: a próxima execução não enfileira nada
+    assert tasks.job_verificar_processos_cnj() == 0
+
+
+def test_atualizar_cnj_em_modo_fila(app, client, db, fila_habilitada, monkeypatch):
+    """Testa POST atualizar-cnj no modo fila: o pedido entra na fila e é atendido pelo pool de threads da API."""
+    caso = criar_caso(db, '0000060-02.2023.8.19.0001', 'api-fila')
+    monkeypatch.setattr(cnj_jobs, 'consultar_processo_cnj',
+                        lambda numero: (resposta_cnj([{"dataHora": "2024-06-01T10:00:00Z", "movimentoNacional": {"descricao": "Sentença"}}]), 200))
+    headers = cabecalho_autenticado(app, caso.user_id)
+
+    response = client.post(f'/api/casos/{caso.id}/atualizar-cnj', headers=headers)
+    assert response.status_code == 202
+    job = aguardar_job(client, headers, response.get_json()['job_id'])
+    assert job['status'] == 'concluido'
+    assert job['resultado']['novas_movimentacoes_registradas'] == 1
+    # O item sai da fila logo depois de o job ser concluído
+    limite = time.monotonic() + 5
+    while FilaSincronizacaoCNJ.query.count() and time.monotonic() < limite:
+        db.session.rollback()
+        time.sleep(0.02)
+    assert FilaSincronizacaoCNJ.query.count() == 0
+
+
+def test_comando_cnj_sync_fila(app, db, fila_habilitada, monkeypatch):
+    """Testa 'flask cnj-sync --fila' e a recusa de --fila junto com --shard."""
+    criar_casos(db, 2, 'cli-fila')
+    monkeypatch.setattr(tasks, 'consultar_lote_por_alias',
+                        lambda alias, numeros: {numero: ({"hits": {"hits": []}}, 200) for numero in numeros})
+
+    resultado = app.test_cli_runner().invoke(args=['cnj-sync', '--fila'])
+    assert resultado.exit_code == 0, resultado.output
+    assert '2 item(ns) da fila processado(s); 0 na fila' in resultado.output
+
+    resultado = app.test_cli_runner().invoke(args=['cnj-sync', '--fila', '--shard', '0/2'])
+    assert resultado.exit_code != 0
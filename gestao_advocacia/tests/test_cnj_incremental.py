@@ -0,0 +1,126 @@
+# Arquivo: tests/test_cnj_incremental.py
+# Testes para a sincronização incremental por tribunal (cnj_incremental.py, tasks.sincronizar_incremental_cnj).
+
+from datetime import datetime, timedelta
+import pytest
+import cnj_ingestao
+import cnj_service
+import tasks
+from app import Caso, MarcaSincronizacaoCNJ, MovimentacaoCNJ
+from cnj_prioridade import registrar_verificacao_cnj
+from tests.conftest import criar_caso
+
+ALIAS = 'api_publica_tjrj'
+NUMEROS = ['0000001-02.2023.8.19.0001', '0000002-02.2023.8.19.0001', '0000003-02.2023.8.19.0001']
+SINCRONIZADO_EM = datetime(2024, 6, 1, 12, 0)
+
+
+def documento(numero, atualizado_em, movimentos, grau='G1'):
+    digitos = cnj_service.normalizar_numero_processo(numero)
+    return {"_source": {"id": f"TJRJ_{grau}_{digitos}", "numeroProcesso": digitos,
+                        "dataHoraUltimaAtualizacao": cnj_service.formatar_data_hora_datajud(atualizado_em),
+                        "movimentos": movimentos}}
+
+
+def movimento(dia, descricao):
+    return {"dataHora": f"2024-06-{dia:02d}T10:00:00.000Z", "movimentoNacional": {"descricao": descricao}}
+
+
+class DataJudIncremental:
+    """Simula consultar_atualizacoes_por_alias sobre uma lista de documentos: filtro, ordem e search_after."""
+
+    def __init__(self, documentos, status=200):
+        self.documentos = documentos
+        self.status = status
+        self.consultas = []
+
+    def __call__(self, alias_tribunal, numeros_processo, atualizados_desde, search_after=None, tamanho_pagina=100):
+        self.consultas.append((alias_tribunal, sorted(numeros_processo), atualizados_desde, search_after))
+        if self.status >= 400:
+            return {"erro": "Serviço indisponível"}, self.status
+        chave = lambda hit: [hit['_source']['dataHoraUltimaAtualizacao'], hit['_source']['id']]
+        hits = sorted((dict(hit, sort=chave(hit)) for hit in self.documentos
+                       if hit['_source']['numeroProcesso'] in numeros_processo
+                       and hit['_source']['dataHoraUltimaAtualizacao'] > cnj_service.formatar_data_hora_datajud(atualizados_desde)), key=chave)
+        if search_after:
+            hits = [hit for hit in hits if hit['sort'] > list(search_after)]
+        return {"hits": {"hits": hits[:tamanho_pagina]}}, 200
+
+
+@pytest.fixture()
+def casos_sincronizados(app, db, monkeypatch):
+    """Três casos do TJRJ já sincronizados em SINCRONIZADO_EM, com a verificação vencida, e um caso novo."""
+    monkeypatch.setitem(app.config, 'CNJ_INCREMENTAL_MARGEM_SEGUNDOS', 0)
+    primeiro = criar_caso(db, NUMEROS[0], 'incremental')
+    casos = [primeiro] + [Caso(nome_caso=f'Caso {numero}', numero_processo=numero, cliente_id=primeiro.cliente_id, user_id=primeiro.user_id)
+                          for numero in NUMEROS[1:] + ['0000009-02.2023.8.19.0001']]
+    db.session.add_all(casos[1:])
+    db.session.commit()
+    for caso, numero in zip(casos, NUMEROS):
+        resultado = cnj_ingestao.ingerir_resposta_processo(caso.numero_processo_digits, {"hits": {"hits": [documento(numero, SINCRONIZADO_EM, [movimento(1, 'Distribuição')])]}})
+        resultado['casos'][0].processo_cnj.data_ultima_sincronizacao_cnj = SINCRONIZADO_EM
+        registrar_verificacao_cnj(caso, agora=SINCRONIZADO_EM)
+        caso.proxima_verificacao_cnj = SINCRONIZADO_EM
+    db.session.commit()
+    return [caso.id for caso in casos]
+
+
+def test_consulta_de_atualizacoes_pagina_com_search_after(app, stub_datajud):
+    """Testa a consulta enviada ao DataJud: filtro por números e por dataHoraUltimaAtualizacao, ordem e search_after."""
+    cnj_service.consultar_atualizacoes_por_alias(ALIAS, [NUMEROS[1], NUMEROS[0]], datetime(2024, 6, 1, 10, 0, 0, 123456),
+                                                 search_after=['2024-06-02T00:00:00.000Z', '00000010220238190001'], tamanho_pagina=50)
+    consulta = stub_datajud.requisicoes[0]['consulta']
+    assert stub_datajud.requisicoes[0]['path'] == f'/{ALIAS}/_search'
+    assert consulta['query']['bool']['filter'] == [
+        {"terms": {"numeroProcesso": ['00000010220238190001', '00000020220238190001']}},
+        {"range": {"dataHoraUltimaAtualizacao": {"gt": '2024-06-01T10:00:00.123Z'}}},
+    ]
+    assert consulta['sort'] == [{"dataHoraUltimaAtualizacao": {"order": "asc"}}, {"id": {"order": "asc"}}]
+    assert consulta['search_after'] == ['2024-06-02T00:00:00.000Z', '00000010220238190001'] and consulta['size'] == 50
+    assert cnj_service.interpretar_data_hora_datajud('2024-06-01T10:00:00.123-03:00') == datetime(2024, 6, 1, 13, 0, 0, 123000)
+    assert cnj_service.interpretar_data_hora_datajud('ontem') is None
+
+
+def test_job_incremental_ingere_so_os_documentos_alterados(app, db, job_habilitado, casos_sincronizados, monkeypatch):
+    """Testa o job no modo incremental: páginas via search_after, todos os graus dos alterados ingeridos, os demais em dia e a marca avançada."""
+    monkeypatch.setitem(app.config, 'CNJ_INCREMENTAL_ENABLED', True)
+    monkeypatch.setitem(app.config, 'CNJ_INCREMENTAL_TAMANHO_PAGINA', 1)
+    atualizado_em = SINCRONIZADO_EM + timedelta(days=2)
+    datajud = DataJudIncremental([
+        documento(NUMEROS[0], SINCRONIZADO_EM - timedelta(days=5), []), # Anterior à marca
+        # Mesmo processo em dois graus, com a mesma data: o 'id' desempata as páginas
+        documento(NUMEROS[1], atualizado_em, [movimento(1, 'Distribuição'), movimento(3, 'Sentença')], 'G2'),
+        documento(NUMEROS[1], atualizado_em, [movimento(2, 'Outro grau')], 'G1'),
+    ])
+    lotes = []
+    monkeypatch.setattr(tasks, 'consultar_atualizacoes_por_alias', datajud)
+    monkeypatch.setattr(tasks, 'consultar_lote_por_alias',
+                        lambda alias, numeros: lotes.append(sorted(numeros)) or {numero: ({"hits": {"hits": []}}, 200) for numero in numeros})
+
+    assert tasks.job_verificar_processos_cnj() == 4
+    assert [consulta[3] for consulta in datajud.consultas] == [None, ['2024-06-03T12:00:00.000Z', 'TJRJ_G1_00000020220238190001'],
+                                                                ['2024-06-03T12:00:00.000Z', 'TJRJ_G2_00000020220238190001']]
+    assert datajud.consultas[0][2] == SINCRONIZADO_EM
+    assert lotes == [['00000090220238190001']] # Só o caso nunca sincronizado vai pela sincronização normal
+    assert sorted(m.descricao for m in MovimentacaoCNJ.query) == ['Distribuição', 'Distribuição', 'Distribuição', 'Outro grau', 'Sentença']
+    assert db.session.get(MarcaSincronizacaoCNJ, ALIAS).data_hora_ultima_atualizacao == atualizado_em
+    for caso_id in casos_sincronizados:
+        assert db.session.get(Caso, caso_id).proxima_verificacao_cnj > datetime.utcnow()
+
+    # Na próxima passada nada mudou: uma consulta a partir da marca e nenhum caso vencido
+    datajud.consultas.clear()
+    assert tasks.sincronizar_incremental_cnj() == 0
+    assert [(consulta[2], consulta[3]) for consulta in datajud.consultas] == [(atualizado_em, None)]
+
+
+def test_falha_na_consulta_incremental_nao_avanca_marca(app, db, casos_sincronizados, monkeypatch):
+    """Testa que um tribunal com a consulta falhando não tem a marca gravada nem os casos registrados como verificados."""
+    datajud = DataJudIncremental([], status=503)
+    monkeypatch.setattr(tasks, 'consultar_atualizacoes_por_alias', datajud)
+    assert tasks.sincronizar_incremental_cnj() == 0
+    assert len(datajud.consultas) == 1
+    assert db.session.get(MarcaSincronizacaoCNJ, ALIAS) is None
+    assert db.session.get(Caso, casos_sincronizados[0]).proxima_verificacao_cnj == SINCRONIZADO_EM
+
+    resultado = app.test_cli_runner().invoke(args=['cnj-sync', '--incremental', '--shard', '0/2'])
+    assert resultado.exit_code != 0
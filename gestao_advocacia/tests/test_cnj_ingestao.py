@@ -0,0 +1,138 @@
+# Arquivo: tests/test_cnj_ingestao.py
+# Testes para o módulo de ingestão das movimentações do DataJud (cnj_ingestao.py).
+
+from datetime import datetime
+import cnj_ingestao
+from tests.conftest import resposta_cnj, criar_caso
+
+
+def movimento(dia, codigo, descricao='Movimento'):
+    """Monta um movimento no formato do DataJud para o dia informado de janeiro/2024."""
+    return {"dataHora": f"2024-01-{dia:02d}T10:00:00Z", "codigo": codigo, "movimentoNacional": {"descricao": descricao}}
+
+
+def test_montar_descricao_movimento():
+    """Testa a montagem da descrição a partir do movimento nacional, local e complementos."""
+    assert cnj_ingestao.montar_descricao_movimento({
+        "movimentoNacional": {"descricao": "Juntada"}, "movimentoLocal": {"descricao": "ignorado"},
+        "complementos": [{"descricao": "Petição"}, {"valor": 1}],
+    }) == "Juntada | Petição"
+    assert cnj_ingestao.montar_descricao_movimento({"movimentoLocal": {"descricao": "Local"}}) == "Local"
+    assert cnj_ingestao.montar_descricao_movimento({"codigoNacional": {"codigo": 51}}) == "Movimento Cód: 51"
+
+
+def test_analisar_movimentos_para_no_limite_em_lista_crescente():
+    """Testa que a análise começa pelo fim de uma lista crescente e para antes dos movimentos antigos."""
+    movimentos = [movimento(dia, dia) for dia in range(1, 11)]
+    candidatos, ignorados = cnj_ingestao.analisar_movimentos(1, movimentos, datetime(2024, 1, 8, 10, 0))
+    # Mesma data do limite ainda é candidata (o diff por hash decide)
+    assert [c[2]["codigo"] for c in candidatos] == [10, 9, 8]
+    assert ignorados == 0
+
+
+def test_analisar_movimentos_lista_decrescente_e_fora_de_ordem():
+    """Testa o limite em lista decrescente e a varredura completa quando a lista está fora de ordem."""
+    decrescente = [movimento(dia, dia) for dia in range(10, 0, -1)]
+    candidatos, _ = cnj_ingestao.analisar_movimentos(1, decrescente, datetime(2024, 1, 9, 10, 0))
+    assert [c[2]["codigo"] for c in candidatos] == [10, 9]
+
+    fora_de_ordem = [movimento(3, 3), movimento(9, 9), movimento(1, 1), movimento(10, 10)]
+    candidatos, _ = cnj_ingestao.analisar_movimentos(1, fora_de_ordem, datetime(2024, 1, 5, 10, 0))
+    assert sorted(c[2]["codigo"] for c in candidatos) == [9, 10]
+
+
+def test_analisar_movimentos_ignora_data_invalida_e_repetidos():
+    """Testa que movimentos com dataHora inválida são contados e repetidos no payload viram um único candidato."""
+    movimentos = [movimento(1, 1), {"dataHora": "ontem", "codigo": 2}, {"codigo": 3}, movimento(1, 1)]
+    candidatos, ignorados = cnj_ingestao.analisar_movimentos(1, movimentos)
+    assert len(candidatos) == 1
+    assert ignorados == 1
+
+
+def test_ingerir_resposta_cnj_registra_somente_novas(db):
+    """Testa que uma nova ingestão do mesmo payload acrescido só grava as movimentações novas."""
+    caso = criar_caso(db, '0000007-08.2023.8.19.0001')
+    movimentos = [movimento(1, 1, 'Distribuição'), movimento(2, 2, 'Conclusão')]
+
+    resultado = cnj_ingestao.ingerir_resposta_cnj(caso, resposta_cnj(movimentos))
+    db.session.commit()
+    assert resultado['processo_encontrado'] is True
+    assert resultado['novas_movimentacoes'] == 2
+    assert caso.status == 'Conclusão'
+
+    movimentos.append(movimento(3, 3, 'Sentença'))
+    resultado = cnj_ingestao.ingerir_resposta_cnj(caso, resposta_cnj(movimentos))
+    db.session.commit()
+    assert resultado['novas_movimentacoes'] == 1
+    assert resultado['descricao_ultima_movimentacao_nova'] == 'Sentença'
+    assert caso.movimentacoes_cnj.count() == 3
+
+
+def test_grau_novo_com_movimentos_anteriores_ao_ultimo_registrado(db):
+    """Testa que os movimentos de um segundo documento (grau) anteriores ao último já registrado são gravados."""
+    caso = criar_caso(db, '0000009-10.2023.8.19.0001')
+    primeiro_grau = {"grau": "G1", "dataHoraUltimaAtualizacao": "2024-01-20T00:00:00.000Z",
+                     "movimentos": [movimento(10, 10, 'Distribuição'), movimento(20, 20, 'Sentença')]}
+    cnj_ingestao.ingerir_resposta_cnj(caso, {"hits": {"hits": [{"_source": primeiro_grau}]}})
+    db.session.commit()
+
+    segundo_grau = {"grau": "G2", "dataHoraUltimaAtualizacao": "2024-01-25T00:00:00.000Z",
+                    "movimentos": [movimento(5, 5, 'Recurso'), movimento(25, 25, 'Acórdão')]}
+    resultado = cnj_ingestao.ingerir_resposta_cnj(caso, {"hits": {"hits": [{"_source": segundo_grau}, {"_source": primeiro_grau}]}})
+    db.session.commit()
+    assert resultado['movimentos_recebidos'] == 4
+    assert resultado['novas_movimentacoes'] == 2
+    assert sorted(m.descricao for m in caso.movimentacoes_cnj) == ['Acórdão', 'Distribuição', 'Recurso', 'Sentença']
+    assert caso.status == 'Acórdão'
+
+
+def test_documentos_mesclados_independem_da_ordem_dos_hits(db):
+    """Testa que a mesclagem dos graus (e o hash do payload) não depende da ordem em que os hits chegam."""
+    caso = criar_caso(db, '0000010-11.2023.8.19.0001')
+    primeiro_grau = {"grau": "G1", "dataHoraUltimaAtualizacao": "2024-01-20T00:00:00.000Z", "movimentos": [movimento(10, 10)]}
+    segundo_grau = {"grau": "G2", "dataHoraUltimaAtualizacao": "2024-01-25T00:00:00.000Z", "movimentos": [movimento(25, 25)]}
+    mesclado = cnj_ingestao.mesclar_documentos_processo([segundo_grau, primeiro_grau])
+    assert mesclado == cnj_ingestao.mesclar_documentos_processo([primeiro_grau, segundo_grau])
+    assert mesclado['grau'] == 'G2' and [m['codigo'] for m in mesclado['movimentos']] == [10, 25]
+
+    cnj_ingestao.ingerir_resposta_cnj(caso, {"hits": {"hits": [{"_source": segundo_grau}, {"_source": primeiro_grau}]}})
+    db.session.commit()
+    resultado = cnj_ingestao.ingerir_resposta_cnj(caso, {"hits": {"hits": [{"_source": primeiro_grau}, {"_source": segundo_grau}]}})
+    assert resultado['payload_inalterado'] and resultado['novas_movimentacoes'] == 0
+    assert caso.movimentacoes_cnj.count() == 2
+
+
+def test_ingerir_resposta_cnj_sem_hits(db):
+    """Testa a ingestão de uma resposta sem hits."""
+    caso = criar_caso(db, '0000008-09.2023.8.19.0001')
+    resultado = cnj_ingestao.ingerir_resposta_cnj(caso, {"hits": {"hits": []}})
+    assert resultado['processo_encontrado'] is False
+    assert resultado['novas_movimentacoes'] == 0
+
+
+def test_inserir_movimentacoes_em_lote_nao_altera_linhas(db):
+    """Testa que a inserção em lote grava o JSON bruto em payload_cnj sem alterar os dicts recebidos."""
+    caso = criar_caso(db, '0000009-10.2023.8.19.0001')
+    cnj_ingestao.ingerir_resposta_cnj(caso, resposta_cnj([movimento(1, 1)]))
+    linhas = [{'processo_cnj_id': caso.processo_cnj_id, 'data_movimentacao': datetime(2024, 1, 2, 10, 0), 'descricao': 'Juntada',
+               'dados_integra_cnj': movimento(2, 2, 'Juntada'), 'hash_movimentacao': 'hash-lote'}]
+    copia = [dict(linha) for linha in linhas]
+
+    assert cnj_ingestao.inserir_movimentacoes_em_lote(linhas) == 1
+    db.session.commit()
+    assert linhas == copia
+    movimentacao = caso.movimentacoes_cnj.filter_by(hash_movimentacao='hash-lote').one()
+    assert movimentacao.payload_cnj_id is not None and movimentacao.data_registro_sistema is not None
+
+
+def test_inserir_movimentacoes_em_lote_conta_so_as_inseridas(db):
+    """Testa que, com ignorar_duplicatas, as linhas descartadas pelo ON CONFLICT não entram na contagem."""
+    caso = criar_caso(db, '0000010-11.2023.8.19.0001')
+    cnj_ingestao.ingerir_resposta_cnj(caso, resposta_cnj([movimento(1, 1)]))
+    linha = {'processo_cnj_id': caso.processo_cnj_id, 'data_movimentacao': datetime(2024, 1, 3, 10, 0), 'descricao': 'Juntada',
+             'hash_movimentacao': 'hash-repetido'}
+
+    assert cnj_ingestao.inserir_movimentacoes_em_lote([linha, dict(linha, hash_movimentacao='hash-novo')], ignorar_duplicatas=True) == 2
+    assert cnj_ingestao.inserir_movimentacoes_em_lote([linha, dict(linha, hash_movimentacao='hash-outro')], ignorar_duplicatas=True) == 1
+    db.session.commit()
+    assert caso.movimentacoes_cnj.count() == 4
@@ -0,0 +1,140 @@
+# Arquivo: tests/test_cnj_metricas.py
+# Testes para as métricas da sincronização com o DataJud (cnj_metricas.py) e os endpoints /api/admin/cnj-sync.
+
+from datetime import datetime, timedelta
+import pytest
+import cnj_metricas
+import tasks
+from sqlalchemy.exc import IntegrityError
+from app import Caso, ExecucaoSincronizacaoCNJ
+from tests.conftest import criar_caso, cabecalho_autenticado
+
+NUMERO = '0000001-02.2023.8.19.0001'
+DIGITOS = '00000010220238190001'
+MOVIMENTOS = [
+    {"dataHora": "2024-03-01T10:00:00.000Z", "movimentoNacional": {"descricao": "Distribuição"}},
+    {"dataHora": "2024-03-05T10:00:00.000Z", "movimentoNacional": {"descricao": "Sentença"}},
+]
+
+
+@pytest.fixture()
+def configuracao_admin(app, db, monkeypatch):
+    """Caso de um usuário administrador (CNJ_ADMIN_USER_IDS) e token de métricas configurado."""
+    caso = criar_caso(db, NUMERO, 'metricas')
+    monkeypatch.setitem(app.config, 'CNJ_ADMIN_USER_IDS', [caso.user_id])
+    monkeypatch.setitem(app.config, 'CNJ_METRICAS_TOKEN', 'segredo-metricas')
+    return caso
+
+
+def test_execucao_do_job_registra_metricas(app, db, job_habilitado, stub_datajud):
+    """Testa a linha de 'cnj_sync_run' do job e da CLI: casos, movimentações, consultas por status e latência."""
+    caso = criar_caso(db, NUMERO, 'execucao')
+    stub_datajud.resposta = {"hits": {"hits": [{"_source": {"numeroProcesso": DIGITOS, "movimentos": MOVIMENTOS}}]}}
+
+    assert tasks.job_verificar_processos_cnj() == 1
+    execucao = ExecucaoSincronizacaoCNJ.query.one()
+    assert (execucao.origem, execucao.casos_verificados, execucao.novas_movimentacoes) == ('job', 1, 2)
+    assert (execucao.consultas_http, execucao.erros_http, execucao.erro) == (1, 0, None)
+    tribunal = execucao.tribunais['api_publica_tjrj']
+    assert tribunal['consultas_por_status'] == {'200': 1}
+    assert sum(tribunal['latencia']['faixas']) == 1 and tribunal['latencia']['soma_segundos'] > 0
+
+    # Com o DataJud falhando, a passada da CLI registra o erro por status
+    db.session.get(Caso, caso.id).proxima_verificacao_cnj = datetime.utcnow() - timedelta(minutes=1)
+    db.session.commit()
+    stub_datajud.status = 500
+    resultado = app.test_cli_runner().invoke(args=['cnj-sync'])
+    assert resultado.exit_code == 0, resultado.output
+    execucao = ExecucaoSincronizacaoCNJ.query.filter_by(origem='cli').one()
+    assert execucao.erros_http == execucao.consultas_http >= 1
+    assert execucao.novas_movimentacoes == 0
+    assert set(execucao.tribunais['api_publica_tjrj']['consultas_por_status']) <= {'500', 'circuito_aberto'}
+
+
+def test_falha_no_bloco_descarta_a_sessao_antes_de_gravar(app, db):
+    """Testa que a execução com erro é gravada mesmo com a sessão inválida, sem levar junto o que o bloco deixou pendente."""
+    caso = criar_caso(db, NUMERO, 'rollback')
+    with pytest.raises(IntegrityError):
+        with cnj_metricas.registrar_execucao('job'):
+            cnj_metricas.registrar_casos('api_publica_tjrj', verificados=1)
+            db.session.add(Caso(nome_caso='Pendente', cliente_id=caso.cliente_id, user_id=caso.user_id))
+            db.session.add(Caso(nome_caso='Inválido', cliente_id=None, user_id=caso.user_id))
+            db.session.flush()
+
+    execucao = ExecucaoSincronizacaoCNJ.query.one()
+    assert execucao.erro.startswith('IntegrityError') and execucao.casos_verificados == 1
+    assert Caso.query.filter_by(nome_caso='Pendente').count() == 0
+
+
+def test_formato_prometheus_e_atraso(app, db):
+    """Testa a soma das execuções na janela, o histograma cumulativo, o escape de rótulos e o atraso das verificações."""
+    with cnj_metricas.registrar_execucao('job'):
+        cnj_metricas.registrar_consulta('api_publica_tjrj', 200, 0.3)
+        cnj_metricas.registrar_consulta('api_publica_tjrj', 503, 12)
+        cnj_metricas.registrar_casos('api_publica_tjrj', verificados=3, novas_movimentacoes=5, adiados=2)
+    with cnj_metricas.registrar_execucao('cli'):
+        cnj_metricas.registrar_consulta('api_publica_tjrj', 'circuito_aberto')
+        cnj_metricas.registrar_consulta('tribunal "x"', 'timeout', 40)
+        cnj_metricas.registrar_casos('api_publica_tjrj', verificados=1)
+    # Execução fora da janela não entra na soma
+    with cnj_metricas.registrar_execucao('job'):
+        cnj_metricas.registrar_casos('api_publica_tjrj', verificados=100)
+    antiga = ExecucaoSincronizacaoCNJ.query.filter_by(casos_verificados=100).one()
+    antiga.concluido_em = datetime.utcnow() - timedelta(days=2)
+    db.session.commit()
+
+    janela = cnj_metricas.agregar_execucoes(86400)
+    tribunal = janela['tribunais']['api_publica_tjrj']
+    assert janela['execucoes'] == 2
+    assert (tribunal['consultas'], tribunal['erros'], tribunal['casos_verificados']) == (3, 2, 4)
+    assert tribunal['consultas_por_status'] == {'200': 1, '503': 1, 'circuito_aberto': 1}
+
+    caso = criar_caso(db, NUMERO, 'atraso')
+    agora = datetime.utcnow()
+    caso.data_criacao = agora - timedelta(hours=2)
+    db.session.commit()
+    atraso = cnj_metricas.calcular_atraso_verificacoes(agora)
+    assert atraso['casos_pendentes'] == atraso['casos_nunca_verificados'] == 1
+    assert atraso['atraso_maximo_segundos'] == pytest.approx(7200)
+
+    linhas = cnj_metricas.formatar_prometheus(janela, atraso).splitlines()
+    assert not any(linha.startswith('# TYPE') and not linha.endswith(' gauge') for linha in linhas)
+    assert 'cnj_sync_execucoes_janela 2' in linhas
+    assert 'cnj_datajud_consultas_janela{tribunal="api_publica_tjrj",status="circuito_aberto"} 1' in linhas
+    assert 'cnj_datajud_latencia_janela_segundos_bucket{tribunal="api_publica_tjrj",le="0.25"} 0' in linhas
+    assert 'cnj_datajud_latencia_janela_segundos_bucket{tribunal="api_publica_tjrj",le="0.5"} 1' in linhas
+    assert 'cnj_datajud_latencia_janela_segundos_bucket{tribunal="api_publica_tjrj",le="+Inf"} 2' in linhas
+    assert 'cnj_datajud_latencia_janela_segundos_count{tribunal="api_publica_tjrj"} 2' in linhas
+    assert 'cnj_datajud_latencia_janela_segundos_sum{tribunal="tribunal \\"x\\""} 40.0' in linhas
+    assert 'cnj_movimentacoes_novas_janela{tribunal="api_publica_tjrj"} 5' in linhas
+    assert 'cnj_casos_verificados_janela{tribunal="api_publica_tjrj"} 4' in linhas
+    assert 'cnj_casos_pendentes 1' in linhas
+    assert not any(linha.startswith('cnj_sync_ultima_execucao') for linha in linhas)
+
+
+def test_endpoints_admin_de_sincronizacao(app, client, db, configuracao_admin, monkeypatch):
+    """Testa o acesso a /api/admin/cnj-sync/stats (só administradores) e /metrics (token Bearer)."""
+    with cnj_metricas.registrar_execucao('cli'):
+        cnj_metricas.registrar_casos('api_publica_tjrj', verificados=4, novas_movimentacoes=1)
+    outro = criar_caso(db, '0000002-02.2023.8.19.0001', 'nao-admin')
+
+    resposta = client.get('/api/admin/cnj-sync/stats', headers=cabecalho_autenticado(app, outro.user_id))
+    assert resposta.status_code == 403
+    resposta = client.get('/api/admin/cnj-sync/stats?limit=5', headers=cabecalho_autenticado(app, configuracao_admin.user_id))
+    assert resposta.status_code == 200
+    dados = resposta.get_json()
+    assert [(execucao['origem'], execucao['casos_verificados']) for execucao in dados['execucoes']] == [('cli', 4)]
+    assert dados['atraso']['casos_pendentes'] == 2
+    assert dados['janela']['tribunais']['api_publica_tjrj']['casos_verificados'] == 4
+
+    assert client.get('/api/admin/cnj-sync/metrics').status_code == 401
+    assert client.get('/api/admin/cnj-sync/metrics', headers={'Authorization': 'Bearer outro'}).status_code == 401
+    resposta = client.get('/api/admin/cnj-sync/metrics', headers={'Authorization': 'Bearer segredo-metricas'})
+    assert resposta.status_code == 200 and resposta.mimetype == 'text/plain'
+    texto = resposta.get_data(as_text=True)
+    assert 'cnj_casos_pendentes 2' in texto
+    assert 'cnj_casos_verificados_janela{tribunal="api_publica_tjrj"} 4' in texto
+    assert 'cnj_sync_ultima_execucao_duracao_segundos{origem="cli"}' in texto
+
+    monkeypatch.setitem(app.config, 'CNJ_METRICAS_TOKEN', None)
+    assert client.get('/api/admin/cnj-sync/metrics', headers={'Authorization': 'Bearer segredo-metricas'}).status_code == 404
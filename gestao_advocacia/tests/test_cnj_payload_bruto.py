@@ -0,0 +1,33 @@
+# Arquivo: tests/test_cnj_payload_bruto.py
+# Testes para o armazenamento comprimido dos JSON brutos do DataJud (cnj_payload_bruto.py).
+
+import cnj_ingestao
+import cnj_payload_bruto
+from app import MovimentacaoCNJ, PayloadCNJ
+from tests.conftest import resposta_cnj, criar_caso
+
+
+def test_comprimir_e_descomprimir_payload():
+    """Testa que o payload comprimido volta ao JSON original e que o hash independe da ordem das chaves."""
+    dados = {"dataHora": "2024-01-02T10:00:00.000Z", "codigo": 26, "nome": "Distribuição",
+             "orgaoJulgador": {"codigoOrgao": 1234, "nome": "1ª VARA CÍVEL"}}
+    payload = cnj_payload_bruto.comprimir_payload(dados)
+    assert payload['formato'] == cnj_payload_bruto.FORMATO_ATUAL
+    assert len(payload['conteudo']) < payload['tamanho_original']
+    assert cnj_payload_bruto.descomprimir_payload(payload['conteudo'], payload['formato']) == dados
+    assert cnj_payload_bruto.comprimir_payload(dict(reversed(list(dados.items()))))['hash'] == payload['hash']
+
+
+def test_payload_identico_gravado_uma_vez_para_processos_diferentes(db):
+    """Testa que o mesmo movimento ingerido por dois processos grava um único payload, lido por dados_integra_cnj."""
+    movimento = {"dataHora": "2024-01-03T10:00:00Z", "codigo": 51, "movimentoNacional": {"descricao": "Conclusão"}}
+    casos = [criar_caso(db, '0000030-31.2023.8.19.0001', 'payload-a'), criar_caso(db, '0000031-32.2023.8.19.0001', 'payload-b')]
+    for caso in casos:
+        cnj_ingestao.ingerir_resposta_cnj(caso, resposta_cnj([movimento]))
+    db.session.commit()
+
+    movimentacoes = MovimentacaoCNJ.query.filter(MovimentacaoCNJ.processo_cnj_id.in_([c.processo_cnj_id for c in casos])).all()
+    assert len(movimentacoes) == 2
+    assert movimentacoes[0].payload_cnj_id == movimentacoes[1].payload_cnj_id
+    assert PayloadCNJ.query.filter_by(id=movimentacoes[0].payload_cnj_id).count() == 1
+    assert movimentacoes[1].dados_integra_cnj == movimento
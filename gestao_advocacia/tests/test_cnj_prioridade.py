@@ -0,0 +1,99 @@
+# Arquivo: tests/test_cnj_prioridade.py
+# Testes para a agenda adaptativa das verificações no CNJ (cnj_prioridade.py).
+
+from datetime import datetime, timedelta
+import pytest
+import tasks
+import cnj_prioridade
+from app import EventoAgenda
+from tests.conftest import criar_caso
+
+
+def test_taxa_converge_para_o_ritmo_do_processo():
+    """Testa que a média móvel da taxa converge para um ritmo constante de movimentações."""
+    taxa = 0.0
+    for _ in range(200):
+        taxa = cnj_prioridade.atualizar_taxa_movimentacoes(taxa, 2, 7) # 2 movimentações por semana
+    assert taxa == pytest.approx(2 / 7, rel=1e-3)
+    assert cnj_prioridade.atualizar_taxa_movimentacoes(taxa, 0, 90) < taxa / 4
+
+
+def test_prioridade_por_status_atividade_e_agenda():
+    """Testa o peso do status (inclusive a descrição da movimentação), da atividade e da agenda."""
+    base = cnj_prioridade.calcular_prioridade(0, 'Ativo', None)
+    assert base == 1.0
+    assert cnj_prioridade.calcular_prioridade(0, 'Arquivado Definitivamente', None) < base
+    assert cnj_prioridade.calcular_prioridade(0, 'Trânsito em Julgado', None) < base
+    assert cnj_prioridade.calcular_prioridade(0, 'Suspenso', None) < base
+    assert cnj_prioridade.calcular_prioridade(0.5, 'Ativo', None) > base
+    assert cnj_prioridade.calcular_prioridade(0, 'Ativo', 3) > cnj_prioridade.calcular_prioridade(0, 'Ativo', 20) > base
+
+
+def test_intervalo_respeita_limites(app):
+    """Testa que o intervalo até a próxima verificação fica entre o mínimo e o máximo configurados."""
+    with app.app_context():
+        assert cnj_prioridade.calcular_intervalo_verificacao(1.0) == timedelta(days=1)
+        assert cnj_prioridade.calcular_intervalo_verificacao(1000) == timedelta(hours=6)
+        assert cnj_prioridade.calcular_intervalo_verificacao(0.0001) == timedelta(days=30)
+
+
+def test_job_so_verifica_casos_com_verificacao_vencida(db, job_habilitado, monkeypatch):
+    """Testa que o job segue proxima_verificacao_cnj e agenda casos arquivados para bem depois."""
+    caso_ativo = criar_caso(db, '0000001-02.2023.8.19.0001', 'at')
+    caso_arquivado = criar_caso(db, '0000002-03.2023.8.19.0001', 'ar')
+    caso_arquivado.status = 'Arquivado'
+    db.session.commit()
+    consultados = []
+
+    def consultar_lote_falso(alias_tribunal, numeros_processo):
+        consultados.extend(numeros_processo)
+        return {numero: ({"hits": {"hits": [{"_source": {"numeroProcesso": numero, "movimentos": []}}]}}, 200) for numero in numeros_processo}
+
+    monkeypatch.setattr(tasks, 'consultar_lote_por_alias', consultar_lote_falso)
+    assert tasks.job_verificar_processos_cnj() == 2
+    db.session.refresh(caso_ativo)
+    db.session.refresh(caso_arquivado)
+    assert caso_ativo.proxima_verificacao_cnj - caso_ativo.data_ultima_verificacao_cnj == timedelta(days=1)
+    assert caso_arquivado.proxima_verificacao_cnj - caso_arquivado.data_ultima_verificacao_cnj == timedelta(days=20)
+
+    # Ninguém vencido: nada a consultar
+    assert tasks.job_verificar_processos_cnj() == 0
+
+    caso_ativo.proxima_verificacao_cnj = datetime.utcnow() - timedelta(minutes=1)
+    db.session.commit()
+    consultados.clear()
+    assert tasks.job_verificar_processos_cnj() == 1
+    assert consultados == [caso_ativo.numero_processo_digits]
+
+
+def test_evento_proximo_antecipa_verificacao(client, db):
+    """Testa que um evento da agenda vinculado ao caso antecipa a próxima verificação no CNJ."""
+    caso = criar_caso(db, '0000003-04.2023.8.19.0001', 'ev')
+    caso.data_ultima_verificacao_cnj = datetime.utcnow()
+    cnj_prioridade.reagendar_verificacao_cnj(caso)
+    db.session.commit()
+    proxima_sem_evento = caso.proxima_verificacao_cnj
+
+    db.session.add(EventoAgenda(titulo='Audiência', data_inicio=datetime.utcnow() + timedelta(days=2), user_id=caso.user_id, caso_id=caso.id))
+    db.session.flush()
+    cnj_prioridade.reagendar_verificacao_cnj(caso)
+    db.session.commit()
+
+    assert caso.prioridade_cnj == 4.0
+    assert caso.proxima_verificacao_cnj == caso.data_ultima_verificacao_cnj + timedelta(hours=6)
+    assert caso.proxima_verificacao_cnj < proxima_sem_evento
+
+
+def test_trocar_numero_do_processo_zera_agenda(db):
+    """Testa que editar o número do processo faz o caso ser verificado o quanto antes."""
+    caso = criar_caso(db, '0000005-06.2023.8.19.0001', 'nu')
+    caso.data_ultima_verificacao_cnj = datetime.utcnow()
+    caso.taxa_movimentacoes_cnj = 0.3
+    cnj_prioridade.reagendar_verificacao_cnj(caso)
+    db.session.commit()
+
+    caso.numero_processo = '0000005-06.2023.8.19.0001' # mesmo número: mantém a agenda
+    assert caso.proxima_verificacao_cnj is not None
+    caso.numero_processo = '0000006-07.2023.8.19.0001'
+    assert caso.proxima_verificacao_cnj is None and caso.taxa_movimentacoes_cnj is None
+    db.session.commit()
@@ -0,0 +1,175 @@
+# Arquivo: tests/test_cnj_service.py
+# Testes para o serviço de comunicação com a API do DataJud (cnj_service.py).
+
+import pytest
+import cnj_service
+
+
+def test_consultar_processo_reutiliza_conexao(app, stub_datajud):
+    """Testa que consultas seguidas ao mesmo tribunal reaproveitam a mesma conexão TCP."""
+    for _ in range(3):
+        dados, status = cnj_service.consultar_processo_cnj('0000001-02.2023.8.19.0001')
+        assert status == 200
+        assert dados == {"hits": {"hits": []}}
+    assert len(stub_datajud.requisicoes) == 3
+    assert stub_datajud.requisicoes[0]['path'] == '/api_publica_tjrj/_search'
+    assert stub_datajud.requisicoes[0]['consulta']['query']['match']['numeroProcesso'] == '00000010220238190001'
+    assert len({r['cliente'] for r in stub_datajud.requisicoes}) == 1
+
+
+def test_sessao_http_por_alias(app, stub_datajud):
+    """Testa que cada alias de tribunal tem sua própria sessão (e pool) reutilizada entre chamadas."""
+    sessao_rj = cnj_service.obter_sessao_http('api_publica_tjrj')
+    assert cnj_service.obter_sessao_http('api_publica_tjrj') is sessao_rj
+    assert cnj_service.obter_sessao_http('api_publica_tjmg') is not sessao_rj
+
+
+def test_consultar_processo_usa_timeouts_configurados(app, stub_datajud, monkeypatch):
+    """Testa que os timeouts de conexão e leitura vêm da configuração, e não mais do valor fixo de 30 s."""
+    app.config.update(CNJ_HTTP_CONNECT_TIMEOUT=2, CNJ_HTTP_READ_TIMEOUT=7)
+    sessao = cnj_service.obter_sessao_http('api_publica_tjrj')
+    chamadas = []
+    post_original = sessao.post
+
+    def post_espiao(*args, **kwargs):
+        chamadas.append(kwargs.get('timeout'))
+        return post_original(*args, **kwargs)
+
+    monkeypatch.setattr(sessao, 'post', post_espiao)
+    cnj_service.consultar_processo_cnj('0000001-02.2023.8.19.0001')
+    assert chamadas == [(2.0, 7.0)]
+
+
+def test_consultar_processo_erro_http(app, stub_datajud):
+    """Testa que um erro HTTP do DataJud é convertido em (dict com 'erro', status)."""
+    stub_datajud.status = 503
+    dados, status = cnj_service.consultar_processo_cnj('0000001-02.2023.8.19.0001')
+    assert status == 503
+    assert 'erro' in dados
+
+
+def test_consultar_processos_lote_um_search_por_tribunal(app, stub_datajud):
+    """Testa que o lote emite um _search 'terms' por tribunal e separa os hits de cada processo."""
+    stub_datajud.resposta = {"hits": {"hits": [
+        {"_source": {"numeroProcesso": "00000010220238190001", "grau": "G1"}},
+        {"_source": {"numeroProcesso": "00000020320238190001", "grau": "G1"}},
+        {"_source": {"numeroProcesso": "00000010220238190001", "grau": "G2"}},
+    ]}}
+    numeros = ['0000001-02.2023.8.19.0001', '0000002-03.2023.8.19.0001', '0000003-04.2023.8.19.0001']
+    resultados = cnj_service.consultar_processos_cnj_lote(numeros, tamanho_lote=10)
+
+    assert len(stub_datajud.requisicoes) == 1
+    consulta = stub_datajud.requisicoes[0]['consulta']
+    assert sorted(consulta['query']['terms']['numeroProcesso']) == ['00000010220238190001', '00000020320238190001', '00000030420238190001']
+    assert consulta['sort'][0] == {"numeroProcesso": {"order": "asc"}}
+    dados_1, status_1 = resultados['0000001-02.2023.8.19.0001']
+    assert status_1 == 200
+    assert [h['_source']['grau'] for h in dados_1['hits']['hits']] == ['G1', 'G2']
+    assert len(resultados['0000002-03.2023.8.19.0001'][0]['hits']['hits']) == 1
+    assert resultados['0000003-04.2023.8.19.0001'][0]['hits']['hits'] == []
+
+
+def test_consultar_processos_lote_respeita_tamanho_do_lote(app, stub_datajud):
+    """Testa que grupos maiores que o tamanho do lote são divididos em várias consultas."""
+    numeros = [f'000000{i}-02.2023.8.19.0001' for i in range(5)]
+    resultados = cnj_service.consultar_processos_cnj_lote(numeros, tamanho_lote=2)
+    assert len(stub_datajud.requisicoes) == 3
+    assert set(resultados) == set(numeros)
+
+
+def test_consultar_processos_lote_propaga_erro_http(app, stub_datajud):
+    """Testa que uma falha HTTP no lote é repassada a cada processo do lote."""
+    stub_datajud.status = 429
+    resultados = cnj_service.consultar_processos_cnj_lote(['0000001-02.2023.8.19.0001', '0000002-03.2023.8.19.0001'])
+    assert {status for _, status in resultados.values()} == {429}
+
+
+def test_hash_movimentacao_deterministico():
+    """Testa que o hash da movimentação depende de caso, dataHora, código e complementos, e não da formatação."""
+    movimento = {"dataHora": "2024-01-10T10:00:00Z", "codigo": 11, "complementosTabelados": [{"codigo": 1, "valor": 2}]}
+    mesmo_movimento = {"codigo": 11, "complementosTabelados": [{"valor": 2, "codigo": 1}], "dataHora": "2024-01-10T10:00:00+00:00"}
+    base = cnj_service.calcular_hash_movimentacao(1, movimento)
+    assert len(base) == 64
+    assert cnj_service.calcular_hash_movimentacao(1, mesmo_movimento) == base
+    assert cnj_service.calcular_hash_movimentacao(2, movimento) != base
+    assert cnj_service.calcular_hash_movimentacao(1, {**movimento, "codigo": 12}) != base
+    assert cnj_service.calcular_hash_movimentacao(1, {**movimento, "complementosTabelados": []}) != base
+
+
+def test_hash_payload_muda_com_o_conteudo():
+    """Testa que a impressão digital do _source muda com novos movimentos ou com os dados do processo."""
+    source = {"numeroProcesso": "1", "grau": "G1", "movimentos": [{"dataHora": "2024-01-10T10:00:00Z", "codigo": 11}]}
+    base = cnj_service.calcular_hash_payload(source)
+    assert cnj_service.calcular_hash_payload(dict(reversed(list(source.items())))) == base
+    assert cnj_service.calcular_hash_payload({**source, "grau": "G2"}) != base
+    com_movimento_novo = {**source, "movimentos": source["movimentos"] + [{"dataHora": "2024-01-11T10:00:00Z", "codigo": 12}]}
+    assert cnj_service.calcular_hash_payload(com_movimento_novo) != base
+
+
+def test_decompor_numero_processo_em_qualquer_formatacao():
+    """Testa a extração de dígitos, segmento J, TR e alias independentemente da formatação."""
+    esperado = ('00000011220238190001', '8', '19', 'api_publica_tjrj')
+    assert cnj_service.decompor_numero_processo('0000001-12.2023.8.19.0001') == esperado
+    assert cnj_service.decompor_numero_processo(' 00000011220238190001 ') == esperado
+    assert cnj_service.decompor_numero_processo('123') == ('123', None, None, None)
+    assert cnj_service.decompor_numero_processo(None) == (None, None, None, None)
+
+
+def test_registro_tribunais_cobre_todos_os_segmentos():
+    """Testa o alias obtido pelo par (J, TR) em tribunais superiores, federais, do trabalho, eleitorais e estaduais."""
+    assert cnj_service.obter_alias_tribunal_por_numero('0000001-12.2023.3.00.0000') == 'api_publica_stj'
+    assert cnj_service.obter_alias_tribunal_por_numero('0000001-12.2023.4.03.6100') == 'api_publica_trf3'
+    assert cnj_service.obter_alias_tribunal_por_numero('0000001-12.2023.5.02.0001') == 'api_publica_trt2'
+    assert cnj_service.obter_alias_tribunal_por_numero('0000001-12.2023.6.26.0001') == 'api_publica_tre-sp'
+    assert cnj_service.obter_alias_tribunal_por_numero('0000001-12.2023.8.26.0100') == 'api_publica_tjsp'
+    assert cnj_service.obter_alias_tribunal_por_numero('0000001-12.2023.8.25.0001') == 'api_publica_tjse'
+    assert cnj_service.obter_alias_tribunal_por_numero('0000001-12.2023.8.99.0001') is None
+    assert cnj_service.obter_alias_tribunal_por_numero('123') is None
+    assert cnj_service.TRIBUNAIS_CNJ[('8', '26')].sigla == 'TJSP'
+
+
+def test_registro_tribunais_imutavel():
+    """Testa que o registro carregado na importação não pode ser alterado."""
+    with pytest.raises(TypeError):
+        cnj_service.TRIBUNAIS_CNJ[('8', '99')] = None
+    with pytest.raises(TypeError):
+        cnj_service.TRIBUNAL_ALIASES_CNJ['26'] = 'api_publica_outro'
+
+
+def test_digitos_verificadores_modulo_97():
+    """Testa o cálculo do DD e a validação em lote, em qualquer formatação."""
+    dd = cnj_service.calcular_digitos_verificadores('0000001 2023 8 26 0100')
+    valido = f'0000001-{dd}.2023.8.26.0100'
+    dd_errado = f'{(int(dd) + 1) % 100:02d}'
+    invalido = f'0000001-{dd_errado}.2023.8.26.0100'
+    assert cnj_service.validar_digitos_verificadores([valido, valido.replace('-', '').replace('.', ''), invalido, '123', None]) == \
+        [True, True, False, False, False]
+    with pytest.raises(ValueError):
+        cnj_service.calcular_digitos_verificadores('123')
+
+
+def test_circuito_abre_com_429_e_respeita_retry_after(app, stub_datajud):
+    """Testa que um 429 abre o circuito do tribunal na hora, pelo Retry-After, sem afetar os demais."""
+    stub_datajud.status = 429
+    stub_datajud.cabecalhos = {'Retry-After': '120'}
+    _, status = cnj_service.consultar_processo_cnj('0000001-02.2023.8.19.0001')
+    assert status == 429
+
+    stub_datajud.status = 200
+    dados, status = cnj_service.consultar_processo_cnj('0000001-02.2023.8.19.0001')
+    assert status == 503 and dados['circuito_aberto']
+    assert 60 < dados['tentar_novamente_em'] <= 120
+    assert len(stub_datajud.requisicoes) == 1 # A segunda consulta não chegou ao servidor
+
+    _, status = cnj_service.consultar_processo_cnj('0000001-02.2023.8.26.0100')
+    assert status == 200
+
+
+def test_interpretar_retry_after():
+    """Testa o Retry-After em segundos, como data HTTP e inválido."""
+    from datetime import datetime, timezone
+    agora = datetime(2024, 1, 10, 12, 0, 0, tzinfo=timezone.utc)
+    assert cnj_service.interpretar_retry_after('30') == 30
+    assert cnj_service.interpretar_retry_after('Wed, 10 Jan 2024 12:01:30 GMT', agora) == 90
+    assert cnj_service.interpretar_retry_after('amanhã') is None
+    assert cnj_service.interpretar_retry_after(None) is None
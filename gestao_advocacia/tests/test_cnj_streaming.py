@@ -0,0 +1,139 @@
+# Arquivo: tests/test_cnj_streaming.py
+# Testes para a leitura em streaming das respostas do DataJud (cnj_streaming.py) e a ingestão correspondente.
+
+import io
+import json
+import pytest
+import cnj_service
+import cnj_ingestao
+import cnj_jobs
+import tasks
+from app import CacheNegativoCNJ
+from cnj_streaming import RespostaEmStreaming
+from tests.conftest import criar_caso
+
+
+def resposta_em_streaming(dados, tamanho_bloco=7):
+    """RespostaEmStreaming sobre o JSON de 'dados', lido em blocos pequenos para exercitar as fronteiras."""
+    return RespostaEmStreaming(io.BytesIO(json.dumps(dados, ensure_ascii=False).encode('utf-8')), tamanho_bloco)
+
+
+def gerar_movimentos(quantidade, inicio=0):
+    return [{"dataHora": f"2024-01-{1 + (i // 24) % 28:02d}T{i % 24:02d}:00:00.000Z", "codigo": 1000 + i,
+             "movimentoNacional": {"descricao": f"Movimento nº {i}"}, "complementosTabelados": [{"valor": 1.5e3}]}
+            for i in range(inicio, inicio + quantidade)]
+
+
+@pytest.mark.parametrize('tamanho_bloco', [1, 2, 5, 64, 65536])
+def test_leitura_em_streaming_equivale_ao_json_completo(tamanho_bloco):
+    """Testa que os hits lidos em streaming, com qualquer tamanho de bloco, trazem os mesmos dados do json.loads."""
+    dados = {"took": 5, "hits": {"total": {"value": 2}, "hits": [
+        {"_index": "api_publica_tjrj", "_source": {"numeroProcesso": "1", "classe": {"nome": "Execução"},
+                                                    "movimentos": gerar_movimentos(30), "assuntos": [{"codigo": -7}]}},
+        {"_id": "x", "_source": {"numeroProcesso": "2", "movimentos": [], "nivelSigilo": 0}},
+    ]}}
+
+    lidos = []
+    with resposta_em_streaming(dados, tamanho_bloco) as resposta:
+        for source in resposta.sources():
+            numero = source.campo('numeroProcesso')
+            lidos.append((numero, list(source.movimentos()), dict(source.campos)))
+
+    for (numero, movimentos, campos), hit in zip(lidos, dados['hits']['hits']):
+        esperado = dict(hit['_source'])
+        assert movimentos == esperado.pop('movimentos')
+        assert numero == esperado['numeroProcesso'] and campos == esperado
+    assert len(lidos) == 2
+
+
+def test_movimentos_antes_do_numero_e_hash_do_payload():
+    """Testa 'movimentos' antes de numeroProcesso (guardados para o movimentos() seguinte) e a impressão digital do '_source'."""
+    source_esperado = {"movimentos": gerar_movimentos(3), "numeroProcesso": "00000010220238190001", "dataHoraUltimaAtualizacao": "2024-02-01"}
+    with resposta_em_streaming({"hits": {"hits": [{"_source": source_esperado}]}}) as resposta:
+        source = next(resposta.sources())
+        assert source.campo('numeroProcesso') == "00000010220238190001"
+        assert list(source.movimentos()) == source_esperado['movimentos']
+        assert source.quantidade_movimentos == 3
+        assert cnj_service.calcular_hash_payload_resumido(source.campos, source.resumo_movimentos()) == \
+            cnj_service.calcular_hash_payload(source_esperado)
+
+
+def test_json_invalido_gera_value_error():
+    """Testa que um corpo truncado ou malformado é rejeitado com ValueError durante a leitura."""
+    corpo = json.dumps({"hits": {"hits": [{"_source": {"numeroProcesso": "1", "movimentos": gerar_movimentos(5)}}]}})
+    for invalido in (corpo[:len(corpo) // 2], corpo.replace('},', '};', 1)):
+        with pytest.raises(ValueError):
+            with RespostaEmStreaming(io.BytesIO(invalido.encode()), 16) as resposta:
+                for source in resposta.sources():
+                    source.consumir()
+
+
+def test_ingestao_em_streaming_equivale_a_ingestao_completa(db, monkeypatch):
+    """Testa que a ingestão em streaming (em blocos) grava o mesmo que a ingestão da resposta decodificada."""
+    monkeypatch.setattr(cnj_ingestao, 'TAMANHO_BLOCO_STREAMING', 4)
+    caso_completo = criar_caso(db, '0000031-02.2023.8.19.0001', 'c')
+    caso_streaming = criar_caso(db, '0000032-02.2023.8.19.0001', 's')
+    movimentos = gerar_movimentos(10) + [{"dataHora": "data inválida", "codigo": 1}]
+
+    completo = cnj_ingestao.ingerir_resposta_processo(caso_completo.numero_processo_digits, {"hits": {"hits": [{"_source": {"movimentos": movimentos}}]}})
+    streaming = cnj_ingestao.ingerir_resposta_cnj(caso_streaming, resposta_em_streaming({"hits": {"hits": [{"_source": {"movimentos": movimentos}}]}}))
+    db.session.commit()
+
+    for chave in ('novas_movimentacoes', 'descricao_ultima_movimentacao_nova', 'data_ultima_movimentacao_nova', 'movimentos_recebidos', 'movimentos_ignorados'):
+        assert streaming[chave] == completo[chave]
+    assert streaming['novas_movimentacoes'] == 10
+    assert caso_streaming.status == caso_completo.status == 'Movimento nº 9'
+    assert caso_streaming.processo_cnj.hash_payload_cnj == caso_completo.processo_cnj.hash_payload_cnj
+    assert sorted(m.descricao for m in caso_streaming.movimentacoes_cnj) == sorted(m.descricao for m in caso_completo.movimentacoes_cnj)
+
+    # Mesma resposta de novo: nada novo, e a impressão digital confere
+    repetida = cnj_ingestao.ingerir_resposta_cnj(caso_streaming, resposta_em_streaming({"hits": {"hits": [{"_source": {"movimentos": movimentos}}]}}))
+    assert repetida['payload_inalterado'] and repetida['novas_movimentacoes'] == 0
+
+    # Um movimento a mais: só ele é gravado
+    nova = cnj_ingestao.ingerir_resposta_cnj(caso_streaming, resposta_em_streaming({"hits": {"hits": [{"_source": {"movimentos": movimentos + gerar_movimentos(1, 40)}}]}}))
+    db.session.commit()
+    assert not nova['payload_inalterado'] and nova['novas_movimentacoes'] == 1
+    assert caso_streaming.movimentacoes_cnj.count() == 11
+
+
+def test_job_em_streaming_ingere_os_hits_na_ordem_da_resposta(app, db, job_habilitado, monkeypatch):
+    """Testa o job com CNJ_STREAMING_ENABLED: hits fora de ordem, documentos de dois graus mesclados e número sem hit."""
+    caso_a = criar_caso(db, '0000041-02.2023.8.19.0001', 'a')
+    caso_b = criar_caso(db, '0000042-02.2023.8.19.0001', 'b')
+    caso_sem_hit = criar_caso(db, '0000043-02.2023.8.19.0001', 'n')
+    monkeypatch.setitem(app.config, 'CNJ_STREAMING_ENABLED', True)
+
+    def consultar_lote_em_streaming(alias_tribunal, numeros_processo):
+        return resposta_em_streaming({"hits": {"hits": [
+            {"_source": {"numeroProcesso": caso_b.numero_processo_digits, "movimentos": gerar_movimentos(2)}},
+            {"_source": {"numeroProcesso": caso_a.numero_processo_digits, "movimentos": gerar_movimentos(3)}},
+            {"_source": {"numeroProcesso": caso_a.numero_processo_digits, "grau": "G2", "movimentos": gerar_movimentos(9)}},
+        ]}})
+
+    monkeypatch.setattr(tasks, 'consultar_lote_por_alias_em_streaming', consultar_lote_em_streaming)
+    assert tasks.job_verificar_processos_cnj() == 3
+
+    assert caso_a.movimentacoes_cnj.count() == 9 # Os dois graus são mesclados; os movimentos repetidos são deduplicados pelo hash
+    assert caso_b.movimentacoes_cnj.count() == 2
+    db.session.refresh(caso_sem_hit)
+    assert caso_sem_hit.data_ultima_verificacao_cnj is not None
+    assert db.session.get(CacheNegativoCNJ, caso_sem_hit.numero_processo_digits) is not None
+    assert db.session.get(CacheNegativoCNJ, caso_a.numero_processo_digits) is None
+
+
+def test_atualizar_caso_em_streaming_pelo_http(app, db, stub_datajud, monkeypatch):
+    """Testa a atualização de um caso com a resposta do DataJud (servidor stub) lida em streaming."""
+    caso = criar_caso(db, '0000051-02.2023.8.19.0001')
+    monkeypatch.setitem(app.config, 'CNJ_STREAMING_ENABLED', True)
+    monkeypatch.setitem(app.config, 'CNJ_STREAMING_SPOOL_MAX_BYTES', 256) # Força o arquivo temporário em disco
+    stub_datajud.resposta = {"hits": {"hits": [{"_source": {"numeroProcesso": caso.numero_processo_digits, "movimentos": gerar_movimentos(20)}}]}}
+
+    corpo, status = cnj_jobs.atualizar_caso_cnj(caso)
+    assert status == 200
+    assert corpo['novas_movimentacoes_registradas'] == 20
+    assert caso.movimentacoes_cnj.count() == 20
+
+    stub_datajud.resposta = {"hits": {"hits": []}}
+    corpo, status = cnj_jobs.atualizar_caso_cnj(caso)
+    assert status == 200 and corpo['cnj_raw_response'] == {"hits": {"hits": []}}
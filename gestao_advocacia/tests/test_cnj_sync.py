@@ -0,0 +1,161 @@
+# Arquivo: tests/test_cnj_sync.py
+# Testes para o motor de sincronização concorrente com o DataJud (cnj_sync.py).
+
+import threading
+import time
+from cnj_sync import (TokenBucket, LimitadorPorTribunal, executar_por_tribunal, DisjuntorTribunal, DisjuntoresPorTribunal,
+                      TribunalIndisponivel, ESTADO_FECHADO, ESTADO_ABERTO, ESTADO_MEIO_ABERTO)
+
+
+class RelogioFalso:
+    """Relógio controlado manualmente, para testar o token bucket sem esperar."""
+    def __init__(self):
+        self.agora = 0.0
+    def __call__(self):
+        return self.agora
+
+
+def test_token_bucket_respeita_taxa_e_capacidade():
+    """Testa que o bucket libera a rajada inicial e depois repõe tokens na taxa configurada."""
+    relogio = RelogioFalso()
+    bucket = TokenBucket(taxa_por_segundo=2, capacidade=2, relogio=relogio)
+    assert bucket.tentar_consumir() == 0
+    assert bucket.tentar_consumir() == 0
+    espera = bucket.tentar_consumir()
+    assert abs(espera - 0.5) < 1e-9 # 2 tokens/s -> próximo token em 0,5 s
+    relogio.agora += 0.5
+    assert bucket.tentar_consumir() == 0
+    relogio.agora += 100 # Nunca acumula mais que a capacidade
+    assert bucket.tentar_consumir() == 0
+    assert bucket.tentar_consumir() == 0
+    assert bucket.tentar_consumir() > 0
+
+
+def test_limitador_mantem_bucket_independente_por_alias():
+    """Testa que esgotar o bucket de um tribunal não afeta os demais."""
+    limitador = LimitadorPorTribunal(taxa_por_segundo=1, capacidade=1, relogio=RelogioFalso())
+    assert limitador.tentar_consumir('api_publica_tjsp') == 0
+    assert limitador.tentar_consumir('api_publica_tjsp') > 0
+    assert limitador.tentar_consumir('api_publica_tjrj') == 0
+    assert limitador.tentar_consumir(None) == 0 # Itens sem alias não são limitados
+
+
+def test_executar_por_tribunal_consulta_tribunais_em_paralelo():
+    """Testa que tribunais diferentes são consultados simultaneamente e todos os itens são entregues."""
+    em_execucao = {'atual': 0, 'maximo': 0}
+    lock = threading.Lock()
+
+    def buscar(item):
+        with lock:
+            em_execucao['atual'] += 1
+            em_execucao['maximo'] = max(em_execucao['maximo'], em_execucao['atual'])
+        time.sleep(0.05)
+        with lock:
+            em_execucao['atual'] -= 1
+        return item * 10
+
+    tarefas = [('api_publica_tjsp', 1), ('api_publica_tjrj', 2), ('api_publica_tjmg', 3)]
+    limitador = LimitadorPorTribunal(taxa_por_segundo=100, capacidade=1)
+    resultados = {item: resultado for item, resultado, erro in executar_por_tribunal(tarefas, buscar, 3, limitador)}
+
+    assert resultados == {1: 10, 2: 20, 3: 30}
+    assert em_execucao['maximo'] == 3
+
+
+def test_executar_por_tribunal_limita_taxa_do_mesmo_tribunal():
+    """Testa que itens do mesmo tribunal são espaçados conforme a taxa do token bucket."""
+    inicios = []
+
+    def buscar(item):
+        inicios.append(time.monotonic())
+        return item
+
+    tarefas = [('api_publica_tjsp', i) for i in range(3)]
+    limitador = LimitadorPorTribunal(taxa_por_segundo=10, capacidade=1)
+    list(executar_por_tribunal(tarefas, buscar, 3, limitador))
+
+    assert len(inicios) == 3
+    inicios.sort()
+    assert inicios[2] - inicios[0] >= 0.18 # 3 requisições a 10/s levam ao menos ~0,2 s
+
+
+def test_executar_por_tribunal_repassa_excecoes():
+    """Testa que a exceção de uma busca é entregue ao chamador sem interromper as demais."""
+    def buscar(item):
+        if item == 'falha':
+            raise RuntimeError("erro simulado")
+        return item
+
+    tarefas = [('a', 'falha'), ('b', 'ok')]
+    resultados = list(executar_por_tribunal(tarefas, buscar, 2, LimitadorPorTribunal(100)))
+    por_item = {item: (resultado, erro) for item, resultado, erro in resultados}
+    assert isinstance(por_item['falha'][1], RuntimeError)
+    assert por_item['ok'] == ('ok', None)
+
+
+def test_disjuntor_abre_apos_falhas_seguidas_e_fecha_com_sondagem():
+    """Testa fechado -> aberto -> meio-aberto (uma única sondagem) -> fechado."""
+    relogio = RelogioFalso()
+    disjuntor = DisjuntorTribunal(limite_falhas=3, espera_inicial=10, espera_maxima=100, relogio=relogio, aleatorio=lambda: 1.0)
+    for _ in range(2):
+        disjuntor.registrar_falha()
+    assert disjuntor.estado == ESTADO_FECHADO and disjuntor.permitir()
+    disjuntor.registrar_falha()
+    assert disjuntor.estado == ESTADO_ABERTO
+    assert not disjuntor.permitir()
+    assert disjuntor.segundos_bloqueado() == 10
+
+    relogio.agora += 10
+    assert disjuntor.segundos_bloqueado() == 0
+    assert disjuntor.permitir() # A sondagem
+    assert disjuntor.estado == ESTADO_MEIO_ABERTO
+    assert not disjuntor.permitir() # Só uma consulta por vez no meio-aberto
+    assert disjuntor.segundos_bloqueado() > 0
+    disjuntor.registrar_sucesso()
+    assert disjuntor.estado == ESTADO_FECHADO and disjuntor.permitir()
+
+
+def test_disjuntor_backoff_exponencial_com_jitter_e_retry_after():
+    """Testa que a espera dobra a cada reabertura, fica entre metade e o total, e respeita o Retry-After."""
+    relogio = RelogioFalso()
+    sorteios = iter([0.0, 1.0, 0.5])
+    disjuntor = DisjuntorTribunal(limite_falhas=1, espera_inicial=10, espera_maxima=30, relogio=relogio, aleatorio=lambda: next(sorteios))
+    disjuntor.registrar_falha()
+    assert disjuntor.segundos_bloqueado() == 5 # 10 s, jitter no mínimo (metade)
+
+    relogio.agora += 5
+    assert disjuntor.permitir()
+    disjuntor.registrar_falha() # A sondagem falhou: reabre com o dobro
+    assert disjuntor.segundos_bloqueado() == 20
+
+    relogio.agora += 20
+    assert disjuntor.permitir()
+    disjuntor.registrar_falha(retry_after=300) # 40 s limitado a 30, mas o tribunal pediu 300
+    assert disjuntor.segundos_bloqueado() == 300
+
+
+def test_disjuntor_abre_na_hora_com_429():
+    """Testa que um 429 abre o circuito sem esperar o limite de falhas."""
+    disjuntor = DisjuntorTribunal(limite_falhas=5, relogio=RelogioFalso())
+    disjuntor.registrar_falha(abrir_imediatamente=True)
+    assert disjuntor.estado == ESTADO_ABERTO
+
+
+def test_executar_por_tribunal_pula_tribunal_com_circuito_aberto():
+    """Testa que itens de um tribunal com o circuito aberto saem sem consulta, e os demais são consultados."""
+    disjuntores = DisjuntoresPorTribunal(limite_falhas=1, espera_inicial=60)
+    disjuntores.disjuntor('api_publica_tjsp').registrar_falha()
+    consultados = []
+
+    def buscar(item):
+        consultados.append(item)
+        return item
+
+    tarefas = [('api_publica_tjsp', 1), ('api_publica_tjrj', 2), ('api_publica_tjsp', 3)]
+    resultados = {item: erro for item, _, erro in executar_por_tribunal(tarefas, buscar, 2, LimitadorPorTribunal(100), disjuntores=disjuntores)}
+
+    assert consultados == [2]
+    assert resultados[2] is None
+    for item in (1, 3):
+        assert isinstance(resultados[item], TribunalIndisponivel)
+        assert 30 <= resultados[item].segundos <= 60
@@ -0,0 +1,72 @@
+# Arquivo: tests/test_lideranca_scheduler.py
+# Testes para a eleição de líder do scheduler (lideranca_scheduler.py), no modo lease (SQLite).
+
+from datetime import datetime, timedelta
+from app import create_app, scheduler
+from lideranca_scheduler import EleicaoLider
+
+
+class RelogioFalso:
+    """Relógio controlado pelo teste."""
+    def __init__(self):
+        self.agora = datetime(2024, 1, 1, 12, 0, 0)
+
+    def __call__(self):
+        return self.agora
+
+
+def criar_eleicao(app, relogio, eventos, nome_instancia):
+    return EleicaoLider(
+        app, 'scheduler-teste', duracao_lease=60, id_instancia=nome_instancia, relogio=relogio,
+        ao_assumir=lambda: eventos.append((nome_instancia, 'assumiu')),
+        ao_perder=lambda: eventos.append((nome_instancia, 'perdeu')),
+    )
+
+
+def test_apenas_uma_instancia_e_lider(app, db):
+    """Testa que, com duas instâncias disputando, só a primeira obtém o lease e o mantém com heartbeats."""
+    relogio, eventos = RelogioFalso(), []
+    worker_a = criar_eleicao(app, relogio, eventos, 'worker-a')
+    worker_b = criar_eleicao(app, relogio, eventos, 'worker-b')
+
+    assert worker_a.verificar() is True
+    assert worker_b.verificar() is False
+    relogio.agora += timedelta(seconds=45)
+    assert worker_a.verificar() is True # heartbeat renova o lease
+    relogio.agora += timedelta(seconds=45)
+    assert worker_b.verificar() is False
+    assert eventos == [('worker-a', 'assumiu')]
+
+
+def test_outra_instancia_assume_quando_o_lease_expira(app, db):
+    """Testa que, se o líder para de renovar o lease, outra instância assume e o antigo líder percebe a perda."""
+    relogio, eventos = RelogioFalso(), []
+    worker_a = criar_eleicao(app, relogio, eventos, 'worker-a')
+    worker_b = criar_eleicao(app, relogio, eventos, 'worker-b')
+    worker_a.verificar()
+
+    relogio.agora += timedelta(seconds=61)
+    assert worker_b.verificar() is True
+    assert worker_a.verificar() is False
+    assert eventos == [('worker-a', 'assumiu'), ('worker-b', 'assumiu'), ('worker-a', 'perdeu')]
+
+
+def test_parar_libera_a_lideranca(app, db):
+    """Testa que ao parar o líder libera o lease imediatamente."""
+    relogio, eventos = RelogioFalso(), []
+    worker_a = criar_eleicao(app, relogio, eventos, 'worker-a')
+    worker_b = criar_eleicao(app, relogio, eventos, 'worker-b')
+    worker_a.verificar()
+    worker_a.parar()
+
+    relogio.agora += timedelta(seconds=1)
+    assert worker_b.verificar() is True
+    assert ('worker-a', 'perdeu') in eventos
+
+
+def test_comandos_flask_nao_sobem_scheduler_nem_eleicao(app, monkeypatch):
+    """Testa que um processo de comando 'flask' (FLASK_RUN_FROM_CLI) não inicia o scheduler nem disputa a liderança."""
+    monkeypatch.setenv('FLASK_RUN_FROM_CLI', 'true')
+    app_cli = create_app(type('ConfigCLI', (), dict(app.config, TESTING=False, CNJ_JOB_ENABLED=True)))
+    assert 'eleicao_lider_scheduler' not in app_cli.extensions
+    assert not scheduler.running
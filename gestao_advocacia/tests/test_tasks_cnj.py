@@ -0,0 +1,273 @@
+# Arquivo: tests/test_tasks_cnj.py
+# Testes para o job agendado de verificação de processos no CNJ (tasks.py).
+
+import tasks
+import cnj_ingestao
+import cnj_service
+import cnj_cache_negativo
+from datetime import datetime, timedelta
+from app import Caso, MovimentacaoCNJ, CacheNegativoCNJ
+from tests.conftest import resposta_cnj, criar_caso
+
+
+def test_job_registra_movimentacoes_de_varios_tribunais(db, job_habilitado, monkeypatch):
+    """Testa que o job consulta casos de tribunais diferentes e registra as movimentações de cada um."""
+    caso_sp = criar_caso(db, '0000001-02.2023.8.26.0100', 'sp')
+    caso_rj = criar_caso(db, '0000002-03.2023.8.19.0001', 'rj')
+    lotes_consultados = []
+
+    def consultar_lote_falso(alias_tribunal, numeros_processo):
+        lotes_consultados.append((alias_tribunal, list(numeros_processo)))
+        return {
+            numero: (resposta_cnj([{"dataHora": "2024-01-10T10:00:00Z", "movimentoNacional": {"descricao": f"Despacho {numero}"}}]), 200)
+            for numero in numeros_processo
+        }
+
+    monkeypatch.setattr(tasks, 'consultar_lote_por_alias', consultar_lote_falso)
+    tasks.job_verificar_processos_cnj()
+
+    # Um lote por tribunal, cada um com o seu processo
+    assert len(lotes_consultados) == 2
+    assert sorted(n for _, numeros in lotes_consultados for n in numeros) == sorted([caso_sp.numero_processo_digits, caso_rj.numero_processo_digits])
+    for caso in (caso_sp, caso_rj):
+        db.session.refresh(caso)
+        assert caso.data_ultima_verificacao_cnj is not None
+        assert caso.movimentacoes_cnj.count() == 1
+        assert caso.status.startswith('Despacho')
+
+
+def test_job_agrupa_casos_do_mesmo_tribunal_em_um_lote(db, job_habilitado, monkeypatch):
+    """Testa que casos do mesmo tribunal (inclusive com o mesmo número) geram uma única consulta em lote."""
+    casos = [
+        criar_caso(db, '0000004-05.2023.8.19.0001', 'a'),
+        criar_caso(db, '0000005-06.2023.8.19.0001', 'b'),
+        criar_caso(db, '0000005-06.2023.8.19.0001', 'c'),
+    ]
+    lotes_consultados = []
+
+    def consultar_lote_falso(alias_tribunal, numeros_processo):
+        lotes_consultados.append(list(numeros_processo))
+        return {numero: ({"hits": {"hits": []}}, 200) for numero in numeros_processo}
+
+    monkeypatch.setattr(tasks, 'consultar_lote_por_alias', consultar_lote_falso)
+    tasks.job_verificar_processos_cnj()
+
+    assert len(lotes_consultados) == 1
+    assert sorted(lotes_consultados[0]) == ['00000040520238190001', '00000050620238190001']
+    for caso in casos:
+        db.session.refresh(caso)
+        assert caso.data_ultima_verificacao_cnj is not None
+
+
+def test_job_aceita_fuso_do_scheduler_pelo_nome(db, job_habilitado, monkeypatch):
+    """Testa que o job roda com SCHEDULER_TIMEZONE no formato da configuração padrão ('America/Sao_Paulo')."""
+    caso = criar_caso(db, '0000007-08.2023.8.19.0001', 'tz')
+    monkeypatch.setitem(job_habilitado.config, 'SCHEDULER_TIMEZONE', 'America/Sao_Paulo')
+    monkeypatch.setattr(tasks, 'consultar_lote_por_alias', lambda alias, numeros: {n: (resposta_cnj([]), 200) for n in numeros})
+
+    assert tasks.job_verificar_processos_cnj() >= 1
+    db.session.refresh(caso)
+    assert caso.data_ultima_verificacao_cnj is not None
+
+
+def test_job_marca_verificacao_mesmo_com_erro_na_consulta(db, job_habilitado, monkeypatch):
+    """Testa que uma exceção na consulta de um caso não impede o registro da verificação."""
+    caso = criar_caso(db, '0000003-04.2023.8.26.0100')
+
+    def consultar_com_erro(alias_tribunal, numeros_processo):
+        raise RuntimeError("falha simulada")
+
+    monkeypatch.setattr(tasks, 'consultar_lote_por_alias', consultar_com_erro)
+    tasks.job_verificar_processos_cnj()
+
+    db.session.refresh(caso)
+    assert caso.data_ultima_verificacao_cnj is not None
+    assert caso.movimentacoes_cnj.count() == 0
+
+
+def test_job_nao_duplica_movimentacoes_ja_registradas(db, job_habilitado, monkeypatch):
+    """Testa que uma segunda sincronização só registra as movimentações realmente novas (diff por hash)."""
+    caso = criar_caso(db, '0000006-07.2023.8.19.0001')
+    movimentos = [
+        {"dataHora": "2024-01-10T10:00:00Z", "codigo": 11, "movimentoNacional": {"descricao": "Conclusão"}},
+        {"dataHora": "2024-01-10T10:00:00Z", "codigo": 12, "movimentoNacional": {"descricao": "Juntada"}},
+    ]
+
+    def consultar_lote_falso(alias_tribunal, numeros_processo):
+        return {numero: (resposta_cnj(list(movimentos)), 200) for numero in numeros_processo}
+
+    monkeypatch.setattr(tasks, 'consultar_lote_por_alias', consultar_lote_falso)
+    tasks.job_verificar_processos_cnj()
+    assert caso.movimentacoes_cnj.count() == 2
+
+    movimentos.append({"dataHora": "2024-01-11T09:00:00Z", "codigo": 13, "movimentoNacional": {"descricao": "Sentença"}})
+    caso.proxima_verificacao_cnj = None
+    db.session.commit()
+    tasks.job_verificar_processos_cnj()
+
+    assert caso.movimentacoes_cnj.count() == 3
+    db.session.refresh(caso)
+    assert caso.status == 'Sentença'
+
+
+def test_job_pula_ingestao_de_resposta_inalterada(db, job_habilitado, monkeypatch):
+    """Testa que uma resposta idêntica à da sincronização anterior só atualiza a data de verificação."""
+    caso = criar_caso(db, '0000009-10.2023.8.19.0001')
+    source = {"dataHoraUltimaAtualizacao": "2024-01-10T12:00:00.000Z",
+              "movimentos": [{"dataHora": "2024-01-10T10:00:00Z", "codigo": 11, "movimentoNacional": {"descricao": "Conclusão"}}]}
+
+    def consultar_lote_falso(alias_tribunal, numeros_processo):
+        return {numero: ({"hits": {"hits": [{"_source": source}]}}, 200) for numero in numeros_processo}
+
+    monkeypatch.setattr(tasks, 'consultar_lote_por_alias', consultar_lote_falso)
+    analises = []
+    analisar_original = cnj_ingestao.analisar_movimentos
+    monkeypatch.setattr(cnj_ingestao, 'analisar_movimentos', lambda *args: analises.append(args) or analisar_original(*args))
+
+    tasks.job_verificar_processos_cnj()
+    db.session.refresh(caso)
+    assert caso.processo_cnj.hash_payload_cnj is not None
+    assert caso.processo_cnj.data_hora_ultima_atualizacao_cnj == "2024-01-10T12:00:00.000Z"
+    primeira_verificacao = caso.data_ultima_verificacao_cnj
+
+    estatisticas_antes = cnj_ingestao.obter_estatisticas_cache_payload()
+    caso.proxima_verificacao_cnj = None
+    db.session.commit()
+    tasks.job_verificar_processos_cnj()
+
+    db.session.refresh(caso)
+    assert len(analises) == 1
+    assert caso.data_ultima_verificacao_cnj is not None and caso.data_ultima_verificacao_cnj >= primeira_verificacao
+    assert cnj_ingestao.obter_estatisticas_cache_payload()['acertos'] == estatisticas_antes['acertos'] + 1
+    assert caso.movimentacoes_cnj.count() == 1
+
+
+def test_sincronizar_apenas_o_shard_informado(db, job_habilitado, monkeypatch):
+    """Testa que cada shard (id % N == i) verifica só a sua fatia dos casos, e que juntos cobrem todos."""
+    casos = [criar_caso(db, f'00000{i:02d}-02.2023.8.19.0001', f's{i}') for i in range(6)]
+    consultados = []
+
+    def consultar_lote_falso(alias_tribunal, numeros_processo):
+        consultados.extend(numeros_processo)
+        return {numero: ({"hits": {"hits": []}}, 200) for numero in numeros_processo}
+
+    monkeypatch.setattr(tasks, 'consultar_lote_por_alias', consultar_lote_falso)
+    assert tasks.sincronizar_casos_cnj(shard=(1, 3)) == 2
+    assert sorted(consultados) == sorted(c.numero_processo_digits for c in casos if c.id % 3 == 1)
+
+    assert tasks.sincronizar_casos_cnj(shard=(0, 3)) + tasks.sincronizar_casos_cnj(shard=(2, 3)) == 4
+    assert tasks.sincronizar_casos_cnj(shard=(1, 3)) == 0
+
+
+def test_comando_cnj_sync(app, db, monkeypatch):
+    """Testa o comando 'flask cnj-sync --shard i/N', que roda mesmo com o job agendado desabilitado."""
+    caso = criar_caso(db, '0000012-13.2023.8.19.0001')
+    monkeypatch.setattr(tasks, 'consultar_lote_por_alias',
+                        lambda alias, numeros: {numero: ({"hits": {"hits": []}}, 200) for numero in numeros})
+
+    resultado = app.test_cli_runner().invoke(args=['cnj-sync', '--shard', f'{caso.id % 2}/2'])
+    assert resultado.exit_code == 0, resultado.output
+    assert '1 caso(s) verificado(s)' in resultado.output
+
+    resultado = app.test_cli_runner().invoke(args=['cnj-sync', '--shard', '2/2'])
+    assert resultado.exit_code != 0
+
+
+def test_job_adia_casos_de_tribunal_com_circuito_aberto(db, job_habilitado, monkeypatch):
+    """Testa que casos de um tribunal com o circuito aberto são adiados sem contar como verificados."""
+    caso_sp = criar_caso(db, '0000013-14.2023.8.26.0100', 'csp')
+    caso_rj = criar_caso(db, '0000014-15.2023.8.19.0001', 'crj')
+    cnj_service.obter_disjuntores().disjuntor('api_publica_tjsp').registrar_falha(abrir_imediatamente=True)
+    consultados = []
+
+    def consultar_lote_falso(alias_tribunal, numeros_processo):
+        consultados.append(alias_tribunal)
+        return {numero: ({"hits": {"hits": []}}, 200) for numero in numeros_processo}
+
+    monkeypatch.setattr(tasks, 'consultar_lote_por_alias', consultar_lote_falso)
+    assert tasks.job_verificar_processos_cnj() == 1
+
+    assert consultados == ['api_publica_tjrj']
+    db.session.refresh(caso_sp)
+    assert caso_sp.data_ultima_verificacao_cnj is None
+    assert caso_sp.proxima_verificacao_cnj is not None
+    db.session.refresh(caso_rj)
+    assert caso_rj.data_ultima_verificacao_cnj is not None
+
+
+def test_job_nao_consulta_numero_no_cache_negativo(app, db, job_habilitado, monkeypatch):
+    """Testa o cache negativo: sem hit, o número só é consultado de novo após o prazo, que cresce a cada consulta vazia."""
+    caso = criar_caso(db, '0000015-16.2023.8.19.0001', 'neg')
+    consultados = []
+
+    def consultar_lote_falso(alias_tribunal, numeros_processo):
+        consultados.extend(numeros_processo)
+        return {numero: ({"hits": {"hits": []}}, 200) for numero in numeros_processo}
+
+    monkeypatch.setattr(tasks, 'consultar_lote_por_alias', consultar_lote_falso)
+    assert tasks.job_verificar_processos_cnj() == 1
+    entrada = db.session.get(CacheNegativoCNJ, caso.numero_processo_digits)
+    assert entrada.consultas_sem_resultado == 1
+    assert timedelta(hours=23) < entrada.valido_ate - datetime.utcnow() <= timedelta(days=1)
+
+    # Vencida a agenda do caso, mas não o cache: nenhuma consulta, e o caso é reagendado para o fim do cache
+    caso.proxima_verificacao_cnj = None
+    db.session.commit()
+    evitadas_antes = cnj_cache_negativo.obter_estatisticas_cache_negativo()['consultas_evitadas']
+    assert tasks.job_verificar_processos_cnj() == 0
+    assert len(consultados) == 1
+    assert cnj_cache_negativo.obter_estatisticas_cache_negativo()['consultas_evitadas'] == evitadas_antes + 1
+    db.session.refresh(caso)
+    assert caso.proxima_verificacao_cnj == entrada.valido_ate
+
+    # Cache vencido: nova consulta vazia sobe o prazo para uma semana
+    entrada.valido_ate = datetime.utcnow() - timedelta(seconds=1)
+    caso.proxima_verificacao_cnj = None
+    db.session.commit()
+    assert tasks.job_verificar_processos_cnj() == 1
+    db.session.refresh(entrada)
+    assert entrada.consultas_sem_resultado == 2
+    assert entrada.valido_ate - datetime.utcnow() > timedelta(days=6)
+
+    # Processo encontrado: sai do cache
+    entrada.valido_ate = datetime.utcnow() - timedelta(seconds=1)
+    caso.proxima_verificacao_cnj = None
+    db.session.commit()
+    monkeypatch.setattr(tasks, 'consultar_lote_por_alias',
+                        lambda alias_tribunal, numeros_processo: {numero: (resposta_cnj([]), 200) for numero in numeros_processo})
+    assert tasks.job_verificar_processos_cnj() == 1
+    db.session.expire_all()
+    assert db.session.get(CacheNegativoCNJ, caso.numero_processo_digits) is None
+
+
+def test_job_consulta_numero_compartilhado_uma_vez_e_repassa_aos_casos(db, job_habilitado, monkeypatch):
+    """Testa que casos de advogados diferentes com o mesmo processo geram uma consulta e um único histórico."""
+    caso_a = criar_caso(db, '0000040-41.2023.8.19.0001', 'dup-a')
+    caso_b = criar_caso(db, '00000404120238190001', 'dup-b') # mesmo número, outra formatação
+    consultados = []
+    movimentos = [{"dataHora": "2024-03-01T10:00:00Z", "codigo": 26, "movimentoNacional": {"descricao": "Distribuição"}},
+                  {"dataHora": "2024-03-02T10:00:00Z", "codigo": 51, "movimentoNacional": {"descricao": "Conclusão"}}]
+
+    def consultar_lote_falso(alias_tribunal, numeros_processo):
+        consultados.extend(numeros_processo)
+        return {numero: (resposta_cnj(movimentos), 200) for numero in numeros_processo}
+
+    monkeypatch.setattr(tasks, 'consultar_lote_por_alias', consultar_lote_falso)
+    assert tasks.job_verificar_processos_cnj() == 2
+    assert consultados == ['00000404120238190001']
+
+    db.session.refresh(caso_a)
+    db.session.refresh(caso_b)
+    assert caso_a.processo_cnj_id == caso_b.processo_cnj_id is not None
+    assert caso_a.movimentacoes_cnj.count() == caso_b.movimentacoes_cnj.count() == 2
+    assert MovimentacaoCNJ.query.count() == 2
+    assert caso_a.status == caso_b.status == 'Conclusão'
+    assert caso_a.data_ultima_verificacao_cnj is not None and caso_b.data_ultima_verificacao_cnj is not None
+
+    # Um novo caso com o mesmo número vê o histórico já registrado e recebe o status da movimentação mais recente
+    caso_c = criar_caso(db, '0000040-41.2023.8.19.0001', 'dup-c')
+    assert tasks.job_verificar_processos_cnj() == 3
+    db.session.refresh(caso_c)
+    assert caso_c.processo_cnj_id == caso_a.processo_cnj_id
+    assert caso_c.status == 'Conclusão'
+    assert MovimentacaoCNJ.query.count() == 2
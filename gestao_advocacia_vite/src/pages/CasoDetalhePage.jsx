@@ -18,6 +18,9 @@ function CasoDetalhePage() {
     
     const [caso, setCaso] = useState(null);
     const [movimentacoesCNJ, setMovimentacoesCNJ] = useState([]);
+    // Cursor da próxima página de movimentações (cabeçalho X-Next-Cursor); null quando não há mais
+    const [cursorMovimentacoes, setCursorMovimentacoes] = useState(null);
+    const [isLoadingMaisMovimentacoes, setIsLoadingMaisMovimentacoes] = useState(false);
     
     const [isLoadingCaso, setIsLoadingCaso] = useState(true);
     const [isLoadingMovimentacoes, setIsLoadingMovimentacoes] = useState(false);
@@ -74,6 +77,7 @@ function CasoDetalhePage() {
             }
             const dataMovCNJ = await resMovCNJ.json();
             setMovimentacoesCNJ(dataMovCNJ);
+            setCursorMovimentacoes(resMovCNJ.headers.get('X-Next-Cursor'));
             
         } catch (err) {
             console.error("Erro ao buscar dados do caso ou movimentações:", err);
@@ -89,6 +93,52 @@ function CasoDetalhePage() {
         carregarDadosDoCaso();
     }, [carregarDadosDoCaso]);
 
+    const carregarMaisMovimentacoes = async () => {
+        const token = localStorage.getItem('token');
+        if (!token || !cursorMovimentacoes) return;
+        setIsLoadingMaisMovimentacoes(true);
+        try {
+            const res = await fetch(
+                `${API_URL}/casos/${casoId}/movimentacoes-cnj?cursor=${encodeURIComponent(cursorMovimentacoes)}`,
+                { headers: { 'Authorization': `Bearer ${token}` } }
+            );
+            if (!res.ok) {
+                const errData = await res.json().catch(() => ({ message: `Erro HTTP ${res.status} ao buscar movimentações.` }));
+                throw new Error(errData.message || `Erro ao buscar movimentações do CNJ: ${res.statusText}`);
+            }
+            const novasMovimentacoes = await res.json();
+            setMovimentacoesCNJ(anteriores => [...anteriores, ...novasMovimentacoes]);
+            setCursorMovimentacoes(res.headers.get('X-Next-Cursor'));
+        } catch (err) {
+            console.error("Erro ao carregar mais movimentações:", err);
+            toast.error(`Erro ao carregar movimentações: ${err.message}`);
+        } finally {
+            setIsLoadingMaisMovimentacoes(false);
+        }
+    };
+
+    // Consulta GET /api/cnj-jobs/<id> até o job terminar e devolve o resultado da atualização.
+    const aguardarJobCNJ = async (jobId, authHeaders) => {
+        const intervaloMs = 1500;
+        const tentativasMaximas = 80; // ~2 minutos
+        for (let tentativa = 0; tentativa < tentativasMaximas; tentativa++) {
+            const resJob = await fetch(`${API_URL}/cnj-jobs/${jobId}`, { headers: authHeaders });
+            const dataJob = await resJob.json().catch(() => ({}));
+            if (!resJob.ok) {
+                throw new Error(dataJob.message || `Erro ${resJob.status} ao consultar o andamento da atualização.`);
+            }
+            if (dataJob.status === 'concluido') {
+                return dataJob.resultado || {};
+            }
+            if (dataJob.status === 'erro') {
+                const resultado = dataJob.resultado || {};
+                throw new Error(resultado.message || resultado.details || `Erro ${dataJob.http_status} na atualização via CNJ.`);
+            }
+            await new Promise((resolve) => setTimeout(resolve, intervaloMs));
+        }
+        throw new Error("A atualização via CNJ ainda está em andamento. Tente recarregar a página em instantes.");
+    };
+
     const handleAtualizarViaCNJ = async () => {
         const token = localStorage.getItem('token');
         if (!token || !caso || !caso.numero_processo) {
@@ -111,12 +161,15 @@ function CasoDetalhePage() {
                 method: 'POST',
                 headers: authHeaders
             });
-            const dataResposta = await response.json(); 
-            
+            const dataEnfileiramento = await response.json();
+
             if (!response.ok) {
-                throw new Error(dataResposta.message || dataResposta.details || `Erro ${response.status} ao tentar atualizar via CNJ.`);
+                throw new Error(dataEnfileiramento.message || dataEnfileiramento.details || `Erro ${response.status} ao tentar atualizar via CNJ.`);
             }
-            
+
+            // A atualização roda em segundo plano (202 + job_id); consulta o job até ele terminar.
+            const dataResposta = await aguardarJobCNJ(dataEnfileiramento.job_id, authHeaders);
+
             setAtualizacaoCNJSuccess(dataResposta.message || "Informações do caso atualizadas com sucesso a partir do CNJ!");
             toast.success(dataResposta.message || "Atualização CNJ bem-sucedida!");
             await carregarDadosDoCaso(); 
@@ -232,7 +285,7 @@ function CasoDetalhePage() {
             <div className="card shadow-lg">
                 <div className="card-header bg-light py-3">
                     <h5 className="card-title mb-0 text-primary">
-                        Histórico de Movimentações do CNJ ({movimentacoesCNJ.length})
+                        Histórico de Movimentações do CNJ ({caso?.movimentacoes_cnj_count ?? movimentacoesCNJ.length})
                     </h5>
                 </div>
                 <div className="card-body p-3" style={{ maxHeight: '400px', overflowY: 'auto' }}>
@@ -253,6 +306,17 @@ function CasoDetalhePage() {
                                     </p>
                                 </li>
                             ))}
+                            {cursorMovimentacoes && (
+                                <li className="list-group-item px-0 py-2 text-center">
+                                    <button
+                                        onClick={carregarMaisMovimentacoes}
+                                        className="btn btn-outline-primary btn-sm"
+                                        disabled={isLoadingMaisMovimentacoes}
+                                    >
+                                        {isLoadingMaisMovimentacoes ? 'Carregando...' : 'Carregar movimentações anteriores'}
+                                    </button>
+                                </li>
+                            )}
                         </ul>
                     ) : (
                         <p className="text-muted fst-italic text-center py-3">Nenhuma movimentação do CNJ registrada para este caso no sistema.</p>